@@ -1,20 +1,40 @@
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, abort, jsonify, request, send_file, send_from_directory
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 import os
 import time
+import mimetypes
 from datetime import timedelta
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .routes.api import api
 from .routes.voice_api import voice_api
 from .routes.auth_api import auth_api
 from .models import init_db
+from .commands import register_commands
+from .services.voice_service import AUDIO_FORMATS
+from .services.metrics import metrics
+from .services.compression import compress_response
+from .services.static_manifest import StaticManifest, IMMUTABLE_MAX_AGE
+from .utils.json_provider import FastJSONProvider
+
+# HLS segments are MPEG transport streams
+mimetypes.add_type('video/mp2t', '.ts')
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__, static_folder='static')
+# Initialize Flask app. The static folder is set after construction so that
+# Flask does not register its own /static route, which would shadow
+# serve_static_audio below.
+app = Flask(__name__, static_folder=None)
+app.static_folder = 'static'
+
+# Serialize responses with orjson when it is installed
+app.json = FastJSONProvider(app)
+
+# Index of the frontend build, so the SPA routes do not probe the filesystem
+frontend_manifest = StaticManifest(app.static_folder)
 
 # Configure app
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URI', 'sqlite:///storyspark.db')
@@ -23,6 +43,13 @@ app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'dev-secret-key-
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
 
+# Apply X-Forwarded-For and X-Forwarded-Proto only from the reverse proxies in
+# front of the app (1 behind the bundled nginx); with none, a client reaching
+# the app directly cannot choose the address admission control sees
+PROXY_FIX_HOPS = int(os.environ.get('PROXY_FIX_HOPS', 0))
+if PROXY_FIX_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS)
+
 # Initialize extensions
 CORS(app, resources={
     r"/*": {
@@ -35,18 +62,27 @@ CORS(app, resources={
 })
 jwt = JWTManager(app)
 init_db(app)
+register_commands(app)
 
 # Register blueprints
 app.register_blueprint(api, url_prefix='/api')
 app.register_blueprint(voice_api, url_prefix='/api/voice')
 app.register_blueprint(auth_api, url_prefix='/api/auth')
 
+# Compress JSON and text responses for clients that accept it
+@app.after_request
+def compress_api_response(response):
+    """Compress responses above the size threshold with Brotli or gzip"""
+    return compress_response(response, request.accept_encodings)
+
 # Route for serving audio files from the static directory
 @app.route('/static/<path:filename>')
 def serve_static_audio(filename):
-    """Serve static audio files"""
+    """Serve static audio files, negotiating the audio format with the Accept header"""
     try:
-        static_dir = os.path.join(os.path.dirname(__file__), '../static')
+        static_dir = app.static_folder
+        filename, negotiated = _negotiate_audio_variant(static_dir, filename)
+        
         if not os.path.exists(os.path.join(static_dir, filename)):
             app.logger.warning(f"Static file not found: {filename}")
             # Return a 404 if the file doesn't exist
@@ -55,7 +91,10 @@ def serve_static_audio(filename):
                 'message': f'File not found: {filename}'
             }), 404
         
-        return send_from_directory(static_dir, filename)
+        response = send_from_directory(static_dir, filename)
+        if negotiated:
+            response.vary.add('Accept')
+        return response
     except Exception as e:
         app.logger.error(f"Error serving static file {filename}: {str(e)}")
         return jsonify({
@@ -63,6 +102,31 @@ def serve_static_audio(filename):
             'message': f'Error serving file: {str(e)}'
         }), 500
 
+def _negotiate_audio_variant(static_dir, filename):
+    """
+    Swap an audio file for another format the client prefers, if it exists
+
+    Returns:
+        Tuple of (filename to serve, whether the file is an audio format)
+    """
+    base, extension = os.path.splitext(filename)
+    current = next(
+        (fmt for fmt in AUDIO_FORMATS.values() if extension == f".{fmt['extension']}"),
+        None
+    )
+    if not current:
+        return filename, False
+
+    current_quality = request.accept_mimetypes.quality(current['mime_type'])
+    for fmt in AUDIO_FORMATS.values():
+        if request.accept_mimetypes.quality(fmt['mime_type']) <= current_quality:
+            continue
+        candidate = f"{base}.{fmt['extension']}"
+        if os.path.exists(os.path.join(static_dir, candidate)):
+            return candidate, True
+
+    return filename, True
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for load balancers and monitoring"""
@@ -87,6 +151,11 @@ def health_check():
             'timestamp': time.time()
         }), 503
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose service metrics in the Prometheus text format"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def hello_world():
     """Simple route to verify the API is working"""
@@ -98,16 +167,51 @@ def hello_world():
         })
     # In production, serve the React app
     else:
-        return send_from_directory(app.static_folder, 'index.html')
+        return _send_index()
 
 # Serve static files in production
 @app.route('/<path:path>')
 def serve_static(path):
-    """Serve static files from the frontend build directory"""
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    """Serve static files from the frontend build directory, falling back to index.html"""
+    entry = frontend_manifest.get(path)
+    if entry is None or entry is frontend_manifest.index:
+        return _send_index()
+    return _send_frontend_file(entry)
+
+def _send_index():
+    """Send index.html from memory; browsers revalidate it with its ETag on every load"""
+    index = frontend_manifest.index
+    if index is None:
+        abort(404)
+
+    encoding = index.variant(request.accept_encodings)
+    response = Response(frontend_manifest.index_body(encoding), mimetype=index.mimetype)
+    response.set_etag(f"{index.etag}-{encoding}" if encoding else index.etag)
+    response.cache_control.no_cache = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if index.variants:
+        response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+def _send_frontend_file(entry):
+    """Send a frontend build file, or its precompressed copy if the client accepts it"""
+    encoding = entry.variant(request.accept_encodings)
+    response = send_file(
+        frontend_manifest.served_path(entry, encoding),
+        mimetype=entry.mimetype,
+        etag=f"{entry.etag}-{encoding}" if encoding else entry.etag,
+        last_modified=entry.mtime,
+        max_age=IMMUTABLE_MAX_AGE if entry.immutable else None
+    )
+    if entry.immutable:
+        # Hashed bundle names change with their content
+        response.cache_control.immutable = True
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if entry.variants:
+        response.vary.add('Accept-Encoding')
+    return response
 
 if __name__ == '__main__':
     # Get port from environment variable or default to 5001 (to match frontend proxy)
@@ -0,0 +1,136 @@
+"""
+ASGI entry point for StorySpark
+
+Story generation and narration are served by async views, so requests
+waiting for Gemini or TTS do not each pin a worker process: one process can
+hold hundreds of upstream calls. Every other route is the regular Flask app,
+run in a pool of threads with streamed responses passed through as they are
+produced.
+
+Run with:
+    uvicorn backend.asgi:create_application --factory --host 0.0.0.0 --port 5001 --workers 2
+or under gunicorn:
+    gunicorn 'backend.asgi:create_application()' -k uvicorn.workers.UvicornWorker --workers 2
+"""
+import io
+import os
+import re
+import logging
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import jsonify
+from .app import app
+from .routes.voice_api import generate_story_async, narrate_story_async
+from .services.admission import admission_controller, ADMISSION_ASGI_SLOTS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Threads running the synchronous Flask routes in each process
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 16))
+
+# Routes served by async views, as (method, path pattern, view)
+ASYNC_ROUTES = [
+    ("POST", re.compile(r"^/api/voice/generate-story$"), generate_story_async),
+    ("GET", re.compile(r"^/api/voice/narrate-story/(?P<story_id>[^/]+)$"), narrate_story_async)
+]
+
+
+def create_application(slots=None):
+    """
+    Create the ASGI application
+
+    Requests waiting for upstream calls do not pin a worker here, so the
+    host admits many more generation requests at once than under sync
+    workers. The slots are set when the server creates the application,
+    not when this module is imported.
+
+    Args:
+        slots: Requests that may run at once on the host (default: ADMISSION_ASGI_SLOTS)
+
+    Returns:
+        ASGI application
+    """
+    admission_controller.slots = ADMISSION_ASGI_SLOTS if slots is None else slots
+
+    # Closes each response once it is sent, which releases the admission
+    # lease of a streamed narration
+    wsgi = WSGIMiddleware(app, workers=ASGI_WSGI_THREADS)
+
+    async def application(scope, receive, send):
+        """
+        ASGI application
+
+        Args:
+            scope: Connection scope
+            receive: Awaitable returning the next event from the client
+            send: Awaitable sending an event to the client
+        """
+        if scope["type"] == "lifespan":
+            await _lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        for method, pattern, view in ASYNC_ROUTES:
+            match = pattern.match(scope["path"])
+            if match and scope["method"] == method:
+                body = await _read_body(receive)
+                await _serve_async_view(view, match.groupdict(), _async_view_environ(scope, body), send)
+                return
+        await wsgi(scope, receive, send)
+
+    return application
+
+
+def _async_view_environ(scope, body):
+    """WSGI environ for a request to an async view, whose body has been read in full"""
+    environ = build_environ(scope, io.BytesIO(body))
+    # Chunked uploads come without a length
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+async def _read_body(receive):
+    """Read the whole request body"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def _serve_async_view(view, view_args, environ, send):
+    """Run an async view in a Flask request context and send its response"""
+    with app.request_context(environ):
+        try:
+            response = app.make_response(await view(**view_args))
+        except Exception as e:
+            logger.error(f"Error in {environ['PATH_INFO']}: {str(e)}")
+            response = app.make_response((jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500))
+        response = app.process_response(response)
+
+    await send({
+        "type": "http.response.start",
+        "status": response.status_code,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.headers.items()]
+    })
+    await send({"type": "http.response.body", "body": response.get_data()})
+
+
+async def _lifespan(receive, send):
+    """Acknowledge server startup and shutdown"""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
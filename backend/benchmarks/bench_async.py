@@ -0,0 +1,231 @@
+"""
+Benchmark of the sync and async serving modes of generate-story
+
+Gemini and TTS are replaced by fakes that answer after a fixed latency, and
+audio assembly is stubbed out, so the benchmark measures how many stories
+each serving mode keeps in flight rather than the upstreams themselves:
+
+- sync: the Flask app with SYNC_WORKERS requests at a time, like gunicorn
+  with 4 sync workers, admitted against ADMISSION_SLOTS
+- async: the ASGI app in one process and one event loop, with --concurrency
+  requests at a time, admitted against ADMISSION_ASGI_SLOTS
+
+Admission control is on: each request comes from its own signed-in user and
+address and saves its story, as the frontend does.
+
+Usage:
+    python backend/benchmarks/bench_async.py --requests 200 --concurrency 100
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the benchmark's database, shared state and audio out of the deployment
+WORK_DIR = tempfile.mkdtemp(prefix="storyspark_bench_")
+os.environ["DATABASE_URI"] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+os.environ["SHARED_STORE_PATH"] = os.path.join(WORK_DIR, "shared.db")
+for limit in ("GEMINI_RPM", "GEMINI_TPM", "TTS_RPM", "TTS_CHARS_PER_MINUTE"):
+    os.environ[limit] = "0"
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from flask_jwt_extended import create_access_token
+
+from backend.app import app
+from backend.asgi import create_application
+from backend.services.voice_service import story_generator, voice_service
+from backend.services.voice_service import voice_service as voice_service_module
+
+SYNC_WORKERS = 4
+PARAGRAPHS = 4
+
+STORY_REQUEST = {"theme": "Kindness", "duration": "short", "bypass_cache": True, "save": True}
+
+
+class FakeResponse:
+    """Gemini response with a story of PARAGRAPHS paragraphs."""
+
+    candidates = []
+
+    def __init__(self, number):
+        paragraphs = [f"Paragraph {i} of story {number}. The kind crow helped a friend." for i in range(PARAGRAPHS)]
+        self.text = f"Title: Story {number}\n\n" + "\n\n".join(paragraphs)
+
+
+class FakeGemini:
+    """Gemini model answering after a fixed latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def _next(self):
+        with self.lock:
+            self.count += 1
+            return FakeResponse(self.count)
+
+    def generate_content(self, prompt, generation_config=None):
+        time.sleep(self.latency)
+        return self._next()
+
+    async def generate_content_async(self, prompt, generation_config=None):
+        await asyncio.sleep(self.latency)
+        return self._next()
+
+
+class FakeSpeech:
+    """TTS response."""
+
+    audio_content = b"\xff\xf3"
+
+
+class FakeTTS:
+    """TTS client answering after a fixed latency."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def synthesize_speech(self, input, voice, audio_config, retry=None, timeout=None):
+        time.sleep(self.latency)
+        return FakeSpeech()
+
+
+class FakeAsyncTTS(FakeTTS):
+    """Async TTS client answering after a fixed latency."""
+
+    async def synthesize_speech(self, input, voice, audio_config, retry=None, timeout=None):
+        await asyncio.sleep(self.latency)
+        return FakeSpeech()
+
+
+def fake_combine(audio_files, output_path, audio_format):
+    """Stand-in for audio assembly."""
+    with open(output_path, "wb") as f:
+        f.write(b"\xff\xf3")
+    return True
+
+
+def install_fakes(gemini_latency, tts_latency):
+    """Replace the upstreams and audio processing with fakes."""
+    story_generator.gemini_model = FakeGemini(gemini_latency)
+    voice_service.tts_client = FakeTTS(tts_latency)
+    async_tts = FakeAsyncTTS(tts_latency)
+    voice_service._get_async_tts_client = lambda: async_tts
+    voice_service.static_dir = WORK_DIR
+    voice_service.output_dir = os.path.join(WORK_DIR, "generated")
+    voice_service.describe_audio = lambda path: None
+    voice_service_module.combine_audio_files = fake_combine
+
+
+def client_headers(number):
+    """Headers of a request from its own signed-in user."""
+    with app.app_context():
+        token = create_access_token(identity=str(number + 1))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def client_address(number):
+    """Address of the client sending a request, one per request."""
+    return f"10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}"
+
+
+def percentile(latencies, fraction):
+    """Latency below which the given fraction of requests finished."""
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_sync(requests):
+    """Serve the requests with SYNC_WORKERS requests at a time."""
+    client = app.test_client()
+    headers = [client_headers(number) for number in range(requests)]
+
+    def request_story(number):
+        start = time.perf_counter()
+        response = client.post(
+            "/api/voice/generate-story", json=STORY_REQUEST, headers=headers[number],
+            environ_base={"REMOTE_ADDR": client_address(number)}
+        )
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        return list(executor.map(request_story, range(requests)))
+
+
+async def run_async(requests, concurrency):
+    """Serve the requests through the ASGI app, concurrency requests at a time."""
+    application = create_application()
+    semaphore = asyncio.Semaphore(concurrency)
+    body = json.dumps(STORY_REQUEST).encode()
+    headers = [client_headers(number) for number in range(requests)]
+
+    async def request_story(number):
+        async with semaphore:
+            start = time.perf_counter()
+            messages = [{"type": "http.request", "body": body}]
+            sent = []
+
+            async def receive():
+                return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+
+            await application({
+                "type": "http",
+                "http_version": "1.1",
+                "method": "POST",
+                "path": "/api/voice/generate-story",
+                "query_string": b"",
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + [
+                    (name.lower().encode(), value.encode()) for name, value in headers[number].items()
+                ],
+                "client": (client_address(number), 5000),
+                "server": ("localhost", 5001)
+            }, receive, send)
+            assert sent[0]["status"] == 200, sent
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(request_story(number) for number in range(requests)))
+
+
+def report(mode, requests, concurrency, elapsed, latencies):
+    """Print one result row."""
+    print(
+        f"{mode:<6} {requests:>8} {concurrency:>11} {elapsed:>9.2f} {requests / elapsed:>9.1f} "
+        f"{percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.95):>8.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="stories per mode")
+    parser.add_argument("--concurrency", type=int, default=100, help="requests in flight in async mode")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="seconds per Gemini call")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="seconds per TTS call")
+    args = parser.parse_args()
+
+    install_fakes(args.gemini_latency, args.tts_latency)
+    print(f"Gemini {args.gemini_latency:.2f}s, TTS {args.tts_latency:.2f}s per call, {PARAGRAPHS} paragraphs per story")
+    print(f"{'mode':<6} {'requests':>8} {'concurrency':>11} {'seconds':>9} {'req/s':>9} {'p50':>8} {'p95':>8}")
+
+    start = time.perf_counter()
+    latencies = run_sync(args.requests)
+    report("sync", args.requests, SYNC_WORKERS, time.perf_counter() - start, latencies)
+
+    start = time.perf_counter()
+    latencies = asyncio.run(run_async(args.requests, args.concurrency))
+    report("async", args.requests, args.concurrency, time.perf_counter() - start, latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark of login throughput and its effect on story generation latency
+
+A burst of logins runs against the Flask app while story requests (with the
+fake Gemini and TTS upstreams of bench_async.py) are served alongside them,
+once with bcrypt in the request threads and once in the password hashing
+pool, plus a baseline without logins:
+
+- inline: PASSWORD_HASH_WORKERS=0, bcrypt runs in the request thread
+- pool: bcrypt runs in the bounded pool of lower-priority processes
+
+Usage:
+    python backend/benchmarks/bench_login.py --seconds 10 --login-threads 8
+"""
+import time
+import argparse
+import threading
+
+# Sets up the temporary database and the fake upstreams before the app is imported
+from bench_async import STORY_REQUEST, install_fakes, percentile
+
+from backend.app import app
+from backend.models import db, User
+from backend.services.password_hasher import BCRYPT_LOG_ROUNDS, PASSWORD_HASH_WORKERS, password_hasher
+
+USERNAME = "bench"
+PASSWORD = "bench-password"
+
+
+def create_user():
+    """Create the user the logins sign in as"""
+    with app.app_context():
+        if not User.query.filter_by(username=USERNAME).first():
+            user = User(username=USERNAME, email="bench@example.com")
+            user.set_password(PASSWORD)
+            db.session.add(user)
+            db.session.commit()
+
+
+def run(seconds, login_threads, story_threads):
+    """
+    Serve logins and story requests side by side
+
+    Returns:
+        Tuple of (logins per second, refused logins, story latencies)
+    """
+    client = app.test_client()
+    stop = time.perf_counter() + seconds
+    logins, refused, latencies = [], [], []
+    lock = threading.Lock()
+
+    def login():
+        while time.perf_counter() < stop:
+            response = client.post("/api/auth/login", json={"username_or_email": USERNAME, "password": PASSWORD})
+            with lock:
+                (logins if response.status_code == 200 else refused).append(response.status_code)
+
+    def story():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            response = client.post("/api/voice/generate-story", json=STORY_REQUEST)
+            assert response.status_code == 200, response.get_data(as_text=True)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=login) for _ in range(login_threads)]
+    threads += [threading.Thread(target=story) for _ in range(story_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(logins) / seconds, len(refused), latencies
+
+
+def report(mode, result):
+    """Print one result row"""
+    rate, refused, latencies = result
+    print(
+        f"{mode:<9} {rate:>9.1f} {refused:>8} {len(latencies):>8} "
+        f"{percentile(latencies, 0.5):>8.3f} {percentile(latencies, 0.95):>8.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each mode")
+    parser.add_argument("--login-threads", type=int, default=8, help="clients logging in continuously")
+    parser.add_argument("--story-threads", type=int, default=2, help="clients generating stories continuously")
+    parser.add_argument("--gemini-latency", type=float, default=0.2, help="seconds per Gemini call")
+    parser.add_argument("--tts-latency", type=float, default=0.05, help="seconds per TTS call")
+    args = parser.parse_args()
+
+    install_fakes(args.gemini_latency, args.tts_latency)
+    create_user()
+    print(f"bcrypt work factor {BCRYPT_LOG_ROUNDS}, {max(1, PASSWORD_HASH_WORKERS)} pool process(es)")
+    print(f"{'mode':<9} {'logins/s':>9} {'refused':>8} {'stories':>8} {'p50':>8} {'p95':>8}")
+
+    report("baseline", run(args.seconds, 0, args.story_threads))
+
+    password_hasher.workers = 0
+    report("inline", run(args.seconds, args.login_threads, args.story_threads))
+
+    password_hasher.workers = max(1, PASSWORD_HASH_WORKERS)
+    password_hasher.check(PASSWORD, password_hasher.hash(PASSWORD))  # Start the pool outside the measurement
+    report("pool", run(args.seconds, args.login_threads, args.story_threads))
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
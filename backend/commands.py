@@ -0,0 +1,133 @@
+"""
+Command line tools for StorySpark
+
+This module defines Flask CLI commands for offline maintenance tasks.
+Run them with: flask --app backend.app <command>
+"""
+import logging
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .models.story import Story, db
+from .services.voice_service import voice_service
+from .services import catalog
+from .services.compression import precompress_directory, available_encodings
+from .services.audio_gc import audio_collector
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@click.command('package-hls')
+@click.option('--force', is_flag=True, help='Repackage stories that already have an HLS playlist.')
+@click.option('--limit', type=int, default=None, help='Maximum number of stories to package.')
+@with_appcontext
+def package_hls_command(force, limit):
+    """Package the narration of existing stories as HLS renditions."""
+    query = Story.query.filter(Story.audio_path.isnot(None))
+    if not force:
+        query = query.filter(Story.hls_path.is_(None))
+    if limit:
+        query = query.limit(limit)
+
+    packaged = 0
+    failed = 0
+    for story in query.all():
+        hls_path = voice_service.package_hls(story.audio_path)
+        if not hls_path:
+            failed += 1
+            click.echo(f"Story {story.id}: packaging failed for {story.audio_path}")
+            continue
+
+        story.hls_path = hls_path
+        db.session.commit()
+        packaged += 1
+        click.echo(f"Story {story.id}: {hls_path}")
+
+    click.echo(f"Packaged {packaged} stories ({failed} failed)")
+
+
+def _split(value):
+    """Split a comma-separated option value"""
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+@click.command('pregenerate-catalog')
+@click.option('--themes', help='Comma-separated themes (default: themes from frontend/src/data/themes.js).')
+@click.option('--age-groups', help='Comma-separated age groups (default: 3-5,5-8,8-12).')
+@click.option('--durations', help='Comma-separated durations (default: short,medium,long).')
+@click.option('--languages', help='Comma-separated language codes (default: en).')
+@click.option('--variants', type=int, default=1, show_default=True, help='Stories per parameter combination.')
+@click.option('--workers', type=int, default=4, show_default=True, help='Worker processes.')
+@click.option('--rate-limit', type=float, default=10, show_default=True, help='Maximum stories started per minute.')
+@click.option('--dry-run', is_flag=True, help='List the stories that would be generated.')
+@with_appcontext
+def pregenerate_catalog_command(themes, age_groups, durations, languages, variants, workers, rate_limit, dry_run):
+    """Pre-generate narrated public stories for a matrix of parameters.
+
+    Stories that already exist are skipped, so an interrupted run can be
+    resumed by running the command again.
+    """
+    entries = catalog.build_matrix(
+        themes=_split(themes) or catalog.load_themes(),
+        age_groups=_split(age_groups) or catalog.DEFAULT_AGE_GROUPS,
+        durations=_split(durations) or catalog.DEFAULT_DURATIONS,
+        languages=_split(languages) or catalog.DEFAULT_LANGUAGES,
+        variants=variants
+    )
+
+    if dry_run:
+        existing = {key for (key,) in db.session.query(Story.catalog_key).filter(Story.catalog_key.isnot(None))}
+        for entry in entries:
+            click.echo(f"{'exists ' if entry['catalog_key'] in existing else 'pending'} {entry['catalog_key']}")
+        return
+
+    click.echo(f"Catalog has {len(entries)} entries; generating with {workers} workers at up to {rate_limit}/min")
+    counts = catalog.pregenerate(
+        entries,
+        workers=workers,
+        rate_per_minute=rate_limit,
+        on_progress=lambda key, outcome: click.echo(f"{outcome:9} {key}")
+    )
+    click.echo(f"Generated {counts['generated']}, skipped {counts['skipped']} existing, {counts['failed']} failed")
+
+
+@click.command('precompress-static')
+@click.option('--directory', type=click.Path(exists=True, file_okay=False),
+              help='Frontend build directory (default: the app static folder).')
+@click.option('--force', is_flag=True, help='Rewrite compressed copies that are up to date.')
+@with_appcontext
+def precompress_static_command(directory, force):
+    """Write .br and .gz copies of the frontend build for direct serving"""
+    directory = directory or current_app.static_folder
+    counts = precompress_directory(directory, force=force)
+    saved = counts['original_bytes'] - counts['compressed_bytes']
+    click.echo(
+        f"Compressed {counts['files']} files ({', '.join(available_encodings())}), "
+        f"{counts['skipped']} up to date; {counts['original_bytes']} -> {counts['compressed_bytes']} bytes "
+        f"({saved} saved)"
+    )
+
+
+@click.command('gc-audio')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without removing it.')
+@click.option('--grace-hours', type=float, default=None,
+              help='Keep unreferenced files used within this many hours (default: AUDIO_GC_GRACE_HOURS).')
+@with_appcontext
+def gc_audio_command(dry_run, grace_hours):
+    """Remove generated audio that no story refers to"""
+    if grace_hours is not None:
+        audio_collector.grace_period = grace_hours * 3600
+    counts = audio_collector.collect(dry_run=dry_run)
+    click.echo(
+        f"{'Would remove' if dry_run else 'Removed'} {counts['removed']} of {counts['scanned']} entries "
+        f"({counts['bytes_reclaimed']} bytes reclaimed), kept {counts['kept']}; {counts['errors']} errors"
+    )
+
+
+def register_commands(app):
+    """Register the CLI commands with the Flask app"""
+    app.cli.add_command(package_hls_command)
+    app.cli.add_command(pregenerate_catalog_command)
+    app.cli.add_command(precompress_static_command)
+    app.cli.add_command(gc_audio_command)
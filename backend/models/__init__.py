@@ -7,6 +7,7 @@ Models include:
 - StoryMetadata: Additional data about generated stories
 """
 
+from sqlalchemy import inspect, text
 from .user import db, bcrypt, User, UserPreference
 from .story import Story, StoryMetadata
 
@@ -19,3 +20,31 @@ def init_db(app):
     # Create tables if they don't exist
     with app.app_context():
         db.create_all()
+        add_missing_columns()
+
+def add_missing_columns():
+    """
+    Add columns that were introduced after a table was created
+    
+    db.create_all() does not alter existing tables, so new nullable columns
+    and their indexes are added here to keep existing databases usable.
+    """
+    inspector = inspect(db.engine)
+    
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        db.session.commit()
+        
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=db.engine)
@@ -15,6 +15,12 @@ class Story(db.Model):
     title = db.Column(db.String(255), nullable=False)
     content = db.Column(db.Text, nullable=False)
     audio_path = db.Column(db.String(255), nullable=True)
+    hls_path = db.Column(db.String(255), nullable=True)  # HLS master playlist
+    content_hash = db.Column(db.String(64), nullable=True)  # Hash of the narrated title and text
+    catalog_key = db.Column(db.String(255), nullable=True, index=True)  # Set for pre-generated catalog stories
+    served_at = db.Column(db.DateTime, nullable=True)  # When a catalog story was served from the pool
+    narration_status = db.Column(db.String(20), nullable=True)  # "ready", "pending" or "failed"; None for older stories
+    sequence_id = db.Column(db.String(32), nullable=True)  # Stored sound sequence of a streamed or pending narration
     theme = db.Column(db.String(100), nullable=True)
     duration = db.Column(db.String(50), nullable=True)  # "short", "medium", "long"
     age_group = db.Column(db.String(50), nullable=True)  # "3-5", "6-8", etc.
@@ -35,6 +41,8 @@ class Story(db.Model):
             'title': self.title,
             'content': self.content,
             'audio_path': self.audio_path,
+            'hls_path': self.hls_path,
+            'narration_status': self.narration_status,
             'theme': self.theme,
             'duration': self.duration,
             'age_group': self.age_group,
@@ -56,14 +64,18 @@ class StoryMetadata(db.Model):
     prompt_used = db.Column(db.Text, nullable=True)
     generation_time = db.Column(db.Float, nullable=True)  # Time in seconds
     
-    # Emotional markers - stored as JSON string
-    emotional_markers = db.Column(db.Text, nullable=True)  # JSON string with paragraph-level emotions
+    # Emotional markers - stored as JSON (rows written as JSON text load unchanged)
+    emotional_markers = db.Column(db.JSON, nullable=True)  # Paragraph-level emotions
     
-    # Sound effects - stored as JSON string
-    sound_effects = db.Column(db.Text, nullable=True)  # JSON string with sound effect mappings
+    # Sound effects - stored as JSON
+    sound_effects = db.Column(db.JSON, nullable=True)  # Sound effect mappings
     
-    # Cultural elements - stored as JSON string
-    cultural_elements = db.Column(db.Text, nullable=True)  # JSON string with cultural element markers
+    # Cultural elements - stored as JSON
+    cultural_elements = db.Column(db.JSON, nullable=True)  # Cultural element markers
+    
+    # Rendered narration - exact length and waveform envelope
+    audio_duration = db.Column(db.Float, nullable=True)  # Length in seconds
+    waveform_peaks = db.Column(db.JSON, nullable=True)  # Peaks from 0.0 to 1.0
     
     def to_dict(self):
         """Convert metadata object to dictionary"""
@@ -74,5 +86,7 @@ class StoryMetadata(db.Model):
             'generation_time': self.generation_time,
             'emotional_markers': self.emotional_markers,
             'sound_effects': self.sound_effects,
-            'cultural_elements': self.cultural_elements
+            'cultural_elements': self.cultural_elements,
+            'audio_duration': self.audio_duration,
+            'waveform_peaks': self.waveform_peaks
         }
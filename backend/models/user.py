@@ -31,12 +31,27 @@ class User(db.Model):
     stories = db.relationship('Story', backref='creator', lazy=True)
     
     def set_password(self, password):
-        """Hash and set the user password"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        """Hash and set the user password (in the password hashing pool)"""
+        from ..services.password_hasher import password_hasher
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check if the provided password matches the stored hash"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        """Check if the provided password matches the stored hash (in the password hashing pool)"""
+        from ..services.password_hasher import password_hasher
+        return password_hasher.check(password, self.password_hash)
+    
+    def rehash_password(self, password):
+        """
+        Hash a verified password again if its stored hash uses another work factor
+        
+        Returns:
+            True if the stored hash was replaced
+        """
+        from ..services.password_hasher import password_hasher
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        self.set_password(password)
+        return True
     
     def to_dict(self):
         """Convert user object to dictionary (excludes password)"""
@@ -1,8 +1,9 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..models.story import Story, StoryMetadata, db
 from ..models.user import User
-from ..utils.auth import get_current_user
+from ..services.story_cache import story_response_cache
+from ..utils.auth import get_user_context
 
 # Create a Blueprint for API routes
 api = Blueprint('api', __name__)
@@ -16,31 +17,32 @@ def get_stories():
     - public_only: If 'true', return only public stories
     """
     # Get current user (if authenticated)
-    current_user = get_current_user()
+    current_user = get_user_context()
     
     # Check if we should return only public stories
     public_only = request.args.get('public_only', 'false').lower() == 'true'
     
+    # Pre-generated stories still waiting in the story pool are not listed
+    listed = Story.catalog_key.is_(None) | Story.served_at.isnot(None)
+    
     # Query stories
     if current_user and not public_only:
         # Return both public stories and user's private stories
         stories = Story.query.filter(
-            (Story.user_id == current_user.id) | (Story.user_id.is_(None))
-        ).order_by(Story.created_at.desc()).all()
+            (Story.user_id == current_user.id) | (Story.user_id.is_(None)), listed
+        ).order_by(Story.created_at.desc())
     else:
         # Return only public stories
-        stories = Story.query.filter(Story.user_id.is_(None)).order_by(Story.created_at.desc()).all()
-    
-    # Convert to dictionaries
-    stories_data = [story.to_dict() for story in stories]
+        stories = Story.query.filter(Story.user_id.is_(None), listed).order_by(Story.created_at.desc())
     
-    return jsonify(stories_data)
+    # Public stories are answered from their pre-serialized JSON
+    return _json_response(story_response_cache.list_json(stories))
 
 @api.route('/stories/<int:story_id>')
 def get_story(story_id):
     """Get a specific story by ID"""
     # Get current user (if authenticated)
-    current_user = get_current_user()
+    current_user = get_user_context()
     
     # Find the story
     story = Story.query.get(story_id)
@@ -59,7 +61,11 @@ def get_story(story_id):
             'message': 'You do not have permission to access this story'
         }), 403
     
-    return jsonify(story.to_dict())
+    return _json_response(story_response_cache.story_json(story))
+
+def _json_response(body):
+    """Response with serialized JSON, as jsonify would return it"""
+    return current_app.response_class(body + b"\n", mimetype='application/json')
 
 @api.route('/stories/<int:story_id>', methods=['DELETE'])
 @jwt_required()
@@ -78,7 +84,7 @@ def delete_story(story_id):
         }), 404
     
     # Check permission - users can only delete their own stories
-    if not story.user_id or story.user_id != user_id:
+    if not story.user_id or story.user_id != int(user_id):
         return jsonify({
             'status': 'error',
             'message': 'You do not have permission to delete this story'
@@ -111,7 +117,7 @@ def get_my_stories():
     user_id = get_jwt_identity()
     
     # Get user's stories
-    stories = Story.query.filter_by(user_id=user_id).order_by(Story.created_at.desc()).all()
+    stories = Story.query.filter_by(user_id=int(user_id)).order_by(Story.created_at.desc()).all()
     
     # Convert to dictionaries
     stories_data = [story.to_dict() for story in stories]
@@ -14,6 +14,10 @@ import datetime
 import logging
 from email_validator import validate_email, EmailNotValidError
 from ..models.user import User, UserPreference, db
+from ..services.metrics import metrics
+from ..services.password_hasher import PasswordHasherBusy
+from ..services.user_cache import user_cache, user_record
+from ..utils.auth import token_claims
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -21,6 +25,17 @@ logger = logging.getLogger(__name__)
 # Create a Blueprint for auth API routes
 auth_api = Blueprint('auth_api', __name__)
 
+@auth_api.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    """Answer requests that could not get a password hashing slot"""
+    db.session.rollback()
+    response = jsonify({
+        'status': 'error',
+        'message': str(e)
+    })
+    response.headers['Retry-After'] = str(int(e.retry_after))
+    return response, 503
+
 @auth_api.route('/register', methods=['POST'])
 def register():
     """
@@ -88,8 +103,11 @@ def register():
         db.session.commit()
         
         # Generate tokens
-        access_token = create_access_token(identity=new_user.id)
-        refresh_token = create_refresh_token(identity=new_user.id)
+        access_token = create_access_token(
+            identity=str(new_user.id),
+            additional_claims=token_claims(user_record(new_user, default_preferences))
+        )
+        refresh_token = create_refresh_token(identity=str(new_user.id))
         
         return jsonify({
             'status': 'success',
@@ -99,6 +117,8 @@ def register():
             'user': new_user.to_dict()
         }), 201
         
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error registering user: {str(e)}")
@@ -147,9 +167,24 @@ def login():
             'message': 'Account is inactive. Please contact support.'
         }), 403
     
+    # Upgrade the stored hash to the configured work factor
+    try:
+        if user.rehash_password(data['password']):
+            db.session.commit()
+            metrics.inc("password_rehashes_total")
+    except PasswordHasherBusy:
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error rehashing password: {str(e)}")
+    
     # Generate tokens
-    access_token = create_access_token(identity=user.id)
-    refresh_token = create_refresh_token(identity=user.id)
+    preferences = user.preferences[0] if user.preferences else None
+    access_token = create_access_token(
+        identity=str(user.id),
+        additional_claims=token_claims(user_record(user, preferences))
+    )
+    refresh_token = create_refresh_token(identity=str(user.id))
     
     return jsonify({
         'status': 'success',
@@ -165,7 +200,10 @@ def login():
 def refresh_token():
     """Refresh access token using a valid refresh token"""
     user_id = get_jwt_identity()
-    access_token = create_access_token(identity=user_id)
+    access_token = create_access_token(
+        identity=user_id,
+        additional_claims=token_claims(user_cache.get(user_id))
+    )
     
     return jsonify({
         'status': 'success',
@@ -237,10 +275,20 @@ def update_preferences():
     
     try:
         db.session.commit()
+        
+        # Drop this worker's cached copy; other workers reload theirs when they
+        # see the new preferences version in the returned token
+        user_cache.invalidate(user_id)
+        access_token = create_access_token(
+            identity=user_id,
+            additional_claims=token_claims(user_cache.get(user_id))
+        )
+        
         return jsonify({
             'status': 'success',
             'message': 'Preferences updated successfully',
-            'preferences': preferences.to_dict()
+            'preferences': preferences.to_dict(),
+            'access_token': access_token
         }), 200
     except Exception as e:
         db.session.rollback()
@@ -290,6 +338,8 @@ def change_password():
             'status': 'success',
             'message': 'Password updated successfully'
         }), 200
+    except PasswordHasherBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error changing password: {str(e)}")
@@ -4,16 +4,22 @@ Voice and Story API routes for StorySpark
 This module defines the API endpoints for voice-related features,
 including story generation and narration.
 """
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
 import os
 import json
+import math
+import time
 import logging
 from datetime import datetime
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..services.voice_service import voice_service, story_generator
+from ..services.voice_service import voice_service, story_generator, AUDIO_FORMATS, negotiate_audio_format
+from ..services.jobs import job_queue
+from ..services.audio_gc import audio_collector
+from ..services.rate_limiter import RateLimited
+from ..services.story_pool import story_pool, INSTANT_SERVE_ENABLED
 from ..models.story import Story, StoryMetadata, db
-from ..models.user import User, UserPreference
-from ..utils.auth import get_current_user
+from ..utils.auth import admin_required, get_user_context
+from ..utils.admission import admission_controlled
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -21,7 +27,57 @@ logger = logging.getLogger(__name__)
 # Create a Blueprint for voice API routes
 voice_api = Blueprint('voice_api', __name__)
 
+# Stories longer than this (in characters) are narrated as background jobs
+NARRATION_ASYNC_THRESHOLD = int(os.environ.get('NARRATION_ASYNC_THRESHOLD', 4000))
+
+# Seconds a request may spend generating and narrating before it answers;
+# segments not synthesized by then are completed in a background job
+STORY_REQUEST_BUDGET = float(os.environ.get('STORY_REQUEST_BUDGET', 50))
+
+
+def schedule_narration(narration_data, audio_format=None, story_id=None, owner=None):
+    """
+    Queue a background job completing a pending narration
+    
+    Args:
+        narration_data: Story or narration data with narration_status "pending"
+        audio_format: Narration format
+        story_id: ID of the saved story to update, if any
+        owner: Identity of the user the job is reported to, if the story is private
+    """
+    job_id = job_queue.submit(
+        story_generator.complete_narration,
+        args=(narration_data['sequence_id'],),
+        kwargs={'audio_format': audio_format, 'story_id': story_id},
+        app=current_app._get_current_object(),
+        description=f"Complete narration {narration_data['sequence_id']}",
+        owner=owner
+    )
+    narration_data['narration_job_id'] = job_id
+    narration_data['status_url'] = f"/api/voice/jobs/{job_id}"
+
+def schedule_hls_packaging(story_data, story_id=None, owner=None):
+    """
+    Queue a background job packaging a rendered narration as HLS
+    
+    Args:
+        story_data: Story data with hls_status "pending"
+        story_id: ID of the saved story to update, if any
+        owner: Identity of the user the job is reported to, if the story is private
+    """
+    job_id = job_queue.submit(
+        story_generator.package_story_hls,
+        args=(story_data['audio_path'],),
+        kwargs={'story_id': story_id},
+        app=current_app._get_current_object(),
+        description=f"Package HLS for {story_data['audio_path']}",
+        owner=owner
+    )
+    story_data['hls_job_id'] = job_id
+    story_data['hls_status_url'] = f"/api/voice/jobs/{job_id}"
+
 @voice_api.route('/generate-story', methods=['POST'])
+@admission_controlled()
 def generate_story():
     """
     Generate a new story based on given parameters
@@ -35,99 +91,259 @@ def generate_story():
     - language: Primary language code (default: "en")
     - child_name: Name of the child for personalization (optional)
     - save: Whether to save the story to the database (default: false)
+    - stream: Return a stream_url for progressive playback instead of
+      waiting for the full audio (default: false)
+    - audio_format: Narration format, "mp3" or "ogg_opus" (default: AUDIO_FORMAT setting)
+    - bypass_cache: Call the model even if the same request was answered
+      before (default: false)
+    - instant: Serve a matching pre-generated story when one is available
+      (default: INSTANT_SERVE setting); ignored when characters or a
+      setting are given
     
     Returns:
-        JSON with story data including title, text, and audio path
+        JSON with story data including title, text, and audio path. When part
+        of the narration could not be synthesized within the request's time
+        budget, or the narration is streamed, narration_status is "pending"
+        and status_url reports the background job that renders it (with its
+        audio_duration and waveform). With HLS packaging on,
+        hls_status is "pending" and hls_status_url reports the job that
+        writes the playlist
     """
     try:
-        # Get request data
-        data = request.json or {}
-        
-        # Get current user (if authenticated)
-        current_user = get_current_user()
+        deadline = time.monotonic() + STORY_REQUEST_BUDGET
+        generation_start = datetime.utcnow()
+        data, current_user, story_data = _begin_story_request()
         
-        # Use user preferences if available and not overridden
-        if current_user:
-            user_prefs = UserPreference.query.filter_by(user_id=current_user.id).first()
-            if user_prefs:
-                if 'language' not in data and user_prefs.preferred_language:
-                    data['language'] = user_prefs.preferred_language
-                if 'child_name' not in data and user_prefs.child_name:
-                    data['child_name'] = user_prefs.child_name
+        # Generate the story
+        if story_data is None:
+            story_data = story_generator.generate_story(**_story_generation_args(data, deadline))
         
-        # Track generation start time
+        generation_time = (datetime.utcnow() - generation_start).total_seconds()
+        return _finish_story_request(data, current_user, story_data, generation_time)
+    
+    except Exception as e:
+        return _story_error_response(e)
+
+@admission_controlled()
+async def generate_story_async():
+    """
+    Generate a new story like generate_story, awaiting Gemini and TTS
+    
+    Served for POST /api/voice/generate-story by the ASGI app in backend/asgi.py,
+    so that waiting for the upstreams does not hold a worker.
+    
+    Returns:
+        JSON with story data, as generate_story
+    """
+    try:
+        deadline = time.monotonic() + STORY_REQUEST_BUDGET
         generation_start = datetime.utcnow()
+        data, current_user, story_data = _begin_story_request()
         
-        # Check if Gemini model is initialized
-        logger.info(f"Gemini model initialized: {story_generator.gemini_model is not None}")
+        if story_data is None:
+            # Hand the database connection back to the pool while waiting for the upstreams
+            db.session.close()
+            story_data = await story_generator.generate_story_async(**_story_generation_args(data, deadline))
         
-        # Generate the story
-        story_data = story_generator.generate_story(
-            theme=data.get('theme'),
-            characters=data.get('characters'),
-            setting=data.get('setting'),
-            duration=data.get('duration', 'medium'),
+        generation_time = (datetime.utcnow() - generation_start).total_seconds()
+        return _finish_story_request(data, current_user, story_data, generation_time)
+    
+    except Exception as e:
+        return _story_error_response(e)
+
+def _begin_story_request():
+    """
+    Read a generate-story request, filling in the user's preferences
+    
+    Returns:
+        Tuple of (request data, current user or None, story served from the
+        pre-generated pool or None)
+    """
+    # Get request data
+    data = request.json or {}
+    
+    # Get current user (if authenticated), from the token claims and the user cache
+    current_user = get_user_context()
+    
+    # Use user preferences if available and not overridden
+    if current_user:
+        if 'language' not in data and current_user.preferred_language:
+            data['language'] = current_user.preferred_language
+        if 'child_name' not in data and current_user.child_name:
+            data['child_name'] = current_user.child_name
+    
+    # Check if Gemini model is initialized
+    logger.info(f"Gemini model initialized: {story_generator.gemini_model is not None}")
+    
+    # Serve a pre-generated story if one matches the request
+    story_data = None
+    instant = data.get('instant', INSTANT_SERVE_ENABLED)
+    if instant and data.get('theme') and not data.get('characters') and not data.get('setting'):
+        story_data = story_pool.serve(
+            theme=data['theme'],
             age_group=data.get('age_group', '5-8'),
+            duration=data.get('duration', 'medium'),
             language=data.get('language', 'en'),
-            child_name=data.get('child_name')
+            child_name=data.get('child_name'),
+            app=current_app._get_current_object()
         )
+    
+    return data, current_user, story_data
+
+def _story_generation_args(data, deadline):
+    """Arguments of StoryGenerator.generate_story for a generate-story request"""
+    return {
+        'theme': data.get('theme'),
+        'characters': data.get('characters'),
+        'setting': data.get('setting'),
+        'duration': data.get('duration', 'medium'),
+        'age_group': data.get('age_group', '5-8'),
+        'language': data.get('language', 'en'),
+        'child_name': data.get('child_name'),
+        'stream': bool(data.get('stream', False)),
+        'audio_format': data.get('audio_format'),
+        'use_cache': not data.get('bypass_cache', False),
+        'deadline': deadline
+    }
+
+def _finish_story_request(data, current_user, story_data, generation_time):
+    """
+    Save a generated story if requested and answer the request
+    
+    Args:
+        data: Request data
+        current_user: Signed-in user context, or None
+        story_data: Generated story
+        generation_time: Seconds spent generating the story
         
-        # Track generation end time
-        generation_time = (datetime.utcnow() - generation_start).total_seconds()
-        
-        # Save to database if requested
-        if data.get('save', False) and current_user:
-            try:
-                # Create new story record
-                story = Story(
-                    title=story_data.get('title', 'Untitled Story'),
-                    content=story_data.get('text', ''),
-                    audio_path=story_data.get('audio_path'),
-                    theme=data.get('theme'),
-                    duration=data.get('duration', 'medium'),
-                    age_group=data.get('age_group', '5-8'),
-                    language=data.get('language', 'en'),
-                    user_id=current_user.id
-                )
-                
-                # Create metadata
-                metadata = StoryMetadata(
-                    prompt_used=json.dumps(data),
-                    generation_time=generation_time,
-                    emotional_markers=json.dumps(story_data.get('emotions', {})),
-                    sound_effects=json.dumps(story_data.get('sound_effects', {})),
-                    cultural_elements=json.dumps(story_data.get('cultural_elements', {}))
-                )
-                
-                story.story_metadata = metadata
-                
-                # Save to database
-                db.session.add(story)
-                db.session.commit()
-                
-                # Update story_data with database ID
-                story_data['id'] = story.id
-                story_data['saved'] = True
+    Returns:
+        JSON response with the story
+    """
+    # A streamed narration is only a stored sequence, so its audio file,
+    # measurements and HLS renditions are rendered in the background
+    if story_data.get('sequence_id') and not story_data.get('audio_path'):
+        story_data['narration_status'] = 'pending'
+    
+    # Save to database if requested
+    if data.get('save', False) and current_user and current_user.record:
+        try:
+            # Create new story record
+            story = Story(
+                title=story_data.get('title', 'Untitled Story'),
+                content=story_data.get('text', ''),
+                audio_path=story_data.get('audio_path'),
+                hls_path=story_data.get('hls_path'),
+                content_hash=story_data.get('content_hash'),
+                narration_status=story_data.get('narration_status'),
+                sequence_id=story_data.get('sequence_id'),
+                theme=data.get('theme'),
+                duration=data.get('duration', 'medium'),
+                age_group=data.get('age_group', '5-8'),
+                language=data.get('language', 'en'),
+                user_id=current_user.id
+            )
+            
+            # Create metadata
+            metadata = StoryMetadata(
+                prompt_used=json.dumps(dict(data, prompt_version=story_data.get('prompt_version'))),
+                generation_time=generation_time,
+                emotional_markers=story_data.get('emotions', {}),
+                sound_effects=story_data.get('sound_effects', {}),
+                cultural_elements=story_data.get('cultural_elements', {}),
+                audio_duration=story_data.get('audio_duration'),
+                waveform_peaks=story_data.get('waveform') or []
+            )
+            
+            story.story_metadata = metadata
             
-            except Exception as e:
-                logger.error(f"Error saving story to database: {str(e)}")
-                db.session.rollback()
-                # Continue without saving
-                story_data['saved'] = False
+            # Save to database
+            db.session.add(story)
+            db.session.commit()
+            
+            # Update story_data with database ID
+            story_data['id'] = story.id
+            story_data['saved'] = True
         
-        return jsonify({
-            'status': 'success',
-            'story': story_data
+        except Exception as e:
+            logger.error(f"Error saving story to database: {str(e)}")
+            db.session.rollback()
+            # Continue without saving
+            story_data['saved'] = False
+    
+    # Synthesize the rest of the narration in the background
+    story_id = story_data['id'] if story_data.get('saved') else None
+    owner = str(current_user.id) if current_user else None
+    if story_data.get('narration_status') == 'pending':
+        schedule_narration(story_data, audio_format=data.get('audio_format'), story_id=story_id, owner=owner)
+    
+    # Package the narration for adaptive streaming in the background
+    if story_data.get('hls_status') == 'pending':
+        schedule_hls_packaging(story_data, story_id=story_id, owner=owner)
+    
+    return jsonify({
+        'status': 'success',
+        'story': story_data
+    })
+
+def _story_error_response(e):
+    """Response for a generate-story request that failed"""
+    if isinstance(e, RateLimited):
+        logger.warning(f"Story generation turned away: {str(e)}")
+        response = jsonify({
+            'status': 'error',
+            'message': 'Story generation is busy right now, please try again shortly'
         })
+        response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+        return response, 429
     
-    except Exception as e:
-        logger.error(f"Error generating story: {str(e)}")
+    logger.error(f"Error generating story: {str(e)}")
+    return jsonify({
+        'status': 'error',
+        'message': str(e)
+    }), 500
+
+@voice_api.route('/stream/<sequence_id>', methods=['GET'])
+@admission_controlled()
+def stream_narration(sequence_id):
+    """
+    Stream the narration of a generated story as it is synthesized
+    
+    Path parameters:
+    - sequence_id: ID from the stream_url returned by generate-story
+    
+    Query parameters:
+    - format: "mp3" or "ogg_opus" (default: negotiated from the Accept header)
+    
+    Returns:
+        Chunked audio, one chunk per narrated paragraph
+    """
+    sequence = voice_service.load_sequence(sequence_id)
+    if not sequence:
         return jsonify({
             'status': 'error',
-            'message': str(e)
-        }), 500
+            'message': 'Narration not found'
+        }), 404
+    
+    audio_format = negotiate_audio_format(request.accept_mimetypes, request.args.get('format'))
+    audio_stream = voice_service.stream_sound_sequence(
+        sequence['items'],
+        voice_id=sequence['voice_id'],
+        audio_format=audio_format
+    )
+    
+    return Response(
+        stream_with_context(audio_stream),
+        mimetype=AUDIO_FORMATS[audio_format]['mime_type'],
+        headers={
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept',
+            # Stop nginx from buffering the response before sending it on
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @voice_api.route('/narrate-story/<story_id>', methods=['GET'])
+@admission_controlled()
 def narrate_story(story_id):
     """
     Generate narration for an existing story
@@ -135,30 +351,181 @@ def narrate_story(story_id):
     Path parameters:
     - story_id: ID of the story to narrate
     
+    Query parameters:
+    - async: 'true' to narrate in a background job, 'false' to wait for the
+      narration (default: background job for long stories)
+    - format: "mp3" or "ogg_opus" (default: AUDIO_FORMAT setting)
+    
     Returns:
-        JSON with narration data including audio path
+        JSON with narration data including audio path, or with a job ID
+        (HTTP 202) when narrating in the background
     """
     try:
+        story, audio_format, response = _begin_narration_request(story_id)
+        if response is not None:
+            return response
+        
         # Generate narration for the story
-        narration_data = story_generator.narrate_existing_story(story_id)
+        narration_data = story_generator.narrate_existing_story(
+            story.id, audio_format=audio_format, deadline=time.monotonic() + STORY_REQUEST_BUDGET
+        )
+        return _finish_narration_request(story, audio_format, narration_data)
+    
+    except Exception as e:
+        return _narration_error_response(e)
+
+@admission_controlled()
+async def narrate_story_async(story_id):
+    """
+    Generate narration for an existing story like narrate_story, awaiting TTS
+    
+    Served for GET /api/voice/narrate-story/<story_id> by the ASGI app in
+    backend/asgi.py.
+    
+    Returns:
+        JSON with narration data or a job ID, as narrate_story
+    """
+    try:
+        story, audio_format, response = _begin_narration_request(story_id)
+        if response is not None:
+            return response
         
-        return jsonify({
-            'status': 'success',
-            'narration': narration_data
-        })
+        narration_data = await story_generator.narrate_existing_story_async(
+            story.id, audio_format=audio_format, deadline=time.monotonic() + STORY_REQUEST_BUDGET
+        )
+        return _finish_narration_request(story, audio_format, narration_data)
+    
+    except Exception as e:
+        return _narration_error_response(e)
+
+def _begin_narration_request(story_id):
+    """
+    Check a narrate-story request, queueing it as a background job if it should run there
     
-    except ValueError as e:
+    Returns:
+        Tuple of (story, audio format, response), where response is set if
+        the request has already been answered
+    """
+    story = Story.query.get(story_id)
+    if not story:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'Story not found'
+        }), 404)
+    
+    # Users can only narrate their own stories or public stories
+    current_user = get_user_context()
+    if story.user_id and (not current_user or story.user_id != current_user.id):
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'You do not have permission to narrate this story'
+        }), 403)
+    
+    audio_format = request.args.get('format')
+    run_async = request.args.get('async')
+    if run_async is None:
+        run_async = len(story.content or '') > NARRATION_ASYNC_THRESHOLD
+    else:
+        run_async = run_async.lower() == 'true'
+    
+    if run_async:
+        job_id = job_queue.submit(
+            story_generator.narrate_existing_story,
+            args=(story.id,),
+            kwargs={'audio_format': audio_format, 'retry_pending': True},
+            app=current_app._get_current_object(),
+            description=f"Narrate story {story.id}",
+            owner=_story_owner(story)
+        )
+        return story, audio_format, (jsonify({
+            'status': 'accepted',
+            'job_id': job_id,
+            'status_url': f"/api/voice/jobs/{job_id}"
+        }), 202)
+    
+    return story, audio_format, None
+
+def _finish_narration_request(story, audio_format, narration_data):
+    """Answer a narrate-story request, completing a pending narration in the background"""
+    if narration_data.get('narration_status') == 'pending':
+        schedule_narration(narration_data, audio_format=audio_format, story_id=story.id, owner=_story_owner(story))
+    
+    return jsonify({
+        'status': 'success',
+        'narration': narration_data
+    })
+
+def _story_owner(story):
+    """Identity of the user a job about a story is reported to, or None for a public story"""
+    return str(story.user_id) if story.user_id else None
+
+def _narration_error_response(e):
+    """Response for a narrate-story request that failed"""
+    if isinstance(e, ValueError):
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 404
     
-    except Exception as e:
-        logger.error(f"Error narrating story: {str(e)}")
+    logger.error(f"Error narrating story: {str(e)}")
+    return jsonify({
+        'status': 'error',
+        'message': str(e)
+    }), 500
+
+@voice_api.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Get the status of a background job
+    
+    Path parameters:
+    - job_id: ID returned when the job was queued
+    
+    Returns:
+        JSON with the job status ("queued", "running", "succeeded" or "failed")
+        and its result or error. Jobs about a private story are only reported
+        to its owner; anyone else gets a 404 as for an unknown job
+    """
+    job = job_queue.get(job_id)
+    owner = job.pop('owner', None) if job else None
+    current_user = get_user_context()
+    if not job or (owner is not None and (not current_user or str(current_user.id) != owner)):
         return jsonify({
             'status': 'error',
-            'message': str(e)
-        }), 500
+            'message': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
+
+@voice_api.route('/gc', methods=['POST'])
+@admin_required()
+def collect_generated_audio():
+    """
+    Queue garbage collection of unreferenced generated audio (admin only)
+    
+    Query parameters:
+    - dry_run: "true" to only report what would be removed
+    
+    Returns:
+        202 with the job ID and status URL; the job result has the counts of
+        removed files and reclaimed bytes
+    """
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    job_id = job_queue.submit(
+        audio_collector.collect,
+        kwargs={'dry_run': dry_run},
+        app=current_app._get_current_object(),
+        description="Collect unreferenced generated audio",
+        owner=str(get_jwt_identity())
+    )
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job_id,
+        'status_url': f"/api/voice/jobs/{job_id}"
+    }), 202
 
 @voice_api.route('/available-voices', methods=['GET'])
 def get_available_voices():
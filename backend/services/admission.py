@@ -0,0 +1,214 @@
+"""
+Admission Control Module for StorySpark
+
+This module decides whether an expensive request (story generation,
+narration) may start, so that one client looping on an endpoint cannot
+occupy every worker. Each running request holds a lease in the shared
+store. A request is admitted only if its client (user or IP address) is
+below its concurrency limit and its priority class is below its share of
+the host's generation slots.
+
+Priority classes are weighted: a class and the classes below it may
+together use slots * weight / max weight of the slots, and never all of
+them, so the slots left over are reserved for higher classes. With at least
+two slots, requests from signed-in users saving stories therefore always
+find a free slot, whatever members and anonymous previews hold.
+
+Admission is immediate: there is no queue, so requests that are not
+admitted are refused at once, before any database or upstream work, with a
+retry-after hint. Fairness between clients comes only from the per-client
+limits, which keep any one client from holding more than its share of the
+slots; which of several retrying clients gets a freed slot is not
+scheduled. Leases expire after ADMISSION_LEASE_TTL seconds so that a
+crashed worker does not hold its slots forever.
+"""
+import os
+import math
+import time
+import uuid
+import logging
+from typing import Callable, Dict, Optional
+
+from .metrics import metrics
+from .shared_store import SharedStore, shared_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Whether admission control is applied
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('true', '1', 't')
+
+# Generation requests that may run at once on this host (one per gunicorn worker)
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', 4))
+
+# Generation requests that may run at once on this host under the ASGI server
+# (backend.asgi), where a request waiting for Gemini or TTS does not pin a worker
+ADMISSION_ASGI_SLOTS = int(os.environ.get('ADMISSION_ASGI_SLOTS', 200))
+
+# Requests that may run at once per signed-in user and per IP address
+ADMISSION_USER_LIMIT = int(os.environ.get('ADMISSION_USER_LIMIT', 2))
+ADMISSION_IP_LIMIT = int(os.environ.get('ADMISSION_IP_LIMIT', 4))
+
+# Seconds after which a lease is dropped; above the worker timeout
+ADMISSION_LEASE_TTL = float(os.environ.get('ADMISSION_LEASE_TTL', 150))
+
+# Seconds refused clients are asked to wait before retrying
+ADMISSION_RETRY_AFTER = float(os.environ.get('ADMISSION_RETRY_AFTER', 10))
+
+# Priority classes, from most to least important, and their weights
+PRIORITY_SAVE = "save"
+PRIORITY_MEMBER = "member"
+PRIORITY_PREVIEW = "preview"
+PRIORITY_WEIGHTS = {PRIORITY_SAVE: 3, PRIORITY_MEMBER: 2, PRIORITY_PREVIEW: 1}
+
+metrics.describe("admission_admitted_total", "counter", "Generation requests admitted")
+metrics.describe("admission_rejected_client_total", "counter", "Generation requests refused because their client was at its limit")
+metrics.describe("admission_rejected_busy_total", "counter", "Generation requests refused because their priority class had no free slot")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS admission_leases ("
+    "id TEXT PRIMARY KEY, user_key TEXT, ip TEXT, priority TEXT NOT NULL, expires REAL NOT NULL)"
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request may not start now"""
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        """
+        Args:
+            message: Explanation for the client
+            status_code: 429 if the client is at its own limit, 503 if the host is busy
+            retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Concurrency limits per client and weighted slots per priority class
+    """
+
+    def __init__(
+        self,
+        slots: int = ADMISSION_SLOTS,
+        user_limit: int = ADMISSION_USER_LIMIT,
+        ip_limit: int = ADMISSION_IP_LIMIT,
+        weights: Optional[Dict[str, int]] = None,
+        lease_ttl: float = ADMISSION_LEASE_TTL,
+        retry_after: float = ADMISSION_RETRY_AFTER,
+        store: Optional[SharedStore] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Initialize the controller
+
+        Args:
+            slots: Requests that may run at once on the host
+            user_limit: Requests that may run at once per signed-in user
+            ip_limit: Requests that may run at once per IP address
+            weights: Weight of each priority class (default: PRIORITY_WEIGHTS)
+            lease_ttl: Seconds after which a lease is dropped
+            retry_after: Seconds refused clients are asked to wait
+            store: Shared store holding the leases (default: the process-wide store)
+            clock: Wall clock shared by the worker processes
+        """
+        self.slots = slots
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.weights = weights or PRIORITY_WEIGHTS
+        self.lease_ttl = lease_ttl
+        self.retry_after = retry_after
+        self.store = store or shared_store
+        self.store.register_schema(_SCHEMA)
+        self._clock = clock
+
+    def class_slots(self, priority: str) -> int:
+        """
+        Slots a priority class and the classes below it may use together
+
+        Args:
+            priority: Priority class
+
+        Returns:
+            Number of requests of the class and lower classes that may run
+            at once; below the top class, at least one slot is left over
+        """
+        weight = self._weight(priority)
+        top = max(self.weights.values())
+        share = math.ceil(self.slots * weight / top)
+        if weight < top:
+            share = min(share, self.slots - 1)
+        return max(1, share)
+
+    def _weight(self, priority: str) -> int:
+        """Weight of a priority class; unknown classes get the lowest weight"""
+        return self.weights.get(priority, min(self.weights.values()))
+
+    def admit(self, priority: str, user_key: Optional[str] = None, ip: Optional[str] = None) -> str:
+        """
+        Take a lease for a request
+
+        Args:
+            priority: Priority class of the request
+            user_key: Identity of the signed-in user, if any
+            ip: IP address of the client
+
+        Returns:
+            Lease id, to be given back with release()
+
+        Raises:
+            AdmissionRejected: If the request may not start now
+        """
+        with self.store.transaction() as connection:
+            now = self._clock()
+            connection.execute("DELETE FROM admission_leases WHERE expires <= ?", (now,))
+
+            if user_key is not None and self._count(connection, "user_key", user_key) >= self.user_limit:
+                metrics.inc("admission_rejected_client_total")
+                raise AdmissionRejected("Too many stories in progress for this account", 429, self.retry_after)
+            if ip is not None and self._count(connection, "ip", ip) >= self.ip_limit:
+                metrics.inc("admission_rejected_client_total")
+                raise AdmissionRejected("Too many stories in progress from this address", 429, self.retry_after)
+
+            total = connection.execute("SELECT COUNT(*) FROM admission_leases").fetchone()[0]
+            if total >= self.slots or self._count_up_to(connection, priority) >= self.class_slots(priority):
+                metrics.inc("admission_rejected_busy_total")
+                raise AdmissionRejected("The storyteller is busy right now, please try again shortly", 503, self.retry_after)
+
+            lease_id = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO admission_leases (id, user_key, ip, priority, expires) VALUES (?, ?, ?, ?, ?)",
+                (lease_id, user_key, ip, priority, now + self.lease_ttl)
+            )
+        metrics.inc("admission_admitted_total")
+        return lease_id
+
+    def release(self, lease_id: str) -> None:
+        """
+        Give back a lease once its request finished
+
+        Args:
+            lease_id: Lease id returned by admit()
+        """
+        with self.store.transaction() as connection:
+            connection.execute("DELETE FROM admission_leases WHERE id = ?", (lease_id,))
+
+    def _count(self, connection, column: str, value: str) -> int:
+        """Number of leases with the given value in a column"""
+        return connection.execute(f"SELECT COUNT(*) FROM admission_leases WHERE {column} = ?", (value,)).fetchone()[0]
+
+    def _count_up_to(self, connection, priority: str) -> int:
+        """Number of leases of a priority class and the classes below it"""
+        weight = self._weight(priority)
+        return sum(
+            count for lease_priority, count in connection.execute(
+                "SELECT priority, COUNT(*) FROM admission_leases GROUP BY priority"
+            ) if self._weight(lease_priority) <= weight
+        )
+
+
+# Create a singleton instance
+admission_controller = AdmissionController()
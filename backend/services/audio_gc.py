@@ -0,0 +1,233 @@
+"""
+Audio Garbage Collection Module for StorySpark
+
+This module removes generated audio that nothing refers to any more from
+static/generated, which otherwise grows with every narration, including
+previews that were never saved:
+
+- story audio, HLS packages and sound sequences referenced by a story's
+  audio_path, hls_path or sequence_id are always kept
+- everything else (speech segments, renditions in other formats, unsaved
+  previews, sequences of unsaved stories, abandoned temporary files and
+  builds) is kept while it was written or used within the grace period; the
+  segment, story and sequence stores touch their files on every hit, so
+  their modification time is the index of recent use
+- waveform sidecars (<audio>.json) go with their audio file
+
+Files are examined in batches with a pause in between, and each file is
+checked again just before it is removed, so a file reused while the
+collector runs is kept.
+"""
+import os
+import time
+import shutil
+import logging
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from ..models.story import Story
+from .metrics import metrics
+from .voice_service import voice_service
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Collection settings
+AUDIO_GC_GRACE_HOURS = float(os.environ.get('AUDIO_GC_GRACE_HOURS', 24))  # Unreferenced files younger than this are kept
+AUDIO_GC_BATCH_SIZE = int(os.environ.get('AUDIO_GC_BATCH_SIZE', 200))  # Files examined between pauses
+AUDIO_GC_BATCH_PAUSE = float(os.environ.get('AUDIO_GC_BATCH_PAUSE', 0.05))  # Seconds
+
+# Subdirectories of the output directory, as written by the voice service and HLS packager
+HLS_DIR = 'hls'
+SEQUENCES_DIR = 'sequences'
+SIDECAR_SUFFIX = '.json'
+TEMP_SUFFIX = '.tmp'
+
+metrics.describe("audio_gc_runs_total", "counter", "Garbage collection runs over generated audio")
+metrics.describe("audio_gc_files_removed_total", "counter", "Generated audio files and packages removed")
+metrics.describe("audio_gc_bytes_reclaimed_total", "counter", "Bytes reclaimed from generated audio")
+
+
+class AudioCollector:
+    """
+    Incremental garbage collector for the generated audio directory
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        grace_period: float = AUDIO_GC_GRACE_HOURS * 3600,
+        batch_size: int = AUDIO_GC_BATCH_SIZE,
+        batch_pause: float = AUDIO_GC_BATCH_PAUSE,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Initialize the collector
+
+        Args:
+            output_dir: Directory the voice service writes audio to
+            grace_period: Seconds an unreferenced file is kept after it was last written or used
+            batch_size: Files examined between pauses
+            batch_pause: Seconds to pause between batches, leaving disk time to request workers
+            clock: Wall clock, compared with file modification times
+            sleep: Function used to pause
+        """
+        self.output_dir = output_dir
+        self.grace_period = grace_period
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.clock = clock
+        self.sleep = sleep
+
+    def live_set(self) -> Set[str]:
+        """
+        Paths referenced by stories, relative to the output directory
+
+        Requires an application context.
+
+        Returns:
+            Audio file paths, HLS package directories ("hls/<digest>") and
+            sequence files ("sequences/<id>.json")
+        """
+        live = set()
+        query = Story.query.with_entities(Story.audio_path, Story.hls_path, Story.sequence_id).filter(
+            (Story.audio_path.isnot(None)) | (Story.hls_path.isnot(None)) | (Story.sequence_id.isnot(None))
+        )
+        for audio_path, hls_path, sequence_id in query.yield_per(1000):
+            if sequence_id:
+                live.add(f"{SEQUENCES_DIR}/{sequence_id}.json")
+            for path in (audio_path, hls_path):
+                relative = self._relative(path) if path else None
+                if not relative:
+                    continue
+                parts = relative.split('/')
+                live.add('/'.join(parts[:2]) if parts[0] == HLS_DIR and len(parts) > 2 else relative)
+        return live
+
+    def _relative(self, path: str) -> Optional[str]:
+        """Path of a '/static/...' URL path relative to the output directory, or None if outside it"""
+        if path.startswith('/static/'):
+            # The output directory is static/generated
+            path = os.path.join(os.path.dirname(self.output_dir), path[len('/static/'):])
+        relative = os.path.relpath(os.path.abspath(path), self.output_dir)
+        if relative.startswith('..'):
+            return None
+        return relative.replace(os.sep, '/')
+
+    def collect(self, live: Optional[Set[str]] = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        Remove unreferenced files older than the grace period
+
+        Args:
+            live: Referenced paths from live_set (queried when None; requires an application context)
+            dry_run: Whether to only report what would be removed
+
+        Returns:
+            Counts of "scanned" entries, "removed" files and packages, "kept"
+            entries, "bytes_reclaimed" and "errors"
+        """
+        if live is None:
+            live = self.live_set()
+
+        counts = {"scanned": 0, "removed": 0, "kept": 0, "bytes_reclaimed": 0, "errors": 0}
+        cutoff = self.clock() - self.grace_period
+        started = time.monotonic()
+
+        for relative, path, is_dir in self._candidates():
+            counts["scanned"] += 1
+            if counts["scanned"] % self.batch_size == 0 and self.batch_pause > 0:
+                self.sleep(self.batch_pause)
+
+            try:
+                if self._is_live(relative, path, live) or os.stat(path).st_mtime > cutoff:
+                    counts["kept"] += 1
+                    continue
+
+                reclaimed = self._remove(path, is_dir, dry_run)
+                if not is_dir and not relative.endswith((SIDECAR_SUFFIX, TEMP_SUFFIX)):
+                    reclaimed += self._remove_sidecar(path, dry_run)
+            except FileNotFoundError:
+                # Removed by another worker or along with its audio file
+                continue
+            except OSError as e:
+                logger.warning(f"Could not collect {relative}: {str(e)}")
+                counts["errors"] += 1
+                continue
+
+            counts["removed"] += 1
+            counts["bytes_reclaimed"] += reclaimed
+
+        if not dry_run:
+            metrics.inc("audio_gc_runs_total")
+            metrics.inc("audio_gc_files_removed_total", counts["removed"])
+            metrics.inc("audio_gc_bytes_reclaimed_total", counts["bytes_reclaimed"])
+        logger.info(
+            f"{'Dry run: ' if dry_run else ''}Collected {counts['removed']} of {counts['scanned']} generated audio "
+            f"entries ({counts['bytes_reclaimed']} bytes) in {time.monotonic() - started:.1f}s"
+        )
+        return counts
+
+    def _candidates(self) -> Iterator[Tuple[str, str, bool]]:
+        """Entries of the output directory as (relative path, path, is directory), listed lazily"""
+        for name, path, is_dir in self._scan(self.output_dir):
+            if not is_dir:
+                yield name, path, False
+            elif name == HLS_DIR:
+                # Each package directory is collected as a whole
+                for package, package_path, package_is_dir in self._scan(path):
+                    yield f"{HLS_DIR}/{package}", package_path, package_is_dir
+            elif name == SEQUENCES_DIR:
+                for sequence, sequence_path, sequence_is_dir in self._scan(path):
+                    if not sequence_is_dir:
+                        yield f"{SEQUENCES_DIR}/{sequence}", sequence_path, False
+
+    @staticmethod
+    def _scan(directory: str) -> Iterator[Tuple[str, str, bool]]:
+        """Entries of one directory, or none if it does not exist"""
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    yield entry.name, entry.path, entry.is_dir(follow_symlinks=False)
+        except FileNotFoundError:
+            return
+
+    @staticmethod
+    def _is_live(relative: str, path: str, live: Set[str]) -> bool:
+        """Whether an entry is referenced, directly or as the sidecar of an existing audio file"""
+        if relative in live:
+            return True
+        if relative.endswith(SIDECAR_SUFFIX) and '/' not in relative:
+            audio = relative[:-len(SIDECAR_SUFFIX)]
+            return audio in live or os.path.exists(path[:-len(SIDECAR_SUFFIX)])
+        return False
+
+    @staticmethod
+    def _remove(path: str, is_dir: bool, dry_run: bool) -> int:
+        """Remove a file or package directory and return its size in bytes"""
+        if not is_dir:
+            size = os.stat(path).st_size
+            if not dry_run:
+                os.remove(path)
+            return size
+
+        size = 0
+        for root, _, names in os.walk(path):
+            for name in names:
+                try:
+                    size += os.stat(os.path.join(root, name)).st_size
+                except OSError:
+                    continue
+        if not dry_run:
+            shutil.rmtree(path)
+        return size
+
+    def _remove_sidecar(self, path: str, dry_run: bool) -> int:
+        """Remove the waveform sidecar of a removed audio file"""
+        try:
+            return self._remove(path + SIDECAR_SUFFIX, False, dry_run)
+        except FileNotFoundError:
+            return 0
+
+
+# Create a singleton instance
+audio_collector = AudioCollector(voice_service.output_dir)
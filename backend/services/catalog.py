@@ -0,0 +1,302 @@
+"""
+Story Catalog Service for StorySpark
+
+This module pre-generates narrated public stories for the most common
+combinations of theme, age group, duration and language, so that they can
+be served instantly instead of being generated live.
+"""
+import os
+import re
+import json
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+from typing import Callable, Dict, Iterable, List, Optional
+
+from ..models.story import Story, StoryMetadata, db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Theme definitions shared with the frontend
+THEMES_FILE = os.path.join(os.path.dirname(__file__), '../../frontend/src/data/themes.js')
+
+# Used when the frontend sources are not deployed alongside the backend
+DEFAULT_THEMES = ["Kindness", "Honesty", "Courage", "Sharing", "Gratitude", "Friendship"]
+
+DEFAULT_AGE_GROUPS = ["3-5", "5-8", "8-12"]
+DEFAULT_DURATIONS = ["short", "medium", "long"]
+DEFAULT_LANGUAGES = ["en"]
+
+
+def load_themes(themes_file: str = THEMES_FILE) -> List[str]:
+    """
+    Load the theme names offered by the frontend
+
+    Args:
+        themes_file: Path to frontend/src/data/themes.js
+
+    Returns:
+        List of theme names, as sent by the frontend when generating a story
+    """
+    try:
+        with open(themes_file) as f:
+            names = re.findall(r'name:\s*"([^"]+)"', f.read())
+        if names:
+            return names
+    except OSError:
+        pass
+
+    logger.warning(f"Could not read themes from {themes_file}, using defaults")
+    return list(DEFAULT_THEMES)
+
+
+def catalog_key(theme: str, age_group: str, duration: str, language: str, variant: int = 0) -> str:
+    """
+    Build the key that identifies one pre-generated story
+
+    Args:
+        theme: Story theme
+        age_group: Target age group
+        duration: Story length ("short", "medium", "long")
+        language: Language code
+        variant: Index of the story among stories with the same parameters
+
+    Returns:
+        Normalized catalog key
+    """
+    return "|".join([
+        " ".join(theme.lower().split()),
+        age_group.strip(),
+        duration.strip().lower(),
+        language.strip().lower(),
+        str(variant)
+    ])
+
+
+def bucket_prefix(theme: str, age_group: str, duration: str, language: str) -> str:
+    """
+    Build the catalog key prefix shared by all variants of a parameter set
+
+    Args:
+        theme: Story theme
+        age_group: Target age group
+        duration: Story length
+        language: Language code
+
+    Returns:
+        Catalog key without the variant index, ending in "|"
+    """
+    return catalog_key(theme, age_group, duration, language, 0)[:-1]
+
+
+def build_matrix(
+    themes: Iterable[str],
+    age_groups: Iterable[str],
+    durations: Iterable[str],
+    languages: Iterable[str],
+    variants: int = 1
+) -> List[Dict]:
+    """
+    Expand the parameter matrix into one entry per story to generate
+
+    Args:
+        themes: Story themes
+        age_groups: Target age groups
+        durations: Story lengths
+        languages: Language codes
+        variants: Number of stories per parameter combination
+
+    Returns:
+        List of dictionaries with catalog_key and generation parameters
+    """
+    entries = []
+    for theme, age_group, duration, language in product(themes, age_groups, durations, languages):
+        for variant in range(variants):
+            entries.append({
+                "catalog_key": catalog_key(theme, age_group, duration, language, variant),
+                "params": {
+                    "theme": theme,
+                    "age_group": age_group,
+                    "duration": duration,
+                    "language": language
+                }
+            })
+    return entries
+
+
+def generate_catalog_story(params: Dict) -> Dict:
+    """
+    Generate and narrate one catalog story
+
+    Runs in a worker process, so it only returns data; the parent process
+    writes to the database.
+
+    Args:
+        params: Generation parameters for StoryGenerator.generate_story
+
+    Returns:
+        Story data with the generation time in seconds
+    """
+    from .voice_service import story_generator
+
+    start = time.time()
+    story_data = story_generator.generate_story(**params)
+    # Nobody is waiting here, so the HLS renditions are packaged right away
+    if story_data.get("hls_status") == "pending":
+        packaged = story_generator.package_story_hls(story_data["audio_path"])
+        story_data["hls_path"], story_data["hls_status"] = packaged["hls_path"], packaged["hls_status"]
+    story_data["generation_time"] = time.time() - start
+    return story_data
+
+
+def save_catalog_story(key: str, params: Dict, story_data: Dict) -> Story:
+    """
+    Store a generated story as a public catalog story
+
+    Args:
+        key: Catalog key of the story
+        params: Parameters the story was generated with
+        story_data: Story data returned by generate_story
+
+    Returns:
+        The saved Story
+    """
+    story = Story(
+        title=story_data.get("title", "Untitled Story"),
+        content=story_data.get("text", ""),
+        audio_path=story_data.get("audio_path"),
+        hls_path=story_data.get("hls_path"),
+        content_hash=story_data.get("content_hash"),
+        narration_status=story_data.get("narration_status"),
+        catalog_key=key,
+        theme=params.get("theme"),
+        duration=params.get("duration"),
+        age_group=params.get("age_group"),
+        language=params.get("language", "en"),
+        user_id=None
+    )
+    story.story_metadata = StoryMetadata(
+        prompt_used=json.dumps(dict(params, prompt_version=story_data.get("prompt_version"))),
+        generation_time=story_data.get("generation_time"),
+        emotional_markers=story_data.get("emotions", {}),
+        sound_effects=story_data.get("sound_effects", {}),
+        cultural_elements=story_data.get("cultural_elements", {}),
+        audio_duration=story_data.get("audio_duration"),
+        waveform_peaks=story_data.get("waveform") or []
+    )
+
+    db.session.add(story)
+    db.session.commit()
+    return story
+
+
+def is_usable(story_data: Dict) -> bool:
+    """
+    Check that a generated story is worth keeping in the catalog
+
+    Fallback stories and stories without narration are left out, so that
+    a later run generates them again.
+    """
+    from .voice_service.voice_service import PLACEHOLDER_AUDIO_PATH
+
+    return (
+        not story_data.get("is_fallback")
+        and bool(story_data.get("audio_path"))
+        and story_data.get("audio_path") != PLACEHOLDER_AUDIO_PATH
+    )
+
+
+def pregenerate(
+    entries: List[Dict],
+    workers: int = 4,
+    rate_per_minute: float = 10,
+    generate_fn: Callable[[Dict], Dict] = generate_catalog_story,
+    on_progress: Optional[Callable[[str, str], None]] = None
+) -> Dict[str, int]:
+    """
+    Generate the catalog stories that do not exist yet
+
+    Entries whose catalog key is already stored are skipped, so an
+    interrupted run can simply be started again. Each story is saved as soon
+    as it is ready. Submissions are spaced out to stay within the upstream
+    rate limit.
+
+    Args:
+        entries: Entries from build_matrix
+        workers: Number of worker processes (1 or less generates inline)
+        rate_per_minute: Maximum number of stories started per minute
+        generate_fn: Function generating one story from its parameters
+        on_progress: Called with (catalog_key, outcome) after each entry
+
+    Returns:
+        Counts of "generated", "skipped" and "failed" entries
+    """
+    counts = {"generated": 0, "skipped": 0, "failed": 0}
+    existing = {
+        key for (key,) in db.session.query(Story.catalog_key).filter(Story.catalog_key.isnot(None))
+    }
+
+    pending = []
+    for entry in entries:
+        if entry["catalog_key"] in existing:
+            counts["skipped"] += 1
+        else:
+            pending.append(entry)
+
+    if not pending:
+        return counts
+
+    min_interval = 60.0 / rate_per_minute if rate_per_minute > 0 else 0.0
+
+    def record(entry, story_data, error=None):
+        if error is None and is_usable(story_data):
+            save_catalog_story(entry["catalog_key"], entry["params"], story_data)
+            outcome = "generated"
+        else:
+            if error is not None:
+                logger.error(f"Failed to generate {entry['catalog_key']}: {error}")
+            outcome = "failed"
+        counts[outcome] += 1
+        if on_progress:
+            on_progress(entry["catalog_key"], outcome)
+
+    if workers <= 1:
+        for index, entry in enumerate(pending):
+            if index and min_interval:
+                time.sleep(min_interval)
+            try:
+                record(entry, generate_fn(entry["params"]))
+            except Exception as e:
+                record(entry, None, e)
+        return counts
+
+    # gRPC clients are not fork-safe, so workers start from a fresh interpreter
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {}
+        for index, entry in enumerate(pending):
+            if index and min_interval:
+                time.sleep(min_interval)
+            futures[executor.submit(generate_fn, entry["params"])] = entry
+
+            # Save whatever has finished while pacing submissions
+            for future in [f for f in futures if f.done()]:
+                _record_future(futures.pop(future), future, record)
+
+        for future in as_completed(list(futures)):
+            _record_future(futures.pop(future), future, record)
+
+    return counts
+
+
+def _record_future(entry: Dict, future, record: Callable) -> None:
+    """Record the outcome of a finished generation future"""
+    try:
+        story_data = future.result()
+    except Exception as e:
+        record(entry, None, e)
+        return
+    record(entry, story_data)
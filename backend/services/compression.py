@@ -0,0 +1,205 @@
+"""
+Response Compression Module for StorySpark
+
+This module compresses API responses and the frontend build:
+
+- JSON and text responses above COMPRESS_MIN_SIZE bytes are compressed on
+  the fly with Brotli or gzip, whichever the client prefers (Brotli on a
+  tie, when the brotli package is installed)
+- Frontend assets are compressed once at build time into .br and .gz files
+  next to the originals, which are served directly to clients accepting
+  them
+
+Audio, images and other already compressed formats are left alone.
+"""
+import os
+import gzip
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+from .metrics import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Compression settings
+COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # Bytes
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+# Media types compressed on the fly
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/xml',
+    'application/manifest+json', 'application/vnd.apple.mpegurl', 'image/svg+xml'
+}
+
+# Frontend build files compressed ahead of time, with the strongest settings
+PRECOMPRESS_EXTENSIONS = {'.html', '.js', '.mjs', '.css', '.json', '.svg', '.webmanifest', '.map', '.txt', '.xml'}
+
+# File suffix of each precompressed encoding, in order of preference
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+metrics.describe("response_compressed_total", "counter", "Responses compressed on the fly")
+metrics.describe("response_bytes_saved_total", "counter", "Bytes saved by compressing responses on the fly")
+
+
+def available_encodings() -> Tuple[str, ...]:
+    """Content encodings this process can produce, in order of preference"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings, offered: Iterable[str]) -> Optional[str]:
+    """
+    Pick the content encoding for a client
+
+    Args:
+        accept_encodings: The request's parsed Accept-Encoding header
+        offered: Encodings that can be served, in order of preference
+
+    Returns:
+        The encoding with the client's highest quality (the first offered
+        one on a tie), or None if the client accepts none of them
+    """
+    best, best_quality = None, 0
+    for encoding in offered:
+        quality = accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body: bytes, encoding: str, strongest: bool = False) -> bytes:
+    """
+    Compress a body
+
+    Args:
+        body: Uncompressed bytes
+        encoding: "br" or "gzip"
+        strongest: Whether to use the slowest, strongest settings (for build time)
+
+    Returns:
+        Compressed bytes
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=11 if strongest else COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=9 if strongest else COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    """Whether responses of a media type benefit from compression"""
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a response for the client, in place
+
+    Streamed responses, files sent from disk, partial content and bodies
+    below COMPRESS_MIN_SIZE are left as they are.
+
+    Args:
+        response: Flask response
+        accept_encodings: The request's parsed Accept-Encoding header
+
+    Returns:
+        The response
+    """
+    if (
+        not COMPRESS_ENABLED
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or 'Content-Encoding' in response.headers
+        or not is_compressible(response.mimetype)
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings, available_encodings())
+    if encoding is None:
+        return response
+
+    compressed = compress(body, encoding)
+    if len(compressed) >= len(body):
+        return response
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The compressed body is a different representation of the resource
+        response.set_etag(etag, weak=True)
+
+    metrics.inc("response_compressed_total")
+    metrics.inc("response_bytes_saved_total", len(body) - len(compressed))
+    return response
+
+
+def precompress_directory(directory: str, min_size: int = COMPRESS_MIN_SIZE, force: bool = False) -> Dict[str, int]:
+    """
+    Write .br and .gz copies of the text assets in a directory tree
+
+    Copies that are up to date are kept, and copies that would not be
+    smaller than the original are not written.
+
+    Args:
+        directory: Root of the frontend build
+        min_size: Smallest file to compress, in bytes
+        force: Whether to rewrite copies that are up to date
+
+    Returns:
+        Counts of "files" compressed, "skipped" up-to-date files and the
+        "original_bytes" and "compressed_bytes" of the smallest copies
+    """
+    counts = {"files": 0, "skipped": 0, "original_bytes": 0, "compressed_bytes": 0}
+    encodings = [encoding for encoding in PRECOMPRESSED_SUFFIXES if encoding in available_encodings()]
+
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in PRECOMPRESS_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            size = os.path.getsize(path)
+            if size < min_size:
+                continue
+
+            mtime = os.path.getmtime(path)
+            stale = [
+                encoding for encoding in encodings
+                if force or not os.path.exists(path + PRECOMPRESSED_SUFFIXES[encoding])
+                or os.path.getmtime(path + PRECOMPRESSED_SUFFIXES[encoding]) < mtime
+            ]
+            if not stale:
+                counts["skipped"] += 1
+                continue
+
+            with open(path, 'rb') as f:
+                body = f.read()
+            smallest = size
+            for encoding in stale:
+                compressed = compress(body, encoding, strongest=True)
+                variant = path + PRECOMPRESSED_SUFFIXES[encoding]
+                if len(compressed) >= size:
+                    if os.path.exists(variant):
+                        os.remove(variant)
+                    continue
+                with open(variant, 'wb') as f:
+                    f.write(compressed)
+                smallest = min(smallest, len(compressed))
+
+            counts["files"] += 1
+            counts["original_bytes"] += size
+            counts["compressed_bytes"] += smallest
+
+    return counts
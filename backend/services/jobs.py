@@ -0,0 +1,177 @@
+"""
+Background Job Module for StorySpark
+
+This module runs long tasks, such as narrating a long story, on a background
+thread pool so that they do not hold a request worker. Job state is stored as
+JSON files so that any worker process on the host can report on a job; the
+files are removed JOB_TTL seconds after a job last changed state.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds job state is kept after the job last changed state
+JOB_TTL = float(os.environ.get('JOB_TTL', 24 * 60 * 60))
+
+# Seconds between sweeps for expired job state
+EXPIRE_INTERVAL = 600
+
+
+class JobQueue:
+    """
+    Thread pool for background jobs with file-based status tracking
+    """
+
+    def __init__(self, max_workers: int = 2, jobs_dir: Optional[str] = None, ttl: float = JOB_TTL):
+        """
+        Initialize the job queue
+
+        Args:
+            max_workers: Number of jobs run at the same time in this process
+            jobs_dir: Directory where job state is stored
+            ttl: Seconds job state is kept after the job last changed state
+        """
+        self.max_workers = max_workers
+        self.jobs_dir = jobs_dir or os.path.join(tempfile.gettempdir(), 'storyspark_jobs')
+        self.ttl = ttl
+        self._executor = None
+        self._last_expired = 0.0
+
+    def submit(
+        self,
+        fn: Callable,
+        args: tuple = (),
+        kwargs: Optional[Dict] = None,
+        app=None,
+        description: str = "",
+        owner: Optional[str] = None
+    ) -> str:
+        """
+        Queue a function to run in the background
+
+        Args:
+            fn: Function to run; its return value becomes the job result
+            args: Positional arguments for fn
+            kwargs: Keyword arguments for fn
+            app: Flask app whose context the job runs in (needed for database access)
+            description: Short description of the job
+            owner: Identity of the user whose data the job handles, if the
+                job must only be reported to them
+
+        Returns:
+            ID of the job
+        """
+        if time.monotonic() - self._last_expired >= EXPIRE_INTERVAL:
+            self.expire()
+
+        job_id = uuid.uuid4().hex
+        self._write(job_id, {
+            'id': job_id,
+            'description': description,
+            'owner': owner,
+            'status': 'queued',
+            'created_at': time.time()
+        })
+
+        if self._executor is None:
+            # Created lazily so that forked worker processes get their own threads
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='storyspark-job')
+
+        self._executor.submit(self._run, job_id, fn, args, kwargs or {}, app, description)
+        logger.info(f"Queued job {job_id}: {description}")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Get the state of a job
+
+        Args:
+            job_id: ID returned by submit
+
+        Returns:
+            Job state dictionary, or None if the job is unknown
+        """
+        if not job_id.isalnum():
+            return None
+
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def expire(self) -> int:
+        """
+        Remove the state of jobs that have not changed state within the TTL
+
+        Finished jobs are never written again, so a state file's modification
+        time is when its job finished; abandoned temporary files go too.
+
+        Returns:
+            Number of files removed
+        """
+        self._last_expired = time.monotonic()
+        cutoff = time.time() - self.ttl
+        removed = 0
+        try:
+            with os.scandir(self.jobs_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file() and entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                            removed += 1
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            return 0
+
+        if removed:
+            logger.info(f"Removed {removed} expired job state files")
+        return removed
+
+    def _run(self, job_id: str, fn: Callable, args: tuple, kwargs: Dict, app, description: str) -> None:
+        """Run a job and record its outcome"""
+        state = self.get(job_id) or {'id': job_id, 'description': description}
+        state.update({'status': 'running', 'started_at': time.time()})
+        self._write(job_id, state)
+
+        try:
+            if app is not None:
+                with app.app_context():
+                    result = fn(*args, **kwargs)
+            else:
+                result = fn(*args, **kwargs)
+            state.update({'status': 'succeeded', 'result': result})
+        except Exception as e:
+            logger.error(f"Job {job_id} ({description}) failed: {str(e)}")
+            state.update({'status': 'failed', 'error': str(e)})
+
+        state['finished_at'] = time.time()
+        self._write(job_id, state)
+
+    def _path(self, job_id: str) -> str:
+        """Path of the state file for a job"""
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write(self, job_id: str, state: Dict[str, Any]) -> None:
+        """Atomically write the state of a job"""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        temp_path = f"{self._path(job_id)}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f, default=str)
+        os.replace(temp_path, self._path(job_id))
+
+
+# Create a singleton instance
+job_queue = JobQueue(
+    max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+    jobs_dir=os.environ.get('JOBS_DIR')
+)
@@ -0,0 +1,94 @@
+"""
+Metrics Module for StorySpark
+
+This module keeps process-wide counters and gauges and renders them in the
+Prometheus text exposition format for the /metrics endpoint. Values are
+per process, so a scraper sees each worker separately.
+"""
+import threading
+from typing import Dict, Optional
+
+# Metric names are prefixed so they are easy to find next to other services
+METRIC_PREFIX = "storyspark_"
+
+
+class Metrics:
+    """
+    Registry of named counters and gauges
+    """
+
+    def __init__(self):
+        """Initialize an empty registry"""
+        self._values: Dict[str, float] = {}
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, metric_type: str, help_text: str) -> None:
+        """
+        Declare a metric so it is exported even before it changes
+
+        Args:
+            name: Metric name without the prefix
+            metric_type: "counter" or "gauge"
+            help_text: One-line description of the metric
+        """
+        with self._lock:
+            self._types[name] = metric_type
+            self._help[name] = help_text
+            self._values.setdefault(name, 0.0)
+
+    def inc(self, name: str, value: float = 1.0) -> None:
+        """
+        Increase a counter
+
+        Args:
+            name: Metric name without the prefix
+            value: Amount to add
+        """
+        with self._lock:
+            self._types.setdefault(name, "counter")
+            self._values[name] = self._values.get(name, 0.0) + value
+
+    def set(self, name: str, value: float) -> None:
+        """
+        Set a gauge
+
+        Args:
+            name: Metric name without the prefix
+            value: New value
+        """
+        with self._lock:
+            self._types.setdefault(name, "gauge")
+            self._values[name] = value
+
+    def get(self, name: str) -> Optional[float]:
+        """Current value of a metric, or None if it was never set"""
+        with self._lock:
+            return self._values.get(name)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Copy of all metric values"""
+        with self._lock:
+            return dict(self._values)
+
+    def render_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            Metrics text, one HELP/TYPE block per metric
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._values):
+                full_name = METRIC_PREFIX + name
+                if name in self._help:
+                    lines.append(f"# HELP {full_name} {self._help[name]}")
+                lines.append(f"# TYPE {full_name} {self._types.get(name, 'untyped')}")
+                lines.append(f"{full_name} {self._values[name]:g}")
+        return "\n".join(lines) + "\n"
+
+
+# Create a singleton instance
+metrics = Metrics()
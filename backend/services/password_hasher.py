@@ -0,0 +1,244 @@
+"""
+Password Hashing Service for StorySpark
+
+This module hashes and checks passwords with bcrypt in a small pool of
+worker processes, so a burst of logins or registrations does not take the
+CPU of the request workers that also serve story generation. The pool is
+bounded: its processes run at a lower scheduling priority, and requests
+waiting for a free slot longer than PASSWORD_HASH_QUEUE_TIMEOUT are refused
+instead of piling up behind each other.
+
+Hashes are compatible with those written by Flask-Bcrypt. Their work factor
+is configurable, and a password whose stored hash uses a different work
+factor can be rehashed after a successful login.
+"""
+import os
+import re
+import hmac
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import bcrypt
+
+from .metrics import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Hashing settings
+BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))  # Work factor of new hashes
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))  # Processes per worker; 0 hashes inline
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 8))  # Hashes queued or running
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', 5))  # Seconds to wait for a slot
+PASSWORD_HASH_NICE = int(os.environ.get('PASSWORD_HASH_NICE', 10))  # Priority decrement of the pool processes
+PASSWORD_HASH_RETRY_AFTER = 5  # Seconds
+
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+HASH_PATTERN = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+metrics.describe("password_hashes_total", "counter", "Passwords hashed or checked")
+metrics.describe("password_hash_refused_total", "counter", "Password hashes refused because the pool was busy")
+metrics.describe("password_rehashes_total", "counter", "Stored password hashes upgraded to the configured work factor")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when no hashing slot frees up in time"""
+
+    def __init__(self, retry_after: float = PASSWORD_HASH_RETRY_AFTER):
+        super().__init__("Too many sign-ins at the moment. Please try again shortly.")
+        self.retry_after = retry_after
+
+
+def _password_bytes(password: str) -> bytes:
+    """Encode a password the way bcrypt has always read it"""
+    return password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+
+
+def hash_password(password: str, rounds: int) -> str:
+    """
+    Hash a password
+
+    Args:
+        password: Password
+        rounds: bcrypt work factor
+
+    Returns:
+        bcrypt hash
+    """
+    salt = bcrypt.gensalt(rounds=rounds, prefix=b'2b')
+    return bcrypt.hashpw(_password_bytes(password), salt).decode('utf-8')
+
+
+def check_password(password: str, pw_hash: str) -> bool:
+    """
+    Check a password against its hash in constant time
+
+    Args:
+        password: Candidate password
+        pw_hash: Stored bcrypt hash
+
+    Returns:
+        True if the password matches
+    """
+    pw_hash = pw_hash.encode('utf-8')
+    return hmac.compare_digest(bcrypt.hashpw(_password_bytes(password), pw_hash), pw_hash)
+
+
+def hash_rounds(pw_hash: str) -> Optional[int]:
+    """
+    Work factor of a bcrypt hash
+
+    Args:
+        pw_hash: bcrypt hash
+
+    Returns:
+        The work factor, or None if the hash is not a bcrypt hash
+    """
+    match = HASH_PATTERN.match(pw_hash or '')
+    return int(match.group(1)) if match else None
+
+
+def _lower_priority(increment: int) -> None:
+    """Lower the scheduling priority of a pool process"""
+    try:
+        os.nice(increment)
+    except (AttributeError, OSError):
+        pass
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing in a bounded pool of worker processes
+    """
+
+    def __init__(
+        self,
+        rounds: int = BCRYPT_LOG_ROUNDS,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT,
+        nice: int = PASSWORD_HASH_NICE
+    ):
+        """
+        Initialize the hasher
+
+        Args:
+            rounds: Work factor of new hashes
+            workers: Number of pool processes (0 hashes in the calling thread)
+            max_pending: Hashes allowed to be queued or running at once
+            queue_timeout: Seconds to wait for a free slot before refusing
+            nice: Priority decrement of the pool processes
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.nice = nice
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def hash(self, password: str) -> str:
+        """
+        Hash a password with the configured work factor
+
+        Args:
+            password: Password
+
+        Returns:
+            bcrypt hash
+
+        Raises:
+            PasswordHasherBusy: If no slot freed up in time
+        """
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, password: str, pw_hash: str) -> bool:
+        """
+        Check a password against its hash
+
+        Args:
+            password: Candidate password
+            pw_hash: Stored bcrypt hash
+
+        Returns:
+            True if the password matches
+
+        Raises:
+            PasswordHasherBusy: If no slot freed up in time
+        """
+        if hash_rounds(pw_hash) is None:
+            return False
+        return self._run(check_password, password, pw_hash)
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        """
+        Whether a stored hash uses a different work factor than the configured one
+
+        Args:
+            pw_hash: Stored bcrypt hash
+
+        Returns:
+            True if the password should be hashed again
+        """
+        return hash_rounds(pw_hash) not in (None, self.rounds)
+
+    def _run(self, func, *args):
+        """Run a hashing function in the pool, holding a slot while it runs"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            metrics.inc("password_hash_refused_total")
+            raise PasswordHasherBusy()
+        try:
+            metrics.inc("password_hashes_total")
+            executor = self._get_executor()
+            if executor is None:
+                return func(*args)
+            try:
+                return executor.submit(func, *args).result()
+            except BrokenProcessPool:
+                logger.error("Password hashing pool broke, hashing in the request worker")
+                self._reset_executor(executor)
+                return func(*args)
+        finally:
+            self._slots.release()
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """Pool of this process, started on first use"""
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Forked request workers must not share their parent's pool;
+                # spawned processes also keep gRPC clients out of the pool
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_lower_priority,
+                    initargs=(self.nice,)
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken pool so the next hash starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self) -> None:
+        """Stop the pool processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=True)
+
+
+# Create a singleton instance
+password_hasher = PasswordHasher()
@@ -0,0 +1,181 @@
+"""
+Prompt Registry for StorySpark
+
+This module keeps the prompts sent to Gemini as versioned templates. Each
+template is compiled once at import: its text is dedented and split into a
+base template and optional sections (such as the theme or the child's name)
+that are only included when their field is given. Rendering a prompt is then
+a few string substitutions.
+
+Every template has a version id made of its name, its declared version and a
+digest of its text. The id is stored with generated stories and is part of
+the generation cache key, so changing a prompt never serves responses that
+were generated from the old one.
+"""
+import os
+import hashlib
+import logging
+import textwrap
+from string import Template
+from typing import Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Name of the story generation prompt
+STORY_PROMPT = "story"
+
+
+def _compile(text: str) -> Template:
+    """Dedent and trim a template once, at registration"""
+    return Template(textwrap.dedent(text).strip())
+
+
+class PromptTemplate:
+    """
+    A versioned prompt made of a base template and optional sections
+    """
+
+    def __init__(self, name: str, version: str, base: str, sections: Optional[List[Tuple[str, str]]] = None):
+        """
+        Compile a prompt template
+
+        Args:
+            name: Name of the prompt, such as "story"
+            version: Version of the prompt text; bump it when the text changes
+            base: Template text; $sections marks where optional sections go
+            sections: (field, template text) pairs, included in order when
+                the field is given
+        """
+        self.name = name
+        self.version = version
+        self._base = _compile(base)
+        self._sections = [(field, _compile(text)) for field, text in sections or []]
+
+        source = "\n".join([base] + [f"{field}:{text}" for field, text in sections or []])
+        digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:8]
+        self.version_id = f"{name}/{version}+{digest}"
+
+    def render(self, **fields) -> str:
+        """
+        Render the prompt
+
+        List values (such as characters) are joined with commas. Sections
+        whose field is empty are left out.
+
+        Args:
+            fields: Values for the template placeholders
+
+        Returns:
+            Prompt text
+        """
+        values = {
+            key: ", ".join(str(item) for item in value) if isinstance(value, (list, tuple)) else value
+            for key, value in fields.items()
+        }
+        sections = " ".join(
+            template.substitute(values) for field, template in self._sections if values.get(field)
+        )
+        return self._base.substitute(values, sections=sections)
+
+
+class PromptRegistry:
+    """
+    Registered prompt templates and the active version of each prompt
+    """
+
+    def __init__(self, active_versions: Optional[Dict[str, str]] = None):
+        """
+        Initialize the registry
+
+        Args:
+            active_versions: Version to use per prompt name instead of the
+                latest registered one
+        """
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        self._active: Dict[str, str] = {}
+        self._pinned = dict(active_versions or {})
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        """
+        Register a template; it becomes active unless another version is pinned
+
+        Args:
+            template: Compiled template
+
+        Returns:
+            The registered template
+        """
+        self._templates.setdefault(template.name, {})[template.version] = template
+        pinned = self._pinned.get(template.name)
+        if pinned is None or pinned == template.version:
+            self._active[template.name] = template.version
+        return template
+
+    def get(self, name: str, version: Optional[str] = None) -> PromptTemplate:
+        """
+        Get a template
+
+        Args:
+            name: Name of the prompt
+            version: Version to get (default: the active version)
+
+        Returns:
+            The template
+
+        Raises:
+            KeyError: If the prompt or version is not registered
+        """
+        versions = self._templates[name]
+        return versions[version or self._active[name]]
+
+    def versions(self, name: str) -> List[str]:
+        """Registered versions of a prompt"""
+        return list(self._templates.get(name, {}))
+
+
+def _parse_versions(value: str) -> Dict[str, str]:
+    """Parse PROMPT_VERSIONS, such as "story=1" """
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {name.strip(): version.strip() for name, version in pairs}
+
+
+# Create a singleton instance; PROMPT_VERSIONS pins older prompt versions
+prompt_registry = PromptRegistry(_parse_versions(os.environ.get("PROMPT_VERSIONS", "")))
+
+_STORY_SECTIONS = [
+    ("theme", "The story should be about $theme and teach the value of $theme."),
+    ("setting", "The story should take place in a $setting."),
+    ("characters", "Include these characters: $characters."),
+    ("child_name", "Make $child_name the main character or mention $child_name in the story.")
+]
+
+_STORY_INSTRUCTIONS = """
+    Make the story engaging, age-appropriate, and with a clear beginning, middle, and end.
+    Use simple language that children can understand.
+    Divide the story into paragraphs for better readability.
+    The story should be inspired from Indian folk lore, fairy tales, or modern children's literature.
+    Children story books like panchatantra, hitopadesh, akbar birbal, tenali raman, etc. should be used as inspiration.
+    The names should be Indian names, and the story should reflect Indian culture and values.
+    The story should be written in English, but can include some Hindi or regional words where appropriate.
+    The story should be formatted as follows:
+    Start with a title on the first line prefixed with "Title: ".
+
+    The story should convey positive values and end with a meaningful lesson.
+"""
+
+# Version 1: the original prompt, with the length given only as reading time
+prompt_registry.register(PromptTemplate(
+    STORY_PROMPT, "1",
+    "Write a children's story for age group $age_group years that would take about "
+    "$duration_minutes minutes to read aloud.\n$sections\n" + textwrap.dedent(_STORY_INSTRUCTIONS),
+    _STORY_SECTIONS
+))
+
+# Version 2: adds an explicit word count from the token budget
+prompt_registry.register(PromptTemplate(
+    STORY_PROMPT, "2",
+    "Write a children's story for age group $age_group years that would take about "
+    "$duration_minutes minutes to read aloud.\n$sections\n" + textwrap.dedent(_STORY_INSTRUCTIONS),
+    [("target_words", "The story should be about $target_words words long.")] + _STORY_SECTIONS
+))
@@ -0,0 +1,194 @@
+"""
+Rate Limiter Module for StorySpark
+
+This module keeps calls to quota-limited upstreams (Gemini, Google TTS)
+within their per-minute quotas across all worker processes, so that load
+above the quota waits for capacity instead of failing with quota errors.
+
+Each limited unit (requests, tokens, characters) is a GCRA token bucket
+whose state - the theoretical arrival time of the next unit - is kept in
+the shared store. A call reserves its cost in every bucket in one
+transaction and is told how long to wait for its turn. Reservations are
+handed out in arrival order, which makes the waiting callers a fair FIFO
+queue. A caller whose wait would run past its deadline reserves nothing
+and gets RateLimited with the wait as a retry-after time, so it can be
+turned away at once.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+from .metrics import metrics
+from .shared_store import SharedStore, shared_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds of quota that may be used at once after an idle period
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get('RATE_LIMIT_BURST_SECONDS', 5))
+
+metrics.describe("rate_limited_total", "counter", "Upstream calls turned away because the wait for quota exceeded their deadline")
+metrics.describe("rate_limit_wait_seconds_total", "counter", "Time spent waiting for upstream quota")
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS rate_limits (bucket TEXT PRIMARY KEY, tat REAL NOT NULL)"
+
+
+class RateLimited(Exception):
+    """Raised when a call would have to wait longer for quota than it can"""
+
+    def __init__(self, name: str, retry_after: float):
+        """
+        Args:
+            name: Name of the limited upstream
+            retry_after: Seconds after which the quota is expected to be available
+        """
+        super().__init__(f"{name} is busy, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Shared per-minute quotas for one upstream
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limits: Dict[str, float],
+        burst_seconds: float = RATE_LIMIT_BURST_SECONDS,
+        store: Optional[SharedStore] = None,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Initialize the limiter
+
+        Args:
+            name: Name of the upstream, such as "gemini"
+            limits: Units allowed per minute, such as {"requests": 60};
+                units with a limit of 0 or None are not limited
+            burst_seconds: Seconds of quota that may be used at once
+            store: Shared store holding the bucket state (default: the process-wide store)
+            clock: Wall clock shared by the worker processes
+            sleep: Sleep function, replaceable in tests
+        """
+        self.name = name
+        self.limits = {unit: float(rate) for unit, rate in limits.items() if rate}
+        self.burst_seconds = burst_seconds
+        self.store = store or shared_store
+        self.store.register_schema(_SCHEMA)
+        self._clock = clock
+        self._sleep = sleep
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any unit is limited"""
+        return bool(self.limits)
+
+    def reserve(self, costs: Dict[str, float], max_wait: Optional[float] = None) -> float:
+        """
+        Reserve quota for a call
+
+        Args:
+            costs: Units the call uses, such as {"requests": 1, "characters": 420}
+            max_wait: Longest acceptable wait in seconds, or None to wait as long as needed
+
+        Returns:
+            Seconds to wait before making the call
+
+        Raises:
+            RateLimited: If the wait would be longer than max_wait; nothing
+                is reserved then
+        """
+        units = [unit for unit, cost in costs.items() if cost > 0 and unit in self.limits]
+        if not units:
+            return 0.0
+
+        with self.store.transaction() as connection:
+            now = self._clock()
+            placeholders = ",".join("?" * len(units))
+            rows = connection.execute(
+                f"SELECT bucket, tat FROM rate_limits WHERE bucket IN ({placeholders})",
+                [self._bucket(unit) for unit in units]
+            ).fetchall()
+            arrival = dict(rows)
+
+            # The call starts once every bucket is within its burst allowance
+            start = now
+            for unit in units:
+                start = max(start, arrival.get(self._bucket(unit), now) - self.burst_seconds)
+            wait = start - now
+
+            if max_wait is not None and wait > max_wait:
+                metrics.inc("rate_limited_total")
+                raise RateLimited(self.name, wait)
+
+            for unit in units:
+                interval = 60.0 / self.limits[unit]
+                tat = max(arrival.get(self._bucket(unit), now), start) + costs[unit] * interval
+                connection.execute(
+                    "INSERT INTO rate_limits (bucket, tat) VALUES (?, ?) "
+                    "ON CONFLICT(bucket) DO UPDATE SET tat = excluded.tat",
+                    (self._bucket(unit), tat)
+                )
+        return wait
+
+    def acquire(self, costs: Dict[str, float], deadline: Optional[float] = None) -> float:
+        """
+        Wait for quota for a call
+
+        Args:
+            costs: Units the call uses
+            deadline: time.monotonic() value by which the call has to be made
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateLimited: If the call could not be made before its deadline
+        """
+        if not self.enabled:
+            return 0.0
+
+        wait = self._reserve_before(costs, deadline)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    async def acquire_async(self, costs: Dict[str, float], deadline: Optional[float] = None) -> float:
+        """
+        Wait for quota like acquire, without blocking the event loop
+
+        Args:
+            costs: Units the call uses
+            deadline: time.monotonic() value by which the call has to be made
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            RateLimited: If the call could not be made before its deadline
+        """
+        if not self.enabled:
+            return 0.0
+
+        wait = await asyncio.to_thread(self._reserve_before, costs, deadline)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _reserve_before(self, costs: Dict[str, float], deadline: Optional[float]) -> float:
+        """Reserve quota for a call that has to be made by the deadline, returning the wait"""
+        max_wait = deadline - time.monotonic() if deadline is not None else None
+        wait = self.reserve(costs, max_wait)
+        if wait > 0:
+            logger.info(f"Waiting {wait:.2f}s for {self.name} quota")
+            metrics.inc("rate_limit_wait_seconds_total", wait)
+        return wait
+
+    def _bucket(self, unit: str) -> str:
+        """Key of a unit's bucket in the shared store"""
+        return f"{self.name}:{unit}"
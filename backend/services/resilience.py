@@ -0,0 +1,511 @@
+"""
+Resilience Module for StorySpark
+
+This module protects request handlers from slow or failing upstream
+services such as Gemini. ResilientClient runs each call in a bounded worker
+pool so it can be given a deadline, retries transient failures with
+exponential backoff and full jitter, can send a hedged second request when
+the first one is slower than usual, and stops calling an unhealthy upstream
+altogether through a circuit breaker so callers fall back immediately.
+An optional rate limiter holds each attempt back until the upstream's
+quota allows it.
+
+A call that missed its deadline cannot be cancelled; its worker thread
+finishes in the background, and the pool size bounds how many can pile up.
+call_async applies the same policy to coroutines on an event loop, where
+late and losing requests are cancelled and no thread is held per call.
+Breaker state is kept per process.
+"""
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .metrics import metrics
+from .rate_limiter import RateLimited, RateLimiter
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # pragma: no cover - google-api-core is optional
+    google_exceptions = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Upstream errors worth retrying: overload, server errors and timeouts
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+if google_exceptions is not None:
+    TRANSIENT_ERRORS += (
+        google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded
+    )
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an upstream call does not finish in time"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether an error is worth retrying"""
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    are refused for reset_timeout seconds. Then one trial call is let through;
+    its success closes the circuit and its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize a closed breaker
+
+        Args:
+            name: Name of the upstream, used in logs and metric names
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+            clock: Time source, replaceable in tests
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        metrics.describe(f"{name}_circuit_open", "gauge", f"Whether the {name} circuit breaker is open")
+        metrics.describe(f"{name}_circuit_rejected_total", "counter", f"Calls to {name} refused by the circuit breaker")
+
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once the reset timeout passed"""
+        with self._lock:
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_running = False
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go through
+
+        Returns:
+            True if the circuit is closed, or if this is the trial call of a
+            half-open circuit
+        """
+        state = self.state
+        with self._lock:
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+        metrics.inc(f"{self.name}_circuit_rejected_total")
+        return False
+
+    def record_success(self) -> None:
+        """Record a successful call"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+        metrics.set(f"{self.name}_circuit_open", 0)
+
+    def release(self) -> None:
+        """Give back a call that was allowed but never made"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        """Record a failed call"""
+        with self._lock:
+            self._failures += 1
+            opened = self._state == self.HALF_OPEN or self._failures >= self.failure_threshold
+            if opened:
+                if self._state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self._trial_running = False
+        if opened:
+            metrics.set(f"{self.name}_circuit_open", 1)
+
+
+class LatencyTracker:
+    """
+    Recent call latencies, for choosing when to hedge
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        """
+        Initialize the tracker
+
+        Args:
+            window: Number of recent latencies kept
+            min_samples: Latencies needed before percentiles are reported
+        """
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """Record the latency of a successful call"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Latency below which the given fraction of recent calls finished
+
+        Args:
+            fraction: Between 0 and 1, such as 0.95
+
+        Returns:
+            Latency in seconds, or None if there are too few samples
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float, rng: random.Random = random) -> float:
+    """
+    Exponential backoff with full jitter
+
+    Args:
+        attempt: Number of the failed attempt, starting at 1
+        base_delay: Delay ceiling after the first failure, in seconds
+        max_delay: Largest delay ceiling, in seconds
+        rng: Random source
+
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    return rng.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class ResilientClient:
+    """
+    Deadline, retry, hedging and circuit breaker policy for one upstream
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 30.0,
+        deadline: float = 45.0,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 4.0,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        breaker: Optional[CircuitBreaker] = None,
+        max_workers: int = 8,
+        retry_on: Callable[[BaseException], bool] = is_transient,
+        limiter: Optional[RateLimiter] = None,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Initialize the client
+
+        Args:
+            name: Name of the upstream, used in logs and metric names
+            timeout: Seconds each attempt may take
+            deadline: Seconds all attempts and backoff together may take
+            max_attempts: Attempts per call, including the first
+            base_delay: Backoff ceiling after the first failure, in seconds
+            max_delay: Largest backoff ceiling, in seconds
+            hedge: Send a second request when an attempt is slower than the
+                hedge percentile of recent latencies
+            hedge_percentile: Latency percentile after which to hedge
+            breaker: Circuit breaker (default: a new breaker for the upstream)
+            max_workers: Upstream calls that may run at once in this process
+            retry_on: Decides whether an error is worth retrying
+            limiter: Rate limiter for the upstream's quota (default: none)
+            sleep: Sleep function, replaceable in tests
+        """
+        self.name = name
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self.retry_on = retry_on
+        self.limiter = limiter
+        self._sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-call")
+
+        metrics.describe(f"{name}_retries_total", "counter", f"Retried calls to {name}")
+        metrics.describe(f"{name}_timeouts_total", "counter", f"Calls to {name} that missed their deadline")
+        metrics.describe(f"{name}_hedged_total", "counter", f"Hedged second requests sent to {name}")
+
+    def call(
+        self,
+        func: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        cost: Optional[Dict[str, float]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Call the upstream through the resilience policy
+
+        Args:
+            func: Function making the upstream request
+            args: Positional arguments for func
+            timeout: Seconds each attempt may take (default: the client's timeout)
+            deadline: time.monotonic() value by which the caller needs an
+                answer, such as the end of the request's budget; shortens
+                the client's own deadline
+            cost: Quota each request uses, such as {"requests": 1,
+                "characters": 420} (default: one request)
+            kwargs: Keyword arguments for func
+
+        Returns:
+            Result of func
+
+        Raises:
+            CircuitOpenError: If the circuit breaker refuses the call
+            RateLimited: If the quota does not allow an attempt before the deadline
+            DeadlineExceeded: If the last attempt did not finish in time, or
+                no time was left to make one
+            Exception: The last error of func if it is not worth retrying
+                or no attempts are left
+        """
+        timeout = timeout or self.timeout
+        give_up_at = self._give_up_at(deadline)
+        cost = cost or {"requests": 1}
+        attempt = 0
+        while True:
+            self._admit(give_up_at)
+            if self.limiter is not None:
+                try:
+                    self.limiter.acquire(cost, deadline=give_up_at)
+                except Exception:
+                    # The breaker admitted this call, so a half-open trial has to be released
+                    self.breaker.release()
+                    raise
+
+            attempt += 1
+            try:
+                result = self._attempt(func, args, kwargs, min(timeout, give_up_at - time.monotonic()), cost)
+            except Exception as e:
+                self._sleep(self._retry_delay(e, attempt, give_up_at))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def call_async(
+        self,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        timeout: Optional[float] = None,
+        deadline: Optional[float] = None,
+        cost: Optional[Dict[str, float]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Call the upstream through the resilience policy from an event loop
+
+        Works like call, but func is a coroutine function; attempts that miss
+        their timeout and hedged requests that lose are cancelled instead of
+        finishing in the background, and no worker thread is held while
+        waiting for the upstream.
+
+        Args:
+            func: Coroutine function making the upstream request
+            args: Positional arguments for func
+            timeout: Seconds each attempt may take (default: the client's timeout)
+            deadline: time.monotonic() value by which the caller needs an answer
+            cost: Quota each request uses (default: one request)
+            kwargs: Keyword arguments for func
+
+        Returns:
+            Result of func
+
+        Raises:
+            CircuitOpenError, RateLimited, DeadlineExceeded or the last error
+            of func, as call does
+        """
+        timeout = timeout or self.timeout
+        give_up_at = self._give_up_at(deadline)
+        cost = cost or {"requests": 1}
+        attempt = 0
+        while True:
+            self._admit(give_up_at)
+            if self.limiter is not None:
+                try:
+                    await self.limiter.acquire_async(cost, deadline=give_up_at)
+                except BaseException:
+                    self.breaker.release()
+                    raise
+
+            attempt += 1
+            try:
+                result = await self._attempt_async(func, args, kwargs, min(timeout, give_up_at - time.monotonic()), cost)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt, give_up_at))
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def _give_up_at(self, deadline: Optional[float]) -> float:
+        """time.monotonic() value after which a call is abandoned"""
+        give_up_at = time.monotonic() + self.deadline
+        if deadline is not None:
+            give_up_at = min(give_up_at, deadline)
+        return give_up_at
+
+    def _admit(self, give_up_at: float) -> None:
+        """Check that an attempt may be made, raising if not"""
+        if time.monotonic() >= give_up_at:
+            metrics.inc(f"{self.name}_timeouts_total")
+            raise DeadlineExceeded(f"No time left to call {self.name}")
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable")
+
+    def _retry_delay(self, error: Exception, attempt: int, give_up_at: float) -> float:
+        """
+        Record a failed attempt and decide whether to retry it
+
+        Returns:
+            Seconds to wait before the next attempt
+
+        Raises:
+            Exception: error, if it is not worth retrying or no attempts are left
+        """
+        transient = self.retry_on(error)
+        if transient:
+            self.breaker.record_failure()
+        else:
+            # The upstream answered, so it is healthy even if the request was bad
+            self.breaker.record_success()
+
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+        if not transient or attempt >= self.max_attempts or time.monotonic() + delay >= give_up_at:
+            raise error
+        logger.warning(f"Call to {self.name} failed ({type(error).__name__}: {error}), retrying in {delay:.2f}s")
+        metrics.inc(f"{self.name}_retries_total")
+        return delay
+
+    def _attempt(self, func: Callable[..., Any], args: tuple, kwargs: dict, timeout: float, cost: Dict[str, float]) -> Any:
+        """Run one attempt with a deadline, hedging it if it is slow"""
+        start = time.monotonic()
+        futures = [self._executor.submit(func, *args, **kwargs)]
+
+        hedge_after = self.latency.percentile(self.hedge_percentile) if self.hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done and self._hedge_allowed(cost):
+                logger.info(f"Call to {self.name} slower than {hedge_after:.2f}s, sending a hedged request")
+                metrics.inc(f"{self.name}_hedged_total")
+                futures.append(self._executor.submit(func, *args, **kwargs))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, start + timeout - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    self.latency.record(time.monotonic() - start)
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not pending:
+            raise error
+        # Calls still waiting for a worker are dropped; running ones finish in the background
+        for future in pending:
+            future.cancel()
+        metrics.inc(f"{self.name}_timeouts_total")
+        raise DeadlineExceeded(f"{self.name} did not answer within {timeout:.1f}s")
+
+    async def _attempt_async(
+        self, func: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict, timeout: float, cost: Dict[str, float]
+    ) -> Any:
+        """Run one attempt of call_async with a deadline, hedging it if it is slow"""
+        start = time.monotonic()
+        tasks = [asyncio.ensure_future(func(*args, **kwargs))]
+
+        error = None
+        pending = set(tasks)
+        try:
+            hedge_after = self.latency.percentile(self.hedge_percentile) if self.hedge else None
+            if hedge_after is not None and hedge_after < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+                if not done and self._hedge_allowed(cost):
+                    logger.info(f"Call to {self.name} slower than {hedge_after:.2f}s, sending a hedged request")
+                    metrics.inc(f"{self.name}_hedged_total")
+                    pending.add(asyncio.ensure_future(func(*args, **kwargs)))
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, start + timeout - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.record(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+        finally:
+            # Losing and late requests are cancelled
+            for task in pending:
+                task.cancel()
+
+        if error is not None and not pending:
+            raise error
+        metrics.inc(f"{self.name}_timeouts_total")
+        raise DeadlineExceeded(f"{self.name} did not answer within {timeout:.1f}s")
+
+    def _hedge_allowed(self, cost: Dict[str, float]) -> bool:
+        """Whether the quota has room for a hedged request right now"""
+        if self.limiter is None:
+            return True
+        try:
+            self.limiter.reserve(cost, max_wait=0)
+        except RateLimited:
+            return False
+        return True
@@ -0,0 +1,95 @@
+"""
+Shared Store Module for StorySpark
+
+This module gives every worker process on a host access to one small SQLite
+database for state that has to be shared between them, such as rate limits.
+Each thread gets its own connection; transactions take the write lock up
+front, so a read-modify-write of shared state is atomic across processes.
+"""
+import os
+import sqlite3
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Database file shared by the workers on this host
+SHARED_STORE_PATH = os.environ.get('SHARED_STORE_PATH') or os.path.join(tempfile.gettempdir(), 'storyspark_shared.db')
+
+# Milliseconds to wait for another process holding the write lock
+BUSY_TIMEOUT_MS = 5000
+
+
+class SharedStore:
+    """
+    SQLite database shared between worker processes
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the store; the database is opened on first use
+
+        Args:
+            path: Database file (default: SHARED_STORE_PATH)
+        """
+        self.path = path or SHARED_STORE_PATH
+        self._local = threading.local()
+        self._schema = []
+
+    def register_schema(self, statement: str) -> None:
+        """
+        Add a CREATE TABLE IF NOT EXISTS (or similar) statement, run on every new connection
+
+        Args:
+            statement: SQL statement that is safe to run repeatedly
+        """
+        self._schema.append(statement)
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.execute(statement)
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Connection of the current thread
+
+        Returns:
+            Connection in autocommit mode; use transaction() to group statements
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            for statement in self._schema:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Run statements atomically, holding the database write lock
+
+        Yields:
+            Connection inside the transaction; it commits when the block ends
+            and rolls back if the block raises
+        """
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+
+# Create a singleton instance
+shared_store = SharedStore()
@@ -0,0 +1,173 @@
+"""
+Static Manifest Module for StorySpark
+
+This module indexes the frontend build once at startup, so the SPA routes
+can answer without probing the filesystem for every path:
+
+- each file is recorded with its size, content hash, media type and the
+  precompressed .br/.gz copies written by `precompress-static`
+- index.html and its compressed copies are kept in memory with an ETag
+- files with a content hash in their name (as Vite names its bundles) are
+  marked immutable, so browsers cache them for a year without revalidating
+
+Directories with content written at runtime, such as generated narration,
+are left out; they are served by the /static route. A new frontend build
+is picked up when the app restarts.
+"""
+import os
+import re
+import hashlib
+import logging
+import mimetypes
+from typing import Optional
+
+from .compression import PRECOMPRESSED_SUFFIXES, choose_encoding
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Top-level directories of the static folder that are not part of the build
+STATIC_MANIFEST_EXCLUDE = [
+    name.strip() for name in os.environ.get('STATIC_MANIFEST_EXCLUDE', 'generated').split(',') if name.strip()
+]
+
+# Bundles named like index-852dfc98.js: a separator, then 8+ characters including a digit
+HASHED_NAME_PATTERN = re.compile(r'[-.](?=[A-Za-z_-]*[0-9])[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+
+INDEX_FILE = 'index.html'
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60  # Seconds
+
+COMPRESSED_SUFFIXES = tuple(PRECOMPRESSED_SUFFIXES.values())
+
+
+class StaticFile:
+    """Manifest entry of one file"""
+
+    __slots__ = ("path", "size", "etag", "mimetype", "mtime", "immutable", "variants")
+
+    def __init__(self, path: str, size: int, etag: str, mimetype: str, mtime: float, immutable: bool):
+        self.path = path
+        self.size = size
+        self.etag = etag
+        self.mimetype = mimetype
+        self.mtime = mtime
+        self.immutable = immutable
+        self.variants = {}  # Content encoding -> path of the precompressed copy
+
+    def variant(self, accept_encodings) -> Optional[str]:
+        """
+        Pick the precompressed copy for a client
+
+        Args:
+            accept_encodings: The request's parsed Accept-Encoding header
+
+        Returns:
+            The content encoding to serve, or None for the original file
+        """
+        if not self.variants:
+            return None
+        return choose_encoding(accept_encodings, self.variants)
+
+
+class StaticManifest:
+    """
+    Index of a frontend build directory
+    """
+
+    def __init__(self, directory: str, exclude=None):
+        """
+        Build the manifest
+
+        Args:
+            directory: Root of the frontend build
+            exclude: Top-level directories to leave out
+        """
+        self.directory = directory
+        self.exclude = set(STATIC_MANIFEST_EXCLUDE if exclude is None else exclude)
+        self.files = {}
+        self.index = None
+        self.index_bodies = {}  # Content encoding (None for identity) -> bytes of index.html
+        self.build()
+
+    def build(self) -> None:
+        """Scan the directory and load index.html"""
+        files = {}
+        for root, dirs, names in os.walk(self.directory):
+            if root == self.directory:
+                dirs[:] = [name for name in dirs if name not in self.exclude]
+            for name in names:
+                if name.endswith(COMPRESSED_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                try:
+                    files[relative] = self._describe(relative, path)
+                except OSError as e:
+                    logger.warning(f"Could not index static file {relative}: {str(e)}")
+
+        self.files = files
+        self.index = files.get(INDEX_FILE)
+        self.index_bodies = {}
+        if self.index is not None:
+            for encoding in [None] + list(self.index.variants):
+                with open(os.path.join(self.directory, self._served_path(self.index, encoding)), 'rb') as f:
+                    self.index_bodies[encoding] = f.read()
+        logger.info(f"Indexed {len(files)} static files in {self.directory}")
+
+    def _describe(self, relative: str, path: str) -> StaticFile:
+        """Build the manifest entry of a file"""
+        stat = os.stat(path)
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+
+        entry = StaticFile(
+            path=relative,
+            size=stat.st_size,
+            etag=digest.hexdigest(),
+            mimetype=mimetypes.guess_type(relative)[0] or 'application/octet-stream',
+            mtime=stat.st_mtime,
+            immutable=bool(HASHED_NAME_PATTERN.search(os.path.basename(relative)))
+        )
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+            try:
+                if os.stat(path + suffix).st_mtime >= stat.st_mtime:
+                    entry.variants[encoding] = relative + suffix
+            except OSError:
+                continue
+        return entry
+
+    def get(self, path: str) -> Optional[StaticFile]:
+        """
+        Look up a file
+
+        Args:
+            path: URL path relative to the build root
+
+        Returns:
+            The manifest entry, or None if the build has no such file
+        """
+        return self.files.get(path)
+
+    def index_body(self, encoding: Optional[str]) -> bytes:
+        """Bytes of index.html in a content encoding (None for identity)"""
+        return self.index_bodies[encoding]
+
+    @staticmethod
+    def _served_path(entry: StaticFile, encoding: Optional[str]) -> str:
+        """Path of the original file or of its precompressed copy"""
+        return entry.variants[encoding] if encoding else entry.path
+
+    def served_path(self, entry: StaticFile, encoding: Optional[str]) -> str:
+        """
+        Absolute path of the original file or of its precompressed copy
+
+        Args:
+            entry: Manifest entry
+            encoding: Content encoding from StaticFile.variant
+
+        Returns:
+            Path of the file to send
+        """
+        return os.path.join(self.directory, self._served_path(entry, encoding))
@@ -0,0 +1,150 @@
+"""
+Story Response Cache Module for StorySpark
+
+This module keeps the serialized JSON of public stories, so the story
+routes can answer from bytes instead of loading each story's metadata and
+serializing it again. Public stories do not change once generated; any
+update to a story row changes its updated_at, which is part of the key, so
+an edited story is serialized again and its old bytes age out of the LRU.
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, List
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from ..models.story import Story
+from .metrics import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache settings
+STORY_RESPONSE_CACHE_SIZE = int(os.environ.get('STORY_RESPONSE_CACHE_SIZE', 2048))  # Stories; 0 disables the cache
+
+# Stories loaded per query when filling the cache for a list
+LOAD_BATCH_SIZE = 500
+
+metrics.describe("story_response_cache_hits_total", "counter", "Stories answered from pre-serialized JSON")
+metrics.describe("story_response_cache_misses_total", "counter", "Stories serialized for a response")
+
+
+def serialize(obj) -> bytes:
+    """
+    Serialize data with the app's JSON provider
+
+    Args:
+        obj: Data to serialize
+
+    Returns:
+        Compact JSON bytes
+    """
+    provider = current_app.json
+    if hasattr(provider, 'dumps_bytes'):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+class StoryResponseCache:
+    """
+    LRU cache of serialized public stories keyed by id and update time
+    """
+
+    def __init__(self, max_entries: int = STORY_RESPONSE_CACHE_SIZE):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of stories kept (0 disables the cache)
+        """
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def story_json(self, story: Story) -> bytes:
+        """
+        Serialized JSON of a story
+
+        Args:
+            story: Story the client may read
+
+        Returns:
+            JSON bytes of story.to_dict(), from the cache for public stories
+        """
+        key = (story.id, story.updated_at)
+        if story.user_id is None:
+            cached = self._get(key)
+            if cached is not None:
+                return cached
+
+        metrics.inc("story_response_cache_misses_total")
+        data = serialize(story.to_dict())
+        if story.user_id is None:
+            self._put(key, data)
+        return data
+
+    def list_json(self, query) -> bytes:
+        """
+        Serialized JSON array of the stories of a query
+
+        Only ids and update times are read for the stories in the cache;
+        the others are loaded with their metadata in batches.
+
+        Args:
+            query: Story query, in the order of the response
+
+        Returns:
+            JSON bytes of the list of story.to_dict()
+        """
+        rows = query.with_entities(Story.id, Story.updated_at, Story.user_id).all()
+        parts = {}
+        missing = []
+        for story_id, updated_at, user_id in rows:
+            cached = self._get((story_id, updated_at)) if user_id is None else None
+            if cached is None:
+                missing.append(story_id)
+            else:
+                parts[story_id] = cached
+
+        for story in self._load(missing):
+            parts[story.id] = self.story_json(story)
+
+        return b"[" + b",".join(parts[story_id] for story_id, _, _ in rows if story_id in parts) + b"]"
+
+    @staticmethod
+    def _load(story_ids: List[int]) -> Iterable[Story]:
+        """Load stories with their metadata"""
+        for start in range(0, len(story_ids), LOAD_BATCH_SIZE):
+            batch = story_ids[start:start + LOAD_BATCH_SIZE]
+            yield from Story.query.options(joinedload(Story.story_metadata)).filter(Story.id.in_(batch)).all()
+
+    def _get(self, key):
+        """Cached bytes for a key, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                metrics.inc("story_response_cache_hits_total")
+            return data
+
+    def _put(self, key, data: bytes):
+        """Store bytes for a key, evicting the least recently used stories"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all stories"""
+        with self._lock:
+            self._entries.clear()
+
+
+# Create a singleton instance
+story_response_cache = StoryResponseCache()
@@ -0,0 +1,321 @@
+"""
+Story Pool Service for StorySpark
+
+This module serves generate-story requests instantly from the pre-generated
+catalog. A matching unused catalog story is claimed, personalized with
+lightweight fields such as the child's name, and a background job generates
+a replacement so the pool stays warm. Pool sizes follow how often each bucket
+of theme, age group, duration and language is requested.
+
+Buckets of catalog themes are refilled after any request; a free-text theme
+only gets a bucket once it has missed the pool several times within the
+demand window, so one-off themes do not leave unused public stories behind.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from string import Template
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import func, update
+
+from ..models.story import Story, db
+from . import catalog
+from .jobs import job_queue
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Answer generate-story from the pool unless the request says otherwise
+INSTANT_SERVE_ENABLED = os.environ.get('INSTANT_SERVE', 'false').lower() == 'true'
+
+# Bounds for the number of unused stories kept per bucket
+POOL_MIN_SIZE = int(os.environ.get('STORY_POOL_MIN_SIZE', 1))
+POOL_MAX_SIZE = int(os.environ.get('STORY_POOL_MAX_SIZE', 10))
+
+# Stories served within this window set the target size of a bucket
+POOL_DEMAND_WINDOW = timedelta(hours=float(os.environ.get('STORY_POOL_DEMAND_HOURS', 1)))
+
+# Misses within the demand window before a theme outside the catalog gets a bucket
+POOL_MISS_THRESHOLD = int(os.environ.get('STORY_POOL_MISS_THRESHOLD', 3))
+
+# Personalized line shown with a pooled story
+DEDICATION_TEMPLATE = Template("A story for $child_name")
+
+
+class StoryPool:
+    """
+    Pool of unused pre-generated stories, bucketed by generation parameters
+    """
+
+    def __init__(
+        self,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        demand_window: timedelta = POOL_DEMAND_WINDOW,
+        miss_threshold: int = POOL_MISS_THRESHOLD,
+        themes: Optional[Iterable[str]] = None
+    ):
+        """
+        Initialize the story pool
+
+        Args:
+            min_size: Unused stories kept for every requested bucket
+            max_size: Upper bound on unused stories per bucket
+            demand_window: Period over which served stories and misses are counted
+            miss_threshold: Misses before a bucket of a theme outside the catalog is filled
+            themes: Catalog themes, whose buckets are always refilled (default: catalog.load_themes())
+        """
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.demand_window = demand_window
+        self.miss_threshold = miss_threshold
+        self._themes = {self._normalize(theme) for theme in themes} if themes is not None else None
+        self._misses: Dict[str, List[float]] = {}  # Monotonic times of recent misses, per bucket
+        self._refilling = set()
+        self._lock = threading.Lock()
+
+    def serve(
+        self,
+        theme: str,
+        age_group: str,
+        duration: str,
+        language: str = "en",
+        child_name: Optional[str] = None,
+        app=None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Serve an unused pre-generated story and schedule a replacement
+
+        Args:
+            theme: Story theme
+            age_group: Target age group
+            duration: Story length ("short", "medium", "long")
+            language: Language code
+            child_name: Name of the child for personalization
+            app: Flask app the refill job runs in (no refill if None)
+
+        Returns:
+            Story data in the format of StoryGenerator.generate_story, or
+            None if the bucket is empty
+        """
+        prefix = catalog.bucket_prefix(theme, age_group, duration, language)
+        story = self.claim(prefix)
+        misses = self._record_miss(prefix) if story is None else 0
+
+        # Top up the bucket in the background; after a miss only if the theme is in demand
+        in_demand = story is not None or self.is_catalog_theme(theme) or misses >= self.miss_threshold
+        if app is not None and in_demand and self.unused_count(prefix) < self.target_size(prefix):
+            self.schedule_refill(app, {
+                "theme": theme,
+                "age_group": age_group,
+                "duration": duration,
+                "language": language
+            })
+
+        if story is None:
+            logger.info(f"Story pool miss for {prefix}")
+            return None
+
+        logger.info(f"Served story {story.id} from pool {prefix}")
+        return self.personalize(story, child_name)
+
+    def claim(self, prefix: str) -> Optional[Story]:
+        """
+        Atomically mark the oldest unused story of a bucket as served
+
+        Args:
+            prefix: Bucket prefix from catalog.bucket_prefix
+
+        Returns:
+            The claimed story, or None if the bucket is empty
+        """
+        candidates = (
+            db.session.query(Story.id)
+            .filter(Story.catalog_key.startswith(prefix, autoescape=True), Story.served_at.is_(None))
+            .order_by(Story.id)
+            .limit(3)
+            .all()
+        )
+
+        for (story_id,) in candidates:
+            # Another worker may claim the same story; only one update wins
+            result = db.session.execute(
+                update(Story)
+                .where(Story.id == story_id, Story.served_at.is_(None))
+                .values(served_at=datetime.utcnow())
+            )
+            db.session.commit()
+            if result.rowcount:
+                return db.session.get(Story, story_id)
+
+        return None
+
+    def personalize(self, story: Story, child_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Build story data for a pooled story, filling in personal fields
+
+        The narration is shared, so only fields shown around the story are
+        personalized; the title and text are left as generated.
+
+        Args:
+            story: Claimed catalog story
+            child_name: Name of the child for personalization
+
+        Returns:
+            Story data in the format of StoryGenerator.generate_story
+        """
+        metadata = story.story_metadata
+        waveform = metadata.waveform_peaks if metadata and metadata.waveform_peaks else None
+        prompt = json.loads(metadata.prompt_used) if metadata and metadata.prompt_used else {}
+
+        return {
+            "id": story.id,
+            "title": story.title,
+            "text": story.content,
+            "dedication": DEDICATION_TEMPLATE.safe_substitute(child_name=child_name) if child_name else None,
+            "audio_path": story.audio_path,
+            "stream_url": None,
+            "hls_path": story.hls_path,
+            "duration": story.duration,
+            "audio_duration": metadata.audio_duration if metadata else None,
+            "waveform": waveform,
+            "content_hash": story.content_hash,
+            "prompt_version": prompt.get("prompt_version"),
+            "is_fallback": False,
+            "from_pool": True,
+            "theme": story.theme,
+            "age_group": story.age_group,
+            "language": story.language,
+            "created_by": child_name,
+            "created_at": story.created_at.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "is_downloadable": True
+        }
+
+    def target_size(self, prefix: str) -> int:
+        """
+        Number of unused stories to keep in a bucket
+
+        The target is the number of stories served from the bucket in the
+        demand window, so busy buckets can absorb a burst while they refill.
+
+        Args:
+            prefix: Bucket prefix from catalog.bucket_prefix
+
+        Returns:
+            Target pool size between min_size and max_size
+        """
+        since = datetime.utcnow() - self.demand_window
+        served = (
+            db.session.query(func.count(Story.id))
+            .filter(Story.catalog_key.startswith(prefix, autoescape=True), Story.served_at >= since)
+            .scalar()
+        )
+        return max(self.min_size, min(self.max_size, served))
+
+    def is_catalog_theme(self, theme: str) -> bool:
+        """Whether a theme is one of the catalog themes offered by the frontend"""
+        if self._themes is None:
+            self._themes = {self._normalize(name) for name in catalog.load_themes()}
+        return self._normalize(theme) in self._themes
+
+    def _record_miss(self, prefix: str) -> int:
+        """Record a miss of a bucket and count its misses within the demand window"""
+        now = time.monotonic()
+        since = now - self.demand_window.total_seconds()
+        with self._lock:
+            # Drop buckets whose misses have all aged out, so the table stays small
+            for key in [key for key, times in self._misses.items() if times[-1] < since]:
+                del self._misses[key]
+            times = [t for t in self._misses.get(prefix, []) if t >= since]
+            times.append(now)
+            self._misses[prefix] = times
+            return len(times)
+
+    @staticmethod
+    def _normalize(theme: str) -> str:
+        """Theme as it appears in catalog keys"""
+        return " ".join(theme.lower().split())
+
+    def unused_count(self, prefix: str) -> int:
+        """Count the unused stories in a bucket"""
+        return (
+            db.session.query(func.count(Story.id))
+            .filter(Story.catalog_key.startswith(prefix, autoescape=True), Story.served_at.is_(None))
+            .scalar()
+        )
+
+    def schedule_refill(self, app, params: Dict[str, str]) -> Optional[str]:
+        """
+        Queue a background job that tops up a bucket
+
+        Args:
+            app: Flask app the job runs in
+            params: theme, age_group, duration and language of the bucket
+
+        Returns:
+            ID of the job, or None if the bucket is already being refilled
+        """
+        prefix = catalog.bucket_prefix(params["theme"], params["age_group"], params["duration"], params["language"])
+        with self._lock:
+            if prefix in self._refilling:
+                return None
+            self._refilling.add(prefix)
+
+        try:
+            return job_queue.submit(
+                self.refill,
+                args=(params,),
+                app=app,
+                description=f"Refill story pool {prefix}"
+            )
+        except Exception:
+            self._release(prefix)
+            raise
+
+    def refill(self, params: Dict[str, str], generate_fn=catalog.generate_catalog_story) -> int:
+        """
+        Generate stories until a bucket reaches its target size
+
+        Args:
+            params: theme, age_group, duration and language of the bucket
+            generate_fn: Function generating one story from its parameters
+
+        Returns:
+            Number of stories added to the pool
+        """
+        prefix = catalog.bucket_prefix(params["theme"], params["age_group"], params["duration"], params["language"])
+        added = 0
+        try:
+            missing = self.target_size(prefix) - self.unused_count(prefix)
+            for _ in range(missing):
+                story_data = generate_fn(params)
+                if not catalog.is_usable(story_data):
+                    logger.warning(f"Discarded unusable story while refilling {prefix}")
+                    break
+                catalog.save_catalog_story(prefix + str(self._next_variant(prefix)), params, story_data)
+                added += 1
+        finally:
+            self._release(prefix)
+
+        if added:
+            logger.info(f"Added {added} stories to pool {prefix}")
+        return added
+
+    def _next_variant(self, prefix: str) -> int:
+        """Next unused variant index in a bucket"""
+        keys = db.session.query(Story.catalog_key).filter(Story.catalog_key.startswith(prefix, autoescape=True))
+        variants = [int(key[len(prefix):]) for (key,) in keys if key[len(prefix):].isdigit()]
+        return max(variants, default=-1) + 1
+
+    def _release(self, prefix: str) -> None:
+        """Allow the bucket to be refilled again"""
+        with self._lock:
+            self._refilling.discard(prefix)
+
+
+# Create a singleton instance
+story_pool = StoryPool()
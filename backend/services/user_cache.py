@@ -0,0 +1,169 @@
+"""
+User Cache Module for StorySpark
+
+This module keeps a short-lived, in-process copy of each signed-in user's
+account flags and story preferences, so requests do not query the users and
+user_preferences tables every time. Entries expire after a TTL, are dropped
+when the user's preferences change in this process, and are reloaded when a
+request's token carries a newer preferences version than the cached copy,
+which is how other workers learn about an update before the TTL runs out.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from typing import Callable, Dict, Optional
+
+from ..models.user import User, UserPreference, db
+from .metrics import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache settings
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 60))  # Seconds
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 4096))  # Users; 0 disables the cache
+
+metrics.describe("user_cache_hits_total", "counter", "User lookups answered from the user cache")
+metrics.describe("user_cache_misses_total", "counter", "User lookups that queried the database")
+
+
+def preferences_version(preferences: Optional[UserPreference]) -> int:
+    """
+    Version of a user's preferences, changing whenever they are updated
+
+    Args:
+        preferences: Preferences of the user, if any
+
+    Returns:
+        Milliseconds since the epoch of the last update, or 0
+    """
+    if preferences is None or preferences.updated_at is None:
+        return 0
+    return int(preferences.updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def user_record(user: User, preferences: Optional[UserPreference]) -> Dict:
+    """
+    Cached fields of a user
+
+    Args:
+        user: User
+        preferences: Preferences of the user, if any
+
+    Returns:
+        Dictionary of account flags and story preferences
+    """
+    return {
+        'id': user.id,
+        'is_admin': bool(user.is_admin),
+        'is_active': bool(user.is_active),
+        'preferred_language': preferences.preferred_language if preferences else None,
+        'preferred_storyteller': preferences.preferred_storyteller if preferences else None,
+        'child_name': preferences.child_name if preferences else None,
+        'child_age': preferences.child_age if preferences else None,
+        'prefs_version': preferences_version(preferences)
+    }
+
+
+def load_user_record(user_id) -> Optional[Dict]:
+    """
+    Load the cached fields of a user with a single query
+
+    Args:
+        user_id: User id
+
+    Returns:
+        Dictionary of account flags and story preferences, or None if the
+        user does not exist
+    """
+    row = db.session.query(User, UserPreference).outerjoin(
+        UserPreference, UserPreference.user_id == User.id
+    ).filter(User.id == user_id).first()
+    if row is None:
+        return None
+    return user_record(*row)
+
+
+class UserCache:
+    """
+    TTL cache of user records keyed by user id
+    """
+
+    def __init__(
+        self,
+        ttl: float = USER_CACHE_TTL,
+        max_entries: int = USER_CACHE_SIZE,
+        loader: Callable = load_user_record,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            ttl: Seconds a record stays valid
+            max_entries: Maximum number of users kept (0 disables the cache)
+            loader: Function loading the record of a user id from the database
+            clock: Monotonic time source
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.loader = loader
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, min_version: int = 0) -> Optional[Dict]:
+        """
+        Get the record of a user, loading it on a miss
+
+        Args:
+            user_id: User id
+            min_version: Preferences version the record must have reached,
+                as carried in the request's token
+
+        Returns:
+            The user's record, or None if the user does not exist
+        """
+        key = str(user_id)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, record = entry
+                if now - stored_at < self.ttl and (record is None or record['prefs_version'] >= min_version):
+                    self._entries.move_to_end(key)
+                    metrics.inc("user_cache_hits_total")
+                    return record
+                del self._entries[key]
+
+        metrics.inc("user_cache_misses_total")
+        record = self.loader(user_id)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (now, record)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return record
+
+    def invalidate(self, user_id):
+        """
+        Drop the record of a user, after its account or preferences changed
+
+        Args:
+            user_id: User id
+        """
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        """Drop all records"""
+        with self._lock:
+            self._entries.clear()
+
+
+# Create a singleton instance
+user_cache = UserCache()
@@ -5,7 +5,10 @@ This package contains modules for text-to-speech conversion,
 sound effect management, and story narration.
 """
 
-from .voice_service import voice_service, SoundItem, SoundType, EmotionType
+from .voice_service import (
+    voice_service, SoundItem, SoundType, EmotionType,
+    AUDIO_FORMATS, negotiate_audio_format
+)
 from .story_generator import story_generator
 
 __all__ = [
@@ -13,5 +16,7 @@ __all__ = [
     'story_generator',
     'SoundItem',
     'SoundType',
-    'EmotionType'
+    'EmotionType',
+    'AUDIO_FORMATS',
+    'negotiate_audio_format'
 ]
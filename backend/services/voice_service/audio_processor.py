@@ -5,23 +5,50 @@ This module provides functions for processing and combining audio files
 for the StorySpark storytelling features.
 """
 import os
+import math
 import logging
 import tempfile
 import subprocess
 import shutil
+from functools import lru_cache
 from typing import List, Dict
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def combine_audio_files(audio_files: List[Dict], output_path: str) -> bool:
+# Longest portion of a sound effect mixed into a story, in milliseconds
+EFFECT_MAX_MS = 4000
+
+# pydub export parameters for each supported output format
+EXPORT_FORMATS = {
+    "mp3": {"format": "mp3"},
+    "ogg_opus": {"format": "ogg", "codec": "libopus"}
+}
+
+
+@lru_cache(maxsize=1)
+def ffmpeg_available() -> bool:
     """
-    Combine multiple audio files into a single file using file concatenation
-    This is a simplified version for development use only
+    Check whether ffmpeg is installed
+    
+    Returns:
+        True if ffmpeg can be executed, False otherwise
+    """
+    return shutil.which("ffmpeg") is not None
+
+
+def combine_audio_files(audio_files: List[Dict], output_path: str, audio_format: str = "mp3") -> bool:
+    """
+    Combine multiple audio files into a single file
+    
+    Uses pydub (backed by ffmpeg) when available so that volume, pauses and
+    sound effects are applied. Without ffmpeg the spoken segments are joined
+    without decoding: MP3 frames are concatenated, and Ogg files are chained.
     
     Args:
-        audio_files: List of dictionaries with path, volume, and pause_after information
+        audio_files: List of dictionaries with path, sound_type, volume, and pause_after information
         output_path: Path to save the combined audio file
+        audio_format: Output format, a key of EXPORT_FORMATS
         
     Returns:
         True if successful, False otherwise
@@ -31,28 +58,131 @@ def combine_audio_files(audio_files: List[Dict], output_path: str) -> bool:
         if not audio_files:
             logger.error("No audio files provided to combine")
             return False
-            
-        # In a full implementation, we would use ffmpeg or a library like pydub
-        # For development, we just copy the first file as a placeholder
-        source_path = audio_files[0].get("path")
         
-        if not source_path or not os.path.exists(source_path):
-            logger.error(f"First audio file not found: {source_path}")
-            return False
-            
         # Create the output directory if it doesn't exist
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-        # Copy the file
-        shutil.copy2(source_path, output_path)
-        logger.info(f"Created placeholder combined audio file at {output_path}")
         
+        # Write to a temporary file so a partially written file is never served
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        
+        combined = False
+        if ffmpeg_available():
+            try:
+                combined = _combine_with_pydub(audio_files, temp_path, audio_format)
+            except Exception as e:
+                logger.warning(f"pydub combine failed, falling back to frame concatenation: {str(e)}")
+        
+        if not combined:
+            combined = _concatenate_segments(audio_files, temp_path, audio_format)
+        
+        if not combined:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return False
+        
+        os.replace(temp_path, output_path)
+        logger.info(f"Created combined audio file at {output_path}")
         return True
             
     except Exception as e:
         logger.error(f"Error combining audio files: {str(e)}")
         return False
 
+
+def _combine_with_pydub(audio_files: List[Dict], output_path: str, audio_format: str = "mp3") -> bool:
+    """
+    Mix the audio files with pydub, applying volume and pauses
+    
+    Args:
+        audio_files: List of dictionaries with path, sound_type, volume, and pause_after information
+        output_path: Path to save the combined audio file
+        audio_format: Output format, a key of EXPORT_FORMATS
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    from pydub import AudioSegment
+    
+    combined = AudioSegment.empty()
+    for audio_file in audio_files:
+        segment = AudioSegment.from_file(audio_file["path"])
+        
+        if audio_file.get("sound_type") == "effect" and len(segment) > EFFECT_MAX_MS:
+            segment = segment[:EFFECT_MAX_MS].fade_out(500)
+        
+        volume = audio_file.get("volume", 1.0)
+        if volume <= 0:
+            continue
+        if volume < 1.0:
+            segment = segment.apply_gain(20 * math.log10(volume))
+        
+        combined += segment
+        pause_after = audio_file.get("pause_after", 0.0)
+        if pause_after > 0:
+            combined += AudioSegment.silent(duration=int(pause_after * 1000))
+    
+    combined.export(output_path, **EXPORT_FORMATS.get(audio_format, EXPORT_FORMATS["mp3"]))
+    return True
+
+
+def _concatenate_segments(audio_files: List[Dict], output_path: str, audio_format: str = "mp3") -> bool:
+    """
+    Join spoken segments without decoding them
+    
+    MP3 streams can be concatenated once their ID3 tags are removed, and Ogg
+    files placed one after another form a valid chained Ogg stream. Sound
+    effects are skipped because they are encoded differently from the
+    synthesized speech.
+    
+    Args:
+        audio_files: List of dictionaries with path and sound_type information
+        output_path: Path to save the combined audio file
+        audio_format: Format of the segments, a key of EXPORT_FORMATS
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    written = 0
+    with open(output_path, "wb") as out:
+        for audio_file in audio_files:
+            if audio_file.get("sound_type", "human") != "human":
+                continue
+            
+            source_path = audio_file.get("path")
+            if not source_path or not os.path.exists(source_path):
+                logger.error(f"Audio file not found: {source_path}")
+                continue
+            
+            with open(source_path, "rb") as source:
+                data = source.read()
+            out.write(strip_id3_tags(data) if audio_format == "mp3" else data)
+            written += 1
+    
+    if not written:
+        logger.error("No spoken audio segments available to concatenate")
+        return False
+    return True
+
+
+def strip_id3_tags(data: bytes) -> bytes:
+    """
+    Remove ID3v2 headers and ID3v1 trailers from MP3 data
+    
+    Args:
+        data: Raw MP3 file content
+        
+    Returns:
+        MP3 frame data
+    """
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # The tag size is a 28-bit "syncsafe" integer
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+    return data
+
 def get_audio_duration(file_path: str) -> float:
     """
     Get the duration of an audio file in seconds using ffprobe if available
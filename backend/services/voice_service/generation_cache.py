@@ -0,0 +1,205 @@
+"""
+Generation Cache Module for StorySpark
+
+This module caches Gemini responses keyed on the normalized story prompt and
+the model id, so identical requests (such as a default theme without a
+child's name) do not call the model again. Entries expire after a TTL, the
+least recently used entries are evicted when the cache is full, and several
+variants can be kept per key and served in rotation so repeated requests do
+not always get the same story.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from ..metrics import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache settings
+GENERATION_CACHE_TTL = float(os.environ.get('GENERATION_CACHE_TTL', 24 * 60 * 60))  # Seconds
+GENERATION_CACHE_SIZE = int(os.environ.get('GENERATION_CACHE_SIZE', 512))  # Keys; 0 disables the cache
+GENERATION_CACHE_VARIANTS = int(os.environ.get('GENERATION_CACHE_VARIANTS', 1))  # Responses kept per key
+
+metrics.describe("generation_cache_hits_total", "counter", "Story generations answered from the cache")
+metrics.describe("generation_cache_misses_total", "counter", "Story generations that called the model")
+metrics.describe("generation_cache_bypass_total", "counter", "Story generations that skipped the cache")
+metrics.describe("generation_cache_hit_ratio", "gauge", "Share of cache lookups that were hits")
+metrics.describe("generation_cache_entries", "gauge", "Prompts currently held in the generation cache")
+metrics.describe("generation_upstream_seconds_total", "counter", "Time spent waiting for the model")
+metrics.describe("generation_upstream_calls_total", "counter", "Model calls timed for the latency average")
+metrics.describe("generation_saved_seconds_total", "counter", "Model latency avoided by cache hits")
+
+
+def average_upstream_latency() -> float:
+    """Average duration of a model call in this process, in seconds"""
+    calls = metrics.get("generation_upstream_calls_total") or 0
+    return (metrics.get("generation_upstream_seconds_total") or 0.0) / calls if calls else 0.0
+
+
+class _Entry:
+    """Variants cached for one key"""
+
+    __slots__ = ("variants", "next_index")
+
+    def __init__(self):
+        self.variants = []  # (stored_at, content) pairs, oldest first
+        self.next_index = 0
+
+
+class GenerationCache:
+    """
+    Exact-match cache of model responses with TTL, LRU eviction and variants
+    """
+
+    def __init__(
+        self,
+        ttl: float = GENERATION_CACHE_TTL,
+        max_entries: int = GENERATION_CACHE_SIZE,
+        variants: int = GENERATION_CACHE_VARIANTS
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            ttl: Seconds a response stays valid
+            max_entries: Maximum number of keys kept (0 disables the cache)
+            variants: Number of responses kept and rotated per key
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether responses are cached at all"""
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(prompt: str, model_id: str, prompt_version: str = "") -> str:
+        """
+        Build the cache key for a prompt
+
+        Whitespace is normalized so formatting changes in the prompt template
+        do not split the cache, while a new template version always does.
+
+        Args:
+            prompt: Prompt sent to the model
+            model_id: Name of the model
+            prompt_version: Version id of the prompt template
+
+        Returns:
+            Hex SHA-256 digest of the normalized prompt, model id and prompt version
+        """
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{model_id}\n{prompt_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Keys with fewer than the configured number of variants are treated
+        as misses, so that the caller generates and stores another variant.
+
+        Args:
+            key: Key from make_key
+
+        Returns:
+            Cached response, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._lookups += 1
+            content = None
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.variants = [(stored_at, text) for stored_at, text in entry.variants if now - stored_at < self.ttl]
+                if not entry.variants:
+                    del self._entries[key]
+                elif len(entry.variants) >= self.variants:
+                    content = entry.variants[entry.next_index % len(entry.variants)][1]
+                    entry.next_index += 1
+                    self._entries.move_to_end(key)
+
+            if content is not None:
+                self._hits += 1
+            self._update_gauges()
+
+        if content is None:
+            metrics.inc("generation_cache_misses_total")
+            return None
+
+        metrics.inc("generation_cache_hits_total")
+        metrics.inc("generation_saved_seconds_total", average_upstream_latency())
+        return content
+
+    def __contains__(self, key: str) -> bool:
+        """Whether any variant is cached for a key"""
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: str, content: str) -> None:
+        """
+        Store a response as a variant of a key
+
+        Args:
+            key: Key from make_key
+            content: Response from the model
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            entry.variants.append((time.time(), content))
+            # Keep the newest variants
+            del entry.variants[:-self.variants]
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                evicted_key, _ = self._entries.popitem(last=False)
+                logger.debug(f"Evicted generation cache entry {evicted_key[:12]}")
+            self._update_gauges()
+
+    def record_upstream(self, seconds: float) -> None:
+        """
+        Record how long a model call took
+
+        Args:
+            seconds: Duration of the call
+        """
+        metrics.inc("generation_upstream_seconds_total", seconds)
+        metrics.inc("generation_upstream_calls_total")
+
+    def record_bypass(self) -> None:
+        """Record a generation that skipped the cache"""
+        metrics.inc("generation_cache_bypass_total")
+
+    def clear(self) -> None:
+        """Remove all cached responses"""
+        with self._lock:
+            self._entries.clear()
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        """Publish the size and hit ratio (called with the lock held)"""
+        metrics.set("generation_cache_entries", len(self._entries))
+        metrics.set("generation_cache_hit_ratio", self._hits / self._lookups if self._lookups else 0.0)
+
+
+# Create a singleton instance
+generation_cache = GenerationCache()
@@ -0,0 +1,157 @@
+"""
+HLS Packaging Module for StorySpark
+
+This module packages narrated story audio into HLS renditions at several
+bitrates, so clients on slow connections can pick a low-bitrate stream and
+seeking only fetches the segments that are needed.
+"""
+import os
+import shutil
+import hashlib
+import logging
+import subprocess
+import tempfile
+from typing import List, Optional
+
+from .audio_processor import ffmpeg_available
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Audio bitrates (kbps) of the renditions in the ladder
+DEFAULT_BITRATES = [
+    int(bitrate) for bitrate in os.environ.get("HLS_BITRATES", "32,64,96").split(",") if bitrate.strip()
+]
+
+# Target duration of each segment in seconds
+SEGMENT_SECONDS = 6
+
+MASTER_PLAYLIST = "master.m3u8"
+
+
+def content_digest(file_path: str) -> str:
+    """
+    Compute the content address of an audio file
+
+    Args:
+        file_path: Path to the audio file
+
+    Returns:
+        Hex digest identifying the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_master_playlist(bitrates: List[int]) -> str:
+    """
+    Build the master playlist that lists each rendition
+
+    Args:
+        bitrates: Rendition bitrates in kbps
+
+    Returns:
+        Master playlist content
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for bitrate in sorted(bitrates):
+        # Allow for the MPEG-TS container overhead in the advertised bandwidth
+        bandwidth = int(bitrate * 1000 * 1.1)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},CODECS="mp4a.40.2"')
+        lines.append(f"{bitrate}k/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def package_hls(
+    source_path: str,
+    output_root: str,
+    bitrates: Optional[List[int]] = None
+) -> Optional[str]:
+    """
+    Package an audio file as HLS renditions with a master playlist
+
+    The output is stored under output_root/hls/<content digest>/, so a file
+    that has already been packaged is never transcoded again.
+
+    Args:
+        source_path: Path to the audio file to package
+        output_root: Directory under which the hls/ directory is created
+        bitrates: Rendition bitrates in kbps (default: DEFAULT_BITRATES)
+
+    Returns:
+        Path to the master playlist, or None if packaging is not possible
+    """
+    bitrates = bitrates or DEFAULT_BITRATES
+
+    if not os.path.exists(source_path):
+        logger.error(f"Cannot package missing audio file: {source_path}")
+        return None
+
+    if not ffmpeg_available():
+        logger.warning("Skipping HLS packaging (ffmpeg not available)")
+        return None
+
+    hls_root = os.path.join(output_root, "hls")
+    package_dir = os.path.join(hls_root, content_digest(source_path))
+    master_path = os.path.join(package_dir, MASTER_PLAYLIST)
+
+    if os.path.exists(master_path):
+        logger.info(f"Using existing HLS package: {package_dir}")
+        try:
+            # Mark the package as recently used for the audio garbage collector
+            os.utime(package_dir, None)
+        except OSError:
+            pass
+        return master_path
+
+    os.makedirs(hls_root, exist_ok=True)
+
+    # Build in a temporary directory and move it into place once complete
+    build_dir = tempfile.mkdtemp(dir=hls_root, prefix=".build-")
+    try:
+        for bitrate in bitrates:
+            rendition_dir = os.path.join(build_dir, f"{bitrate}k")
+            os.makedirs(rendition_dir)
+
+            proc = subprocess.run([
+                "ffmpeg",
+                "-y",
+                "-i", source_path,
+                "-vn",
+                "-ac", "1",
+                "-c:a", "aac",
+                "-b:a", f"{bitrate}k",
+                "-f", "hls",
+                "-hls_time", str(SEGMENT_SECONDS),
+                "-hls_playlist_type", "vod",
+                "-hls_segment_filename", os.path.join(rendition_dir, "segment_%03d.ts"),
+                os.path.join(rendition_dir, "index.m3u8")
+            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            if proc.returncode != 0:
+                logger.error(f"ffmpeg failed packaging {bitrate}k rendition: {proc.stderr.decode(errors='ignore')[-500:]}")
+                return None
+
+        with open(os.path.join(build_dir, MASTER_PLAYLIST), "w") as f:
+            f.write(build_master_playlist(bitrates))
+
+        try:
+            os.rename(build_dir, package_dir)
+        except OSError:
+            # Another worker packaged the same content first
+            if not os.path.exists(master_path):
+                raise
+
+        logger.info(f"Packaged {source_path} as HLS at {bitrates} kbps in {package_dir}")
+        return master_path
+
+    except Exception as e:
+        logger.error(f"Error packaging HLS: {str(e)}")
+        return None
+
+    finally:
+        if os.path.exists(build_dir):
+            shutil.rmtree(build_dir, ignore_errors=True)
@@ -0,0 +1,290 @@
+"""
+Keyword Matcher Module for StorySpark
+
+This module scores paragraphs against keyword tables, such as the words
+that suggest an emotion or a sound effect. All keywords of all tables are
+compiled once: single words and prefixes into one trie-shaped regular
+expression, and phrases into an Aho-Corasick automaton over words. Each
+paragraph is then scanned in a single pass regardless of how many keywords
+there are.
+
+Matching works on whole words, so "tear" does not match "steering" and
+"cat" does not match "education". A keyword ending in "*" matches any word
+starting with it ("laugh*" matches "laughed"), and keywords can be phrases
+of several words ("once upon a time").
+"""
+import os
+import re
+import json
+import logging
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Words, including contractions such as "don't"
+_WORD = re.compile(r"\w+(?:['’]\w+)*")
+
+# Number of distinct words whose prefix matches are remembered
+PREFIX_CACHE_SIZE = 50000
+
+# Keywords per group and category. A list gives every keyword a weight of 1;
+# a dictionary maps keywords to weights. Categories are listed in priority
+# order, which breaks ties between equal scores.
+DEFAULT_KEYWORD_TABLE = {
+    "emotion": {
+        "happy": ["happy", "happily", "joy*", "laugh*", "smil*", "danc*", "celebrat*"],
+        "scared": ["scared", "scary", "fear*", "afraid", "terrified", "terrifying", "horror*"],
+        "sad": ["sad", "sadly", "sadness", "cry", "cries", "cried", "crying", "tear", "tears", "sorrow*", "unhappy"],
+        "excited": ["wow", "amazing", "amazed", "wonder*", "incredibl*", "magic*"],
+        "calm": ["calm*", "peace*", "quiet*", "gentl*", "soft*"],
+        "mysterious": ["secret*", "myster*", "hidden", "unknown"]
+    },
+    "effect": {
+        "forest": ["forest*", "tree", "trees", "wood", "woods", "jungle*"],
+        "rain": ["rain", "rains", "rained", "raining", "rainy", "storm*", "thunder*"],
+        "river": ["river*", "stream", "brook", "water"],
+        "wind": ["wind", "winds", "windy", "breeze*", "gust*"],
+        "magic": ["magic*", "spell", "spells", "wizard*", "fairy", "fairies"],
+        "door": ["door*", "knock*", "enter", "entered", "house"],
+        "animal": ["animal*", "dog", "dogs", "cat", "cats", "bird", "birds", "puppy", "kitten*"]
+    }
+}
+
+KeywordTable = Dict[str, Dict[str, Union[List[str], Dict[str, float]]]]
+
+
+class KeywordMatcher:
+    """
+    Single-pass, word-boundary aware multi-keyword matcher
+    """
+
+    def __init__(self, table: KeywordTable):
+        """
+        Compile a keyword table
+
+        Args:
+            table: Keywords per group and category, see DEFAULT_KEYWORD_TABLE
+
+        Raises:
+            ValueError: If a phrase of several words uses "*"
+        """
+        self.categories = {group: list(categories) for group, categories in table.items()}
+
+        # Automaton over words: transitions, failure links and the
+        # (group, category, weight) outputs of each state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[Tuple[str, str, float]]] = [[]]
+
+        # Prefix keywords, matched against each word separately
+        self._prefixes: List[Tuple[str, str, str, float]] = []
+        self._prefix_cache: Dict[str, List[Tuple[str, str, float]]] = {}
+
+        for group, categories in table.items():
+            for category, keywords in categories.items():
+                items = keywords.items() if isinstance(keywords, dict) else ((keyword, 1.0) for keyword in keywords)
+                for keyword, weight in items:
+                    self._add(keyword, group, category, float(weight))
+
+        self._build_failure_links()
+        self._has_phrases = any(self._goto[state] for state in self._goto[0].values())
+        self._pattern = self._compile_pattern()
+
+    def _add(self, keyword: str, group: str, category: str, weight: float) -> None:
+        """Add one keyword to the automaton"""
+        keyword = keyword.strip().lower()
+        if keyword.endswith("*"):
+            words = _WORD.findall(keyword[:-1])
+            if len(words) != 1:
+                raise ValueError(f"Prefix keywords must be a single word: {keyword!r}")
+            self._prefixes.append((words[0], group, category, weight))
+            return
+
+        words = _WORD.findall(keyword)
+        if not words or "*" in keyword:
+            raise ValueError(f"Invalid keyword: {keyword!r}")
+
+        state = 0
+        for word in words:
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append((group, category, weight))
+
+    def _build_failure_links(self) -> None:
+        """Link each state to the longest proper suffix that is also a prefix"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(word, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def _compile_pattern(self) -> Optional["re.Pattern"]:
+        """
+        Compile single-word and prefix keywords into one regular expression
+
+        The alternatives are nested as a trie, so the regex engine only
+        follows keywords sharing the characters read so far. Matches span
+        whole words as _WORD splits them, so the matched text can be looked
+        up directly.
+        """
+        words = [word for word in self._goto[0] if self._outputs[self._goto[0][word]]]
+        prefixes = [prefix for prefix, _, _, _ in self._prefixes]
+        alternatives = []
+        if prefixes:
+            alternatives.append(_trie_pattern(prefixes) + r"\w*(?:['’]\w+)*")
+        if words:
+            alternatives.append(_trie_pattern(words) + r"(?!\w|['’]\w)")
+        if not alternatives:
+            return None
+        return re.compile(r"(?<!\w)(?<!\w['’])(?:" + "|".join(alternatives) + ")")
+
+    def matches(self, text: str) -> Iterator[Tuple[int, str, str, float]]:
+        """
+        Find all keyword matches in a text
+
+        Args:
+            text: Text to scan
+
+        Yields:
+            (word index where the match ends, group, category, weight)
+        """
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        for index, word in enumerate(_WORD.findall(text.lower())):
+            if self._prefixes:
+                for group, category, weight in self._prefix_matches(word):
+                    yield index, group, category, weight
+
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for group, category, weight in outputs[state]:
+                yield index, group, category, weight
+
+    def scan(self, text: str) -> Dict[str, Dict[str, float]]:
+        """
+        Score a text for every category in one pass
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            Total weight of matched keywords per group and category; groups
+            are always present, categories only when they matched
+        """
+        scores = {group: {} for group in self.categories}
+        if self._has_phrases:
+            found = ((group, category, weight) for _, group, category, weight in self.matches(text))
+        elif self._pattern is None:
+            found = ()
+        else:
+            found = (match for word in self._pattern.findall(text.lower()) for match in self._word_matches(word))
+
+        for group, category, weight in found:
+            group_scores = scores[group]
+            group_scores[category] = group_scores.get(category, 0.0) + weight
+        return scores
+
+    def best(self, scores: Dict[str, float], group: str) -> Optional[str]:
+        """
+        Pick the highest scoring category of a group
+
+        Args:
+            scores: Scores of one group, from scan
+            group: Name of the group, for the tie-breaking order
+
+        Returns:
+            Category name, or None if nothing matched
+        """
+        best_category, best_score = None, 0.0
+        for category in self.categories.get(group, []):
+            score = scores.get(category, 0.0)
+            if score > best_score:
+                best_category, best_score = category, score
+        return best_category
+
+    def _word_matches(self, word: str) -> List[Tuple[str, str, float]]:
+        """Single-word and prefix keywords matching a word"""
+        state = self._goto[0].get(word)
+        exact = self._outputs[state] if state is not None else []
+        return exact + self._prefix_matches(word) if self._prefixes else exact
+
+    def _prefix_matches(self, word: str) -> List[Tuple[str, str, float]]:
+        """Prefix keywords matching a word, remembered per word"""
+        found = self._prefix_cache.get(word)
+        if found is None:
+            found = [
+                (group, category, weight)
+                for prefix, group, category, weight in self._prefixes
+                if word.startswith(prefix)
+            ]
+            if len(self._prefix_cache) >= PREFIX_CACHE_SIZE:
+                self._prefix_cache.clear()
+            self._prefix_cache[word] = found
+        return found
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """Regular expression matching any of the words, nested as a trie"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+def load_keyword_table(path: Optional[str] = None) -> KeywordTable:
+    """
+    Load the keyword table, applying overrides from a JSON file
+
+    Groups and categories in the file replace the defaults with the same
+    name; other defaults are kept.
+
+    Args:
+        path: JSON file with the same structure as DEFAULT_KEYWORD_TABLE
+
+    Returns:
+        Keyword table
+    """
+    table = {group: dict(categories) for group, categories in DEFAULT_KEYWORD_TABLE.items()}
+    if not path:
+        return table
+
+    try:
+        with open(path) as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not load keyword table from {path}: {str(e)}")
+        return table
+
+    for group, categories in overrides.items():
+        table.setdefault(group, {}).update(categories)
+    logger.info(f"Loaded keyword table overrides from {path}")
+    return table
+
+
+# Create a singleton instance
+keyword_matcher = KeywordMatcher(load_keyword_table(os.environ.get('KEYWORD_TABLE_FILE')))
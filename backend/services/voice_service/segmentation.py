@@ -0,0 +1,350 @@
+"""
+Text Segmentation Module for StorySpark
+
+This module splits story text into paragraphs and sentences. Gemini output
+is normalized on the way: Markdown emphasis, links, list markers, headings,
+code blocks and stray "Title:" lines are removed, whitespace is collapsed,
+and a line ending a sentence ends its paragraph even without a blank line
+after it, since Gemini often separates paragraphs with single newlines.
+
+Segments carry byte offsets into the normalized text, which is the
+paragraphs joined by blank lines. Text can be fed in pieces as it arrives;
+a sentence is returned as soon as the start of the next one shows where it
+ends, and the result does not depend on how the text was split into pieces.
+"""
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Bytes of text synthesized per speech item; Google Cloud TTS accepts at most 5000
+MAX_SPEECH_BYTES = 4500
+
+# Block-level Markdown
+_FENCE = re.compile(r"^\s*(?:```|~~~)")
+_HEADING = re.compile(r"^\s{0,3}#{1,6}(?:\s|$)")
+_TITLE = re.compile(r"^\W*title\s*\W*:", re.IGNORECASE)
+_RULE = re.compile(r"^\s{0,3}([-*_])(?:\s*\1){2,}\s*$")
+_BLOCK_PREFIX = re.compile(r"^\s*(?:>\s*)*(?:[-*+]\s+|\d{1,3}[.)]\s+)?")
+
+# Inline Markdown
+_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_EMPHASIS = re.compile(r"(?<!\w)[*_]{1,3}(?=\S)|(?<=\S)[*_]{1,3}(?!\w)|`")
+_SPACE = re.compile(r"\s+")
+
+# Sentence ends, including closing quotes and brackets, and a line ending one
+_SENTENCE_END = re.compile(r"[.!?…।]+[\"'”’)\]]*(?= )")
+_PARAGRAPH_END = re.compile(r"[.!?…।][\"'”’)\]]*$")
+_NEXT_WORD = re.compile(r"[^\W_]")
+_LAST_WORD = re.compile(r"(\w+)\.$")
+
+# Words whose period does not end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "mt"}
+
+
+class Segment:
+    """A paragraph or sentence of normalized story text"""
+
+    def __init__(self, kind: str, index: int, text: str, start: int, end: int, paragraph: int):
+        """
+        Initialize a segment
+
+        Args:
+            kind: "paragraph" or "sentence"
+            index: Position among the segments of the same kind
+            text: Normalized text of the segment
+            start: Byte offset of the segment in the normalized UTF-8 text
+            end: Byte offset just after the segment
+            paragraph: Index of the paragraph the segment belongs to
+        """
+        self.kind = kind
+        self.index = index
+        self.text = text
+        self.start = start
+        self.end = end
+        self.paragraph = paragraph
+
+    def to_dict(self) -> Dict:
+        """Convert to dictionary for serialization"""
+        return {
+            "kind": self.kind,
+            "index": self.index,
+            "text": self.text,
+            "start": self.start,
+            "end": self.end,
+            "paragraph": self.paragraph
+        }
+
+    def __repr__(self) -> str:
+        return f"Segment({self.kind!r}, {self.index}, {self.text[:30]!r}, {self.start}, {self.end})"
+
+
+def clean_line(line: str) -> str:
+    """
+    Remove inline Markdown and list or quote markers from one line
+
+    Args:
+        line: Line of text
+
+    Returns:
+        Plain text with collapsed whitespace
+    """
+    text = _BLOCK_PREFIX.sub("", line, count=1)
+    text = _LINK.sub(r"\1", text)
+    text = _EMPHASIS.sub("", text)
+    return _SPACE.sub(" ", text).strip()
+
+
+def clean_title(line: str) -> str:
+    """
+    Clean a title line, such as "**Title:** The Clever Crow" or "# The Clever Crow"
+
+    Args:
+        line: First line of a generated story
+
+    Returns:
+        Title text
+    """
+    text = re.sub(r"^\s*#+\s*", "", line)
+    text = clean_line(text)
+    return re.sub(r"^title\s*:\s*", "", text, flags=re.IGNORECASE).strip()
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """
+    Find the sentences of a paragraph
+
+    A sentence ends at ".", "!", "?", an ellipsis or a danda followed by a
+    word that does not start in lowercase, so that dialogue such as
+    '"Help!" she cried.' stays one sentence. Abbreviations and initials do
+    not end sentences.
+
+    Args:
+        text: Paragraph text with collapsed whitespace
+
+    Returns:
+        (start, end) character offsets of each sentence; the last one runs
+        to the end of the text
+    """
+    spans = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        next_word = _NEXT_WORD.search(text, match.end())
+        if next_word is None or next_word.group().islower():
+            continue
+        last_word = _LAST_WORD.search(text, start, match.end())
+        if last_word and (last_word.group(1).lower() in ABBREVIATIONS or len(last_word.group(1)) == 1):
+            continue
+        spans.append((start, match.end()))
+        start = match.end() + 1
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+class Segmenter:
+    """
+    Incremental paragraph and sentence segmenter
+    """
+
+    def __init__(self):
+        """Initialize an empty segmenter"""
+        self._buffer = ""  # Text after the last newline
+        self._lines: List[str] = []  # Cleaned lines of the open paragraph
+        self._in_fence = False
+        self._offset = 0  # Bytes of normalized text of the completed paragraphs
+        self._paragraphs = 0
+        self._sentences = 0
+        self._emitted = 0  # Sentences of the open paragraph already returned
+
+    def feed(self, text: str) -> List[Segment]:
+        """
+        Add text
+
+        Args:
+            text: Next piece of the story
+
+        Returns:
+            Segments completed by this piece
+        """
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+
+        segments = []
+        for line in lines:
+            segments.extend(self._add_line(line))
+        segments.extend(self._open_sentences(self._peek()))
+        return segments
+
+    def close(self) -> List[Segment]:
+        """
+        End the text
+
+        Returns:
+            The remaining segments
+        """
+        segments = self._add_line(self._buffer) if self._buffer else []
+        self._buffer = ""
+        segments.extend(self._end_paragraph())
+        return segments
+
+    def _add_line(self, line: str) -> List[Segment]:
+        """Add a complete line"""
+        line = line.rstrip("\r")
+        if _FENCE.match(line):
+            self._in_fence = not self._in_fence
+            return self._end_paragraph()
+        if self._in_fence:
+            return []
+        if not line.strip() or _HEADING.match(line) or _TITLE.match(line) or _RULE.match(line):
+            return self._end_paragraph()
+
+        text = clean_line(line)
+        if not text:
+            return []
+        self._lines.append(text)
+        if _PARAGRAPH_END.search(text):
+            return self._end_paragraph()
+        return self._open_sentences()
+
+    def _peek(self) -> Optional[str]:
+        """Cleaned text of the incomplete last line, if it can be part of the open paragraph"""
+        line = self._buffer.rstrip("\r")
+        if self._in_fence or not line.strip() or _FENCE.match(line) or _HEADING.match(line) or _TITLE.match(line):
+            return None
+        return clean_line(line) or None
+
+    def _paragraph_text(self, tail: Optional[str] = None) -> str:
+        """Text of the open paragraph"""
+        return " ".join(self._lines + [tail] if tail else self._lines)
+
+    def _paragraph_start(self) -> int:
+        """Byte offset of the open paragraph"""
+        return self._offset + 2 if self._paragraphs else self._offset
+
+    def _sentence(self, text: str, span: Tuple[int, int], paragraph_start: int) -> Segment:
+        """Create the segment of a sentence of the open paragraph"""
+        start = paragraph_start + len(text[:span[0]].encode("utf-8"))
+        sentence = text[span[0]:span[1]]
+        segment = Segment("sentence", self._sentences, sentence, start, start + len(sentence.encode("utf-8")), self._paragraphs)
+        self._sentences += 1
+        self._emitted += 1
+        return segment
+
+    def _open_sentences(self, tail: Optional[str] = None) -> List[Segment]:
+        """Sentences of the open paragraph whose end is known"""
+        text = self._paragraph_text(tail)
+        spans = sentence_spans(text)[self._emitted:-1]
+        paragraph_start = self._paragraph_start()
+        return [self._sentence(text, span, paragraph_start) for span in spans]
+
+    def _end_paragraph(self) -> List[Segment]:
+        """Complete the open paragraph"""
+        text = self._paragraph_text()
+        self._lines = []
+        if not text:
+            return []
+
+        paragraph_start = self._paragraph_start()
+        segments = [self._sentence(text, span, paragraph_start) for span in sentence_spans(text)[self._emitted:]]
+        end = paragraph_start + len(text.encode("utf-8"))
+        segments.append(Segment("paragraph", self._paragraphs, text, paragraph_start, end, self._paragraphs))
+
+        self._offset = end
+        self._paragraphs += 1
+        self._emitted = 0
+        return segments
+
+
+def segment(text: str) -> List[Segment]:
+    """
+    Split a complete text into segments
+
+    Args:
+        text: Story text, possibly with Markdown
+
+    Returns:
+        Sentence segments, each paragraph followed by its paragraph segment
+    """
+    segmenter = Segmenter()
+    return segmenter.feed(text) + segmenter.close()
+
+
+def split_paragraphs(text: str) -> List[Tuple[str, List[str]]]:
+    """
+    Split a complete text into paragraphs and their sentences
+
+    Args:
+        text: Story text, possibly with Markdown
+
+    Returns:
+        List of (paragraph text, sentence texts)
+    """
+    paragraphs, sentences = [], []
+    for item in segment(text):
+        if item.kind == "sentence":
+            sentences.append(item.text)
+        else:
+            paragraphs.append((item.text, sentences))
+            sentences = []
+    return paragraphs
+
+
+def normalize(text: str) -> str:
+    """
+    Normalize story text: plain paragraphs separated by blank lines
+
+    Segment offsets refer to this text.
+
+    Args:
+        text: Story text, possibly with Markdown
+
+    Returns:
+        Normalized text
+    """
+    return "\n\n".join(item.text for item in segment(text) if item.kind == "paragraph")
+
+
+def pack_sentences(sentences: List[str], max_bytes: int = MAX_SPEECH_BYTES) -> List[str]:
+    """
+    Group consecutive sentences into chunks of at most max_bytes
+
+    A sentence longer than max_bytes is split between words.
+
+    Args:
+        sentences: Sentences of a paragraph
+        max_bytes: Largest chunk in UTF-8 bytes
+
+    Returns:
+        Chunks of text
+    """
+    chunks: List[str] = []
+    current, size = [], 0
+    for sentence in sentences:
+        for part in _split_long(sentence, max_bytes):
+            part_size = len(part.encode("utf-8"))
+            if current and size + 1 + part_size > max_bytes:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            size += part_size + (1 if current else 0)
+            current.append(part)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def _split_long(sentence: str, max_bytes: int) -> List[str]:
+    """Split a sentence between words into parts of at most max_bytes"""
+    if len(sentence.encode("utf-8")) <= max_bytes:
+        return [sentence]
+    parts, current = [], ""
+    for word in sentence.split(" "):
+        candidate = f"{current} {word}" if current else word
+        if current and len(candidate.encode("utf-8")) > max_bytes:
+            parts.append(current)
+            candidate = word
+        current = candidate
+    parts.append(current)
+    return parts
@@ -0,0 +1,360 @@
+"""
+Similarity Cache Module for StorySpark
+
+This module reuses Gemini responses for requests that differ only trivially
+from an earlier one, such as "kindness" vs "Kindness", reordered characters
+or extra whitespace in the setting. The setting and characters are turned
+into sets of word and character shingles, summarized with MinHash
+signatures, and indexed with locality-sensitive hashing (LSH) so a lookup
+only compares the few entries that share a band with the request, however
+many entries are cached.
+
+Fields that change the story in ways a child would notice (the theme, which
+is the moral asked for, age group, duration, language and the child's name)
+are not compared by similarity; after normalizing case, whitespace and
+punctuation they must match exactly.
+"""
+import os
+import re
+import sys
+import time
+import zlib
+import random
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+from ..metrics import metrics
+from .generation_cache import average_upstream_latency
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache settings
+SIMILARITY_CACHE_THRESHOLD = float(os.environ.get('SIMILARITY_CACHE_THRESHOLD', 0.8))  # Estimated Jaccard similarity
+SIMILARITY_CACHE_SIZE = int(os.environ.get('SIMILARITY_CACHE_SIZE', 2000))  # Entries, each holding a story; 0 disables the cache
+SIMILARITY_CACHE_TTL = float(os.environ.get('SIMILARITY_CACHE_TTL', 24 * 60 * 60))  # Seconds
+
+# MinHash signature layout: BANDS * ROWS hash functions. With 16 bands of 4
+# rows, requests with a similarity of 0.8 share a band with a probability
+# above 99.9%, while requests below 0.3 rarely do.
+SIGNATURE_BANDS = 16
+SIGNATURE_ROWS = 4
+
+# Multiply-shift hashing works modulo 2^64
+_MASK64 = (1 << 64) - 1
+
+# Length of character shingles taken from each word
+SHINGLE_SIZE = 3
+
+metrics.describe("similarity_cache_hits_total", "counter", "Story generations answered by a similar cached request")
+metrics.describe("similarity_cache_entries", "gauge", "Requests currently held in the similarity cache")
+
+
+def normalize_words(value) -> List[str]:
+    """
+    Split a field into lower-case words without punctuation
+
+    Args:
+        value: String, list of strings or None
+
+    Returns:
+        List of words
+    """
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        value = " ".join(str(item) for item in value)
+    return re.findall(r"\w+", str(value).casefold())
+
+
+def shingles(theme=None, setting=None, characters=None) -> Set[str]:
+    """
+    Build the shingle set compared between requests
+
+    Each word contributes itself and its character trigrams, prefixed with
+    the field it came from so that a theme word does not match the same word
+    in the setting. Characters are treated as a set, so their order does
+    not matter.
+
+    Args:
+        theme: Theme of the story
+        setting: Setting of the story
+        characters: Character types or names
+
+    Returns:
+        Set of shingles
+    """
+    result = set()
+    for field, value in (("t", theme), ("s", setting), ("c", characters)):
+        words = normalize_words(value)
+        if not words:
+            result.add(f"{field}:")
+        for word in words:
+            result.add(f"{field}:{word}")
+            padded = f" {word} "
+            for i in range(len(padded) - SHINGLE_SIZE + 1):
+                result.add(f"{field}#{padded[i:i + SHINGLE_SIZE]}")
+    return result
+
+
+class MinHasher:
+    """
+    MinHash signatures from a fixed family of multiply-shift hash functions
+    """
+
+    def __init__(self, num_hashes: int = SIGNATURE_BANDS * SIGNATURE_ROWS, seed: int = 42):
+        """
+        Initialize the hash family
+
+        Args:
+            num_hashes: Length of each signature
+            seed: Seed for the hash coefficients, so signatures are stable
+        """
+        rng = random.Random(seed)
+        self.multipliers = [rng.getrandbits(64) | 1 for _ in range(num_hashes)]
+        self.offsets = [rng.getrandbits(64) for _ in range(num_hashes)]
+        if numpy is not None:
+            self._multipliers = numpy.array(self.multipliers, dtype=numpy.uint64)[:, None]
+            self._offsets = numpy.array(self.offsets, dtype=numpy.uint64)[:, None]
+
+    def signature(self, items: Iterable[str]) -> array:
+        """
+        Compute the MinHash signature of a set
+
+        Each hash function is the top 32 bits of (a * x + b) mod 2^64, which
+        numpy computes for all functions and shingles at once.
+
+        Args:
+            items: Shingles
+
+        Returns:
+            Array of unsigned 32-bit minimum hash values
+        """
+        values = [zlib.crc32(item.encode("utf-8")) for item in items] or [0]
+
+        if numpy is not None:
+            # uint64 arithmetic wraps around, which is the mod 2^64
+            hashed = (self._multipliers * numpy.array(values, dtype=numpy.uint64) + self._offsets) >> numpy.uint64(32)
+            signature = array("I")
+            signature.frombytes(hashed.min(axis=1).astype(numpy.uint32).tobytes())
+            return signature
+
+        return array("I", [
+            min(((a * x + b) & _MASK64) >> 32 for x in values)
+            for a, b in zip(self.multipliers, self.offsets)
+        ])
+
+
+def estimate_similarity(first: array, second: array) -> float:
+    """
+    Estimate the Jaccard similarity of two sets from their signatures
+
+    Args:
+        first: MinHash signature
+        second: MinHash signature of the same length
+
+    Returns:
+        Fraction of matching signature positions
+    """
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+class _Entry:
+    """One cached request"""
+
+    __slots__ = ("partition", "signature", "content", "stored_at")
+
+    def __init__(self, partition: str, signature: array, content: str, stored_at: float):
+        self.partition = partition
+        self.signature = signature
+        self.content = content
+        self.stored_at = stored_at
+
+
+class SimilarityCache:
+    """
+    In-memory MinHash/LSH index of model responses
+    """
+
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_CACHE_THRESHOLD,
+        max_entries: int = SIMILARITY_CACHE_SIZE,
+        ttl: float = SIMILARITY_CACHE_TTL,
+        bands: int = SIGNATURE_BANDS,
+        rows: int = SIGNATURE_ROWS
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            threshold: Minimum estimated similarity for a hit
+            max_entries: Maximum number of requests kept (0 disables the cache)
+            ttl: Seconds a response stays valid
+            bands: Number of LSH bands
+            rows: Signature positions per band
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = rows
+        self.hasher = MinHasher(bands * rows)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Most buckets hold a single entry, which is stored without a set
+        self._buckets: Dict[int, Union[str, Set[str]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether responses are cached at all"""
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_partition(model_id: str, **exact_fields) -> str:
+        """
+        Build the partition of fields that must match exactly
+
+        Args:
+            model_id: Name of the model
+            exact_fields: Fields such as age_group, duration, language and child_name
+
+        Returns:
+            Partition key
+        """
+        parts = [model_id] + [
+            f"{name}={' '.join(normalize_words(exact_fields[name]))}" for name in sorted(exact_fields)
+        ]
+        return "|".join(parts)
+
+    def get(self, partition: str, theme=None, setting=None, characters=None) -> Optional[str]:
+        """
+        Find a cached response for a similar request
+
+        Args:
+            partition: Key from make_partition
+            theme: Theme of the story, which must match exactly
+            setting: Setting of the story
+            characters: Character types or names
+
+        Returns:
+            The response of the most similar cached request at or above the
+            threshold, or None
+        """
+        if not self.enabled:
+            return None
+
+        partition = self._theme_partition(partition, theme)
+        signature = self.hasher.signature(shingles(setting=setting, characters=characters))
+        now = time.time()
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(partition, signature):
+                bucket = self._buckets.get(band_key)
+                if isinstance(bucket, set):
+                    candidates.update(bucket)
+                elif bucket is not None:
+                    candidates.add(bucket)
+
+            best_id, best_similarity = None, self.threshold
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry.stored_at >= self.ttl:
+                    self._remove(entry_id)
+                    continue
+                similarity = estimate_similarity(signature, entry.signature)
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            if best_id is None:
+                return None
+
+            self._entries.move_to_end(best_id)
+            content = self._entries[best_id].content
+
+        logger.info(f"Similarity cache hit ({best_similarity:.2f}) in {partition}")
+        metrics.inc("similarity_cache_hits_total")
+        metrics.inc("generation_saved_seconds_total", average_upstream_latency())
+        return content
+
+    def put(self, entry_id: str, partition: str, content: str, theme=None, setting=None, characters=None) -> None:
+        """
+        Index a response
+
+        Args:
+            entry_id: Unique ID of the request, such as its exact cache key
+            partition: Key from make_partition
+            content: Response from the model
+            theme: Theme of the story, which must match exactly
+            setting: Setting of the story
+            characters: Character types or names
+        """
+        if not self.enabled:
+            return
+
+        partition = self._theme_partition(partition, theme)
+        signature = self.hasher.signature(shingles(setting=setting, characters=characters))
+        with self._lock:
+            if entry_id in self._entries:
+                self._remove(entry_id)
+
+            # Entries in a partition share one partition string
+            self._entries[entry_id] = _Entry(sys.intern(partition), signature, content, time.time())
+            for band_key in self._band_keys(partition, signature):
+                bucket = self._buckets.get(band_key)
+                if bucket is None:
+                    self._buckets[band_key] = entry_id
+                elif isinstance(bucket, set):
+                    bucket.add(entry_id)
+                else:
+                    self._buckets[band_key] = {bucket, entry_id}
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            metrics.set("similarity_cache_entries", len(self._entries))
+
+    def clear(self) -> None:
+        """Remove all cached responses"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            metrics.set("similarity_cache_entries", 0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _theme_partition(partition: str, theme) -> str:
+        """Partition narrowed to one normalized theme, which a long setting or cast must not outweigh"""
+        return f"{partition}|theme={' '.join(normalize_words(theme))}"
+
+    def _band_keys(self, partition: str, signature: array) -> List[int]:
+        """LSH bucket keys of a signature within a partition"""
+        return [
+            hash((partition, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, entry_id: str) -> None:
+        """Remove an entry and its bucket memberships (called with the lock held)"""
+        entry = self._entries.pop(entry_id)
+        for band_key in self._band_keys(entry.partition, entry.signature):
+            bucket = self._buckets.get(band_key)
+            if isinstance(bucket, set):
+                bucket.discard(entry_id)
+                if len(bucket) == 1:
+                    self._buckets[band_key] = bucket.pop()
+            elif bucket == entry_id:
+                del self._buckets[band_key]
+
+
+# Create a singleton instance
+similarity_cache = SimilarityCache()
@@ -6,11 +6,21 @@ utilizing the voice service for audio output.
 """
 import logging
 import os
+import re
 import time
-import json
+import asyncio
+import hashlib
 import google.generativeai as genai
-from typing import Dict, List, Optional, Any, Union
-from .voice_service import voice_service, SoundItem
+from typing import Dict, List, Optional, Any, Tuple, Union
+from .voice_service import voice_service, SoundItem, NarrationPending, AUDIO_FORMATS, PLACEHOLDER_AUDIO_PATH
+from .generation_cache import generation_cache
+from .similarity_cache import similarity_cache
+from .token_budget import token_budget
+from .keyword_matcher import keyword_matcher
+from .segmentation import clean_title, normalize, pack_sentences, split_paragraphs
+from ..prompts import prompt_registry, PromptTemplate, STORY_PROMPT
+from ..rate_limiter import RateLimited, RateLimiter
+from ..resilience import CircuitBreaker, ResilientClient, backoff_delay
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -29,6 +39,47 @@ if GEMINI_API_KEY:
 else:
     logger.warning("Skipping Gemini API configuration due to missing API key")
 
+# Gemini model used for story generation - the flash model for faster responses
+GEMINI_MODEL_ID = "gemini-2.0-flash"
+
+# Gemini call policy: per-attempt timeout, overall deadline (well below the
+# 60s proxy timeout), retries of transient errors, hedging and circuit breaker
+GEMINI_TIMEOUT = float(os.environ.get("GEMINI_TIMEOUT", 25))
+GEMINI_DEADLINE = float(os.environ.get("GEMINI_DEADLINE", 40))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", 3))
+GEMINI_HEDGE = os.environ.get("GEMINI_HEDGE", "false").lower() in ("true", "1", "t")
+GEMINI_BREAKER_THRESHOLD = int(os.environ.get("GEMINI_BREAKER_THRESHOLD", 5))
+GEMINI_BREAKER_RESET = float(os.environ.get("GEMINI_BREAKER_RESET", 30))
+GEMINI_SETUP_TIMEOUT = 10.0
+
+# Gemini quota shared by all workers, in requests and tokens per minute
+# (0 disables a limit); a call is charged its estimated prompt tokens plus
+# its output token limit
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", 1000))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", 1000000))
+GEMINI_DEFAULT_OUTPUT_TOKENS = 2048
+
+gemini_limiter = RateLimiter("gemini", {"requests": GEMINI_RPM, "tokens": GEMINI_TPM})
+
+gemini_client = ResilientClient(
+    "gemini",
+    timeout=GEMINI_TIMEOUT,
+    deadline=GEMINI_DEADLINE,
+    max_attempts=GEMINI_MAX_ATTEMPTS,
+    hedge=GEMINI_HEDGE,
+    breaker=CircuitBreaker("gemini", GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_RESET),
+    limiter=gemini_limiter
+)
+
+# Completing narrations in the background: rounds of synthesis of the missing
+# segments, with jittered backoff of up to NARRATION_RETRY_MAX_DELAY seconds between them
+NARRATION_RETRY_ROUNDS = int(os.environ.get("NARRATION_RETRY_ROUNDS", 5))
+NARRATION_RETRY_DELAY = float(os.environ.get("NARRATION_RETRY_DELAY", 15))
+NARRATION_RETRY_MAX_DELAY = 120.0
+
+# Package narrations as HLS renditions after rendering (requires ffmpeg)
+HLS_PACKAGING_ENABLED = os.environ.get("HLS_PACKAGING", "false").lower() in ("true", "1", "t")
+
 class StoryGenerator:
     """
     Service for generating and narrating stories
@@ -37,6 +88,11 @@ class StoryGenerator:
     def __init__(self):
         """Initialize the story generator"""
         self.voice_service = voice_service
+        self.generation_cache = generation_cache
+        self.similarity_cache = similarity_cache
+        self.token_budget = token_budget
+        self.keyword_matcher = keyword_matcher
+        self.gemini_client = gemini_client
         self.gemini_model = None
         self.setup_gemini_model()
     
@@ -49,11 +105,11 @@ class StoryGenerator:
                 self.gemini_model = None
                 return
                 
-            # Initialize Gemini model - using the flash model for faster responses
-            self.gemini_model = genai.GenerativeModel('gemini-2.0-flash')
+            # Initialize Gemini model
+            self.gemini_model = genai.GenerativeModel(GEMINI_MODEL_ID)
             
             # Test the model with a simple prompt to verify it works
-            test_response = self.gemini_model.generate_content("Hello")
+            test_response = self.gemini_client.call(self.gemini_model.generate_content, "Hello", timeout=GEMINI_SETUP_TIMEOUT)
             if test_response and hasattr(test_response, 'text'):
                 logger.info("Gemini model initialized and tested successfully")
             else:
@@ -71,7 +127,11 @@ class StoryGenerator:
         duration: str = "medium",
         age_group: str = "5-8",
         language: str = "en",
-        child_name: Optional[str] = None
+        child_name: Optional[str] = None,
+        stream: bool = False,
+        audio_format: Optional[str] = None,
+        use_cache: bool = True,
+        deadline: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Generate a new story based on given parameters
@@ -84,16 +144,139 @@ class StoryGenerator:
             age_group: Target age group (e.g., "3-5", "5-8", "8-12")
             language: Primary language code
             child_name: Name of the child for personalization
+            stream: Return a stream URL instead of rendering the full audio
+            audio_format: Narration format, "mp3" or "ogg_opus" (default: deployment setting)
+            use_cache: Reuse a cached response for the same prompt; when False
+                the model is always called and its response replaces a cached one
+            deadline: time.monotonic() value by which the story is needed, such
+                as the end of the request's time budget; generation and each
+                narrated segment get the time that is left
             
         Returns:
-            Dictionary containing story data including title, text, and audio
+            Dictionary containing story data including title, text, and audio.
+            narration_status is "pending" (with a sequence_id for
+            complete_narration) when part of the narration could not be
+            synthesized in time
+        """
+        plan = self._plan_story(theme, characters, setting, duration, age_group, language, child_name)
+        
+        story_content = None
+        if self.gemini_model:
+            try:
+                # Generate story using Gemini
+                story_content = self._generate_content(
+                    plan["prompt"], use_cache, params=plan["params"], budget=plan["budget"],
+                    prompt_version=plan["prompt_version"], deadline=deadline
+                )
+            except RateLimited:
+                # Over quota: the caller should come back later rather than get a fallback story
+                raise
+            except Exception as e:
+                logger.error(f"Error generating story with Gemini: {str(e)}")
+        story_title, story_text, is_fallback = self._compose_story(story_content, plan)
+        
+        # Convert story text to structured sound sequence
+        sound_sequence = self._create_sound_sequence(story_text, story_title)
+        
+        # Process the sound sequence to create audio, or defer it to the
+        # streaming endpoint so playback can start with the first paragraph
+        if stream:
+            narration = self._streamed_narration(sound_sequence, audio_format)
+        else:
+            try:
+                narration = {"audio_path": self.voice_service.process_sound_sequence(
+                    sound_sequence, audio_format=audio_format, deadline=deadline
+                )}
+            except NarrationPending as e:
+                narration = self._pending_narration(sound_sequence, e)
+        
+        return self._story_data(plan, story_title, story_text, is_fallback, sound_sequence, narration)
+    
+    async def generate_story_async(
+        self,
+        theme: Optional[str] = None,
+        characters: Optional[List[str]] = None,
+        setting: Optional[str] = None,
+        duration: str = "medium",
+        age_group: str = "5-8",
+        language: str = "en",
+        child_name: Optional[str] = None,
+        stream: bool = False,
+        audio_format: Optional[str] = None,
+        use_cache: bool = True,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate a new story like generate_story, awaiting Gemini and TTS on the event loop
+        
+        The model call and the narration's TTS requests do not hold a thread
+        while they wait, so one process can serve many stories at once.
+        Audio assembly and waveform analysis run in worker threads.
+        
+        Args:
+            The arguments of generate_story
+            
+        Returns:
+            Story data as returned by generate_story
+        """
+        plan = self._plan_story(theme, characters, setting, duration, age_group, language, child_name)
+        
+        story_content = None
+        if self.gemini_model:
+            try:
+                story_content = await self._generate_content_async(
+                    plan["prompt"], use_cache, params=plan["params"], budget=plan["budget"],
+                    prompt_version=plan["prompt_version"], deadline=deadline
+                )
+            except RateLimited:
+                raise
+            except Exception as e:
+                logger.error(f"Error generating story with Gemini: {str(e)}")
+        story_title, story_text, is_fallback = self._compose_story(story_content, plan)
+        
+        sound_sequence = self._create_sound_sequence(story_text, story_title)
+        
+        if stream:
+            narration = self._streamed_narration(sound_sequence, audio_format)
+        else:
+            try:
+                narration = {"audio_path": await self.voice_service.process_sound_sequence_async(
+                    sound_sequence, audio_format=audio_format, deadline=deadline
+                )}
+            except NarrationPending as e:
+                narration = self._pending_narration(sound_sequence, e)
+        
+        return await asyncio.to_thread(
+            self._story_data, plan, story_title, story_text, is_fallback, sound_sequence, narration
+        )
+    
+    def _plan_story(
+        self,
+        theme: Optional[str],
+        characters: Optional[List[str]],
+        setting: Optional[str],
+        duration: str,
+        age_group: str,
+        language: str,
+        child_name: Optional[str]
+    ) -> Dict[str, Any]:
+        """
+        Build the prompt and length budget for a story
+        
+        Returns:
+            Dictionary with the prompt, its template version, the token
+            budget and the story parameters
         """
         logger.info(f"Generating {duration} story with theme '{theme}' for age {age_group}")
         
         # Convert duration to minutes for the prompt
         duration_minutes = {"short": "3-5", "medium": "5-10", "long": "10-15"}.get(duration, "5-10")
         
+        # Bound the story length, and with it generation and narration time
+        budget = self.token_budget.plan(duration, age_group, language)
+        
         # Build the prompt for the Gemini model
+        template = prompt_registry.get(STORY_PROMPT)
         prompt = self._build_story_prompt(
             theme=theme, 
             characters=characters,
@@ -101,39 +284,102 @@ class StoryGenerator:
             duration_minutes=duration_minutes,
             age_group=age_group,
             language=language,
-            child_name=child_name
+            child_name=child_name,
+            target_words=budget["requested_words"],
+            template=template
         )
         
-        try:
-            # Generate story using Gemini
-            if self.gemini_model:
-                logger.info(f"Sending prompt to Gemini: {prompt[:100]}...")
-                story_response = self.gemini_model.generate_content(prompt)
-                story_content = story_response.text
-                logger.info(f"Received response from Gemini: {len(story_content)} characters")
-                
+        return {
+            "prompt": prompt,
+            "prompt_version": template.version_id,
+            "budget": budget,
+            "params": {
+                "theme": theme,
+                "setting": setting,
+                "characters": characters,
+                "age_group": age_group,
+                "duration": duration,
+                "language": language,
+                "child_name": child_name
+            }
+        }
+    
+    def _compose_story(self, story_content: Optional[str], plan: Dict[str, Any]) -> tuple:
+        """
+        Title and text of a story from the model response, or of the fallback story
+        
+        Args:
+            story_content: Raw model response, or None if there is none
+            plan: Plan from _plan_story
+            
+        Returns:
+            Tuple of (title, text, whether the fallback story was used)
+        """
+        params = plan["params"]
+        theme, setting = params["theme"], params["setting"]
+        if story_content is not None:
+            try:
                 # Extract title and text from the generated content
                 story_title, story_text = self._parse_story_content(story_content, theme, setting)
                 logger.info(f"Parsed story title: {story_title}")
-            else:
-                # Fallback if model isn't available
-                logger.warning("Gemini model not available, using fallback story generation")
-                story_title = f"The Adventure in the {setting or 'Magical Land'}"
-                story_text = self._generate_fallback_story(theme, setting, child_name, age_group)
-                
-                # Log the fallback story
-                logger.info(f"Generated fallback story with title: {story_title} and text: {story_text[:100]}...")
-        except Exception as e:
-            logger.error(f"Error generating story with Gemini: {str(e)}")
-            # Fallback story if generation fails
-            story_title = f"The Adventure in the {setting or 'Magical Land'}"
-            story_text = self._generate_fallback_story(theme, setting, child_name, age_group)
+                return story_title, story_text, False
+            except Exception as e:
+                logger.error(f"Error generating story with Gemini: {str(e)}")
+        elif not self.gemini_model:
+            logger.warning("Gemini model not available, using fallback story generation")
         
-        # Convert story text to structured sound sequence
-        sound_sequence = self._create_sound_sequence(story_text, story_title)
+        # Fallback story if the model is unavailable or generation failed
+        story_title = f"The Adventure in the {setting or 'Magical Land'}"
+        story_text = self._generate_fallback_story(theme, setting, params["child_name"], params["age_group"])
+        logger.info(f"Generated fallback story with title: {story_title} and text: {story_text[:100]}...")
+        return story_title, story_text, True
+    
+    def _streamed_narration(self, sound_sequence: List[SoundItem], audio_format: Optional[str]) -> Dict[str, Any]:
+        """Save a sequence for the streaming endpoint instead of rendering it"""
+        sequence_id = self.voice_service.save_sequence(sound_sequence)
+        stream_url = f"/api/voice/stream/{sequence_id}"
+        if audio_format:
+            stream_url += f"?format={audio_format}"
+        return {"sequence_id": sequence_id, "stream_url": stream_url}
+    
+    def _pending_narration(self, sound_sequence: List[SoundItem], error: NarrationPending) -> Dict[str, Any]:
+        """Save a sequence whose narration has to be completed later"""
+        # Return the story now; the missing segments are synthesized later
+        logger.warning(f"Narration pending: {str(error)}")
+        return {"sequence_id": self.voice_service.save_sequence(sound_sequence), "narration_status": "pending"}
+    
+    def _story_data(
+        self,
+        plan: Dict[str, Any],
+        story_title: str,
+        story_text: str,
+        is_fallback: bool,
+        sound_sequence: List[SoundItem],
+        narration: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Build the story data structure returned by generate_story
         
-        # Process the sound sequence to create audio
-        audio_path = self.voice_service.process_sound_sequence(sound_sequence)
+        Args:
+            plan: Plan from _plan_story
+            story_title: Title of the story
+            story_text: Text of the story
+            is_fallback: Whether the fallback story was used
+            sound_sequence: Narration sequence of the story
+            narration: audio_path, stream_url, sequence_id and narration_status
+                of the narration, where known
+            
+        Returns:
+            Story data
+        """
+        params = plan["params"]
+        audio_path = narration.get("audio_path")
+        
+        # Transcoding the HLS renditions is left to a background job (package_story_hls)
+        hls_pending = HLS_PACKAGING_ENABLED and audio_path and audio_path != PLACEHOLDER_AUDIO_PATH
+        
+        # Measure the rendered narration so players can draw it before downloading
+        audio_info = self.voice_service.describe_audio(audio_path) if audio_path else None
         
         # Create unique ID for the story
         story_id = int(time.time() * 1000)
@@ -144,17 +390,239 @@ class StoryGenerator:
             "title": story_title,
             "text": story_text,
             "audio_path": audio_path,
+            "stream_url": narration.get("stream_url"),
+            "sequence_id": narration.get("sequence_id"),
+            "narration_status": narration.get("narration_status", "ready"),
+            "hls_path": None,
+            "hls_status": "pending" if hls_pending else None,
             "duration": self._estimate_duration(sound_sequence),
-            "theme": theme,
-            "age_group": age_group,
-            "language": language,
-            "created_by": child_name,
+            "audio_duration": audio_info["duration"] if audio_info else None,
+            "waveform": audio_info["peaks"] if audio_info else None,
+            "content_hash": self.compute_content_hash(story_title, story_text),
+            "prompt_version": plan["prompt_version"],
+            "is_fallback": is_fallback,
+            "theme": params["theme"],
+            "age_group": params["age_group"],
+            "language": params["language"],
+            "created_by": params["child_name"],
             "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
             "is_downloadable": True
         }
         
         return story_data
     
+    def _generate_content(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        params: Optional[Dict[str, Any]] = None,
+        budget: Optional[Dict[str, int]] = None,
+        prompt_version: str = "",
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Get the model response for a prompt, using the generation caches
+        
+        The exact cache is checked first. Requests that only differ
+        trivially from an earlier one, such as a differently capitalized
+        theme, are then answered by the similarity cache when params are given.
+        
+        Args:
+            prompt: Prompt from _build_story_prompt
+            use_cache: Look the prompt up in the caches before calling the model
+            params: Parameters the prompt was built from
+            budget: Plan from TokenBudget.plan; limits the output tokens and
+                is calibrated with the length of the response
+            prompt_version: Version id of the prompt template, part of the cache keys
+            deadline: time.monotonic() value by which the response is needed
+            
+        Returns:
+            Raw story content from the model
+        """
+        cache_key, partition, story_content = self._cached_content(prompt, use_cache, params, prompt_version)
+        if story_content is not None:
+            return story_content
+        
+        logger.info(f"Sending prompt to Gemini: {prompt[:100]}...")
+        start = time.time()
+        generation_config, cost = self._gemini_request(prompt, budget)
+        story_response = self.gemini_client.call(
+            self.gemini_model.generate_content, prompt,
+            generation_config=generation_config,
+            deadline=deadline,
+            cost=cost
+        )
+        return self._received_content(story_response, start, cache_key, partition, params, budget)
+    
+    async def _generate_content_async(
+        self,
+        prompt: str,
+        use_cache: bool = True,
+        params: Optional[Dict[str, Any]] = None,
+        budget: Optional[Dict[str, int]] = None,
+        prompt_version: str = "",
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Get the model response for a prompt like _generate_content, awaiting Gemini
+        
+        Args:
+            The arguments of _generate_content
+            
+        Returns:
+            Raw story content from the model
+        """
+        cache_key, partition, story_content = self._cached_content(prompt, use_cache, params, prompt_version)
+        if story_content is not None:
+            return story_content
+        
+        logger.info(f"Sending prompt to Gemini: {prompt[:100]}...")
+        start = time.time()
+        generation_config, cost = self._gemini_request(prompt, budget)
+        story_response = await self.gemini_client.call_async(
+            self.gemini_model.generate_content_async, prompt,
+            generation_config=generation_config,
+            deadline=deadline,
+            cost=cost
+        )
+        return self._received_content(story_response, start, cache_key, partition, params, budget)
+    
+    def _cached_content(
+        self,
+        prompt: str,
+        use_cache: bool,
+        params: Optional[Dict[str, Any]],
+        prompt_version: str
+    ) -> tuple:
+        """
+        Look a prompt up in the generation caches
+        
+        Returns:
+            Tuple of (exact cache key, similarity partition, cached content
+            or None)
+        """
+        cache_key = self.generation_cache.make_key(prompt, GEMINI_MODEL_ID, prompt_version)
+        partition = None
+        if params is not None:
+            partition = self.similarity_cache.make_partition(
+                f"{GEMINI_MODEL_ID}|{prompt_version}",
+                age_group=params.get("age_group"),
+                duration=params.get("duration"),
+                language=params.get("language"),
+                child_name=params.get("child_name")
+            )
+        
+        if use_cache:
+            # A prompt in the exact cache is still collecting variants, which
+            # a similarity hit on its own earlier response would prevent
+            exact_cached = cache_key in self.generation_cache
+            story_content = self.generation_cache.get(cache_key)
+            if story_content is None and partition and not exact_cached:
+                story_content = self.similarity_cache.get(
+                    partition, params.get("theme"), params.get("setting"), params.get("characters")
+                )
+            if story_content is not None:
+                logger.info(f"Using cached Gemini response: {len(story_content)} characters")
+                return cache_key, partition, story_content
+        else:
+            self.generation_cache.record_bypass()
+        return cache_key, partition, None
+    
+    @staticmethod
+    def _gemini_request(prompt: str, budget: Optional[Dict[str, int]]) -> tuple:
+        """
+        Generation config and quota cost of a Gemini request
+        
+        Returns:
+            Tuple of (generation config or None, rate limiter cost)
+        """
+        generation_config = {"max_output_tokens": budget["max_output_tokens"]} if budget else None
+        output_tokens = budget["max_output_tokens"] if budget else GEMINI_DEFAULT_OUTPUT_TOKENS
+        return generation_config, {"requests": 1, "tokens": len(prompt) // 4 + output_tokens}
+    
+    def _received_content(
+        self,
+        story_response,
+        start: float,
+        cache_key: str,
+        partition: Optional[str],
+        params: Optional[Dict[str, Any]],
+        budget: Optional[Dict[str, int]]
+    ) -> str:
+        """Record a Gemini response, apply the token budget and cache the content unless it was cut off"""
+        story_content = story_response.text
+        self.generation_cache.record_upstream(time.time() - start)
+        logger.info(f"Received response from Gemini: {len(story_content)} characters")
+        
+        truncated = False
+        if budget:
+            story_content, truncated = self._apply_token_budget(story_response, story_content, params or {}, budget)
+        
+        # A cut-off story is served once, but the next request gets a fresh try
+        if story_content and story_content.strip() and not truncated:
+            self.generation_cache.put(cache_key, story_content)
+            if partition:
+                self.similarity_cache.put(
+                    cache_key, partition, story_content,
+                    params.get("theme"), params.get("setting"), params.get("characters")
+                )
+        return story_content
+    
+    def _apply_token_budget(
+        self,
+        story_response,
+        story_content: str,
+        params: Dict[str, Any],
+        budget: Dict[str, int]
+    ) -> Tuple[str, bool]:
+        """
+        Calibrate the token budget from a response and tidy a cut-off story
+        
+        Args:
+            story_response: Response from the Gemini model
+            story_content: Text of the response
+            params: Parameters the prompt was built from
+            budget: Plan the prompt was built with
+            
+        Returns:
+            Tuple of (story content, ending on a complete sentence if it was
+            cut off, and whether it was cut off by the token limit)
+        """
+        candidate = story_response.candidates[0] if getattr(story_response, "candidates", None) else None
+        finish_reason = getattr(getattr(candidate, "finish_reason", None), "name", None)
+        token_count = getattr(candidate, "token_count", None)
+        truncated = finish_reason == "MAX_TOKENS"
+        output_words = len(story_content.split())
+        
+        if truncated:
+            logger.warning(f"Story reached the {budget['max_output_tokens']} token limit, trimming the last sentence")
+            story_content = self._trim_to_last_sentence(story_content)
+        
+        self.token_budget.observe(
+            params.get("duration", "medium"),
+            params.get("age_group", "5-8"),
+            requested_words=budget["requested_words"],
+            output_words=output_words,
+            output_tokens=token_count if isinstance(token_count, int) else None,
+            truncated=truncated,
+            language=params.get("language", "en")
+        )
+        return story_content, truncated
+    
+    @staticmethod
+    def _trim_to_last_sentence(text: str) -> str:
+        """
+        Drop an unfinished sentence from the end of a text
+        
+        Args:
+            text: Text that may end mid-sentence
+            
+        Returns:
+            Text up to its last sentence end, or the text unchanged if it has none
+        """
+        match = re.search(r'[.!?]["\'\u201d\u2019)]*(?=[^.!?]*$)', text)
+        return text[:match.end()] if match else text
+    
     def _create_sound_sequence(
         self, 
         story_text: str, 
@@ -191,38 +659,43 @@ class StoryGenerator:
         )
         
         # Split story into paragraphs for better pacing and appropriate emotions
-        paragraphs = story_text.split('\n\n')
+        paragraphs = split_paragraphs(story_text)
+        
+        # Score every paragraph for emotions and sound effects in one pass each
+        scores = [self.keyword_matcher.scan(paragraph) for paragraph, _ in paragraphs]
+        effects = self._place_sound_effects(scores)
         
         # Process each paragraph
-        for i, paragraph in enumerate(paragraphs):
-            if not paragraph.strip():
-                continue
-                
+        for i, (paragraph, sentences) in enumerate(paragraphs):
             # Determine appropriate emotion based on content keywords
-            emotion = self._detect_emotion(paragraph)
+            emotion = self.keyword_matcher.best(scores[i]["emotion"], "emotion") or 'neutral'
             
-            # Add paragraph narration
-            sound_sequence.append(
-                SoundItem(
-                    sound_type="human",
-                    content=paragraph.strip(),
-                    emotion=emotion,
-                    pause_after=0.8 if i < len(paragraphs) - 1 else 0.5
+            # Add paragraph narration, split between sentences if it is too long to synthesize at once
+            chunks = pack_sentences(sentences)
+            for j, chunk in enumerate(chunks):
+                if j < len(chunks) - 1:
+                    pause_after = 0.3
+                else:
+                    pause_after = 0.8 if i < len(paragraphs) - 1 else 0.5
+                sound_sequence.append(
+                    SoundItem(
+                        sound_type="human",
+                        content=chunk,
+                        emotion=emotion,
+                        pause_after=pause_after
+                    )
                 )
-            )
             
-            # Add relevant sound effect after some paragraphs
-            if i < len(paragraphs) - 1 and i % 3 == 0 and len(paragraphs) > 3:
-                effect = self._determine_sound_effect(paragraph)
-                if effect:
-                    sound_sequence.append(
-                        SoundItem(
-                            sound_type="effect",
-                            content=effect,
-                            pause_after=0.5,
-                            volume=0.5
-                        )
+            # Add a sound effect where it fits the text best
+            if i in effects:
+                sound_sequence.append(
+                    SoundItem(
+                        sound_type="effect",
+                        content=effects[i],
+                        pause_after=0.5,
+                        volume=0.5
                     )
+                )
         
         # Add a closing sound effect
         sound_sequence.append(
@@ -236,6 +709,34 @@ class StoryGenerator:
         
         return sound_sequence
     
+    def _place_sound_effects(self, scores: List[Dict[str, Dict[str, float]]]) -> Dict[int, str]:
+        """
+        Choose which paragraphs are followed by a sound effect
+        
+        Stories of more than three paragraphs get at most one effect per
+        three paragraphs, placed after the paragraph of each group with the
+        strongest effect match. No effect follows the last paragraph, which
+        is followed by the closing effect.
+        
+        Args:
+            scores: Keyword scores of each paragraph, from KeywordMatcher.scan
+            
+        Returns:
+            Sound effect name by paragraph index
+        """
+        effects = {}
+        if len(scores) <= 3:
+            return effects
+        
+        for start in range(0, len(scores) - 1, 3):
+            window = range(start, min(start + 3, len(scores) - 1))
+            best_index = max(window, key=lambda i: max(scores[i]["effect"].values(), default=0.0))
+            effect = self.keyword_matcher.best(scores[best_index]["effect"], "effect")
+            if effect:
+                effects[best_index] = effect
+        
+        return effects
+    
     def _detect_emotion(self, text: str) -> str:
         """
         Detect appropriate emotion for narrating a paragraph
@@ -246,23 +747,8 @@ class StoryGenerator:
         Returns:
             Emotion name
         """
-        text = text.lower()
-        
-        # Simple keyword-based detection
-        if any(word in text for word in ['happy', 'joy', 'laugh', 'smile', 'dance', 'celebrate']):
-            return 'happy'
-        elif any(word in text for word in ['scared', 'fear', 'afraid', 'terrified', 'horror']):
-            return 'scared'
-        elif any(word in text for word in ['sad', 'cry', 'tear', 'sorrow', 'unhappy']):
-            return 'sad'
-        elif any(word in text for word in ['wow', 'amazing', 'wonder', 'incredible', 'magic']):
-            return 'excited'
-        elif any(word in text for word in ['calm', 'peace', 'quiet', 'gentle', 'soft']):
-            return 'calm'
-        elif any(word in text for word in ['secret', 'mystery', 'hidden', 'unknown']):
-            return 'mysterious'
-        else:
-            return 'neutral'
+        scores = self.keyword_matcher.scan(text)
+        return self.keyword_matcher.best(scores["emotion"], "emotion") or 'neutral'
     
     def _determine_sound_effect(self, text: str) -> Optional[str]:
         """
@@ -274,21 +760,8 @@ class StoryGenerator:
         Returns:
             Sound effect name or None
         """
-        text = text.lower()
-        
-        # Map keywords to sound effects
-        if any(word in text for word in ['forest', 'tree', 'wood', 'jungle']):
-            return 'forest'
-        elif any(word in text for word in ['rain', 'storm', 'thunder', 'water']):
-            return 'rain'
-        elif any(word in text for word in ['magic', 'spell', 'wizard', 'fairy']):
-            return 'magic'
-        elif any(word in text for word in ['door', 'knock', 'enter', 'house']):
-            return 'door'
-        elif any(word in text for word in ['animal', 'dog', 'cat', 'bird']):
-            return 'animal'
-        
-        return None
+        scores = self.keyword_matcher.scan(text)
+        return self.keyword_matcher.best(scores["effect"], "effect")
     
     def _estimate_duration(self, sound_sequence: List[SoundItem]) -> str:
         """
@@ -321,34 +794,335 @@ class StoryGenerator:
         else:
             return "15+ minutes"
         
-    def narrate_existing_story(self, story_id: Union[int, str]) -> Dict[str, Any]:
+    def narrate_existing_story(
+        self,
+        story_id: Union[int, str],
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None,
+        retry_pending: bool = False
+    ) -> Dict[str, Any]:
         """
         Generate narration for an existing story
         
+        The stored narration is reused while the story text is unchanged.
+        Otherwise the story is narrated again through the segment cache, so
+        only paragraphs that changed are synthesized.
+        
         Args:
             story_id: ID of the story to narrate
+            audio_format: Narration format, "mp3" or "ogg_opus" (default: deployment setting)
+            deadline: time.monotonic() value by which the narration is needed
+            retry_pending: Whether to retry segments that fail in rounds as in
+                complete_narration, sleeping between rounds; only for
+                background jobs, never in a request worker
             
         Returns:
-            Dictionary with narration data including audio path
+            Dictionary with narration data including audio path, or with
+            narration_status "pending" and a sequence_id for
+            complete_narration when segments could not be synthesized
             
         Raises:
             ValueError: If story_id is not found
         """
+        story = self._load_story(story_id)
+        content_hash = self.compute_content_hash(story.title, story.content)
+        sound_sequence = self._create_sound_sequence(story.content, story.title)
+        
+        if self._has_current_narration(story, content_hash, audio_format):
+            logger.info(f"Reusing narration for story {story.id}: {story.audio_path}")
+            audio_info = self.voice_service.describe_audio(story.audio_path)
+            return self._narration_data(story, sound_sequence, story.audio_path, audio_info, content_hash, reused=True)
+        
+        try:
+            audio_path = self.voice_service.process_sound_sequence(
+                sound_sequence, audio_format=audio_format, deadline=deadline
+            )
+        except NarrationPending as e:
+            logger.warning(f"Narration of story {story.id} pending: {str(e)}")
+            sequence_id = self.voice_service.save_sequence(sound_sequence)
+            if retry_pending:
+                return self.complete_narration(sequence_id, audio_format=audio_format, story_id=story.id)
+            return self._pending_story_narration(story, sound_sequence, sequence_id)
+        
+        audio_info = self.voice_service.describe_audio(audio_path)
+        return self._narration_data(story, sound_sequence, audio_path, audio_info, content_hash, reused=False)
+    
+    async def narrate_existing_story_async(
+        self,
+        story_id: Union[int, str],
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate narration for an existing story like narrate_existing_story, from an event loop
+        
+        Segments that cannot be synthesized in time are always reported as
+        pending; completing them is left to complete_narration in a
+        background job. Database access stays on the event loop's thread.
+        
+        Args:
+            story_id: ID of the story to narrate
+            audio_format: Narration format, "mp3" or "ogg_opus" (default: deployment setting)
+            deadline: time.monotonic() value by which the narration is needed
+            
+        Returns:
+            Narration data as returned by narrate_existing_story
+            
+        Raises:
+            ValueError: If story_id is not found
+        """
+        story = self._load_story(story_id)
+        content_hash = self.compute_content_hash(story.title, story.content)
+        sound_sequence = self._create_sound_sequence(story.content, story.title)
+        
+        if self._has_current_narration(story, content_hash, audio_format):
+            logger.info(f"Reusing narration for story {story.id}: {story.audio_path}")
+            audio_path = story.audio_path
+            reused = True
+        else:
+            # End the read transaction, handing the database connection back
+            # to the pool while waiting for TTS; the story reloads afterwards
+            from ...models.story import db
+            db.session.commit()
+            try:
+                audio_path = await self.voice_service.process_sound_sequence_async(
+                    sound_sequence, audio_format=audio_format, deadline=deadline
+                )
+            except NarrationPending as e:
+                logger.warning(f"Narration of story {story.id} pending: {str(e)}")
+                sequence_id = await asyncio.to_thread(self.voice_service.save_sequence, sound_sequence)
+                return self._pending_story_narration(story, sound_sequence, sequence_id)
+            reused = False
+        
+        audio_info = await asyncio.to_thread(self.voice_service.describe_audio, audio_path)
+        return self._narration_data(story, sound_sequence, audio_path, audio_info, content_hash, reused)
+    
+    @staticmethod
+    def _load_story(story_id: Union[int, str]):
+        """
+        Load a story from the database
+        
+        Raises:
+            ValueError: If story_id is not found
+        """
+        # Imported here so the generator can be used without the database models
+        from ...models.story import Story, db
+        
         logger.info(f"Generating narration for story ID {story_id}")
         
-        # In a real implementation, this would:
-        # 1. Fetch the story from a database
-        # 2. Process the text into a sound sequence
-        # 3. Generate the audio file
+        try:
+            story = db.session.get(Story, int(story_id))
+        except (TypeError, ValueError):
+            story = None
+        if not story:
+            raise ValueError(f"Story {story_id} not found")
+        return story
+    
+    def _pending_story_narration(self, story, sound_sequence: List[SoundItem], sequence_id: str) -> Dict[str, Any]:
+        """Mark a story's narration as pending and describe it"""
+        from ...models.story import db
         
-        # Return mock narration data
+        story.narration_status = "pending"
+        story.sequence_id = sequence_id
+        db.session.commit()
         return {
-            "story_id": story_id,
-            "audio_path": f"generated/narration_{story_id}.mp3",
-            "duration": "5 minutes",
+            "story_id": story.id,
+            "audio_path": None,
+            "narration_status": "pending",
+            "sequence_id": sequence_id,
+            "duration": self._estimate_duration(sound_sequence),
             "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
         }
     
+    def _narration_data(
+        self,
+        story,
+        sound_sequence: List[SoundItem],
+        audio_path: str,
+        audio_info: Optional[Dict],
+        content_hash: str,
+        reused: bool
+    ) -> Dict[str, Any]:
+        """Store a new narration with its story and describe it"""
+        if not reused and audio_path != PLACEHOLDER_AUDIO_PATH:
+            self._store_narration(story, audio_path, audio_info, content_hash)
+        
+        return {
+            "story_id": story.id,
+            "audio_path": audio_path,
+            "narration_status": "ready",
+            "duration": self._estimate_duration(sound_sequence),
+            "audio_duration": audio_info["duration"] if audio_info else None,
+            "waveform": audio_info["peaks"] if audio_info else None,
+            "reused": reused,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+    
+    def complete_narration(
+        self,
+        sequence_id: str,
+        audio_format: Optional[str] = None,
+        story_id: Optional[Union[int, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Finish a narration whose segments could not all be synthesized
+        
+        Meant to run as a background job. The sequence is processed again
+        in up to NARRATION_RETRY_ROUNDS rounds; segments synthesized before
+        come from the segment cache, so each round only retries the missing
+        ones. A saved story gets the narration once it is complete.
+        
+        Args:
+            sequence_id: ID of the saved sound sequence
+            audio_format: Narration format, "mp3" or "ogg_opus" (default: deployment setting)
+            story_id: ID of the saved story to update, if any
+            
+        Returns:
+            Dictionary with narration data including audio path
+            
+        Raises:
+            ValueError: If the sequence is not found
+            RuntimeError: If segments are still missing after the last round
+        """
+        # Imported here so the generator can be used without the database models
+        from ...models.story import Story, db
+        
+        sequence = self.voice_service.load_sequence(sequence_id)
+        if not sequence:
+            raise ValueError(f"Sound sequence {sequence_id} not found")
+        story = db.session.get(Story, int(story_id)) if story_id is not None else None
+        
+        audio_path = None
+        for attempt in range(1, NARRATION_RETRY_ROUNDS + 1):
+            try:
+                audio_path = self.voice_service.process_sound_sequence(
+                    sequence["items"], voice_id=sequence["voice_id"], audio_format=audio_format
+                )
+                break
+            except NarrationPending as e:
+                if attempt == NARRATION_RETRY_ROUNDS:
+                    break
+                delay = NARRATION_RETRY_DELAY + backoff_delay(attempt, NARRATION_RETRY_DELAY, NARRATION_RETRY_MAX_DELAY)
+                logger.warning(f"Narration {sequence_id} still pending ({str(e)}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+        
+        if audio_path is None:
+            if story:
+                story.narration_status = "failed"
+                db.session.commit()
+            raise RuntimeError(f"Narration {sequence_id} could not be completed")
+        
+        audio_info = self.voice_service.describe_audio(audio_path)
+        if story and audio_path != PLACEHOLDER_AUDIO_PATH:
+            self._store_narration(story, audio_path, audio_info, self.compute_content_hash(story.title, story.content))
+        
+        # Already in a background job, so the HLS renditions are packaged here too
+        hls_path = None
+        if HLS_PACKAGING_ENABLED and audio_path != PLACEHOLDER_AUDIO_PATH:
+            hls_path = self.package_story_hls(audio_path, story.id if story else None)["hls_path"]
+        
+        logger.info(f"Completed narration {sequence_id}: {audio_path}")
+        return {
+            "story_id": story.id if story else None,
+            "audio_path": audio_path,
+            "hls_path": hls_path,
+            "narration_status": "ready",
+            "audio_duration": audio_info["duration"] if audio_info else None,
+            "waveform": audio_info["peaks"] if audio_info else None,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        }
+    
+    def package_story_hls(self, audio_path: str, story_id: Optional[Union[int, str]] = None) -> Dict[str, Any]:
+        """
+        Package a rendered narration as HLS renditions
+        
+        Meant to run as a background job: transcoding every rendition takes
+        far longer than a story request may wait. A saved story gets the
+        playlist once it is written.
+        
+        Args:
+            audio_path: Path of the narration audio
+            story_id: ID of the saved story to update, if any
+            
+        Returns:
+            Dictionary with the story ID, hls_path (None if packaging is not
+            possible) and hls_status ("ready" or "failed")
+        """
+        # Imported here so the generator can be used without the database models
+        from ...models.story import Story, db
+        
+        hls_path = self.voice_service.package_hls(audio_path)
+        if hls_path and story_id is not None:
+            story = db.session.get(Story, int(story_id))
+            # The story may have been deleted or narrated again in the meantime
+            if story and story.audio_path == audio_path:
+                story.hls_path = hls_path
+                db.session.commit()
+        
+        logger.info(f"Packaged HLS for {audio_path}: {hls_path}")
+        return {
+            "story_id": int(story_id) if story_id is not None else None,
+            "hls_path": hls_path,
+            "hls_status": "ready" if hls_path else "failed"
+        }
+    
+    @staticmethod
+    def _store_narration(story, audio_path: str, audio_info: Optional[Dict], content_hash: str) -> None:
+        """
+        Save a finished narration on a story
+        
+        Args:
+            story: Story model instance
+            audio_path: Path of the narration audio
+            audio_info: Duration and peaks from describe_audio, if available
+            content_hash: Hash of the narrated title and text
+        """
+        from ...models.story import db
+        
+        story.audio_path = audio_path
+        story.content_hash = content_hash
+        story.narration_status = "ready"
+        if story.story_metadata and audio_info:
+            story.story_metadata.audio_duration = audio_info["duration"]
+            story.story_metadata.waveform_peaks = audio_info["peaks"]
+        db.session.commit()
+    
+    def _has_current_narration(self, story, content_hash: str, audio_format: Optional[str]) -> bool:
+        """
+        Check whether a story's stored narration matches its current text
+        
+        Args:
+            story: Story model instance
+            content_hash: Hash of the story's current title and text
+            audio_format: Requested narration format, if any
+            
+        Returns:
+            True if the stored audio can be reused
+        """
+        if not story.audio_path or story.audio_path == PLACEHOLDER_AUDIO_PATH:
+            return False
+        if story.content_hash != content_hash:
+            return False
+        if audio_format:
+            extension = AUDIO_FORMATS.get(audio_format, {}).get("extension")
+            if extension and not story.audio_path.endswith(f".{extension}"):
+                return False
+        return os.path.exists(self.voice_service.resolve_static_path(story.audio_path))
+    
+    @staticmethod
+    def compute_content_hash(title: str, text: str) -> str:
+        """
+        Hash the narrated content of a story
+        
+        Args:
+            title: Story title
+            text: Story text
+            
+        Returns:
+            Hex SHA-256 digest of the title and text
+        """
+        return hashlib.sha256(f"{title}\n{text}".encode("utf-8")).hexdigest()
+    
     def _build_story_prompt(
         self,
         theme: Optional[str] = None,
@@ -357,7 +1131,9 @@ class StoryGenerator:
         duration_minutes: str = "5-10",
         age_group: str = "5-8",
         language: str = "en",
-        child_name: Optional[str] = None
+        child_name: Optional[str] = None,
+        target_words: Optional[int] = None,
+        template: Optional[PromptTemplate] = None
     ) -> str:
         """
         Build a prompt for the Gemini model to generate a story
@@ -370,47 +1146,23 @@ class StoryGenerator:
             age_group: Target age group
             language: Primary language code
             child_name: Name of the child for personalization
+            target_words: Length of the story in words
+            template: Prompt template to render (default: active story prompt)
             
         Returns:
             Formatted prompt string
         """
-        # Base prompt
-        prompt = f"""Write a children's story for age group {age_group} years that would take about {duration_minutes} minutes to read aloud.
-        """
-        
-        # Add theme if provided
-        if theme:
-            prompt += f"The story should be about {theme} and teach the value of {theme}. "
-        
-        # Add setting if provided
-        if setting:
-            prompt += f"The story should take place in a {setting}. "
-        
-        # Add characters if provided
-        if characters and len(characters) > 0:
-            chars_str = ', '.join(characters)
-            prompt += f"Include these characters: {chars_str}. "
-        
-        # Add child name for personalization if provided
-        if child_name:
-            prompt += f"Make {child_name} the main character or mention {child_name} in the story. "
-        
-        # Add formatting instructions
-        prompt += """
-        Make the story engaging, age-appropriate, and with a clear beginning, middle, and end.
-        Use simple language that children can understand.
-        Divide the story into paragraphs for better readability.
-        The story should be inspired from Indian folk lore, fairy tales, or modern children's literature.
-        Children story books like panchatantra, hitopadesh, akbar birbal, tenali raman, etc. should be used as inspiration.
-        The names should be Indian names, and the story should reflect Indian culture and values.
-        The story should be written in English, but can include some Hindi or regional words where appropriate.
-        The story should be formatted as follows:
-        Start with a title on the first line prefixed with "Title: ".
-        
-        The story should convey positive values and end with a meaningful lesson.
-        """
-        
-        return prompt
+        template = template or prompt_registry.get(STORY_PROMPT)
+        return template.render(
+            theme=theme,
+            characters=characters,
+            setting=setting,
+            duration_minutes=duration_minutes,
+            age_group=age_group,
+            language=language,
+            child_name=child_name,
+            target_words=target_words
+        )
     
     def _parse_story_content(self, content: str, theme: Optional[str] = None, setting: Optional[str] = None) -> tuple:
         """
@@ -433,18 +1185,21 @@ class StoryGenerator:
             # Check if content starts with "Title: " format
             if "Title:" in content and content.index("Title:") < 20:
                 parts = content.split("\n", 1)
-                title = parts[0].replace("Title:", "").strip()
+                title = clean_title(parts[0])
                 story_text = parts[1].strip() if len(parts) > 1 else ""
             else:
                 # Try to find a logical title from the first line
-                lines = content.split("\n")
-                if len(lines[0]) < 100 and not lines[0].startswith("Once upon"):
-                    title = lines[0].strip()
+                lines = content.strip().split("\n")
+                if len(lines[0]) < 100 and not clean_title(lines[0]).startswith("Once upon"):
+                    title = clean_title(lines[0])
                     story_text = "\n".join(lines[1:]).strip()
                 else:
                     # Couldn't find a clear title
                     title = default_title
                     story_text = content
+            
+            # Remove Markdown and give the text stable paragraph breaks
+            story_text = normalize(story_text)
                     
             # If either is empty, use defaults
             if not title:
@@ -11,6 +11,9 @@ import json
 from typing import Dict, List, Optional, Any, Union
 from google import genai
 from .voice_service import voice_service, SoundItem
+from .keyword_matcher import keyword_matcher
+from .segmentation import split_paragraphs
+from ..prompts import prompt_registry, STORY_PROMPT
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -205,13 +208,10 @@ class StoryGenerator:
         )
         
         # Split story into paragraphs for better pacing and appropriate emotions
-        paragraphs = story_text.split('\n\n')
+        paragraphs = [paragraph for paragraph, _ in split_paragraphs(story_text)]
         
         # Process each paragraph
         for i, paragraph in enumerate(paragraphs):
-            if not paragraph.strip():
-                continue
-                
             # Determine appropriate emotion based on content keywords
             emotion = self._detect_emotion(paragraph)
             
@@ -260,23 +260,8 @@ class StoryGenerator:
         Returns:
             Emotion name
         """
-        text = text.lower()
-        
-        # Simple keyword-based detection
-        if any(word in text for word in ['happy', 'joy', 'laugh', 'smile', 'dance', 'celebrate']):
-            return 'happy'
-        elif any(word in text for word in ['scared', 'fear', 'afraid', 'terrified', 'horror']):
-            return 'scared'
-        elif any(word in text for word in ['sad', 'cry', 'tear', 'sorrow', 'unhappy']):
-            return 'sad'
-        elif any(word in text for word in ['wow', 'amazing', 'wonder', 'incredible', 'magic']):
-            return 'excited'
-        elif any(word in text for word in ['calm', 'peace', 'quiet', 'gentle', 'soft']):
-            return 'calm'
-        elif any(word in text for word in ['secret', 'mystery', 'hidden', 'unknown']):
-            return 'mysterious'
-        else:
-            return 'neutral'
+        scores = keyword_matcher.scan(text)
+        return keyword_matcher.best(scores["emotion"], "emotion") or 'neutral'
     
     def _determine_sound_effect(self, text: str) -> Optional[str]:
         """
@@ -288,21 +273,8 @@ class StoryGenerator:
         Returns:
             Sound effect name or None
         """
-        text = text.lower()
-        
-        # Map keywords to sound effects
-        if any(word in text for word in ['forest', 'tree', 'wood', 'jungle']):
-            return 'forest'
-        elif any(word in text for word in ['rain', 'storm', 'thunder', 'water']):
-            return 'rain'
-        elif any(word in text for word in ['magic', 'spell', 'wizard', 'fairy']):
-            return 'magic'
-        elif any(word in text for word in ['door', 'knock', 'enter', 'house']):
-            return 'door'
-        elif any(word in text for word in ['animal', 'dog', 'cat', 'bird']):
-            return 'animal'
-        
-        return None
+        scores = keyword_matcher.scan(text)
+        return keyword_matcher.best(scores["effect"], "effect")
     
     def _estimate_duration(self, sound_sequence: List[SoundItem]) -> str:
         """
@@ -388,38 +360,15 @@ class StoryGenerator:
         Returns:
             Formatted prompt string
         """
-        # Base prompt
-        prompt = f"""Write a children's story for age group {age_group} years that would take about {duration_minutes} minutes to read aloud.
-        """
-        
-        # Add theme if provided
-        if theme:
-            prompt += f"The story should be about {theme} and teach the value of {theme}. "
-        
-        # Add setting if provided
-        if setting:
-            prompt += f"The story should take place in a {setting}. "
-        
-        # Add characters if provided
-        if characters and len(characters) > 0:
-            chars_str = ', '.join(characters)
-            prompt += f"Include these characters: {chars_str}. "
-        
-        # Add child name for personalization if provided
-        if child_name:
-            prompt += f"Make {child_name} the main character or mention {child_name} in the story. "
-        
-        # Add formatting instructions
-        prompt += """
-        Make the story engaging, age-appropriate, and with a clear beginning, middle, and end.
-        Use simple language that children can understand.
-        Divide the story into paragraphs for better readability.
-        Start with a title on the first line prefixed with "Title: ".
-        
-        The story should convey positive values and end with a meaningful lesson.
-        """
-        
-        return prompt
+        return prompt_registry.get(STORY_PROMPT).render(
+            theme=theme,
+            characters=characters,
+            setting=setting,
+            duration_minutes=duration_minutes,
+            age_group=age_group,
+            language=language,
+            child_name=child_name
+        )
     
     def _parse_story_content(self, content: str, theme: Optional[str] = None, setting: Optional[str] = None) -> tuple:
         """
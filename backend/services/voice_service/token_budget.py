@@ -0,0 +1,176 @@
+"""
+Token Budget Module for StorySpark
+
+This module turns the requested duration and age group into an explicit
+word count for the story prompt and a max_output_tokens limit for Gemini,
+so that a story cannot run far past the length we narrate. The mapping is
+calibrated from observed outputs: if the model keeps overshooting the
+requested word count, later prompts ask for proportionally fewer words, and
+the token limit follows the observed tokens per word of the story's language.
+"""
+import os
+import math
+import logging
+import threading
+from typing import Dict, Optional
+
+from ..metrics import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Minutes of narration aimed for per duration (middle of the advertised range)
+DURATION_MINUTES = {"short": 4.0, "medium": 7.5, "long": 12.5}
+
+# Read-aloud speed per age group, in words per minute
+READING_WPM = {"3-5": 110, "5-8": 130, "8-12": 150}
+DEFAULT_READING_WPM = 130
+
+# Initial tokens per word, refined per language from responses that report token counts
+TOKENS_PER_WORD = 1.35
+
+# Extra room above the target so stories end naturally instead of being cut off
+TOKEN_HEADROOM = float(os.environ.get('TOKEN_BUDGET_HEADROOM', 1.3))
+
+# Tokens for the title line and paragraph breaks
+TITLE_TOKENS = 32
+
+# Weight of each new observation in the calibration averages
+CALIBRATION_ALPHA = 0.2
+
+# Requested word counts are rounded so prompts (and generation cache keys) stay stable
+WORD_ROUNDING = 25
+
+# Bounds for the overshoot correction
+MIN_LENGTH_RATIO = 0.5
+MAX_LENGTH_RATIO = 2.0
+
+metrics.describe("generation_truncated_total", "counter", "Stories cut off by the output token limit")
+
+
+class TokenBudget:
+    """
+    Word and token targets per duration and age group, calibrated online
+    """
+
+    def __init__(self, headroom: float = TOKEN_HEADROOM, alpha: float = CALIBRATION_ALPHA):
+        """
+        Initialize the budget
+
+        Args:
+            headroom: Multiplier on the expected tokens for max_output_tokens
+            alpha: Weight of each observation in the moving averages
+        """
+        self.headroom = headroom
+        self.alpha = alpha
+        self._length_ratios: Dict[str, float] = {}  # Output words / requested words, per bucket
+        self._tokens_per_word: Dict[str, float] = {}  # Output tokens / output words, per language
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def target_words(duration: str, age_group: str) -> int:
+        """
+        Number of words that fill the requested narration time
+
+        Args:
+            duration: Story length ("short", "medium", "long")
+            age_group: Target age group
+
+        Returns:
+            Target word count
+        """
+        minutes = DURATION_MINUTES.get(duration, DURATION_MINUTES["medium"])
+        return int(minutes * READING_WPM.get(age_group, DEFAULT_READING_WPM))
+
+    def plan(self, duration: str, age_group: str, language: str = "en") -> Dict[str, int]:
+        """
+        Plan the word count to ask for and the output token limit
+
+        Args:
+            duration: Story length ("short", "medium", "long")
+            age_group: Target age group
+            language: Language code of the story
+
+        Returns:
+            Dictionary with target_words (what should be narrated),
+            requested_words (what the prompt asks for, corrected for the
+            model's observed overshoot) and max_output_tokens
+        """
+        target = self.target_words(duration, age_group)
+        with self._lock:
+            ratio = self._length_ratios.get(self._bucket(duration, age_group), 1.0)
+            tokens_per_word = self._tokens_per_word.get(language, TOKENS_PER_WORD)
+
+        requested = max(WORD_ROUNDING, int(round(target / ratio / WORD_ROUNDING)) * WORD_ROUNDING)
+        max_tokens = math.ceil(target * tokens_per_word * self.headroom) + TITLE_TOKENS
+
+        return {
+            "target_words": target,
+            "requested_words": requested,
+            "max_output_tokens": max_tokens
+        }
+
+    def observe(
+        self,
+        duration: str,
+        age_group: str,
+        requested_words: int,
+        output_words: int,
+        output_tokens: Optional[int] = None,
+        truncated: bool = False,
+        language: str = "en"
+    ) -> None:
+        """
+        Calibrate the budget from a generated story
+
+        Args:
+            duration: Story length the story was generated for
+            age_group: Age group the story was generated for
+            requested_words: Word count the prompt asked for
+            output_words: Words in the response, including a cut-off sentence
+            output_tokens: Tokens in the response, if the API reported them
+            truncated: Whether the output hit max_output_tokens
+            language: Language code of the story
+        """
+        if truncated:
+            metrics.inc("generation_truncated_total")
+
+        if requested_words <= 0 or output_words <= 0:
+            return
+
+        with self._lock:
+            bucket = self._bucket(duration, age_group)
+            # A truncated story only shows that the model wanted at least this many words
+            if not truncated or output_words > requested_words:
+                ratio = min(MAX_LENGTH_RATIO, max(MIN_LENGTH_RATIO, output_words / requested_words))
+                previous = self._length_ratios.get(bucket, 1.0)
+                self._length_ratios[bucket] = previous + self.alpha * (ratio - previous)
+
+            # Tokens per word hold for a cut-off response too, which is where a low estimate shows
+            if output_tokens:
+                previous = self._tokens_per_word.get(language, TOKENS_PER_WORD)
+                self._tokens_per_word[language] = previous + self.alpha * (output_tokens / output_words - previous)
+
+        logger.info(
+            f"Story length for {bucket}: asked for {requested_words} words, got {output_words}"
+            f"{' (truncated)' if truncated else ''}"
+        )
+
+    def length_ratio(self, duration: str, age_group: str) -> float:
+        """Calibrated ratio of output words to requested words for a bucket"""
+        with self._lock:
+            return self._length_ratios.get(self._bucket(duration, age_group), 1.0)
+
+    def tokens_per_word(self, language: str = "en") -> float:
+        """Calibrated tokens per word of a language"""
+        with self._lock:
+            return self._tokens_per_word.get(language, TOKENS_PER_WORD)
+
+    @staticmethod
+    def _bucket(duration: str, age_group: str) -> str:
+        """Calibration bucket of a duration and age group"""
+        return f"{duration}|{age_group}"
+
+
+# Create a singleton instance
+token_budget = TokenBudget()
@@ -10,11 +10,18 @@ import time
 import tempfile
 import json
 import hashlib
-from typing import Dict, List, Union, Optional, Literal
+import asyncio
+import functools
+import threading
+from typing import Dict, Iterator, List, Tuple, Union, Optional, Literal
 from google.cloud import texttospeech
 
 # Import local audio processor
-from .audio_processor import combine_audio_files, apply_fade_effect
+from .audio_processor import combine_audio_files, apply_fade_effect, strip_id3_tags
+from .hls_packager import package_hls
+from .waveform import analyze_audio
+from ..rate_limiter import RateLimited, RateLimiter
+from ..resilience import CircuitBreaker, CircuitOpenError, ResilientClient, is_transient
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -23,6 +30,90 @@ logger = logging.getLogger(__name__)
 SoundType = Literal["human", "effect"]
 EmotionType = Literal["neutral", "happy", "sad", "excited", "calm", "scared", "mysterious"]
 
+# Fallback audio returned when synthesis is not possible
+PLACEHOLDER_AUDIO_PATH = "/static/placeholders/story_audio.mp3"
+
+# Supported output formats. Opus is a fraction of the size of MP3 for speech;
+# MP3 is kept for clients that cannot play Ogg.
+AUDIO_FORMATS = {
+    "mp3": {
+        "encoding": texttospeech.AudioEncoding.MP3,
+        "extension": "mp3",
+        "mime_type": "audio/mpeg"
+    },
+    "ogg_opus": {
+        "encoding": texttospeech.AudioEncoding.OGG_OPUS,
+        "extension": "ogg",
+        "mime_type": "audio/ogg"
+    }
+}
+
+# Format used when the request does not ask for one
+DEFAULT_AUDIO_FORMAT = os.environ.get("AUDIO_FORMAT", "mp3").lower()
+if DEFAULT_AUDIO_FORMAT not in AUDIO_FORMATS:
+    logger.warning(f"Unknown AUDIO_FORMAT '{DEFAULT_AUDIO_FORMAT}', using mp3")
+    DEFAULT_AUDIO_FORMAT = "mp3"
+
+# Prosody for each emotion, applied on top of the voice profile's speaking rate.
+# speaking_rate is a multiplier and pitch is in semitones.
+EMOTION_PROSODY = {
+    "neutral": {"speaking_rate": 1.0, "pitch": 0.0},
+    "happy": {"speaking_rate": 1.05, "pitch": 2.0},
+    "sad": {"speaking_rate": 0.9, "pitch": -2.0},
+    "excited": {"speaking_rate": 1.1, "pitch": 3.0},
+    "calm": {"speaking_rate": 0.9, "pitch": -1.0},
+    "scared": {"speaking_rate": 1.05, "pitch": 1.0},
+    "mysterious": {"speaking_rate": 0.85, "pitch": -3.0}
+}
+
+# Text-to-speech call policy: per-chunk timeout, retries of transient gRPC
+# errors and a circuit breaker; a request's own budget can shorten the deadline
+TTS_TIMEOUT = float(os.environ.get("TTS_TIMEOUT", 15))
+TTS_DEADLINE = float(os.environ.get("TTS_DEADLINE", 30))
+TTS_MAX_ATTEMPTS = int(os.environ.get("TTS_MAX_ATTEMPTS", 3))
+TTS_BREAKER_THRESHOLD = int(os.environ.get("TTS_BREAKER_THRESHOLD", 5))
+TTS_BREAKER_RESET = float(os.environ.get("TTS_BREAKER_RESET", 30))
+
+# Text-to-speech quota shared by all workers, in requests and characters
+# per minute (0 disables a limit)
+TTS_RPM = float(os.environ.get("TTS_RPM", 900))
+TTS_CHARS_PER_MINUTE = float(os.environ.get("TTS_CHARS_PER_MINUTE", 0))
+
+# Spoken items of one sequence synthesized at once in async mode
+TTS_ASYNC_CONCURRENCY = int(os.environ.get("TTS_ASYNC_CONCURRENCY", 8))
+
+tts_limiter = RateLimiter("tts", {"requests": TTS_RPM, "characters": TTS_CHARS_PER_MINUTE})
+
+tts_client_policy = ResilientClient(
+    "tts",
+    timeout=TTS_TIMEOUT,
+    deadline=TTS_DEADLINE,
+    max_attempts=TTS_MAX_ATTEMPTS,
+    breaker=CircuitBreaker("tts", TTS_BREAKER_THRESHOLD, TTS_BREAKER_RESET),
+    limiter=tts_limiter
+)
+
+
+class NarrationPending(Exception):
+    """
+    Raised when some spoken items of a sequence could not be synthesized
+    because of a transient failure, so the narration should be completed later
+    """
+    
+    def __init__(self, failed: List[int]):
+        """
+        Args:
+            failed: Indexes of the sound items that could not be synthesized
+        """
+        super().__init__(f"{len(failed)} segments could not be synthesized yet")
+        self.failed = failed
+
+
+def is_retryable_failure(error: BaseException) -> bool:
+    """Whether a failed synthesis may succeed when tried again later"""
+    return isinstance(error, (CircuitOpenError, RateLimited)) or is_transient(error)
+
+
 class SoundItem:
     """Represents a single sound item in a story sequence"""
     
@@ -59,6 +150,17 @@ class SoundItem:
             "pause_after": self.pause_after,
             "volume": self.volume
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SoundItem":
+        """Create a sound item from its dictionary representation"""
+        return cls(
+            sound_type=data["sound_type"],
+            content=data["content"],
+            emotion=data.get("emotion") or "neutral",
+            pause_after=data.get("pause_after", 0.0),
+            volume=data.get("volume", 1.0)
+        )
 
 
 class VoiceService:
@@ -73,9 +175,15 @@ class VoiceService:
         # Use the same API key as Gemini for TTS
         self.tts_api_key = os.environ.get("GEMINI_KEY")
         
+        self.static_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../static'))
+        self.output_dir = os.path.join(self.static_dir, 'generated')
+        
         self.available_voices = self._load_available_voices()
         self.sound_effects = self._load_sound_effects()
         self.tts_client = None
+        self.tts_policy = tts_client_policy
+        self._async_tts_client = None
+        self._async_tts_loop = None
         
         # Try to initialize TTS client with API key
         try:
@@ -127,7 +235,7 @@ class VoiceService:
         Returns:
             Dictionary mapping effect names to file paths
         """
-        effects_dir = os.path.join(os.path.dirname(__file__), '../../static/effects')
+        effects_dir = os.path.join(self.static_dir, 'effects')
         os.makedirs(effects_dir, exist_ok=True)
         
         effects = {
@@ -147,7 +255,9 @@ class VoiceService:
         self, 
         text: str, 
         voice_id: str = "default",
-        emotion: EmotionType = "neutral"
+        emotion: EmotionType = "neutral",
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None
     ) -> str:
         """
         Convert text to speech audio file using Google Cloud TTS
@@ -156,11 +266,133 @@ class VoiceService:
             text: The text to convert to speech
             voice_id: ID of the voice profile to use
             emotion: Emotional tone for the speech
+            audio_format: Output format, a key of AUDIO_FORMATS (default: DEFAULT_AUDIO_FORMAT)
+            deadline: time.monotonic() value by which the audio is needed
             
         Returns:
-            Path to the generated audio file
+            Path to the generated audio file, or PLACEHOLDER_AUDIO_PATH if it
+            could not be synthesized
+        """
+        try:
+            return self.synthesize(text, voice_id, emotion, audio_format, deadline)
+        except Exception as e:
+            logger.error(f"Error with Google Cloud TTS: {str(e)}")
+            logger.warning("Using fallback audio file")
+            return PLACEHOLDER_AUDIO_PATH
+    
+    def synthesize(
+        self,
+        text: str,
+        voice_id: str = "default",
+        emotion: EmotionType = "neutral",
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Convert text to speech like text_to_speech, raising synthesis errors
+        
+        Args:
+            text: The text to convert to speech
+            voice_id: ID of the voice profile to use
+            emotion: Emotional tone for the speech
+            audio_format: Output format, a key of AUDIO_FORMATS (default: DEFAULT_AUDIO_FORMAT)
+            deadline: time.monotonic() value by which the audio is needed
+            
+        Returns:
+            Path to the generated audio file, or PLACEHOLDER_AUDIO_PATH if
+            no TTS client is configured
+            
+        Raises:
+            CircuitOpenError: If TTS is failing and is not being called
+            DeadlineExceeded: If the audio could not be synthesized in time
+            Exception: Errors from Google Cloud TTS after retries
+        """
+        output_path, relative_path, speech_request = self._prepare_speech(text, voice_id, emotion, audio_format)
+        if speech_request is None:
+            return relative_path
+            
+        # If Google Cloud TTS client is available, use it
+        if self.tts_client:
+            # Perform the text-to-speech request, passing the chunk's deadline on
+            # to the RPC; retries are done by the policy, not by the client library
+            timeout = self._speech_timeout(deadline)
+            request_speech = functools.partial(
+                self.tts_client.synthesize_speech, **speech_request, retry=None, timeout=timeout
+            )
+            response = self.tts_policy.call(
+                request_speech,
+                timeout=timeout or None,
+                deadline=deadline,
+                cost={"requests": 1, "characters": len(text)}
+            )
+            self._write_speech(output_path, response.audio_content)
+            return relative_path
+        
+        # Fallback to mock audio file without a TTS client
+        logger.warning("Using fallback audio file")
+        return PLACEHOLDER_AUDIO_PATH
+    
+    async def synthesize_async(
+        self,
+        text: str,
+        voice_id: str = "default",
+        emotion: EmotionType = "neutral",
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Convert text to speech like synthesize, awaiting the TTS request on the event loop
+        
+        Args:
+            text: The text to convert to speech
+            voice_id: ID of the voice profile to use
+            emotion: Emotional tone for the speech
+            audio_format: Output format, a key of AUDIO_FORMATS (default: DEFAULT_AUDIO_FORMAT)
+            deadline: time.monotonic() value by which the audio is needed
+            
+        Returns:
+            Path to the generated audio file, or PLACEHOLDER_AUDIO_PATH if
+            no TTS client is configured
+            
+        Raises:
+            The errors of synthesize
         """
-        logger.info(f"Converting text to speech: '{text[:30]}...' with voice {voice_id} and emotion {emotion}")
+        output_path, relative_path, speech_request = self._prepare_speech(text, voice_id, emotion, audio_format)
+        if speech_request is None:
+            return relative_path
+        
+        client = self._get_async_tts_client()
+        if client is None:
+            logger.warning("Using fallback audio file")
+            return PLACEHOLDER_AUDIO_PATH
+        
+        timeout = self._speech_timeout(deadline)
+        request_speech = functools.partial(client.synthesize_speech, **speech_request, retry=None, timeout=timeout)
+        response = await self.tts_policy.call_async(
+            request_speech,
+            timeout=timeout or None,
+            deadline=deadline,
+            cost={"requests": 1, "characters": len(text)}
+        )
+        await asyncio.to_thread(self._write_speech, output_path, response.audio_content)
+        return relative_path
+    
+    def _prepare_speech(
+        self,
+        text: str,
+        voice_id: str,
+        emotion: EmotionType,
+        audio_format: Optional[str]
+    ) -> Tuple[str, str, Optional[Dict]]:
+        """
+        Find the cache file for a speech segment and build its TTS request
+        
+        Returns:
+            Tuple of (output path, static path, request arguments), where the
+            request arguments are None if the segment is already cached
+        """
+        audio_format = resolve_audio_format(audio_format)
+        logger.info(f"Converting text to speech: '{text[:30]}...' with voice {voice_id}, emotion {emotion} and format {audio_format}")
         
         # Get voice profile
         voice_profile = next((v for v in self.available_voices if v["id"] == voice_id), None)
@@ -170,101 +402,476 @@ class VoiceService:
                                 self.available_voices[0])
         
         # Create output directory if it doesn't exist
-        output_dir = os.path.join(os.path.dirname(__file__), '../../static/generated')
-        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
         
-        # Generate a unique filename based on the content and voice
-        filename = f"speech_{voice_id}_{emotion}_{hashlib.md5(text.encode()).hexdigest()[:10]}.mp3"
-        output_path = os.path.join(output_dir, filename)
+        # Generate a unique filename based on the content, voice and emotion
+        extension = AUDIO_FORMATS[audio_format]["extension"]
+        filename = f"speech_{voice_id}_{emotion}_{hashlib.md5(text.encode()).hexdigest()[:10]}.{extension}"
+        output_path = os.path.join(self.output_dir, filename)
         relative_path = f"/static/generated/{filename}"
         
         # Check if the file already exists (caching)
         if os.path.exists(output_path):
             logger.info(f"Using cached audio file: {output_path}")
-            return relative_path
-            
-        # If Google Cloud TTS client is available, use it
-        if self.tts_client:
-            try:
-                # Set the text input to be synthesized
-                synthesis_input = texttospeech.SynthesisInput(text=text)
-                
-                # Build the voice request
-                voice = texttospeech.VoiceSelectionParams(
-                    language_code=voice_profile["language"],
-                    name=voice_profile["google_voice"],
-                    ssml_gender=texttospeech.SsmlVoiceGender.FEMALE if voice_profile["gender"] == "female" 
-                               else texttospeech.SsmlVoiceGender.MALE
-                )
-                
-                # Select the type of audio file
-                audio_config = texttospeech.AudioConfig(
-                    audio_encoding=texttospeech.AudioEncoding.MP3,
-                    speaking_rate=voice_profile.get("speaking_rate", 1.0)
-                )
-                
-                # Perform the text-to-speech request
-                response = self.tts_client.synthesize_speech(
-                    input=synthesis_input,
-                    voice=voice,
-                    audio_config=audio_config
-                )
-                
-                # Write the response to the output file
-                with open(output_path, "wb") as out:
-                    out.write(response.audio_content)
-                
-                logger.info(f"Audio content written to: {output_path}")
-                return relative_path
-                
-            except Exception as e:
-                logger.error(f"Error with Google Cloud TTS: {str(e)}")
-        
-        # Fallback to mock audio file if TTS fails
-        logger.warning("Using fallback audio file")
-        return "/static/placeholders/story_audio.mp3"
+            self._touch(output_path)
+            return output_path, relative_path, None
+        
+        # Build the voice request
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=voice_profile["language"],
+            name=voice_profile["google_voice"],
+            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE if voice_profile["gender"] == "female" 
+                       else texttospeech.SsmlVoiceGender.MALE
+        )
+        
+        # Select the type of audio file and the prosody for the emotion
+        prosody = EMOTION_PROSODY.get(emotion, EMOTION_PROSODY["neutral"])
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=AUDIO_FORMATS[audio_format]["encoding"],
+            speaking_rate=voice_profile.get("speaking_rate", 1.0) * prosody["speaking_rate"],
+            pitch=prosody["pitch"]
+        )
+        
+        return output_path, relative_path, {
+            "input": texttospeech.SynthesisInput(text=text),
+            "voice": voice,
+            "audio_config": audio_config
+        }
+    
+    def _speech_timeout(self, deadline: Optional[float]) -> float:
+        """Seconds a TTS request may take, shortened by the deadline"""
+        timeout = self.tts_policy.timeout
+        if deadline is not None:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        return timeout
+    
+    def _write_speech(self, output_path: str, audio_content: bytes) -> None:
+        """Store synthesized speech in the segment cache"""
+        # Write the response to a temporary file first so concurrent
+        # workers never observe a partially written cache entry
+        temp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as out:
+            out.write(audio_content)
+        os.replace(temp_path, output_path)
+        
+        logger.info(f"Audio content written to: {output_path}")
     
-    def process_sound_sequence(self, sound_sequence: List[SoundItem]) -> str:
+    def _get_async_tts_client(self):
+        """
+        TTS client for the running event loop
+        
+        gRPC's asyncio channels belong to the loop they were created on, so
+        the client is created on first use and again if the loop changes.
+        
+        Returns:
+            TextToSpeechAsyncClient, or None without TTS credentials
+        """
+        if not self.tts_client:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._async_tts_client is None or self._async_tts_loop is not loop:
+            self._async_tts_client = texttospeech.TextToSpeechAsyncClient(
+                client_options={"api_key": self.tts_api_key}
+            )
+            self._async_tts_loop = loop
+        return self._async_tts_client
+    
+    def process_sound_sequence(
+        self,
+        sound_sequence: List[SoundItem],
+        voice_id: str = "default",
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> str:
         """
         Process a sequence of sound items into a single audio file
         
+        Each spoken item is synthesized separately with its own emotion and
+        cached per (text, voice, emotion), so editing one paragraph of a story
+        only re-synthesizes that paragraph. The segments are then assembled
+        into a story file named after its segments, which is reused as long
+        as the segments do not change.
+        
+        Items that fail because TTS is slow or unavailable do not stop the
+        others from being synthesized and cached. The story is then not
+        assembled without them; NarrationPending is raised instead, and
+        processing the same sequence again later only synthesizes those items.
+        
         Args:
             sound_sequence: List of SoundItem objects
+            voice_id: ID of the voice profile to narrate with
+            audio_format: Output format, a key of AUDIO_FORMATS (default: DEFAULT_AUDIO_FORMAT)
+            deadline: time.monotonic() value by which the narration is needed
             
         Returns:
             Path to the generated audio file
+            
+        Raises:
+            NarrationPending: If some items failed with a transient error or
+                ran out of time
         """
+        audio_format = resolve_audio_format(audio_format)
+        
         if not sound_sequence:
             logger.warning("Empty sound sequence provided")
-            return "/static/placeholders/story_audio.mp3"
+            return PLACEHOLDER_AUDIO_PATH
         
-        # Collect all human speech items and combine them into complete story text
-        speech_parts = []
-        for item in sound_sequence:
+        segments = {}
+        for index, item in enumerate(sound_sequence):
+            if item.sound_type == "human":
+                try:
+                    segments[index] = self.synthesize(
+                        text=item.content,
+                        voice_id=voice_id,
+                        emotion=item.emotion or "neutral",
+                        audio_format=audio_format,
+                        deadline=deadline
+                    )
+                except Exception as e:
+                    segments[index] = self._failed_segment(index, item, e)
+        
+        return self._assemble_sequence(sound_sequence, segments, audio_format)
+    
+    async def process_sound_sequence_async(
+        self,
+        sound_sequence: List[SoundItem],
+        voice_id: str = "default",
+        audio_format: Optional[str] = None,
+        deadline: Optional[float] = None
+    ) -> str:
+        """
+        Process a sequence of sound items like process_sound_sequence, from an event loop
+        
+        The spoken items are synthesized concurrently, at most
+        TTS_ASYNC_CONCURRENCY at a time per sequence, and the story is
+        assembled in a worker thread.
+        
+        Args:
+            sound_sequence: List of SoundItem objects
+            voice_id: ID of the voice profile to narrate with
+            audio_format: Output format, a key of AUDIO_FORMATS (default: DEFAULT_AUDIO_FORMAT)
+            deadline: time.monotonic() value by which the narration is needed
+            
+        Returns:
+            Path to the generated audio file
+            
+        Raises:
+            NarrationPending: If some items failed with a transient error or
+                ran out of time
+        """
+        audio_format = resolve_audio_format(audio_format)
+        
+        if not sound_sequence:
+            logger.warning("Empty sound sequence provided")
+            return PLACEHOLDER_AUDIO_PATH
+        
+        semaphore = asyncio.Semaphore(TTS_ASYNC_CONCURRENCY)
+        
+        async def speak(index: int, item: SoundItem):
+            async with semaphore:
+                try:
+                    return index, await self.synthesize_async(
+                        text=item.content,
+                        voice_id=voice_id,
+                        emotion=item.emotion or "neutral",
+                        audio_format=audio_format,
+                        deadline=deadline
+                    )
+                except Exception as e:
+                    return index, self._failed_segment(index, item, e)
+        
+        segments = dict(await asyncio.gather(*(
+            speak(index, item) for index, item in enumerate(sound_sequence) if item.sound_type == "human"
+        )))
+        return await asyncio.to_thread(self._assemble_sequence, sound_sequence, segments, audio_format)
+    
+    def _failed_segment(self, index: int, item: SoundItem, error: Exception) -> Optional[str]:
+        """
+        Decide what to do with a spoken item that could not be synthesized
+        
+        Returns:
+            None if the item should be synthesized again later, otherwise
+            PLACEHOLDER_AUDIO_PATH so the story is assembled without it
+        """
+        if is_retryable_failure(error):
+            logger.warning(f"Segment {index} not synthesized yet ({type(error).__name__}): '{item.content[:30]}...'")
+            return None
+        logger.error(f"Error with Google Cloud TTS: {str(error)}")
+        return PLACEHOLDER_AUDIO_PATH
+    
+    def _assemble_sequence(
+        self,
+        sound_sequence: List[SoundItem],
+        segments: Dict[int, Optional[str]],
+        audio_format: str
+    ) -> str:
+        """
+        Assemble synthesized speech and sound effects into the story file
+        
+        Args:
+            sound_sequence: List of SoundItem objects
+            segments: Static path of each spoken item by index, None for
+                items that are still pending
+            audio_format: Output format, a key of AUDIO_FORMATS
+            
+        Returns:
+            Path to the generated audio file
+            
+        Raises:
+            NarrationPending: If any spoken item is pending
+        """
+        audio_files = []
+        speech_count = 0
+        pending = [index for index, path in segments.items() if path is None]
+        for index, item in enumerate(sound_sequence):
             if item.sound_type == "human":
-                speech_parts.append(item.content)
-        
-        if not speech_parts:
-            logger.warning("No human speech found in sequence, using fallback")
-            return "/static/placeholders/story_audio.mp3"
-        
-        # Combine all speech parts into a single narrative
-        # Add natural pauses between sentences/paragraphs
-        combined_text = ""
-        for i, part in enumerate(speech_parts):
-            combined_text += part
-            # Add pause between segments (except the last one)
-            if i < len(speech_parts) - 1:
-                combined_text += "... "  # Natural pause in speech
-        
-        logger.info(f"Processing complete story audio with {len(speech_parts)} speech segments, total length: {len(combined_text)} characters")
-        
-        # Convert the complete story text to speech
-        return self.text_to_speech(
-            text=combined_text,
-            voice_id="default",
-            emotion="neutral"  # Use neutral for the overall story, could be enhanced to detect dominant emotion
+                segment_path = segments.get(index)
+                if segment_path is None:
+                    continue
+                if segment_path == PLACEHOLDER_AUDIO_PATH:
+                    logger.warning(f"Skipping segment that could not be synthesized: '{item.content[:30]}...'")
+                    continue
+                speech_count += 1
+            else:
+                segment_path = self.sound_effects.get(item.content)
+                if not segment_path or not os.path.exists(segment_path):
+                    logger.warning(f"Sound effect not available: {item.content}")
+                    continue
+            
+            audio_files.append({
+                "path": self.resolve_static_path(segment_path),
+                "sound_type": item.sound_type,
+                "volume": item.volume,
+                "pause_after": item.pause_after
+            })
+        
+        if pending:
+            raise NarrationPending(pending)
+        
+        if not speech_count:
+            logger.warning("No human speech could be synthesized for sequence, using fallback")
+            return PLACEHOLDER_AUDIO_PATH
+        
+        # Name the assembled file after its segments so unchanged stories are reused.
+        # Extensions are left out so every format of a story shares the same name.
+        assembly_key = json.dumps(
+            [[os.path.splitext(os.path.basename(f["path"]))[0], f["volume"], f["pause_after"]] for f in audio_files]
         )
+        extension = AUDIO_FORMATS[audio_format]["extension"]
+        filename = f"story_{hashlib.sha1(assembly_key.encode()).hexdigest()[:16]}.{extension}"
+        output_path = os.path.join(self.output_dir, filename)
+        relative_path = f"/static/generated/{filename}"
+        
+        if os.path.exists(output_path):
+            logger.info(f"Using cached story audio: {output_path}")
+            self._touch(output_path)
+            return relative_path
+        
+        logger.info(f"Assembling story audio from {len(audio_files)} segments ({speech_count} spoken)")
+        if combine_audio_files(audio_files, output_path, audio_format):
+            return relative_path
+        
+        logger.warning("Failed to assemble story audio, using fallback")
+        return PLACEHOLDER_AUDIO_PATH
+    
+    def package_hls(self, audio_path: str) -> Optional[str]:
+        """
+        Package a narrated story as HLS renditions at several bitrates
+        
+        Args:
+            audio_path: Path to the story audio as returned by process_sound_sequence
+            
+        Returns:
+            Path to the master playlist, or None if packaging is not possible
+        """
+        if not audio_path or audio_path == PLACEHOLDER_AUDIO_PATH:
+            return None
+        
+        master_path = package_hls(self.resolve_static_path(audio_path), self.output_dir)
+        if not master_path:
+            return None
+        
+        return "/static/" + os.path.relpath(master_path, self.static_dir).replace(os.sep, "/")
+    
+    def describe_audio(self, audio_path: str) -> Optional[Dict]:
+        """
+        Get the exact duration and waveform peaks of a generated audio file
+        
+        Args:
+            audio_path: Path to the audio as returned by process_sound_sequence
+            
+        Returns:
+            Dictionary with duration (seconds) and peaks, or None if unavailable
+        """
+        if not audio_path or audio_path == PLACEHOLDER_AUDIO_PATH:
+            return None
+        
+        try:
+            return analyze_audio(self.resolve_static_path(audio_path))
+        except Exception as e:
+            logger.error(f"Error analyzing audio {audio_path}: {str(e)}")
+            return None
+    
+    def save_sequence(self, sound_sequence: List[SoundItem], voice_id: str = "default") -> str:
+        """
+        Store a sound sequence so that it can be streamed by any worker
+        
+        Args:
+            sound_sequence: List of SoundItem objects
+            voice_id: ID of the voice profile to narrate with
+            
+        Returns:
+            ID of the stored sequence
+        """
+        payload = json.dumps({
+            "voice_id": voice_id,
+            "items": [item.to_dict() for item in sound_sequence]
+        }, sort_keys=True)
+        sequence_id = hashlib.sha1(payload.encode()).hexdigest()[:16]
+        
+        sequences_dir = os.path.join(self.output_dir, 'sequences')
+        os.makedirs(sequences_dir, exist_ok=True)
+        sequence_path = os.path.join(sequences_dir, f"{sequence_id}.json")
+        
+        if os.path.exists(sequence_path):
+            self._touch(sequence_path)
+        else:
+            temp_path = f"{sequence_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                f.write(payload)
+            os.replace(temp_path, sequence_path)
+        
+        return sequence_id
+    
+    def load_sequence(self, sequence_id: str) -> Optional[Dict]:
+        """
+        Load a stored sound sequence
+        
+        Args:
+            sequence_id: ID returned by save_sequence
+            
+        Returns:
+            Dictionary with voice_id and a list of SoundItem objects, or None if not found
+        """
+        if not sequence_id.isalnum():
+            return None
+        
+        sequence_path = os.path.join(self.output_dir, 'sequences', f"{sequence_id}.json")
+        if not os.path.exists(sequence_path):
+            return None
+        
+        with open(sequence_path) as f:
+            data = json.load(f)
+        self._touch(sequence_path)
+        
+        return {
+            "voice_id": data.get("voice_id", "default"),
+            "items": [SoundItem.from_dict(item) for item in data.get("items", [])]
+        }
+    
+    def stream_sound_sequence(
+        self,
+        sound_sequence: List[SoundItem],
+        voice_id: str = "default",
+        audio_format: Optional[str] = None
+    ) -> Iterator[bytes]:
+        """
+        Synthesize a sound sequence and yield the audio as each segment is ready
+        
+        Segments are synthesized in order through the segment cache, so the
+        first paragraph can be played while the rest is still being rendered.
+        Only spoken items are streamed, since sound effects are encoded
+        differently from the synthesized speech.
+        
+        Args:
+            sound_sequence: List of SoundItem objects
+            voice_id: ID of the voice profile to narrate with
+            audio_format: Output format, a key of AUDIO_FORMATS (default: DEFAULT_AUDIO_FORMAT)
+            
+        Yields:
+            Audio data for each spoken segment (MP3 frames or chained Ogg streams)
+        """
+        audio_format = resolve_audio_format(audio_format)
+        
+        for item in sound_sequence:
+            if item.sound_type != "human":
+                continue
+            
+            segment_path = self.text_to_speech(
+                text=item.content,
+                voice_id=voice_id,
+                emotion=item.emotion or "neutral",
+                audio_format=audio_format
+            )
+            if segment_path == PLACEHOLDER_AUDIO_PATH:
+                logger.warning(f"Skipping segment that could not be synthesized: '{item.content[:30]}...'")
+                continue
+            
+            with open(self.resolve_static_path(segment_path), "rb") as f:
+                data = f.read()
+            yield strip_id3_tags(data) if audio_format == "mp3" else data
+    
+    def resolve_static_path(self, path: str) -> str:
+        """
+        Map a '/static/...' URL path to its location on disk
+        
+        Args:
+            path: URL path or filesystem path
+            
+        Returns:
+            Absolute filesystem path
+        """
+        if path.startswith("/static/"):
+            return os.path.join(self.static_dir, path[len("/static/"):])
+        return os.path.abspath(path)
+    
+    def _touch(self, path: str) -> None:
+        """Mark a cached file as recently used"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+
+def resolve_audio_format(audio_format: Optional[str]) -> str:
+    """
+    Validate an audio format name, falling back to the deployment default
+    
+    Args:
+        audio_format: Requested format name or None
+        
+    Returns:
+        A key of AUDIO_FORMATS
+    """
+    if audio_format and audio_format.lower() in AUDIO_FORMATS:
+        return audio_format.lower()
+    if audio_format:
+        logger.warning(f"Unsupported audio format '{audio_format}', using {DEFAULT_AUDIO_FORMAT}")
+    return DEFAULT_AUDIO_FORMAT
+
+
+def negotiate_audio_format(accept_mimetypes, requested: Optional[str] = None) -> str:
+    """
+    Choose an audio format from an explicit request or the Accept header
+    
+    Args:
+        accept_mimetypes: The request's parsed Accept header (werkzeug MIMEAccept)
+        requested: Format name asked for explicitly, which takes precedence
+        
+    Returns:
+        A key of AUDIO_FORMATS
+    """
+    if requested:
+        return resolve_audio_format(requested)
+    
+    # Offer the deployment default first so that "*/*" selects it
+    offered = [DEFAULT_AUDIO_FORMAT] + [name for name in AUDIO_FORMATS if name != DEFAULT_AUDIO_FORMAT]
+    best_match = accept_mimetypes.best_match([AUDIO_FORMATS[name]["mime_type"] for name in offered])
+    
+    for name in offered:
+        if AUDIO_FORMATS[name]["mime_type"] == best_match:
+            return name
+    return DEFAULT_AUDIO_FORMAT
 
 
 # Create a singleton instance
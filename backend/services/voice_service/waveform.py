@@ -0,0 +1,275 @@
+"""
+Waveform Analysis Module for StorySpark
+
+This module computes the exact duration and a compact peak envelope of
+generated audio files, so players can draw the waveform and show the length
+of a story before downloading the audio.
+"""
+import os
+import sys
+import json
+import logging
+import subprocess
+from array import array
+from typing import Dict, List, Optional
+
+from .audio_processor import ffmpeg_available
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is optional
+    numpy = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Number of peaks in the waveform envelope
+PEAK_COUNT = 100
+
+# Sample rate the audio is decoded at for peak detection. Peaks only need a
+# coarse envelope, so a low rate keeps decoding cheap.
+ANALYSIS_SAMPLE_RATE = 8000
+
+# MPEG audio lookup tables, indexed by the bits of the frame header
+_MPEG_BITRATES = {
+    # (version is MPEG-1, layer) -> kbps by bitrate index
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MPEG_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def analyze_audio(file_path: str, peak_count: int = PEAK_COUNT) -> Optional[Dict]:
+    """
+    Compute the duration and waveform peaks of an audio file
+
+    Results are stored in a JSON file next to the audio file, which is
+    reused as long as the audio file is not newer than it.
+
+    Args:
+        file_path: Path to the audio file
+        peak_count: Number of peaks in the envelope
+
+    Returns:
+        Dictionary with duration (seconds) and peaks (0.0 to 1.0), or None if the file is missing
+    """
+    if not os.path.exists(file_path):
+        logger.error(f"Cannot analyze missing audio file: {file_path}")
+        return None
+
+    sidecar_path = f"{file_path}.json"
+    if os.path.exists(sidecar_path) and os.path.getmtime(sidecar_path) >= os.path.getmtime(file_path):
+        try:
+            with open(sidecar_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable waveform file {sidecar_path}: {str(e)}")
+
+    info = None
+    if ffmpeg_available():
+        info = _analyze_with_ffmpeg(file_path, peak_count)
+
+    if info is None:
+        # Without decoding, the exact duration can still be read from the
+        # container, but there are no samples to build peaks from
+        duration = read_container_duration(file_path)
+        if duration is None:
+            return None
+        info = {"duration": round(duration, 3), "peaks": []}
+
+    try:
+        temp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(info, f)
+        os.replace(temp_path, sidecar_path)
+    except OSError as e:
+        logger.warning(f"Could not store waveform for {file_path}: {str(e)}")
+
+    return info
+
+
+def _analyze_with_ffmpeg(file_path: str, peak_count: int) -> Optional[Dict]:
+    """
+    Decode an audio file to mono PCM with ffmpeg and compute its peaks
+
+    Args:
+        file_path: Path to the audio file
+        peak_count: Number of peaks in the envelope
+
+    Returns:
+        Dictionary with duration and peaks, or None if decoding fails
+    """
+    proc = subprocess.run([
+        "ffmpeg",
+        "-v", "error",
+        "-i", file_path,
+        "-ac", "1",
+        "-ar", str(ANALYSIS_SAMPLE_RATE),
+        "-f", "s16le",
+        "-"
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    if proc.returncode != 0:
+        logger.error(f"ffmpeg failed decoding {file_path}: {proc.stderr.decode(errors='ignore')[-500:]}")
+        return None
+
+    pcm = proc.stdout[:len(proc.stdout) - len(proc.stdout) % 2]
+    sample_count = len(pcm) // 2
+
+    return {
+        "duration": round(sample_count / ANALYSIS_SAMPLE_RATE, 3),
+        "peaks": compute_peaks(pcm, peak_count)
+    }
+
+
+def compute_peaks(pcm: bytes, peak_count: int = PEAK_COUNT) -> List[float]:
+    """
+    Downsample 16-bit mono PCM to an envelope of absolute peaks
+
+    Args:
+        pcm: Little-endian signed 16-bit samples
+        peak_count: Number of peaks in the envelope
+
+    Returns:
+        Peaks scaled to the range 0.0 to 1.0
+    """
+    sample_count = len(pcm) // 2
+    if not sample_count:
+        return []
+
+    peak_count = min(peak_count, sample_count)
+    window = sample_count // peak_count
+    used = window * peak_count
+
+    if numpy is not None:
+        samples = numpy.frombuffer(pcm, dtype="<i2", count=used).astype(numpy.int32)
+        peaks = numpy.abs(samples).reshape(peak_count, window).max(axis=1) / 32768.0
+        return [round(float(peak), 3) for peak in peaks]
+
+    samples = array("h", pcm[:used * 2])
+    if samples.itemsize != 2:  # pragma: no cover - all supported platforms use 16-bit shorts
+        raise ValueError("Unsupported platform short size")
+    if sys.byteorder == "big":  # pragma: no cover
+        samples.byteswap()
+
+    peaks = []
+    for start in range(0, used, window):
+        chunk = samples[start:start + window]
+        peaks.append(round(max(max(chunk), -min(chunk)) / 32768.0, 3))
+    return peaks
+
+
+def read_container_duration(file_path: str) -> Optional[float]:
+    """
+    Read the exact duration of an MP3 or Ogg Opus file without decoding it
+
+    Args:
+        file_path: Path to the audio file
+
+    Returns:
+        Duration in seconds, or None if the format is not recognized
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+
+    if data[:4] == b"OggS":
+        return _ogg_opus_duration(data)
+    return _mp3_duration(data)
+
+
+def _mp3_duration(data: bytes) -> Optional[float]:
+    """
+    Sum the duration of every MPEG audio frame in a file
+
+    Args:
+        data: MP3 file content
+
+    Returns:
+        Duration in seconds, or None if no frames were found
+    """
+    position = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        position = 10 + ((data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9])
+
+    duration = 0.0
+    frames = 0
+    length = len(data)
+    while position + 4 <= length:
+        if data[position] != 0xFF or (data[position + 1] & 0xE0) != 0xE0:
+            position += 1
+            continue
+
+        version_bits = (data[position + 1] >> 3) & 0x03
+        layer = 4 - ((data[position + 1] >> 1) & 0x03)
+        bitrate_index = data[position + 2] >> 4
+        rate_index = (data[position + 2] >> 2) & 0x03
+        padding = (data[position + 2] >> 1) & 0x01
+
+        if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+            position += 1
+            continue
+
+        mpeg1 = version_bits == 3
+        bitrate = _MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+        sample_rate = _MPEG_SAMPLE_RATES[version_bits][rate_index]
+
+        if layer == 1:
+            samples_per_frame = 384
+            frame_length = (12 * bitrate // sample_rate + padding) * 4
+        else:
+            samples_per_frame = 1152 if (layer == 2 or mpeg1) else 576
+            frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+
+        duration += samples_per_frame / sample_rate
+        frames += 1
+        position += max(frame_length, 1)
+
+    return duration if frames else None
+
+
+def _ogg_opus_duration(data: bytes) -> Optional[float]:
+    """
+    Compute the duration of a (possibly chained) Ogg Opus file
+
+    Each logical stream ends at the granule position of its last page,
+    counted in 48 kHz samples and including the stream's pre-skip.
+
+    Args:
+        data: Ogg file content
+
+    Returns:
+        Duration in seconds, or None if no Opus streams were found
+    """
+    last_granule = {}
+    pre_skip = {}
+
+    position = 0
+    while True:
+        position = data.find(b"OggS", position)
+        if position < 0 or position + 27 > len(data):
+            break
+
+        granule = int.from_bytes(data[position + 6:position + 14], "little", signed=True)
+        serial = int.from_bytes(data[position + 14:position + 18], "little")
+        segment_count = data[position + 26]
+        body_start = position + 27 + segment_count
+        body_length = sum(data[position + 27:body_start])
+
+        body = data[body_start:body_start + body_length]
+        if body[:8] == b"OpusHead" and len(body) >= 12:
+            pre_skip[serial] = int.from_bytes(body[10:12], "little")
+        if granule >= 0:
+            last_granule[serial] = granule
+
+        position = body_start + body_length
+
+    samples = sum(
+        max(granule - pre_skip.get(serial, 0), 0)
+        for serial, granule in last_granule.items()
+        if serial in pre_skip
+    )
+    return samples / 48000 if pre_skip else None
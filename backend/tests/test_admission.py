@@ -0,0 +1,178 @@
+"""Unit tests for admission control of generation requests."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask, Response, jsonify
+from flask_jwt_extended import JWTManager, create_access_token
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.services.admission import (
+    AdmissionController, AdmissionRejected, PRIORITY_MEMBER, PRIORITY_PREVIEW, PRIORITY_SAVE
+)
+from backend.services.shared_store import SharedStore
+from backend.utils.admission import admission_controlled, client_ip
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test client limits and priority slots."""
+
+    def setUp(self):
+        """Keep the leases in a temporary database."""
+        self.test_dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.controller = AdmissionController(
+            slots=4, user_limit=2, ip_limit=3,
+            store=SharedStore(os.path.join(self.test_dir, "shared.db")), clock=self.clock
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_client_limits(self):
+        """A user or address at its limit is refused with 429 until a request finishes."""
+        lease = self.controller.admit(PRIORITY_SAVE, user_key="1", ip="10.0.0.1")
+        self.controller.admit(PRIORITY_SAVE, user_key="1", ip="10.0.0.2")
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            self.controller.admit(PRIORITY_SAVE, user_key="1", ip="10.0.0.3")
+        self.assertEqual(raised.exception.status_code, 429)
+
+        self.controller.release(lease)
+        self.controller.admit(PRIORITY_SAVE, user_key="1", ip="10.0.0.3")
+        self.controller.admit(PRIORITY_MEMBER, user_key="2", ip="10.0.0.3")
+        self.controller.admit(PRIORITY_MEMBER, user_key="3", ip="10.0.0.3")
+        with self.assertRaises(AdmissionRejected) as raised:
+            self.controller.admit(PRIORITY_MEMBER, user_key="4", ip="10.0.0.3")
+        self.assertEqual(raised.exception.status_code, 429)
+
+    def test_previews_leave_room_for_saves(self):
+        """Anonymous previews cannot take the slots reserved for higher priorities."""
+        self.controller.admit(PRIORITY_PREVIEW, ip="10.0.0.1")
+        self.controller.admit(PRIORITY_PREVIEW, ip="10.0.0.2")
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            self.controller.admit(PRIORITY_PREVIEW, ip="10.0.0.3")
+        self.assertEqual(raised.exception.status_code, 503)
+
+        self.controller.admit(PRIORITY_MEMBER, user_key="1", ip="10.0.0.4")
+        self.controller.admit(PRIORITY_SAVE, user_key="2", ip="10.0.0.5")
+        with self.assertRaises(AdmissionRejected):
+            self.controller.admit(PRIORITY_SAVE, user_key="3", ip="10.0.0.6")
+
+    def test_members_and_previews_leave_room_for_saves(self):
+        """Members and previews together never take the last slot."""
+        self.controller.admit(PRIORITY_PREVIEW, ip="10.0.0.1")
+        self.controller.admit(PRIORITY_MEMBER, user_key="1", ip="10.0.0.2")
+        self.controller.admit(PRIORITY_MEMBER, user_key="2", ip="10.0.0.3")
+
+        with self.assertRaises(AdmissionRejected) as raised:
+            self.controller.admit(PRIORITY_MEMBER, user_key="3", ip="10.0.0.4")
+        self.assertEqual(raised.exception.status_code, 503)
+        self.controller.admit(PRIORITY_SAVE, user_key="4", ip="10.0.0.5")
+
+    def test_leases_expire(self):
+        """Leases of requests that never finished are dropped after their TTL."""
+        for i in range(4):
+            self.controller.admit(PRIORITY_SAVE, user_key=str(i), ip=f"10.0.0.{i}")
+
+        self.clock.now += self.controller.lease_ttl
+        self.controller.admit(PRIORITY_SAVE, user_key="9", ip="10.0.0.9")
+
+
+class TestAdmissionDecorator(unittest.TestCase):
+    """Test the decorator on a Flask endpoint."""
+
+    def setUp(self):
+        """Create an app with one controlled endpoint."""
+        self.test_dir = tempfile.mkdtemp()
+        controller = AdmissionController(slots=1, store=SharedStore(os.path.join(self.test_dir, "shared.db")))
+        self.patcher = patch("backend.utils.admission.admission_controller", controller)
+        self.patcher.start()
+        self.controller = controller
+
+        self.app = Flask(__name__)
+        self.app.config["JWT_SECRET_KEY"] = "admission-test-secret-key-of-32-bytes"
+        JWTManager(self.app)
+        self.priorities = []
+
+        @self.app.route("/generate", methods=["POST"])
+        @admission_controlled()
+        def generate():
+            self.priorities.append(controller.store.connect().execute(
+                "SELECT priority FROM admission_leases"
+            ).fetchone()[0])
+            return jsonify({"status": "success"})
+
+        @self.app.route("/stream")
+        @admission_controlled()
+        def stream():
+            return Response((chunk for chunk in [b"once ", b"upon a time"]), mimetype="audio/mpeg")
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.test_dir)
+
+    def test_requests_are_classified(self):
+        """Signed-in users saving a story run with the highest priority, anonymous ones as previews."""
+        with self.app.app_context():
+            token = create_access_token(identity="7")
+
+        self.client.post("/generate", json={"save": True}, headers={"Authorization": f"Bearer {token}"})
+        self.client.post("/generate", json={})
+
+        self.assertEqual(self.priorities, [PRIORITY_SAVE, PRIORITY_PREVIEW])
+
+    def test_refused_requests_get_retry_after(self):
+        """A busy host answers at once with 503 and Retry-After."""
+        self.controller.admit(PRIORITY_SAVE, user_key="1")
+
+        response = self.client.post("/generate", json={})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json["status"], "error")
+        self.assertIn("Retry-After", response.headers)
+        self.assertEqual(self.priorities, [])
+
+    def test_stream_holds_lease_until_closed(self):
+        """A streamed response keeps its slot until the body has been sent."""
+        response = self.client.get("/stream", buffered=False)
+        self.assertEqual(self.client.get("/stream").status_code, 503)
+
+        self.assertEqual(b"".join(response.response), b"once upon a time")
+        response.close()
+        self.assertEqual(self.client.get("/stream").status_code, 200)
+
+    def test_forwarded_addresses_need_a_trusted_proxy(self):
+        """Clients cannot pick their address; forwarded headers count only behind ProxyFix."""
+        self.app.add_url_rule("/ip", "ip", client_ip)
+        headers = {"X-Real-IP": "6.6.6.6", "X-Forwarded-For": "6.6.6.6"}
+        environ = {"REMOTE_ADDR": "10.0.0.1"}
+
+        self.assertEqual(self.client.get("/ip", headers=headers, environ_base=environ).get_data(), b"10.0.0.1")
+
+        self.app.wsgi_app = ProxyFix(self.app.wsgi_app, x_for=1)
+        self.assertEqual(self.client.get("/ip", headers=headers, environ_base=environ).get_data(), b"6.6.6.6")
+
+
+if __name__ == "__main__":
+    unittest.main()
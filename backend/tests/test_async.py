@@ -0,0 +1,238 @@
+"""Unit tests for the async serving mode."""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from google.api_core import exceptions as google_exceptions
+
+# Serve the app from an in-memory database
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from flask import Flask, Response, request
+
+from backend import asgi
+from backend.services.admission import admission_controller
+from backend.services.resilience import CircuitBreaker, DeadlineExceeded, ResilientClient
+from backend.services.voice_service.voice_service import VoiceService, SoundItem, NarrationPending
+from backend.services.voice_service.generation_cache import GenerationCache
+from backend.services.voice_service.similarity_cache import SimilarityCache
+from backend.services.voice_service.story_generator import StoryGenerator
+
+# A single MPEG-2 layer III frame header followed by padding
+FAKE_FRAME = b"\xff\xf3\x64\xc4" + b"\x00" * 140
+
+
+def make_client(**kwargs):
+    """Create a client for a test upstream."""
+    options = {"timeout": 1.0, "deadline": 5.0, "max_attempts": 3, "base_delay": 0.01, "breaker": CircuitBreaker("async_test")}
+    options.update(kwargs)
+    return ResilientClient("async_test", **options)
+
+
+class TestCallAsync(unittest.TestCase):
+    """Test the resilience policy for coroutines."""
+
+    def test_transient_errors_are_retried(self):
+        """Transient errors are retried until a call succeeds."""
+        func = AsyncMock(side_effect=[google_exceptions.ServiceUnavailable("down"), "story"])
+
+        self.assertEqual(asyncio.run(make_client().call_async(func, "prompt")), "story")
+        self.assertEqual(func.await_count, 2)
+
+    def test_late_attempt_is_cancelled(self):
+        """An attempt that misses its timeout is cancelled."""
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            with self.assertRaises(DeadlineExceeded):
+                await make_client(timeout=0.05, max_attempts=1).call_async(slow)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [True])
+
+
+class TestAsyncNarration(unittest.TestCase):
+    """Test concurrent synthesis of a sequence."""
+
+    def setUp(self):
+        """Set up a voice service with a slow async TTS client."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.voice_service = VoiceService()
+        self.voice_service.static_dir = self.temp_dir
+        self.voice_service.output_dir = os.path.join(self.temp_dir, "generated")
+        self.voice_service.sound_effects = {}
+        self.voice_service.tts_client = MagicMock()
+        self.voice_service.tts_policy = make_client()
+
+        self.tts_client = MagicMock()
+
+        async def synthesize_speech(**kwargs):
+            await asyncio.sleep(0.2)
+            return MagicMock(audio_content=FAKE_FRAME)
+
+        self.tts_client.synthesize_speech = AsyncMock(side_effect=synthesize_speech)
+        self.voice_service._get_async_tts_client = lambda: self.tts_client
+        self.sequence = [
+            SoundItem(sound_type="human", content=f"Paragraph {i} of the story.", emotion="neutral")
+            for i in range(4)
+        ]
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_segments_are_synthesized_concurrently(self):
+        """All segments of a sequence are requested at once."""
+        start = time.monotonic()
+        audio_path = asyncio.run(self.voice_service.process_sound_sequence_async(self.sequence))
+
+        self.assertTrue(audio_path.startswith("/static/generated/story_"))
+        self.assertEqual(self.tts_client.synthesize_speech.await_count, 4)
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_transient_failures_leave_narration_pending(self):
+        """Segments that fail transiently are reported as pending."""
+        self.voice_service.tts_policy = make_client(max_attempts=1)
+        self.tts_client.synthesize_speech = AsyncMock(side_effect=google_exceptions.ServiceUnavailable("down"))
+
+        with self.assertRaises(NarrationPending) as raised:
+            asyncio.run(self.voice_service.process_sound_sequence_async(self.sequence))
+        self.assertEqual(raised.exception.failed, [0, 1, 2, 3])
+
+
+class TestAsyncStory(unittest.TestCase):
+    """Test story generation on an event loop."""
+
+    def test_generate_story_async(self):
+        """Gemini is awaited and the story is narrated."""
+        generator = StoryGenerator()
+        generator.gemini_model = MagicMock()
+        generator.gemini_model.generate_content_async = AsyncMock(
+            return_value=MagicMock(text="Title: The Brave Crow\n\nKalu was brave.", candidates=[])
+        )
+        generator.gemini_client = make_client()
+        generator.generation_cache = GenerationCache(ttl=60, max_entries=0)
+        generator.similarity_cache = SimilarityCache(max_entries=0)
+        generator.voice_service = MagicMock()
+        generator.voice_service.process_sound_sequence_async = AsyncMock(return_value="/static/generated/story.mp3")
+        generator.voice_service.describe_audio.return_value = None
+
+        story = asyncio.run(generator.generate_story_async(theme="Courage"))
+
+        self.assertEqual(story["title"], "The Brave Crow")
+        self.assertEqual(story["audio_path"], "/static/generated/story.mp3")
+        self.assertFalse(story["is_fallback"])
+        generator.gemini_model.generate_content.assert_not_called()
+
+
+class TestASGIApplication(unittest.TestCase):
+    """Test routing in the ASGI app."""
+
+    def setUp(self):
+        """Create the app, keeping the admission slots of the other tests."""
+        self.slots = admission_controller.slots
+        self.application = asgi.create_application()
+
+    def tearDown(self):
+        admission_controller.slots = self.slots
+
+    def send_request(self, method, path, body=b"", application=None):
+        """Send a request to an ASGI app and collect the messages it sends."""
+        messages = [{"type": "http.request", "body": body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run((application or self.application)({
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "path": path,
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 5000)
+        }, receive, send))
+        return sent
+
+    def request(self, method, path, body=b""):
+        """Send a request to the ASGI app and return its status and JSON body."""
+        sent = self.send_request(method, path, body)
+        body = b"".join(message.get("body", b"") for message in sent[1:])
+        return sent[0]["status"], json.loads(body)
+
+    def test_slots_are_set_by_the_factory(self):
+        """Only creating the app, not importing the module, admits more requests."""
+        admission_controller.slots = 4
+
+        asgi.create_application(slots=50)
+
+        self.assertEqual(admission_controller.slots, 50)
+
+    def test_flask_routes_are_served(self):
+        """Routes without an async view are served by the Flask app."""
+        status, body = self.request("GET", "/health")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["status"], "healthy")
+
+    def test_flask_routes_get_body_and_stream(self):
+        """Flask routes read the request body and stream their response, which is closed once sent."""
+        flask_app = Flask(__name__)
+        closed = []
+
+        @flask_app.route("/echo", methods=["POST"])
+        def echo():
+            return {"received": request.get_json()}
+
+        @flask_app.route("/stream")
+        def stream():
+            response = Response((chunk for chunk in [b"once ", b"upon a time"]), mimetype="audio/mpeg")
+            response.call_on_close(lambda: closed.append(True))
+            return response
+
+        with patch.object(asgi, "app", flask_app):
+            application = asgi.create_application()
+
+        sent = self.send_request("POST", "/echo", json.dumps({"theme": "Courage"}).encode(), application)
+        self.assertEqual(json.loads(b"".join(message.get("body", b"") for message in sent[1:])), {"received": {"theme": "Courage"}})
+
+        sent = self.send_request("GET", "/stream", application=application)
+        self.assertEqual([message.get("body") for message in sent[1:]], [b"once ", b"upon a time", b""])
+        self.assertEqual(closed, [True])
+
+    @patch("backend.routes.voice_api.story_generator")
+    def test_generate_story_is_awaited(self, story_generator):
+        """generate-story is served by its async view."""
+        story_generator.generate_story_async = AsyncMock(return_value={"title": "The Brave Crow", "narration_status": "ready"})
+
+        status, body = self.request("POST", "/api/voice/generate-story", json.dumps({"theme": "Courage", "instant": False}).encode())
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body["story"]["title"], "The Brave Crow")
+        story_generator.generate_story.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""Unit tests for garbage collection of generated audio."""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.commands import gc_audio_command
+from backend.models import db, init_db, Story
+from backend.services.audio_gc import AudioCollector
+
+DAY = 24 * 3600
+
+
+class TestAudioCollector(unittest.TestCase):
+    """Test the live set, the grace period and incremental collection."""
+
+    def setUp(self):
+        """Create an output directory with referenced, recent and stale files."""
+        self.static_dir = tempfile.mkdtemp()
+        self.output_dir = os.path.join(self.static_dir, "generated")
+        self.sleep = MagicMock()
+        self.collector = AudioCollector(self.output_dir, grace_period=DAY, batch_size=2, batch_pause=0.1, sleep=self.sleep)
+
+        self.write("story_saved.mp3", age=3 * DAY)
+        self.write("story_saved.mp3.json", age=3 * DAY)
+        self.write("story_preview.mp3", size=1000, age=3 * DAY)
+        self.write("story_preview.mp3.json", size=20, age=3 * DAY)
+        self.write("speech_default_happy_0123456789.mp3", age=3 * DAY)
+        self.write("speech_default_calm_9876543210.mp3", age=60)
+        self.write("story_old.mp3.123.tmp", age=3 * DAY)
+        self.write("sequences/abc123.json", age=3 * DAY)
+        self.write("sequences/def456.json", age=3 * DAY)
+        self.write("hls/aaaa/master.m3u8", age=3 * DAY)
+        self.write("hls/aaaa/32k/segment_000.ts", age=3 * DAY)
+        self.write("hls/bbbb/master.m3u8", size=30, age=3 * DAY)
+        self.write("hls/bbbb/32k/segment_000.ts", size=500, age=3 * DAY)
+        for package in ("aaaa", "bbbb"):
+            os.utime(os.path.join(self.output_dir, "hls", package), (time.time() - 3 * DAY,) * 2)
+
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        init_db(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.session.add(Story(
+            title="Saved", content="Once upon a time.",
+            audio_path="/static/generated/story_saved.mp3",
+            hls_path="/static/generated/hls/aaaa/master.m3u8"
+        ))
+        db.session.add(Story(title="Placeholder", content="Once.", audio_path="/static/placeholders/silence.mp3"))
+        db.session.add(Story(title="Streamed", content="Once.", narration_status="pending", sequence_id="def456"))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+        shutil.rmtree(self.static_dir)
+
+    def write(self, name, size=100, age=0):
+        path = os.path.join(self.output_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"\0" * size)
+        os.utime(path, (time.time() - age,) * 2)
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.output_dir, name))
+
+    def test_live_set(self):
+        """Story audio, HLS packages and sequences inside the output directory are referenced."""
+        self.assertEqual(self.collector.live_set(), {"story_saved.mp3", "hls/aaaa", "sequences/def456.json"})
+
+    def test_collect(self):
+        """Unreferenced files past the grace period are removed with their sidecars."""
+        counts = self.collector.collect()
+
+        for name in ("story_saved.mp3", "story_saved.mp3.json", "speech_default_calm_9876543210.mp3",
+                     "hls/aaaa/master.m3u8", "sequences/def456.json"):
+            self.assertTrue(self.exists(name), name)
+        for name in ("story_preview.mp3", "story_preview.mp3.json", "speech_default_happy_0123456789.mp3",
+                     "story_old.mp3.123.tmp", "sequences/abc123.json", "hls/bbbb"):
+            self.assertFalse(self.exists(name), name)
+        self.assertEqual(counts["removed"], 5)
+        self.assertEqual(counts["bytes_reclaimed"], 1020 + 100 + 100 + 100 + 530)
+        self.assertEqual(counts["errors"], 0)
+
+    def test_dry_run(self):
+        """A dry run reports the same files without removing them."""
+        counts = self.collector.collect(dry_run=True)
+
+        self.assertEqual(counts["removed"], 5)
+        self.assertTrue(self.exists("story_preview.mp3"))
+        self.assertTrue(self.exists("hls/bbbb/master.m3u8"))
+
+    def test_pauses_between_batches(self):
+        """The collector pauses after every batch of entries."""
+        counts = self.collector.collect()
+
+        self.assertEqual(self.sleep.call_count, counts["scanned"] // 2)
+        self.sleep.assert_called_with(0.1)
+
+    def test_command(self):
+        """The CLI command reports the reclaimed bytes."""
+        self.app.cli.add_command(gc_audio_command)
+        with patch("backend.commands.audio_collector", self.collector):
+            result = self.app.test_cli_runner().invoke(args=["gc-audio", "--dry-run"])
+
+        self.assertIn("Would remove 5 of", result.output)
+        self.assertIn("(1850 bytes reclaimed)", result.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Unit tests for catalog pre-generation."""
+
+import os
+import sys
+import unittest
+
+from flask import Flask
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.models import db, init_db, Story
+from backend.services import catalog
+
+
+def fake_generate(params):
+    """Stand-in for generate_catalog_story that needs no upstream services."""
+    if params["theme"] == "Broken":
+        raise RuntimeError("upstream error")
+    return {
+        "title": f"A story about {params['theme']}",
+        "text": "Once upon a time.",
+        "audio_path": "/static/generated/story_abc.mp3",
+        "content_hash": "abc",
+        "is_fallback": params["theme"] == "Fallback",
+    }
+
+
+class TestCatalog(unittest.TestCase):
+    """Test building and generating the story catalog."""
+
+    def setUp(self):
+        """Create an in-memory database."""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        init_db(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        self.context.pop()
+
+    def test_themes_are_read_from_the_frontend(self):
+        """Theme names match what the frontend sends."""
+        themes = catalog.load_themes()
+
+        self.assertIn("Kindness", themes)
+        self.assertIn("Seva (Selfless Service)", themes)
+        self.assertEqual(catalog.load_themes("/missing/themes.js"), catalog.DEFAULT_THEMES)
+
+    def test_matrix_keys_are_normalized(self):
+        """Each combination and variant gets a normalized catalog key."""
+        entries = catalog.build_matrix([" Unity in  Diversity"], ["3-5"], ["short", "long"], ["EN"], variants=2)
+
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(entries[0]["catalog_key"], "unity in diversity|3-5|short|en|0")
+        self.assertEqual(entries[0]["params"]["duration"], "short")
+
+    def test_pregenerate_stores_public_stories_and_resumes(self):
+        """Stories are stored without a user and existing entries are skipped."""
+        entries = catalog.build_matrix(["Kindness", "Broken", "Fallback"], ["5-8"], ["medium"], ["en"])
+
+        counts = catalog.pregenerate(entries, workers=1, rate_per_minute=0, generate_fn=fake_generate)
+        self.assertEqual(counts, {"generated": 1, "skipped": 0, "failed": 2})
+
+        story = Story.query.filter_by(catalog_key="kindness|5-8|medium|en|0").one()
+        self.assertIsNone(story.user_id)
+        self.assertEqual(story.content_hash, "abc")
+
+        counts = catalog.pregenerate(entries, workers=1, rate_per_minute=0, generate_fn=fake_generate)
+        self.assertEqual(counts, {"generated": 0, "skipped": 1, "failed": 2})
+
+    def test_pregenerate_with_process_pool(self):
+        """Stories generated in worker processes are saved by the parent."""
+        entries = catalog.build_matrix(["Kindness", "Courage"], ["5-8"], ["short"], ["en"])
+
+        counts = catalog.pregenerate(entries, workers=2, rate_per_minute=0, generate_fn=fake_generate)
+
+        self.assertEqual(counts["generated"], 2)
+        self.assertEqual(Story.query.filter(Story.catalog_key.isnot(None)).count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Unit tests for response compression and precompressed assets."""
+
+import os
+import sys
+import gzip
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import brotli
+from flask import Flask, Response, jsonify, request
+
+# Serve the app from an in-memory database
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend import app as app_module
+from backend.app import app as storyspark_app
+from backend.services import compression
+from backend.services.compression import compress_response, precompress_directory
+from backend.services.static_manifest import StaticManifest
+
+STORY = {"title": "The Brave Crow", "text": "Kalu the crow was brave. " * 200}
+
+
+class TestResponseCompression(unittest.TestCase):
+    """Test on-the-fly compression of API responses."""
+
+    def setUp(self):
+        """Create an app that compresses its responses."""
+        self.app = Flask(__name__)
+
+        @self.app.after_request
+        def compress(response):
+            return compress_response(response, request.accept_encodings)
+
+        @self.app.route("/story")
+        def story():
+            return jsonify(STORY)
+
+        @self.app.route("/small")
+        def small():
+            return jsonify(status="success")
+
+        @self.app.route("/stream")
+        def stream():
+            return Response((chunk for chunk in [b"x" * 4096]), mimetype="text/plain")
+
+        self.client = self.app.test_client()
+
+    def test_brotli_preferred(self):
+        """Clients accepting Brotli get it, others gzip, and the rest plain JSON."""
+        response = self.client.get("/story", headers={"Accept-Encoding": "gzip, deflate, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(brotli.decompress(response.get_data())[:9], b'{"text":"')
+
+        response = self.client.get("/story", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertLess(int(response.headers["Content-Length"]), 1000)
+        self.assertIn(b"Kalu the crow", gzip.decompress(response.get_data()))
+
+        response = self.client.get("/story")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+
+    def test_gzip_without_brotli(self):
+        """gzip is used when the brotli package is not installed."""
+        with patch.object(compression, "brotli", None):
+            response = self.client.get("/story", headers={"Accept-Encoding": "br, gzip"})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+
+    def test_small_and_streamed_responses(self):
+        """Small bodies and streamed responses are sent as they are."""
+        headers = {"Accept-Encoding": "br, gzip"}
+
+        self.assertNotIn("Content-Encoding", self.client.get("/small", headers=headers).headers)
+        self.assertNotIn("Content-Encoding", self.client.get("/stream", headers=headers).headers)
+
+
+class TestPrecompressedAssets(unittest.TestCase):
+    """Test build-time compression and serving of frontend assets."""
+
+    def setUp(self):
+        """Create a frontend build with a script and an image."""
+        self.build_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.build_dir, "assets"))
+        with open(os.path.join(self.build_dir, "assets", "index.js"), "w") as f:
+            f.write("console.log('Once upon a time');\n" * 200)
+        with open(os.path.join(self.build_dir, "index.html"), "w") as f:
+            f.write("<!doctype html><div id=root></div>")
+        with open(os.path.join(self.build_dir, "logo.png"), "wb") as f:
+            f.write(os.urandom(4096))
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def test_precompress_directory(self):
+        """Text assets get .br and .gz copies once; small files and images are skipped."""
+        counts = precompress_directory(self.build_dir)
+
+        self.assertEqual(counts["files"], 1)
+        self.assertLess(counts["compressed_bytes"], counts["original_bytes"] / 10)
+        self.assertTrue(os.path.exists(os.path.join(self.build_dir, "assets", "index.js.br")))
+        self.assertTrue(os.path.exists(os.path.join(self.build_dir, "assets", "index.js.gz")))
+        self.assertFalse(os.path.exists(os.path.join(self.build_dir, "logo.png.gz")))
+        self.assertEqual(precompress_directory(self.build_dir)["skipped"], 1)
+
+    def test_frontend_serves_precompressed_copy(self):
+        """The SPA route sends the copy the client prefers with the original media type."""
+        precompress_directory(self.build_dir)
+        client = storyspark_app.test_client()
+        with patch.object(app_module, "frontend_manifest", StaticManifest(self.build_dir)):
+            response = client.get("/assets/index.js", headers={"Accept-Encoding": "gzip, br"})
+            plain = client.get("/assets/index.js")
+
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertIn("javascript", response.mimetype)
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(brotli.decompress(response.get_data()), plain.get_data())
+        response.close()
+        plain.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
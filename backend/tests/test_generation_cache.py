@@ -0,0 +1,114 @@
+"""Unit tests for the Gemini generation cache and metrics."""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.metrics import Metrics, metrics
+from services.voice_service.generation_cache import GenerationCache
+from services.voice_service.story_generator import StoryGenerator
+
+
+class TestGenerationCache(unittest.TestCase):
+    """Test expiry, eviction and variant rotation."""
+
+    def test_key_ignores_whitespace_but_not_model(self):
+        """Reformatted prompts share a key; other models do not."""
+        key = GenerationCache.make_key("Write a  story\n about kindness", "model-a")
+
+        self.assertEqual(key, GenerationCache.make_key("Write a story about kindness ", "model-a"))
+        self.assertNotEqual(key, GenerationCache.make_key("Write a story about kindness", "model-b"))
+
+    def test_entries_expire(self):
+        """Responses older than the TTL are misses."""
+        cache = GenerationCache(ttl=60, max_entries=10)
+        with patch("services.voice_service.generation_cache.time.time", return_value=1000):
+            cache.put("key", "story")
+            self.assertEqual(cache.get("key"), "story")
+        with patch("services.voice_service.generation_cache.time.time", return_value=1061):
+            self.assertIsNone(cache.get("key"))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """The cache holds at most max_entries keys."""
+        cache = GenerationCache(ttl=60, max_entries=2)
+        cache.put("a", "story a")
+        cache.put("b", "story b")
+        cache.get("a")
+        cache.put("c", "story c")
+
+        self.assertEqual(cache.get("a"), "story a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "story c")
+
+    def test_variants_are_rotated(self):
+        """A key is served once it has all its variants, in rotation."""
+        cache = GenerationCache(ttl=60, max_entries=10, variants=2)
+        cache.put("key", "first")
+        self.assertIsNone(cache.get("key"))
+
+        cache.put("key", "second")
+        self.assertEqual([cache.get("key") for _ in range(3)], ["first", "second", "first"])
+
+        cache.put("key", "third")
+        self.assertEqual({cache.get("key"), cache.get("key")}, {"second", "third"})
+
+    def test_disabled_cache(self):
+        """A size of zero disables caching."""
+        cache = GenerationCache(ttl=60, max_entries=0)
+        cache.put("key", "story")
+
+        self.assertIsNone(cache.get("key"))
+
+
+class TestCachedGeneration(unittest.TestCase):
+    """Test StoryGenerator's use of the cache."""
+
+    def setUp(self):
+        """Create a generator with a mocked model and a fresh cache."""
+        self.generator = StoryGenerator()
+        self.generator.gemini_model = MagicMock()
+        self.generator.gemini_model.generate_content.return_value = MagicMock(text="Title: Kind\n\nOnce upon a time.")
+        self.generator.generation_cache = GenerationCache(ttl=60, max_entries=10)
+
+    def test_identical_prompts_call_the_model_once(self):
+        """The second identical request is answered from the cache."""
+        hits = metrics.get("generation_cache_hits_total")
+
+        first = self.generator._generate_content("prompt")
+        second = self.generator._generate_content("prompt")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.generator.gemini_model.generate_content.call_count, 1)
+        self.assertEqual(metrics.get("generation_cache_hits_total"), hits + 1)
+
+    def test_bypass_calls_the_model(self):
+        """Bypassing the cache always calls the model."""
+        self.generator._generate_content("prompt")
+        self.generator._generate_content("prompt", use_cache=False)
+
+        self.assertEqual(self.generator.gemini_model.generate_content.call_count, 2)
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the metrics registry."""
+
+    def test_prometheus_rendering(self):
+        """Metrics are rendered with their help text and type."""
+        registry = Metrics()
+        registry.describe("requests_total", "counter", "Requests served")
+        registry.inc("requests_total", 2)
+        registry.set("queue_depth", 3)
+
+        text = registry.render_prometheus()
+
+        self.assertIn("# HELP storyspark_requests_total Requests served\n", text)
+        self.assertIn("# TYPE storyspark_requests_total counter\nstoryspark_requests_total 2\n", text)
+        self.assertIn("# TYPE storyspark_queue_depth gauge\nstoryspark_queue_depth 3\n", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
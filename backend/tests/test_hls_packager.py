@@ -0,0 +1,41 @@
+"""Unit tests for HLS packaging of narrated stories."""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.voice_service import hls_packager
+
+
+class TestHlsPackager(unittest.TestCase):
+    """Test the HLS packaging helpers."""
+
+    def test_master_playlist_lists_renditions_by_bitrate(self):
+        """The master playlist lists each rendition from lowest to highest bitrate."""
+        playlist = hls_packager.build_master_playlist([96, 32])
+
+        lines = playlist.splitlines()
+        self.assertEqual(lines[0], "#EXTM3U")
+        self.assertEqual(lines[3], "32k/index.m3u8")
+        self.assertEqual(lines[5], "96k/index.m3u8")
+        self.assertIn("BANDWIDTH=35200", lines[2])
+
+    @patch("services.voice_service.hls_packager.ffmpeg_available", return_value=False)
+    def test_packaging_skipped_without_ffmpeg(self, _):
+        """Packaging is skipped when ffmpeg is not installed."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source_path = os.path.join(temp_dir, "story.mp3")
+            with open(source_path, "wb") as f:
+                f.write(b"\xff\xf3\x64\xc4")
+
+            self.assertIsNone(hls_packager.package_hls(source_path, temp_dir))
+            self.assertFalse(os.path.exists(os.path.join(temp_dir, "hls")))
+
+
+if __name__ == "__main__":
+    unittest.main()
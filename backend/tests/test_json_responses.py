@@ -0,0 +1,154 @@
+"""Unit tests for the JSON provider, JSON metadata columns and serialized stories."""
+
+import os
+import sys
+import json
+import unittest
+import uuid
+from datetime import datetime
+from unittest.mock import patch
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event, text
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.models import db, init_db, Story, StoryMetadata
+from backend.routes.api import api
+from backend.services.story_cache import story_response_cache
+from backend.utils import json_provider
+from backend.utils.json_provider import FastJSONProvider
+
+SAMPLE = {
+    "title": "Kalu the crow कालू",
+    "created": datetime(2024, 5, 1, 8, 30),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "peaks": [0.0, 0.5, 1.0],
+    "emotions": {1: "happy", 0: "calm"},
+    "nested": {"b": None, "a": True}
+}
+
+
+class TestFastJSONProvider(unittest.TestCase):
+    """Test that the provider matches Flask's default output."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.provider = FastJSONProvider(self.app)
+        self.default = DefaultJSONProvider(self.app)
+
+    def test_matches_default_provider(self):
+        """Serialized data decodes to what the default provider produces."""
+        expected = json.loads(self.default.dumps({**SAMPLE, "emotions": {"0": "calm", "1": "happy"}}))
+
+        self.assertEqual(json.loads(self.provider.dumps(SAMPLE)), expected)
+        self.assertEqual(list(json.loads(self.provider.dumps(SAMPLE))), sorted(SAMPLE))
+        self.assertEqual(self.provider.loads(self.provider.dumps_bytes(SAMPLE))["created"], "Wed, 01 May 2024 08:30:00 GMT")
+
+    def test_standard_library_fallback(self):
+        """Values orjson cannot represent, or a missing orjson, use the standard library."""
+        self.assertEqual(self.provider.dumps({"big": 2 ** 70}), '{"big":1180591620717411303424}')
+
+        with patch.object(json_provider, "orjson", None):
+            self.assertEqual(json.loads(self.provider.dumps(SAMPLE)), json.loads(FastJSONProvider(self.app).dumps(SAMPLE)))
+            self.assertEqual(self.provider.loads('{"a": 1}'), {"a": 1})
+
+    def test_jsonify(self):
+        """jsonify builds compact responses ending in a newline."""
+        self.app.json = self.provider
+        with self.app.app_context():
+            response = jsonify(status="success")
+
+        self.assertEqual(response.get_data(), b'{"status":"success"}\n')
+        self.assertEqual(response.mimetype, "application/json")
+
+
+class TestStoryResponses(unittest.TestCase):
+    """Test JSON metadata and pre-serialized public stories."""
+
+    def setUp(self):
+        """Create an app with the story API and two stories."""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.app.config["JWT_SECRET_KEY"] = "story-cache-test-secret-key-of-32-bytes"
+        self.app.json = FastJSONProvider(self.app)
+        init_db(self.app)
+        JWTManager(self.app)
+        self.app.register_blueprint(api, url_prefix="/api")
+        story_response_cache.clear()
+
+        self.context = self.app.app_context()
+        self.context.push()
+        for title in ("First", "Second"):
+            story = Story(title=title, content="Once upon a time.")
+            story.story_metadata = StoryMetadata(emotional_markers={"0": "happy"}, waveform_peaks=[0.2, 0.8])
+            db.session.add(story)
+        db.session.commit()
+        self.client = self.app.test_client()
+
+        self.queries = []
+        event.listen(db.engine, "before_cursor_execute", self.count_query)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self.count_query)
+        story_response_cache.clear()
+        db.session.remove()
+        self.context.pop()
+
+    def count_query(self, *args):
+        self.queries.append(args[2])
+
+    def test_metadata_is_returned_as_objects(self):
+        """Metadata is stored as JSON and returned without double encoding."""
+        story = self.client.get("/api/stories/1").json
+
+        self.assertEqual(story["metadata"]["emotional_markers"], {"0": "happy"})
+        self.assertEqual(story["metadata"]["waveform_peaks"], [0.2, 0.8])
+
+    def test_json_text_rows_load(self):
+        """Metadata written as JSON strings by earlier versions loads as objects."""
+        db.session.execute(text("UPDATE story_metadata SET sound_effects = '{\"3\": \"birds\"}' WHERE id = 1"))
+        db.session.commit()
+        db.session.expire_all()
+
+        self.assertEqual(db.session.get(StoryMetadata, 1).sound_effects, {"3": "birds"})
+
+    def test_public_stories_are_served_from_bytes(self):
+        """Repeated reads only query the story rows."""
+        first = self.client.get("/api/stories").get_data()
+        self.queries.clear()
+        second = self.client.get("/api/stories").get_data()
+
+        self.assertEqual(second, first)
+        self.assertEqual(sorted(story["title"] for story in json.loads(first)), ["First", "Second"])
+        self.assertEqual(len(self.queries), 1)
+
+        self.client.get("/api/stories/1")
+        self.assertEqual(len(self.queries), 2)
+
+    def test_unserved_pool_stories_are_not_listed(self):
+        """Pre-generated stories are listed once they have been served from the pool."""
+        db.session.add(Story(title="Pooled", content="Once.", catalog_key="kindness|5-8|short|en|0"))
+        db.session.commit()
+
+        self.assertNotIn("Pooled", [story["title"] for story in self.client.get("/api/stories").json])
+
+        db.session.get(Story, 3).served_at = datetime.utcnow()
+        db.session.commit()
+        self.assertIn("Pooled", [story["title"] for story in self.client.get("/api/stories").json])
+
+    def test_updated_story_is_serialized_again(self):
+        """A change to the story row replaces its cached JSON."""
+        self.client.get("/api/stories/1")
+        story = db.session.get(Story, 1)
+        story.title = "Renamed"
+        db.session.commit()
+
+        self.assertEqual(self.client.get("/api/stories/1").json["title"], "Renamed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Unit tests for the keyword matcher."""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.voice_service.keyword_matcher import KeywordMatcher, keyword_matcher, load_keyword_table
+from services.voice_service.story_generator import StoryGenerator
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    """Test matching keywords in text."""
+
+    def test_whole_words_only(self):
+        """Keywords do not match inside other words."""
+        scores = keyword_matcher.scan("The steering wheel was part of her education.")
+
+        self.assertEqual(scores, {"emotion": {}, "effect": {}})
+
+    def test_prefix_keywords(self):
+        """A keyword ending in * matches words starting with it."""
+        scores = keyword_matcher.scan("Everyone laughed and kept laughing. LAUGHTER filled the room.")
+
+        self.assertEqual(scores["emotion"], {"happy": 3.0})
+
+    def test_contractions_are_one_word(self):
+        """A keyword does not match part of a contraction."""
+        matcher = KeywordMatcher({"emotion": {"sad": ["don"], "happy": ["don't"]}})
+
+        self.assertEqual(matcher.scan("Don't worry, Don.")["emotion"], {"happy": 1.0, "sad": 1.0})
+
+    def test_phrases(self):
+        """Phrases match across whitespace and overlap with other keywords."""
+        matcher = KeywordMatcher({"effect": {
+            "intro": ["once upon a time"],
+            "clock": ["a time", "time"]
+        }})
+
+        scores = matcher.scan("Once upon\na time, there lived a king.")
+
+        self.assertEqual(scores["effect"], {"intro": 1.0, "clock": 2.0})
+
+    def test_weights_and_ties(self):
+        """Weights add up, and ties go to the category listed first."""
+        matcher = KeywordMatcher({"emotion": {
+            "calm": {"quiet": 2.0},
+            "scared": ["dark", "shadow"]
+        }})
+
+        self.assertEqual(matcher.best(matcher.scan("A quiet, dark shadow.")["emotion"], "emotion"), "calm")
+        self.assertEqual(matcher.best(matcher.scan("A dark shadow.")["emotion"], "emotion"), "scared")
+        self.assertIsNone(matcher.best(matcher.scan("Nothing here.")["emotion"], "emotion"))
+
+    def test_prefix_phrases_are_rejected(self):
+        """Only single words can be prefix keywords."""
+        with self.assertRaises(ValueError):
+            KeywordMatcher({"effect": {"rain": ["heavy rain*"]}})
+
+    def test_table_overrides(self):
+        """Categories from a JSON file replace the defaults with the same name."""
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"effect": {"rain": ["monsoon"]}}, f)
+
+        try:
+            matcher = KeywordMatcher(load_keyword_table(f.name))
+        finally:
+            os.unlink(f.name)
+
+        self.assertEqual(matcher.scan("The monsoon rain came.")["effect"], {"rain": 1.0})
+        self.assertEqual(matcher.scan("A dog barked.")["effect"], {"animal": 1.0})
+
+
+class TestSoundSequence(unittest.TestCase):
+    """Test emotions and sound effects chosen for a story."""
+
+    def test_effects_follow_the_best_matching_paragraph(self):
+        """Each group of three paragraphs gets one effect, after its strongest match."""
+        generator = StoryGenerator()
+        story = "\n\n".join([
+            "Meera woke up early.",
+            "She heard the rain on the roof, a storm was coming.",
+            "She smiled and laughed.",
+            "A dog barked at the door.",
+            "They sat together."
+        ])
+
+        sequence = generator._create_sound_sequence(story, "The Storm")
+
+        items = [(item.sound_type, item.content if item.sound_type == "effect" else item.emotion)
+                 for item in sequence[2:]]
+        self.assertEqual(items, [
+            ("human", "neutral"),
+            ("human", "neutral"),
+            ("effect", "rain"),
+            ("human", "happy"),
+            ("human", "neutral"),
+            ("effect", "door"),
+            ("human", "neutral"),
+            ("effect", "magic")
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,300 @@
+"""Unit tests for narrating stored stories and background jobs."""
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.models import db, init_db, Story, StoryMetadata
+from backend.routes import voice_api
+from backend.services.jobs import JobQueue
+from backend.services.voice_service.story_generator import StoryGenerator
+from backend.services.voice_service.voice_service import NarrationPending
+
+
+class TestNarrateExistingStory(unittest.TestCase):
+    """Test StoryGenerator.narrate_existing_story against the database."""
+
+    def setUp(self):
+        """Create an in-memory database with one story."""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        init_db(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.audio_file = os.path.join(self.temp_dir, "story_abc.mp3")
+        with open(self.audio_file, "wb") as f:
+            f.write(b"\xff\xf3\x64\xc4")
+
+        self.generator = StoryGenerator()
+        self.generator.voice_service = MagicMock()
+        self.generator.voice_service.process_sound_sequence.return_value = "/static/generated/story_abc.mp3"
+        self.generator.voice_service.resolve_static_path.return_value = self.audio_file
+        self.generator.voice_service.describe_audio.return_value = {"duration": 12.5, "peaks": [0.5]}
+
+        self.story = Story(title="Kindness", content="Once upon a time.\n\nThe end.")
+        self.story.story_metadata = StoryMetadata()
+        db.session.add(self.story)
+        db.session.commit()
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        self.context.pop()
+        os.remove(self.audio_file)
+        os.rmdir(self.temp_dir)
+
+    def test_narration_is_persisted(self):
+        """A new narration is stored with its content hash and measurements."""
+        narration = self.generator.narrate_existing_story(self.story.id)
+
+        self.assertFalse(narration["reused"])
+        self.assertEqual(narration["audio_path"], "/static/generated/story_abc.mp3")
+        self.assertEqual(self.story.audio_path, "/static/generated/story_abc.mp3")
+        self.assertEqual(self.story.content_hash, StoryGenerator.compute_content_hash("Kindness", self.story.content))
+        self.assertEqual(self.story.story_metadata.audio_duration, 12.5)
+
+    def test_unchanged_story_reuses_narration(self):
+        """Narration is not rendered again while the text is unchanged."""
+        self.generator.narrate_existing_story(self.story.id)
+        self.generator.voice_service.process_sound_sequence.reset_mock()
+
+        narration = self.generator.narrate_existing_story(self.story.id)
+
+        self.assertTrue(narration["reused"])
+        self.generator.voice_service.process_sound_sequence.assert_not_called()
+
+    def test_edited_story_is_narrated_again(self):
+        """Editing the text renders the narration through the segment cache."""
+        self.generator.narrate_existing_story(self.story.id)
+        self.story.content = "Once upon a time.\n\nThey all lived happily."
+        db.session.commit()
+
+        narration = self.generator.narrate_existing_story(self.story.id)
+
+        self.assertFalse(narration["reused"])
+        self.assertEqual(self.generator.voice_service.process_sound_sequence.call_count, 2)
+
+    def test_missing_story_raises(self):
+        """A missing story raises ValueError."""
+        with self.assertRaises(ValueError):
+            self.generator.narrate_existing_story(9999)
+
+    def test_pending_narration_is_returned_in_time(self):
+        """Segments that miss the request's deadline leave the narration pending."""
+        self.generator.voice_service.process_sound_sequence.side_effect = NarrationPending([2])
+        self.generator.voice_service.save_sequence.return_value = "seq123"
+
+        narration = self.generator.narrate_existing_story(self.story.id, deadline=time.monotonic() + 5)
+
+        self.assertEqual(narration["narration_status"], "pending")
+        self.assertEqual(narration["sequence_id"], "seq123")
+        self.assertEqual(self.story.narration_status, "pending")
+        self.assertIsNone(self.story.audio_path)
+
+    @patch("backend.services.voice_service.story_generator.time.sleep")
+    def test_pending_narration_is_not_retried_by_default(self, sleep):
+        """Without retry_pending the caller gets the pending narration at once instead of waiting out the rounds."""
+        self.generator.voice_service.process_sound_sequence.side_effect = NarrationPending([2])
+        self.generator.voice_service.save_sequence.return_value = "seq123"
+
+        narration = self.generator.narrate_existing_story(self.story.id)
+
+        self.assertEqual(narration["narration_status"], "pending")
+        sleep.assert_not_called()
+        self.assertEqual(self.generator.voice_service.process_sound_sequence.call_count, 1)
+
+    @patch("backend.services.voice_service.story_generator.time.sleep")
+    def test_pending_narration_is_completed(self, sleep):
+        """The background job retries the missing segments and stores the narration."""
+        self.generator.voice_service.process_sound_sequence.side_effect = [
+            NarrationPending([2]), "/static/generated/story_abc.mp3"
+        ]
+        self.generator.voice_service.load_sequence.return_value = {"voice_id": "default", "items": []}
+
+        narration = self.generator.complete_narration("seq123", story_id=self.story.id)
+
+        self.assertEqual(narration["audio_path"], "/static/generated/story_abc.mp3")
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.story.narration_status, "ready")
+        self.assertEqual(self.story.audio_path, "/static/generated/story_abc.mp3")
+
+    @patch("backend.services.voice_service.story_generator.time.sleep")
+    def test_narration_fails_after_last_round(self, sleep):
+        """A narration still missing segments after every round is marked failed."""
+        self.generator.voice_service.process_sound_sequence.side_effect = NarrationPending([2])
+        self.generator.voice_service.load_sequence.return_value = {"voice_id": "default", "items": []}
+
+        with self.assertRaises(RuntimeError):
+            self.generator.complete_narration("seq123", story_id=self.story.id)
+        self.assertEqual(self.story.narration_status, "failed")
+
+
+class TestSavedStreamedStory(unittest.TestCase):
+    """Test saving a story whose narration was streamed."""
+
+    def setUp(self):
+        """Create an in-memory database."""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        init_db(self.app)
+        self.context = self.app.test_request_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    @patch.object(voice_api, "job_queue")
+    def test_streamed_story_is_rendered_in_background(self, job_queue):
+        """The saved row is pending until the background job stores the audio."""
+        job_queue.submit.return_value = "job123"
+        story_data = {
+            "title": "Kindness", "text": "Once upon a time.", "audio_path": None, "narration_status": "ready",
+            "sequence_id": "seq123", "stream_url": "/api/voice/stream/seq123"
+        }
+
+        response = voice_api._finish_story_request({"save": True}, MagicMock(id=None), story_data, 1.0)
+
+        story = db.session.get(Story, response.json["story"]["id"])
+        self.assertEqual(story.narration_status, "pending")
+        self.assertEqual(story.sequence_id, "seq123")
+        self.assertEqual(response.json["story"]["narration_status"], "pending")
+        self.assertEqual(job_queue.submit.call_args.kwargs["args"], ("seq123",))
+        self.assertEqual(job_queue.submit.call_args.kwargs["kwargs"]["story_id"], story.id)
+
+    @patch.object(voice_api, "job_queue")
+    def test_unsaved_streamed_story_reports_render_job(self, job_queue):
+        """A streamed preview gets a status_url for the rendered audio, duration and waveform."""
+        job_queue.submit.return_value = "job789"
+        story_data = {
+            "title": "Kindness", "text": "Once upon a time.", "audio_path": None, "narration_status": "ready",
+            "sequence_id": "seq123", "stream_url": "/api/voice/stream/seq123"
+        }
+
+        response = voice_api._finish_story_request({}, None, story_data, 1.0)
+
+        self.assertEqual(response.json["story"]["narration_status"], "pending")
+        self.assertEqual(response.json["story"]["status_url"], "/api/voice/jobs/job789")
+        self.assertIsNone(job_queue.submit.call_args.kwargs["kwargs"]["story_id"])
+        self.assertIsNone(job_queue.submit.call_args.kwargs["owner"])
+
+    @patch.object(voice_api, "job_queue")
+    def test_hls_is_packaged_in_background(self, job_queue):
+        """The saved story gets its HLS playlist from a background job."""
+        job_queue.submit.return_value = "job456"
+        audio_path = "/static/generated/story_abc.mp3"
+        story_data = {
+            "title": "Kindness", "text": "Once upon a time.", "audio_path": audio_path,
+            "narration_status": "ready", "hls_path": None, "hls_status": "pending"
+        }
+
+        response = voice_api._finish_story_request({"save": True}, MagicMock(id=None), story_data, 1.0)
+
+        story_id = response.json["story"]["id"]
+        self.assertIsNone(db.session.get(Story, story_id).hls_path)
+        self.assertEqual(response.json["story"]["hls_status_url"], "/api/voice/jobs/job456")
+        self.assertEqual(job_queue.submit.call_args.args, (voice_api.story_generator.package_story_hls,))
+        self.assertEqual(job_queue.submit.call_args.kwargs["kwargs"]["story_id"], story_id)
+
+        master = "/static/generated/hls/abc/master.m3u8"
+        with patch.object(voice_api.story_generator.voice_service, "package_hls", return_value=master):
+            result = voice_api.story_generator.package_story_hls(audio_path, story_id=story_id)
+
+        self.assertEqual(result["hls_status"], "ready")
+        self.assertEqual(db.session.get(Story, story_id).hls_path, master)
+
+
+class TestJobQueue(unittest.TestCase):
+    """Test the background job queue."""
+
+    def wait_for(self, queue, job_id):
+        """Wait until a job has finished."""
+        for _ in range(100):
+            job = queue.get(job_id)
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            time.sleep(0.01)
+        self.fail("Job did not finish")
+
+    def test_job_result_is_recorded(self):
+        """Results and errors are readable from the job state."""
+        with tempfile.TemporaryDirectory() as jobs_dir:
+            queue = JobQueue(max_workers=1, jobs_dir=jobs_dir)
+
+            job = self.wait_for(queue, queue.submit(lambda x: x * 2, args=(21,)))
+            self.assertEqual(job["status"], "succeeded")
+            self.assertEqual(job["result"], 42)
+
+            job = self.wait_for(queue, queue.submit(lambda: 1 / 0))
+            self.assertEqual(job["status"], "failed")
+            self.assertIn("division", job["error"])
+
+            self.assertIsNone(queue.get("../missing"))
+
+    def test_expired_jobs_are_removed(self):
+        """State of jobs finished longer ago than the TTL is removed."""
+        with tempfile.TemporaryDirectory() as jobs_dir:
+            queue = JobQueue(max_workers=1, jobs_dir=jobs_dir, ttl=3600)
+            old_job = self.wait_for(queue, queue.submit(lambda: 1))["id"]
+            new_job = self.wait_for(queue, queue.submit(lambda: 2))["id"]
+            os.utime(os.path.join(jobs_dir, f"{old_job}.json"), (time.time() - 7200,) * 2)
+
+            self.assertEqual(queue.expire(), 1)
+            self.assertIsNone(queue.get(old_job))
+            self.assertEqual(queue.get(new_job)["result"], 2)
+
+
+class TestJobOwnership(unittest.TestCase):
+    """Test that jobs about private stories are only reported to their owner."""
+
+    def setUp(self):
+        """Create an app with the voice API and a job queue in a temporary directory."""
+        self.jobs_dir = tempfile.TemporaryDirectory()
+        self.patcher = patch.object(voice_api, "job_queue", JobQueue(max_workers=1, jobs_dir=self.jobs_dir.name))
+        self.queue = self.patcher.start()
+
+        self.app = Flask(__name__)
+        self.app.config["JWT_SECRET_KEY"] = "job-ownership-test-secret-key-32-bytes"
+        JWTManager(self.app)
+        self.app.register_blueprint(voice_api.voice_api, url_prefix="/api/voice")
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.jobs_dir.cleanup()
+
+    def headers(self, identity):
+        with self.app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(identity=identity)}"}
+
+    def test_private_job_is_hidden_from_others(self):
+        """Other users and anonymous clients get a 404; the owner gets the job without its owner."""
+        job_id = self.queue.submit(lambda: {"story_id": 1}, owner="7")
+
+        self.assertEqual(self.client.get(f"/api/voice/jobs/{job_id}").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/voice/jobs/{job_id}", headers=self.headers("8")).status_code, 404)
+
+        response = self.client.get(f"/api/voice/jobs/{job_id}", headers=self.headers("7"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("owner", response.json["job"])
+
+    def test_public_job_is_reported_to_anyone(self):
+        """Jobs without an owner, such as narrations of public stories, can be polled anonymously."""
+        job_id = self.queue.submit(lambda: None)
+
+        self.assertEqual(self.client.get(f"/api/voice/jobs/{job_id}").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
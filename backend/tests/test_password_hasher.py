@@ -0,0 +1,122 @@
+"""Unit tests for password hashing in the process pool."""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+from flask_bcrypt import Bcrypt
+from flask_jwt_extended import JWTManager
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.models import db, init_db, User
+from backend.routes.auth_api import auth_api
+from backend.services.password_hasher import PasswordHasher, PasswordHasherBusy, hash_rounds, password_hasher
+from backend.services.user_cache import user_cache
+
+
+class TestPasswordHasher(unittest.TestCase):
+    """Test hashing, checking and rehash decisions."""
+
+    def setUp(self):
+        """Create a hasher that hashes inline with a low work factor."""
+        self.hasher = PasswordHasher(rounds=4, workers=0)
+
+    def test_hash_and_check(self):
+        """Hashes use the configured work factor and verify their password."""
+        pw_hash = self.hasher.hash("secret")
+
+        self.assertEqual(hash_rounds(pw_hash), 4)
+        self.assertTrue(self.hasher.check("secret", pw_hash))
+        self.assertFalse(self.hasher.check("wrong", pw_hash))
+        self.assertFalse(self.hasher.check("secret", "not a hash"))
+
+    def test_flask_bcrypt_hashes_are_accepted(self):
+        """Hashes written by Flask-Bcrypt still verify, and are rehashed at another work factor."""
+        pw_hash = Bcrypt().generate_password_hash("secret", 5).decode("utf-8")
+
+        self.assertTrue(self.hasher.check("secret", pw_hash))
+        self.assertTrue(self.hasher.needs_rehash(pw_hash))
+        self.assertFalse(self.hasher.needs_rehash(self.hasher.hash("secret")))
+
+    def test_busy_pool_refuses(self):
+        """Requests that cannot get a slot in time are refused."""
+        hasher = PasswordHasher(rounds=4, workers=0, max_pending=1, queue_timeout=0.01)
+        hasher._slots.acquire()
+
+        with self.assertRaises(PasswordHasherBusy):
+            hasher.hash("secret")
+
+    def test_pool_processes(self):
+        """Hashing in pool processes gives the same results."""
+        hasher = PasswordHasher(rounds=4, workers=1)
+        try:
+            pw_hash = hasher.hash("secret")
+            self.assertTrue(hasher.check("secret", pw_hash))
+        finally:
+            hasher.shutdown()
+
+
+class TestLoginRehash(unittest.TestCase):
+    """Test rehash on login."""
+
+    def setUp(self):
+        """Create an app with the auth API and a user hashed with an old work factor."""
+        self.patchers = [patch.object(password_hasher, "workers", 0), patch.object(password_hasher, "rounds", 4)]
+        for patcher in self.patchers:
+            patcher.start()
+
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.app.config["JWT_SECRET_KEY"] = "password-test-secret-key-of-32-bytes"
+        init_db(self.app)
+        JWTManager(self.app)
+        self.app.register_blueprint(auth_api, url_prefix="/api/auth")
+        user_cache.clear()
+
+        with self.app.app_context():
+            user = User(username="asha", email="asha@example.com")
+            user.password_hash = Bcrypt().generate_password_hash("secret", 5).decode("utf-8")
+            db.session.add(user)
+            db.session.commit()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Restore the hasher."""
+        for patcher in self.patchers:
+            patcher.stop()
+        user_cache.clear()
+
+    def stored_rounds(self):
+        with self.app.app_context():
+            return hash_rounds(User.query.filter_by(username="asha").first().password_hash)
+
+    def test_login_rehashes(self):
+        """A successful login upgrades the stored hash to the configured work factor."""
+        response = self.client.post("/api/auth/login", json={"username_or_email": "asha", "password": "secret"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored_rounds(), 4)
+
+    def test_failed_login_keeps_hash(self):
+        """A wrong password leaves the stored hash alone."""
+        response = self.client.post("/api/auth/login", json={"username_or_email": "asha", "password": "wrong"})
+
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.stored_rounds(), 5)
+
+    def test_busy_hasher_answers_503(self):
+        """Logins that cannot get a hashing slot are refused with Retry-After."""
+        with patch.object(password_hasher, "check", side_effect=PasswordHasherBusy()):
+            response = self.client.post("/api/auth/login", json={"username_or_email": "asha", "password": "secret"})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""Unit tests for the prompt registry."""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.prompts import PromptRegistry, PromptTemplate, STORY_PROMPT, prompt_registry
+from services.voice_service.generation_cache import GenerationCache
+from services.voice_service.story_generator import StoryGenerator
+
+
+class TestPromptTemplate(unittest.TestCase):
+    """Test rendering and versioning templates."""
+
+    def setUp(self):
+        """Create a small template."""
+        self.template = PromptTemplate(
+            "greeting", "1",
+            """
+            Say hello to $name.
+            $sections
+            """,
+            [("pet", "Ask about $pet."), ("friends", "Mention $friends.")]
+        )
+
+    def test_optional_sections(self):
+        """Sections are included only when their field is given."""
+        self.assertEqual(self.template.render(name="Asha"), "Say hello to Asha.\n")
+        self.assertEqual(
+            self.template.render(name="Asha", pet="a cat", friends=["Ravi", "Meera"]),
+            "Say hello to Asha.\nAsk about a cat. Mention Ravi, Meera."
+        )
+
+    def test_values_are_not_expanded(self):
+        """Placeholders inside values are left as they are."""
+        self.assertEqual(self.template.render(name="$pet", pet="$name"), "Say hello to $pet.\nAsk about $name.")
+
+    def test_version_id_follows_the_text(self):
+        """Changing the text changes the version id even without a version bump."""
+        edited = PromptTemplate("greeting", "1", "Say hi to $name.\n$sections")
+
+        self.assertTrue(self.template.version_id.startswith("greeting/1+"))
+        self.assertNotEqual(self.template.version_id, edited.version_id)
+
+
+class TestPromptRegistry(unittest.TestCase):
+    """Test selecting prompt versions."""
+
+    def test_latest_version_is_active(self):
+        """The last registered version is used unless one is pinned."""
+        registry = PromptRegistry()
+        registry.register(PromptTemplate("greeting", "1", "Hello $name"))
+        registry.register(PromptTemplate("greeting", "2", "Hi $name"))
+
+        self.assertEqual(registry.get("greeting").render(name="Asha"), "Hi Asha")
+        self.assertEqual(registry.get("greeting", "1").render(name="Asha"), "Hello Asha")
+        self.assertEqual(registry.versions("greeting"), ["1", "2"])
+
+    def test_pinned_version(self):
+        """A pinned version stays active when newer versions are registered."""
+        registry = PromptRegistry({"greeting": "1"})
+        registry.register(PromptTemplate("greeting", "1", "Hello $name"))
+        registry.register(PromptTemplate("greeting", "2", "Hi $name"))
+
+        self.assertEqual(registry.get("greeting").version, "1")
+
+    def test_story_prompt(self):
+        """The story prompt renders the request parameters."""
+        prompt = prompt_registry.get(STORY_PROMPT).render(
+            theme="Kindness", characters=["tiger", "owl"], setting=None, duration_minutes="3-5",
+            age_group="5-8", language="en", child_name=None, target_words=450
+        )
+
+        self.assertIn("age group 5-8 years", prompt)
+        self.assertIn("about 450 words long", prompt)
+        self.assertIn("Include these characters: tiger, owl.", prompt)
+        self.assertNotIn("take place", prompt)
+        self.assertNotIn("$", prompt)
+
+
+class TestVersionedGeneration(unittest.TestCase):
+    """Test that prompt versions reach the cache and story data."""
+
+    def test_cache_key_includes_prompt_version(self):
+        """The same prompt text from another template version is a different key."""
+        self.assertNotEqual(
+            GenerationCache.make_key("prompt", "model", "story/1+aaaa"),
+            GenerationCache.make_key("prompt", "model", "story/2+bbbb")
+        )
+
+    def test_story_data_records_prompt_version(self):
+        """Generated stories carry the version id of their prompt."""
+        generator = StoryGenerator()
+        generator.gemini_model = None
+        generator.voice_service = MagicMock()
+        generator.voice_service.process_sound_sequence.return_value = "/static/generated/story.mp3"
+        generator.voice_service.describe_audio.return_value = None
+
+        story = generator.generate_story(theme="Kindness")
+
+        self.assertEqual(story["prompt_version"], prompt_registry.get(STORY_PROMPT).version_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
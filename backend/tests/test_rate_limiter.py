@@ -0,0 +1,120 @@
+"""Unit tests for the shared upstream rate limiter."""
+
+import os
+import sys
+import shutil
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.rate_limiter import RateLimited, RateLimiter
+from services.resilience import CircuitBreaker, ResilientClient
+from services.shared_store import SharedStore
+from services.voice_service.generation_cache import GenerationCache
+from services.voice_service.similarity_cache import SimilarityCache
+from services.voice_service.story_generator import StoryGenerator
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Test quota reservations."""
+
+    def setUp(self):
+        """Keep the bucket state in a temporary database."""
+        self.test_dir = tempfile.mkdtemp()
+        self.store = SharedStore(os.path.join(self.test_dir, "shared.db"))
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def make_limiter(self, limits, burst_seconds=0):
+        """Create a limiter on the temporary store."""
+        return RateLimiter("test", limits, burst_seconds=burst_seconds, store=self.store, clock=self.clock)
+
+    def test_waits_are_first_come_first_served(self):
+        """After the burst, each call waits one interval longer than the one before it."""
+        limiter = self.make_limiter({"requests": 60}, burst_seconds=1)
+
+        waits = [limiter.reserve({"requests": 1}) for _ in range(5)]
+
+        self.assertEqual(waits, [0.0, 0.0, 1.0, 2.0, 3.0])
+
+    def test_quota_recovers_over_time(self):
+        """Quota used up is available again once its interval passed."""
+        limiter = self.make_limiter({"requests": 60})
+        limiter.reserve({"requests": 1})
+
+        self.clock.now += 1
+        self.assertEqual(limiter.reserve({"requests": 1}), 0.0)
+
+    def test_largest_cost_decides_the_wait(self):
+        """A long text waits for the character quota even when requests are free."""
+        limiter = self.make_limiter({"requests": 600, "characters": 6000})
+
+        limiter.reserve({"requests": 1, "characters": 3000})
+
+        self.assertAlmostEqual(limiter.reserve({"requests": 1, "characters": 10}), 30.0)
+
+    def test_shedding_reserves_nothing(self):
+        """A call that cannot wait long enough is refused and leaves the quota untouched."""
+        limiter = self.make_limiter({"requests": 60})
+        limiter.reserve({"requests": 1})
+
+        with self.assertRaises(RateLimited) as raised:
+            limiter.reserve({"requests": 1}, max_wait=0.5)
+        self.assertAlmostEqual(raised.exception.retry_after, 1.0)
+        self.assertEqual(limiter.reserve({"requests": 1}), 1.0)
+
+    def test_workers_share_the_quota(self):
+        """Limiters in different workers draw from the same buckets."""
+        first = self.make_limiter({"requests": 60})
+        second = RateLimiter("test", {"requests": 60}, burst_seconds=0, store=SharedStore(self.store.path), clock=self.clock)
+
+        first.reserve({"requests": 1})
+
+        self.assertEqual(second.reserve({"requests": 1}), 1.0)
+
+    def test_client_waits_for_quota(self):
+        """ResilientClient sleeps until the quota allows a call."""
+        sleeps = []
+        limiter = RateLimiter("test", {"requests": 60}, burst_seconds=0, store=self.store, clock=self.clock, sleep=sleeps.append)
+        client = ResilientClient("test", limiter=limiter, sleep=sleeps.append)
+        func = MagicMock(return_value="story")
+
+        client.call(func)
+        client.call(func)
+
+        self.assertEqual(sleeps, [1.0])
+        self.assertEqual(func.call_count, 2)
+
+    def test_over_quota_story_is_not_replaced_by_fallback(self):
+        """generate_story lets RateLimited through so the caller can ask the client to retry."""
+        limiter = self.make_limiter({"requests": 60})
+        limiter.reserve({"requests": 1})
+        generator = StoryGenerator()
+        generator.gemini_model = MagicMock()
+        generator.gemini_client = ResilientClient("test", breaker=CircuitBreaker("test"), limiter=limiter)
+        generator.generation_cache = GenerationCache(ttl=60, max_entries=0)
+        generator.similarity_cache = SimilarityCache(max_entries=0)
+
+        with self.assertRaises(RateLimited):
+            generator.generate_story(theme="Courage", deadline=time.monotonic() + 0.5)
+        generator.gemini_model.generate_content.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
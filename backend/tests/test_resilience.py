@@ -0,0 +1,172 @@
+"""Unit tests for the upstream resilience layer."""
+
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from google.api_core import exceptions as google_exceptions
+
+from services.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientClient, backoff_delay
+from services.voice_service.generation_cache import GenerationCache
+from services.voice_service.similarity_cache import SimilarityCache
+from services.voice_service.story_generator import StoryGenerator
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test the breaker's state changes."""
+
+    def test_opens_and_recovers(self):
+        """Failures open the circuit; a successful trial call closes it."""
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # Only one trial call at a time
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        """A failing trial call opens the circuit again."""
+        clock = FakeClock()
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+class TestResilientClient(unittest.TestCase):
+    """Test retries, deadlines and hedging."""
+
+    def setUp(self):
+        """Record backoff sleeps instead of sleeping."""
+        self.sleeps = []
+
+    def make_client(self, **kwargs):
+        """Create a client for a test upstream."""
+        options = {"timeout": 1.0, "deadline": 5.0, "max_attempts": 3, "sleep": self.sleeps.append}
+        options.update(kwargs)
+        return ResilientClient("test", **options)
+
+    def test_transient_errors_are_retried(self):
+        """Transient errors are retried with backoff until a call succeeds."""
+        func = MagicMock(side_effect=[google_exceptions.ServiceUnavailable("down"), "story"])
+
+        self.assertEqual(self.make_client().call(func, "prompt"), "story")
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_other_errors_are_not_retried(self):
+        """A rejected request fails at once and does not count against the breaker."""
+        client = self.make_client()
+        func = MagicMock(side_effect=google_exceptions.InvalidArgument("bad prompt"))
+
+        with self.assertRaises(google_exceptions.InvalidArgument):
+            client.call(func, "prompt")
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_attempts_are_bounded(self):
+        """The last error is raised once all attempts failed."""
+        func = MagicMock(side_effect=google_exceptions.ServiceUnavailable("down"))
+
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            self.make_client(max_attempts=2).call(func)
+        self.assertEqual(func.call_count, 2)
+
+    def test_deadline(self):
+        """A stuck call is abandoned after its timeout."""
+        release = threading.Event()
+        client = self.make_client(timeout=0.05, max_attempts=1)
+
+        start = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            client.call(release.wait)
+        self.assertLess(time.monotonic() - start, 1.0)
+        release.set()
+
+    def test_open_circuit_fails_fast(self):
+        """Calls are refused without reaching the upstream while the circuit is open."""
+        client = self.make_client(breaker=CircuitBreaker("test", failure_threshold=1), max_attempts=1)
+        func = MagicMock(side_effect=google_exceptions.ServiceUnavailable("down"))
+
+        with self.assertRaises(google_exceptions.ServiceUnavailable):
+            client.call(func)
+        with self.assertRaises(CircuitOpenError):
+            client.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_slow_call_is_hedged(self):
+        """A call slower than usual is raced against a second request."""
+        client = self.make_client(hedge=True)
+        for _ in range(client.latency.min_samples):
+            client.latency.record(0.01)
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            if len(calls) == 1:
+                release.wait(1.0)
+                return "slow"
+            return "hedged"
+
+        self.assertEqual(client.call(func), "hedged")
+        self.assertEqual(len(calls), 2)
+        release.set()
+
+    def test_backoff_is_bounded(self):
+        """Backoff grows exponentially up to its ceiling."""
+        for attempt in range(1, 10):
+            delay = backoff_delay(attempt, 0.5, 4.0)
+            self.assertLessEqual(delay, min(4.0, 0.5 * 2 ** (attempt - 1)))
+
+
+class TestGeminiFallback(unittest.TestCase):
+    """Test StoryGenerator's behaviour when Gemini is unhealthy."""
+
+    def test_open_circuit_uses_fallback_story(self):
+        """With the circuit open, the fallback story is returned without calling Gemini."""
+        generator = StoryGenerator()
+        generator.gemini_model = MagicMock()
+        generator.gemini_client = ResilientClient("test", breaker=CircuitBreaker("test", failure_threshold=1))
+        generator.gemini_client.breaker.record_failure()
+        generator.generation_cache = GenerationCache(ttl=60, max_entries=0)
+        generator.similarity_cache = SimilarityCache(max_entries=0)
+        generator.voice_service = MagicMock()
+        generator.voice_service.process_sound_sequence.return_value = "/static/generated/story.mp3"
+        generator.voice_service.describe_audio.return_value = None
+
+        story = generator.generate_story(theme="Courage")
+
+        self.assertTrue(story["is_fallback"])
+        generator.gemini_model.generate_content.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Unit tests for story text segmentation."""
+
+import os
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.voice_service.segmentation import (
+    Segmenter, clean_title, normalize, pack_sentences, segment, sentence_spans, split_paragraphs
+)
+from services.voice_service.story_generator import StoryGenerator
+
+MARKDOWN_STORY = """**Title:** The Clever *Crow*
+
+## Part 1
+Once upon a time, a crow named Kalu lived near the **Ganga**.
+He was very thirsty. "Water!" he cried. Mr. Rao's pot was nearly empty.
+
+- He dropped a pebble.
+- Then another! The water rose.
+---
+यह कहानी है। बहुत सुंदर।
+"""
+
+
+class TestSegmentation(unittest.TestCase):
+    """Test splitting text into paragraphs and sentences."""
+
+    def test_markdown_is_normalized(self):
+        """Markdown, headings and title lines are removed; lines ending a sentence end a paragraph."""
+        self.assertEqual(normalize(MARKDOWN_STORY), "\n\n".join([
+            "Once upon a time, a crow named Kalu lived near the Ganga.",
+            'He was very thirsty. "Water!" he cried. Mr. Rao\'s pot was nearly empty.',
+            "He dropped a pebble.",
+            "Then another! The water rose.",
+            "यह कहानी है। बहुत सुंदर।"
+        ]))
+
+    def test_wrapped_lines_are_joined(self):
+        """A line break inside a sentence does not split the paragraph."""
+        self.assertEqual(normalize("The fox looked\nat the grapes.\nThey were sour."), "The fox looked at the grapes.\n\nThey were sour.")
+
+    def test_sentences(self):
+        """Dialogue, abbreviations and initials do not end sentences."""
+        text = '"Help!" she cried. Dr. A. P. Rao came. Then'
+        self.assertEqual([text[start:end] for start, end in sentence_spans(text)], [
+            '"Help!" she cried.', "Dr. A. P. Rao came.", "Then"
+        ])
+
+    def test_byte_offsets(self):
+        """Offsets index the UTF-8 encoded normalized text."""
+        normalized = normalize(MARKDOWN_STORY).encode("utf-8")
+
+        for item in segment(MARKDOWN_STORY):
+            self.assertEqual(normalized[item.start:item.end].decode("utf-8"), item.text)
+
+    def test_streaming_matches_whole_text(self):
+        """Feeding the text in pieces gives the same segments, each as soon as it is known."""
+        segmenter = Segmenter()
+        streamed = []
+        for i in range(0, len(MARKDOWN_STORY), 7):
+            streamed.extend(segmenter.feed(MARKDOWN_STORY[i:i + 7]))
+        streamed.extend(segmenter.close())
+
+        self.assertEqual(
+            [item.to_dict() for item in streamed],
+            [item.to_dict() for item in segment(MARKDOWN_STORY)]
+        )
+
+        segmenter = Segmenter()
+        first = segmenter.feed("Kalu was thirsty. He looked")
+        self.assertEqual([item.text for item in first], ["Kalu was thirsty."])
+
+    def test_long_paragraphs_are_packed(self):
+        """Sentences are grouped into chunks below the byte limit."""
+        self.assertEqual(pack_sentences(["One two.", "Three four.", "Five."], 20), ["One two. Three four.", "Five."])
+        self.assertEqual(pack_sentences(["one two three four"], 9), ["one two", "three", "four"])
+
+    def test_titles(self):
+        """Titles lose their Markdown and label."""
+        self.assertEqual(clean_title("**Title:** The Clever *Crow*"), "The Clever Crow")
+        self.assertEqual(clean_title("# The Clever Crow"), "The Clever Crow")
+
+
+class TestStoryParsing(unittest.TestCase):
+    """Test StoryGenerator's use of segmentation."""
+
+    def test_parsed_story_is_normalized(self):
+        """Generated stories are stored as normalized paragraphs."""
+        title, text = StoryGenerator()._parse_story_content(MARKDOWN_STORY)
+
+        self.assertEqual(title, "The Clever Crow")
+        self.assertEqual(text, normalize(MARKDOWN_STORY))
+        self.assertEqual(len(split_paragraphs(text)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Unit tests for the near-duplicate prompt cache."""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.voice_service import similarity_cache as similarity_module
+from services.voice_service.generation_cache import GenerationCache
+from services.voice_service.similarity_cache import MinHasher, SimilarityCache, shingles
+from services.voice_service.story_generator import StoryGenerator
+
+
+class TestSimilarityCache(unittest.TestCase):
+    """Test matching, partitioning and eviction."""
+
+    def setUp(self):
+        """Create a cache with one story about kindness in a forest."""
+        self.cache = SimilarityCache(threshold=0.8, max_entries=10, ttl=60)
+        self.partition = SimilarityCache.make_partition("model", age_group="5-8", child_name=None)
+        self.cache.put("first", self.partition, "story", "Kindness", "magical forest", ["tiger", "monkey"])
+
+    def test_trivial_differences_match(self):
+        """Case, whitespace, punctuation and character order are ignored."""
+        self.assertEqual(
+            self.cache.get(self.partition, "kindness", "  Magical   Forest. ", ["Monkey", "tiger"]),
+            "story"
+        )
+
+    def test_different_requests_do_not_match(self):
+        """A different theme or setting is a miss."""
+        self.assertIsNone(self.cache.get(self.partition, "Courage", "magical forest", ["tiger", "monkey"]))
+        self.assertIsNone(self.cache.get(self.partition, "Kindness", "space station", ["tiger", "monkey"]))
+
+    def test_theme_is_not_outweighed_by_setting_and_characters(self):
+        """Another moral is a miss even when a long setting and cast are the same."""
+        setting = "the enchanted forest near the old whispering river"
+        characters = ["rabbit", "fox", "wise owl", "little bear", "squirrel"]
+        self.cache.put("kind", self.partition, "kindness story", "kindness", setting, characters)
+
+        self.assertIsNone(self.cache.get(self.partition, "patience", setting, characters))
+        self.assertEqual(self.cache.get(self.partition, "Kindness", setting, characters[::-1]), "kindness story")
+
+    def test_exact_fields_partition_the_cache(self):
+        """Requests for another child never match."""
+        partition = SimilarityCache.make_partition("model", age_group="5-8", child_name="Asha")
+
+        self.assertIsNone(self.cache.get(partition, "Kindness", "magical forest", ["tiger", "monkey"]))
+
+    def test_oldest_entries_are_evicted(self):
+        """Evicted entries are removed from the LSH buckets."""
+        for i in range(10):
+            self.cache.put(f"extra{i}", self.partition, f"story {i}", f"theme{i}")
+
+        self.assertEqual(len(self.cache), 10)
+        self.assertIsNone(self.cache.get(self.partition, "Kindness", "magical forest", ["tiger", "monkey"]))
+        self.assertFalse(any(
+            bucket == "first" or (isinstance(bucket, set) and "first" in bucket)
+            for bucket in self.cache._buckets.values()
+        ))
+
+    def test_entries_expire(self):
+        """Responses older than the TTL are misses."""
+        with patch("services.voice_service.similarity_cache.time.time", return_value=10 ** 10):
+            self.assertIsNone(self.cache.get(self.partition, "Kindness", "magical forest", ["tiger", "monkey"]))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_signature_does_not_depend_on_numpy(self):
+        """The pure Python signature matches the numpy one."""
+        items = shingles("Kindness", "forest", ["tiger"])
+        hasher = MinHasher()
+        expected = hasher.signature(items)
+
+        with patch.object(similarity_module, "numpy", None):
+            self.assertEqual(hasher.signature(items), expected)
+
+
+class TestSimilarGeneration(unittest.TestCase):
+    """Test StoryGenerator's use of the similarity cache."""
+
+    def test_near_duplicate_request_reuses_response(self):
+        """A differently capitalized theme does not call the model again."""
+        generator = StoryGenerator()
+        generator.gemini_model = MagicMock()
+        generator.gemini_model.generate_content.return_value = MagicMock(text="Title: Kind\n\nOnce upon a time.")
+        generator.generation_cache = GenerationCache(ttl=60, max_entries=10)
+        generator.similarity_cache = SimilarityCache(max_entries=10, ttl=60)
+        generator.voice_service = MagicMock()
+        generator.voice_service.process_sound_sequence.return_value = "/static/generated/story.mp3"
+        generator.voice_service.describe_audio.return_value = None
+
+        first = generator.generate_story(theme="Kindness", setting="forest")
+        second = generator.generate_story(theme="kindness", setting=" Forest ")
+
+        self.assertEqual(first["text"], second["text"])
+        self.assertEqual(generator.gemini_model.generate_content.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
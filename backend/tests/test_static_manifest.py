@@ -0,0 +1,107 @@
+"""Unit tests for the static manifest and the SPA routes served from it."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import brotli
+
+# Serve the app from an in-memory database
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend import app as app_module
+from backend.app import app as storyspark_app
+from backend.services.compression import precompress_directory
+from backend.services.static_manifest import StaticManifest, IMMUTABLE_MAX_AGE
+
+INDEX = "<!doctype html><title>StorySpark</title>" + "<div id=root></div>" * 100
+
+
+class TestStaticManifest(unittest.TestCase):
+    """Test indexing of a frontend build and the routes answering from it."""
+
+    def setUp(self):
+        """Create a frontend build with a hashed bundle, an icon and generated audio."""
+        self.build_dir = tempfile.mkdtemp()
+        for directory in ("assets", "icons", "generated"):
+            os.makedirs(os.path.join(self.build_dir, directory))
+        self.write("index.html", INDEX)
+        self.write("assets/index-852dfc98.js", "console.log('Once upon a time');\n" * 200)
+        self.write("icons/icon-192.png", "png")
+        self.write("generated/story_1.mp3", "mp3")
+        precompress_directory(self.build_dir)
+
+        self.manifest = StaticManifest(self.build_dir)
+        self.patcher = patch.object(app_module, "frontend_manifest", self.manifest)
+        self.patcher.start()
+        self.client = storyspark_app.test_client()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.build_dir)
+
+    def write(self, name, content):
+        with open(os.path.join(self.build_dir, name), "w") as f:
+            f.write(content)
+
+    def test_manifest_entries(self):
+        """Build files are indexed with their copies; generated files and copies are not."""
+        bundle = self.manifest.get("assets/index-852dfc98.js")
+
+        self.assertTrue(bundle.immutable)
+        self.assertEqual(set(bundle.variants), {"br", "gzip"})
+        self.assertIn("javascript", bundle.mimetype)
+        self.assertFalse(self.manifest.get("icons/icon-192.png").immutable)
+        self.assertFalse(self.manifest.index.immutable)
+        self.assertIsNone(self.manifest.get("generated/story_1.mp3"))
+        self.assertIsNone(self.manifest.get("assets/index-852dfc98.js.br"))
+
+    def test_stale_copies_are_ignored(self):
+        """A copy older than its source is not served."""
+        source = os.path.join(self.build_dir, "assets", "index-852dfc98.js")
+        os.utime(source, (os.path.getmtime(source) + 10,) * 2)
+
+        self.assertEqual(StaticManifest(self.build_dir).get("assets/index-852dfc98.js").variants, {})
+
+    def test_index_served_from_memory(self):
+        """Client routes get index.html from memory and revalidate it by ETag."""
+        with patch("builtins.open") as opened, patch("os.path.exists") as exists:
+            response = self.client.get("/stories/42", headers={"Accept-Encoding": "br"})
+
+        opened.assert_not_called()
+        exists.assert_not_called()
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.get_data()).decode(), INDEX)
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+
+        again = self.client.get("/", headers={"Accept-Encoding": "br", "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get("/index.html").get_data().decode(), INDEX)
+
+    def test_hashed_assets_are_immutable(self):
+        """Hashed bundles are cached for a year; other files are revalidated."""
+        response = self.client.get("/assets/index-852dfc98.js")
+        icon = self.client.get("/icons/icon-192.png")
+
+        self.assertEqual(response.cache_control.max_age, IMMUTABLE_MAX_AGE)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertFalse(icon.cache_control.immutable)
+        self.assertEqual(icon.get_data(), b"png")
+        response.close()
+        icon.close()
+
+    def test_generated_files_fall_back_to_index(self):
+        """Runtime output is left to the /static route."""
+        response = self.client.get("/generated/story_1.mp3")
+
+        self.assertEqual(response.mimetype, "text/html")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""Unit tests for serving stories from the pre-generated pool."""
+
+import os
+import sys
+import unittest
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from flask import Flask
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.models import db, init_db, Story
+from backend.services import catalog
+from backend.services.story_pool import StoryPool
+
+PARAMS = {"theme": "Kindness", "age_group": "5-8", "duration": "short", "language": "en"}
+
+
+def fake_generate(params):
+    """Stand-in for generate_catalog_story that needs no upstream services."""
+    return {
+        "title": f"A story about {params['theme']}",
+        "text": "Once upon a time.",
+        "audio_path": "/static/generated/story_abc.mp3",
+        "audio_duration": 42.0,
+        "waveform": [0.1, 0.9]
+    }
+
+
+class TestStoryPool(unittest.TestCase):
+    """Test claiming, personalizing and refilling pooled stories."""
+
+    def setUp(self):
+        """Create an in-memory database with one catalog story."""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        init_db(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+
+        self.pool = StoryPool(min_size=1, max_size=3, demand_window=timedelta(hours=1), miss_threshold=2, themes=["Kindness"])
+        self.prefix = catalog.bucket_prefix(**PARAMS)
+        catalog.save_catalog_story(self.prefix + "0", PARAMS, fake_generate(PARAMS))
+
+    def tearDown(self):
+        """Drop the database."""
+        db.session.remove()
+        self.context.pop()
+
+    def test_story_is_served_once(self):
+        """A pooled story is personalized and not served a second time."""
+        story = self.pool.serve("kindness", "5-8", "short", "en", child_name="Asha")
+
+        self.assertTrue(story["from_pool"])
+        self.assertEqual(story["dedication"], "A story for Asha")
+        self.assertEqual(story["created_by"], "Asha")
+        self.assertEqual(story["waveform"], [0.1, 0.9])
+        self.assertEqual(story["audio_duration"], 42.0)
+
+        self.assertIsNone(self.pool.serve("Kindness", "5-8", "short", "en"))
+
+    def test_other_buckets_do_not_match(self):
+        """Stories are only served for the same parameters."""
+        self.assertIsNone(self.pool.serve("Kindness", "5-8", "long", "en"))
+        self.assertIsNone(self.pool.serve("Kindness", "5-8", "short", "hi"))
+
+    def test_dedication_template_is_safe(self):
+        """Template syntax in a name is not expanded."""
+        story = self.pool.serve("Kindness", "5-8", "short", "en", child_name="$title {0}")
+
+        self.assertEqual(story["dedication"], "A story for $title {0}")
+
+    def test_pool_size_follows_demand(self):
+        """Refills generate as many stories as were recently served."""
+        self.assertEqual(self.pool.target_size(self.prefix), 1)
+
+        self.pool.serve(**PARAMS)
+        catalog.save_catalog_story(self.prefix + "1", PARAMS, fake_generate(PARAMS))
+        self.pool.serve(**PARAMS)
+        self.assertEqual(self.pool.target_size(self.prefix), 2)
+
+        added = self.pool.refill(PARAMS, generate_fn=fake_generate)
+
+        self.assertEqual(added, 2)
+        self.assertEqual(self.pool.unused_count(self.prefix), 2)
+        keys = {key for (key,) in db.session.query(Story.catalog_key)}
+        self.assertEqual(keys, {self.prefix + str(variant) for variant in range(4)})
+
+    def test_refill_stops_on_fallback_story(self):
+        """Fallback stories are not added to the pool."""
+        self.pool.serve(**PARAMS)
+
+        added = self.pool.refill(PARAMS, generate_fn=lambda params: {"is_fallback": True})
+
+        self.assertEqual(added, 0)
+        self.assertEqual(self.pool.unused_count(self.prefix), 0)
+
+    def test_catalog_theme_is_refilled_after_a_miss(self):
+        """An empty bucket of a catalog theme is refilled right away."""
+        self.pool.schedule_refill = MagicMock()
+
+        self.assertIsNone(self.pool.serve("Kindness", "5-8", "long", "en", app=self.app))
+
+        self.pool.schedule_refill.assert_called_once_with(self.app, dict(PARAMS, duration="long"))
+
+    def test_free_text_theme_needs_repeated_misses(self):
+        """A theme outside the catalog only gets a bucket once it keeps being requested."""
+        self.pool.schedule_refill = MagicMock()
+
+        self.pool.serve("A dragon who bakes", "5-8", "short", "en", app=self.app)
+        self.pool.schedule_refill.assert_not_called()
+
+        self.pool.serve("a dragon  who bakes", "5-8", "short", "en", app=self.app)
+        self.pool.schedule_refill.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
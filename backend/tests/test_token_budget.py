@@ -0,0 +1,132 @@
+"""Unit tests for token-budgeted story generation."""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.voice_service.generation_cache import GenerationCache
+from services.voice_service.similarity_cache import SimilarityCache
+from services.voice_service.story_generator import StoryGenerator
+from services.voice_service.token_budget import TokenBudget
+
+
+class TestTokenBudget(unittest.TestCase):
+    """Test planning and calibrating story lengths."""
+
+    def test_plan_follows_duration_and_age(self):
+        """Longer stories and older children get more words and tokens."""
+        budget = TokenBudget(headroom=1.0)
+        short = budget.plan("short", "3-5")
+        long = budget.plan("long", "8-12")
+
+        self.assertEqual(short["target_words"], 440)
+        self.assertEqual(short["requested_words"], 450)
+        self.assertGreater(long["max_output_tokens"], short["max_output_tokens"])
+        self.assertEqual(budget.plan("unknown", "unknown")["target_words"], 975)
+
+    def test_overshoot_lowers_requested_words(self):
+        """A model that writes too much is asked for fewer words."""
+        budget = TokenBudget(alpha=0.5)
+        plan = budget.plan("medium", "5-8")
+
+        for _ in range(5):
+            budget.observe("medium", "5-8", plan["requested_words"], int(plan["requested_words"] * 1.5))
+
+        calibrated = budget.plan("medium", "5-8")
+        self.assertLess(calibrated["requested_words"], plan["requested_words"])
+        self.assertEqual(calibrated["target_words"], plan["target_words"])
+        self.assertEqual(budget.plan("short", "5-8")["requested_words"], TokenBudget().plan("short", "5-8")["requested_words"])
+
+    def test_token_counts_refine_the_limit(self):
+        """Observed tokens per word change the output token limit."""
+        budget = TokenBudget(alpha=1.0)
+        before = budget.plan("short", "5-8")["max_output_tokens"]
+
+        budget.observe("short", "5-8", 500, 500, output_tokens=1000)
+
+        self.assertEqual(budget.tokens_per_word(), 2.0)
+        self.assertGreater(budget.plan("short", "5-8")["max_output_tokens"], before)
+
+    def test_tokens_per_word_are_calibrated_per_language(self):
+        """Token counts of one language do not change the limit for another."""
+        budget = TokenBudget(alpha=1.0)
+        before = budget.plan("short", "5-8", "en")["max_output_tokens"]
+
+        budget.observe("short", "5-8", 500, 500, output_tokens=2000, language="hi")
+
+        self.assertEqual(budget.tokens_per_word("hi"), 4.0)
+        self.assertEqual(budget.plan("short", "5-8", "en")["max_output_tokens"], before)
+        self.assertGreater(budget.plan("short", "5-8", "hi")["max_output_tokens"], before)
+
+    def test_truncated_short_story_is_not_an_undershoot(self):
+        """A story cut off by the token limit does not lower the length ratio but calibrates tokens per word."""
+        budget = TokenBudget(alpha=1.0)
+
+        budget.observe("short", "5-8", 500, 300, output_tokens=600, truncated=True)
+
+        self.assertEqual(budget.length_ratio("short", "5-8"), 1.0)
+        self.assertEqual(budget.tokens_per_word(), 2.0)
+
+
+class TestBudgetedGeneration(unittest.TestCase):
+    """Test StoryGenerator's use of the token budget."""
+
+    def setUp(self):
+        """Create a generator with a mocked model and empty caches."""
+        self.generator = StoryGenerator()
+        self.generator.gemini_model = MagicMock()
+        self.generator.generation_cache = GenerationCache(ttl=60, max_entries=0)
+        self.generator.similarity_cache = SimilarityCache(max_entries=0)
+        self.generator.token_budget = TokenBudget()
+
+    def test_output_tokens_are_limited(self):
+        """The model is called with max_output_tokens and the word target."""
+        self.generator.gemini_model.generate_content.return_value = MagicMock(text="Title: Kind\n\nThe end.")
+        budget = self.generator.token_budget.plan("short", "5-8")
+
+        self.generator._generate_content("prompt", budget=budget, params={"duration": "short", "age_group": "5-8"})
+
+        _, kwargs = self.generator.gemini_model.generate_content.call_args
+        self.assertEqual(kwargs["generation_config"], {"max_output_tokens": budget["max_output_tokens"]})
+        self.assertIn(f"about {budget['requested_words']} words", self.generator._build_story_prompt(
+            target_words=budget["requested_words"]
+        ))
+
+    def test_truncated_story_ends_on_a_sentence(self):
+        """A story cut off by the token limit is trimmed to its last sentence."""
+        candidate = MagicMock(token_count=50)
+        candidate.finish_reason.name = "MAX_TOKENS"
+        self.generator.gemini_model.generate_content.return_value = MagicMock(
+            text='Title: Kind\n\nThey said "Thank you!" Then the',
+            candidates=[candidate]
+        )
+        self.generator.token_budget = TokenBudget(alpha=1.0)
+        budget = self.generator.token_budget.plan("short", "5-8")
+
+        content = self.generator._generate_content("prompt", budget=budget)
+
+        self.assertEqual(content, 'Title: Kind\n\nThey said "Thank you!"')
+        self.assertEqual(self.generator.token_budget.tokens_per_word(), 50 / 8)
+
+    def test_truncated_story_is_not_cached(self):
+        """A story cut off by the token limit is generated afresh for the next request."""
+        candidate = MagicMock(token_count=50)
+        candidate.finish_reason.name = "MAX_TOKENS"
+        self.generator.gemini_model.generate_content.return_value = MagicMock(
+            text="Title: Kind\n\nThey said thank you. Then the", candidates=[candidate]
+        )
+        self.generator.generation_cache = GenerationCache(ttl=60, max_entries=10)
+        budget = self.generator.token_budget.plan("short", "5-8")
+
+        self.generator._generate_content("prompt", budget=budget)
+        self.generator._generate_content("prompt", budget=budget)
+
+        self.assertEqual(self.generator.gemini_model.generate_content.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Unit tests for the user cache and token claims."""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, decode_token
+from sqlalchemy import event
+
+# Add the repository root to the path so the backend package can be imported
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from backend.models import db, init_db
+from backend.routes.auth_api import auth_api
+from backend.services.password_hasher import password_hasher
+from backend.services.user_cache import UserCache, user_cache
+from backend.utils.auth import get_user_context
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestUserCache(unittest.TestCase):
+    """Test expiry and invalidation of cached users."""
+
+    def setUp(self):
+        """Create a cache with a fake loader."""
+        self.clock = FakeClock()
+        self.loader = MagicMock(side_effect=lambda user_id: {"id": user_id, "prefs_version": 5})
+        self.cache = UserCache(ttl=60, max_entries=2, loader=self.loader, clock=self.clock)
+
+    def test_records_expire(self):
+        """A record is loaded once per TTL."""
+        self.cache.get(1)
+        self.cache.get(1)
+        self.assertEqual(self.loader.call_count, 1)
+
+        self.clock.now += 60
+        self.cache.get(1)
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_newer_token_reloads(self):
+        """A token with a newer preferences version bypasses the cached record."""
+        self.cache.get(1)
+        self.cache.get(1, min_version=5)
+        self.cache.get(1, min_version=6)
+        self.assertEqual(self.loader.call_count, 2)
+
+    def test_invalidate_and_eviction(self):
+        """Invalidated and least recently used records are loaded again."""
+        self.cache.get(1)
+        self.cache.invalidate(1)
+        self.cache.get(1)
+        self.cache.get(2)
+        self.cache.get(3)
+        self.cache.get(1)
+        self.assertEqual(self.loader.call_count, 5)
+
+
+class TestUserContext(unittest.TestCase):
+    """Test the request user context against the database."""
+
+    def setUp(self):
+        """Create an app with the auth API and one user."""
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.app.config["JWT_SECRET_KEY"] = "user-cache-test-secret-key-of-32-bytes"
+        init_db(self.app)
+        JWTManager(self.app)
+        self.app.register_blueprint(auth_api, url_prefix="/api/auth")
+        user_cache.clear()
+        self.patchers = [patch.object(password_hasher, "workers", 0), patch.object(password_hasher, "rounds", 4)]
+        for patcher in self.patchers:
+            patcher.start()
+
+        @self.app.route("/whoami")
+        def whoami():
+            context = get_user_context()
+            return jsonify({
+                "id": context.id,
+                "language": context.preferred_language,
+                "child_name": context.child_name,
+                "same": get_user_context() is context
+            })
+
+        self.client = self.app.test_client()
+        response = self.client.post("/api/auth/register", json={
+            "username": "asha", "email": "asha@example.com", "password": "secret", "language": "hi"
+        })
+        self.token = response.json["access_token"]
+
+        self.queries = []
+        with self.app.app_context():
+            self.engine = db.engine
+        event.listen(self.engine, "before_cursor_execute", self.count_query)
+
+    def tearDown(self):
+        """Stop counting queries, restore the hasher and drop the cache."""
+        event.remove(self.engine, "before_cursor_execute", self.count_query)
+        for patcher in self.patchers:
+            patcher.stop()
+        user_cache.clear()
+
+    def count_query(self, *args):
+        self.queries.append(args[2])
+
+    def whoami(self, token):
+        return self.client.get("/whoami", headers={"Authorization": f"Bearer {token}"}).json
+
+    def test_token_carries_claims(self):
+        """Access tokens carry the admin flag, language and preferences version."""
+        with self.app.app_context():
+            claims = decode_token(self.token)
+
+        self.assertFalse(claims["is_admin"])
+        self.assertEqual(claims["preferred_language"], "hi")
+        self.assertGreater(claims["prefs_version"], 0)
+        self.assertNotIn("child_name", claims)
+
+    def test_user_is_queried_once_per_ttl(self):
+        """Repeated requests read the user from the token and the cache."""
+        first = self.whoami(self.token)
+        second = self.whoami(self.token)
+
+        self.assertEqual(first, {"id": first["id"], "language": "hi", "child_name": None, "same": True})
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.queries), 1)
+
+    def test_preference_update_invalidates(self):
+        """Updated preferences are seen at once, with the old and the new token."""
+        self.whoami(self.token)
+
+        response = self.client.put(
+            "/api/auth/me/preferences", json={"child_name": "Meera"},
+            headers={"Authorization": f"Bearer {self.token}"}
+        )
+
+        self.assertEqual(self.whoami(self.token)["child_name"], "Meera")
+        self.assertEqual(self.whoami(response.json["access_token"])["child_name"], "Meera")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+"""Unit tests for the voice service.
+
+This module tests per-paragraph synthesis, segment caching and assembly.
+"""
+
+import os
+import sys
+import shutil
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud import texttospeech
+from werkzeug.datastructures import MIMEAccept
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.resilience import CircuitBreaker, ResilientClient
+from services.voice_service.voice_service import (
+    VoiceService, SoundItem, NarrationPending, PLACEHOLDER_AUDIO_PATH, negotiate_audio_format
+)
+from services.voice_service.audio_processor import strip_id3_tags
+
+# A single MPEG-2 layer III frame header followed by padding
+FAKE_FRAME = b"\xff\xf3\x64\xc4" + b"\x00" * 140
+
+
+class TestVoiceService(unittest.TestCase):
+    """Test the VoiceService synthesis and assembly pipeline."""
+
+    def setUp(self):
+        """Set up a voice service writing into a temporary directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.voice_service = VoiceService()
+        self.voice_service.static_dir = self.temp_dir
+        self.voice_service.output_dir = os.path.join(self.temp_dir, "generated")
+        self.voice_service.sound_effects = {}
+
+        self.tts_client = MagicMock()
+        self.tts_client.synthesize_speech.return_value = MagicMock(audio_content=FAKE_FRAME)
+        self.voice_service.tts_client = self.tts_client
+        self.voice_service.tts_policy = ResilientClient(
+            "tts_test", max_attempts=2, sleep=lambda seconds: None,
+            breaker=CircuitBreaker("tts_test", failure_threshold=10)
+        )
+
+        self.sequence = [
+            SoundItem(sound_type="effect", content="magic", pause_after=0.5),
+            SoundItem(sound_type="human", content="The story of Kindness", emotion="excited"),
+            SoundItem(sound_type="human", content="Meera smiled and danced.", emotion="happy"),
+            SoundItem(sound_type="human", content="The forest was quiet.", emotion="calm"),
+        ]
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_each_paragraph_synthesized_with_its_emotion(self):
+        """Each spoken item is a separate request with emotion-specific prosody."""
+        audio_path = self.voice_service.process_sound_sequence(self.sequence)
+
+        self.assertTrue(audio_path.startswith("/static/generated/story_"))
+        self.assertEqual(self.tts_client.synthesize_speech.call_count, 3)
+
+        pitches = [
+            call.kwargs["audio_config"].pitch
+            for call in self.tts_client.synthesize_speech.call_args_list
+        ]
+        self.assertEqual(len(set(pitches)), 3)
+
+        output_path = self.voice_service.resolve_static_path(audio_path)
+        with open(output_path, "rb") as f:
+            self.assertEqual(f.read(), FAKE_FRAME * 3)
+
+    def test_editing_one_paragraph_reuses_other_segments(self):
+        """Only the changed paragraph is synthesized again."""
+        first_path = self.voice_service.process_sound_sequence(self.sequence)
+        self.tts_client.synthesize_speech.reset_mock()
+
+        self.sequence[3] = SoundItem(sound_type="human", content="The river was quiet.", emotion="calm")
+        second_path = self.voice_service.process_sound_sequence(self.sequence)
+
+        self.assertEqual(self.tts_client.synthesize_speech.call_count, 1)
+        self.assertNotEqual(first_path, second_path)
+
+    def test_unchanged_story_reuses_assembled_audio(self):
+        """An unchanged sequence maps to the same assembled file without synthesis."""
+        first_path = self.voice_service.process_sound_sequence(self.sequence)
+        self.tts_client.synthesize_speech.reset_mock()
+
+        self.assertEqual(self.voice_service.process_sound_sequence(self.sequence), first_path)
+        self.tts_client.synthesize_speech.assert_not_called()
+
+    def test_failed_synthesis_uses_placeholder(self):
+        """The placeholder is returned when no speech could be synthesized."""
+        self.tts_client.synthesize_speech.side_effect = Exception("TTS unavailable")
+
+        self.assertEqual(self.voice_service.process_sound_sequence(self.sequence), PLACEHOLDER_AUDIO_PATH)
+
+    def test_transient_failures_leave_narration_pending(self):
+        """Segments failing transiently are reported, and only they are retried later."""
+        def synthesize_speech(input, **kwargs):
+            if input.text.startswith("Meera"):
+                raise google_exceptions.ServiceUnavailable("TTS overloaded")
+            return MagicMock(audio_content=FAKE_FRAME)
+        self.tts_client.synthesize_speech.side_effect = synthesize_speech
+
+        with self.assertRaises(NarrationPending) as raised:
+            self.voice_service.process_sound_sequence(self.sequence)
+        self.assertEqual(raised.exception.failed, [2])
+        self.assertEqual(self.tts_client.synthesize_speech.call_count, 4)  # One retry of the failing segment
+
+        self.tts_client.synthesize_speech.reset_mock(side_effect=True)
+        self.tts_client.synthesize_speech.return_value = MagicMock(audio_content=FAKE_FRAME)
+        self.assertTrue(self.voice_service.process_sound_sequence(self.sequence).startswith("/static/generated/story_"))
+        self.assertEqual(self.tts_client.synthesize_speech.call_count, 1)
+
+    def test_expired_deadline_defers_synthesis(self):
+        """No requests are made once the request's budget is used up."""
+        with self.assertRaises(NarrationPending) as raised:
+            self.voice_service.process_sound_sequence(self.sequence, deadline=time.monotonic() - 1)
+
+        self.assertEqual(raised.exception.failed, [1, 2, 3])
+        self.tts_client.synthesize_speech.assert_not_called()
+
+    def test_stream_sequence_yields_segments_in_order(self):
+        """Stored sequences stream one chunk per spoken segment."""
+        sequence_id = self.voice_service.save_sequence(self.sequence)
+        loaded = self.voice_service.load_sequence(sequence_id)
+
+        self.assertEqual(loaded["voice_id"], "default")
+        self.assertEqual([item.content for item in loaded["items"]], [item.content for item in self.sequence])
+
+        chunks = list(self.voice_service.stream_sound_sequence(loaded["items"]))
+        self.assertEqual(chunks, [FAKE_FRAME] * 3)
+        self.assertIsNone(self.voice_service.load_sequence("../missing"))
+
+    def test_stored_sequences_are_touched(self):
+        """Saving an existing sequence or loading it marks it as recently used."""
+        sequence_id = self.voice_service.save_sequence(self.sequence)
+        sequence_path = os.path.join(self.voice_service.output_dir, "sequences", f"{sequence_id}.json")
+        day_ago = time.time() - 24 * 3600
+
+        os.utime(sequence_path, (day_ago, day_ago))
+        self.voice_service.load_sequence(sequence_id)
+        self.assertGreater(os.path.getmtime(sequence_path), day_ago + 60)
+
+        os.utime(sequence_path, (day_ago, day_ago))
+        self.assertEqual(self.voice_service.save_sequence(self.sequence), sequence_id)
+        self.assertGreater(os.path.getmtime(sequence_path), day_ago + 60)
+
+    def test_opus_output_is_cached_separately(self):
+        """Opus narration uses the OGG_OPUS encoding and its own cache entries."""
+        mp3_path = self.voice_service.process_sound_sequence(self.sequence, audio_format="mp3")
+        ogg_path = self.voice_service.process_sound_sequence(self.sequence, audio_format="ogg_opus")
+
+        self.assertTrue(ogg_path.endswith(".ogg"))
+        self.assertEqual(os.path.splitext(mp3_path)[0], os.path.splitext(ogg_path)[0])
+        self.assertEqual(self.tts_client.synthesize_speech.call_count, 6)
+        self.assertEqual(
+            self.tts_client.synthesize_speech.call_args.kwargs["audio_config"].audio_encoding,
+            texttospeech.AudioEncoding.OGG_OPUS
+        )
+
+    def test_negotiate_audio_format(self):
+        """An explicit format wins, then the Accept header, then the default."""
+        self.assertEqual(negotiate_audio_format(MIMEAccept([("audio/ogg", 1)])), "ogg_opus")
+        self.assertEqual(negotiate_audio_format(MIMEAccept([("audio/ogg", 1)]), "mp3"), "mp3")
+        self.assertEqual(negotiate_audio_format(MIMEAccept([("*/*", 1)])), "mp3")
+
+    def test_strip_id3_tags(self):
+        """ID3v2 headers and ID3v1 trailers are removed before concatenation."""
+        header = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+        trailer = b"TAG" + b"\x00" * 125
+
+        self.assertEqual(strip_id3_tags(header + FAKE_FRAME + trailer), FAKE_FRAME)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Unit tests for waveform and duration analysis of generated audio."""
+
+import os
+import sys
+import json
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.voice_service import waveform
+
+# A 144 byte MPEG-2 layer III frame: 48 kbps at 24 kHz, 576 samples
+MP3_FRAME = b"\xff\xf3\x64\xc4" + b"\x00" * 140
+
+
+def ogg_page(serial, granule, body):
+    """Build a minimal Ogg page holding a single packet."""
+    return (
+        b"OggS" + bytes([0, 0]) + struct.pack("<q", granule) + struct.pack("<I", serial)
+        + struct.pack("<I", 0) + b"\x00" * 4 + bytes([1, len(body)]) + body
+    )
+
+
+def opus_stream(serial, pre_skip, final_granule):
+    """Build a minimal Ogg Opus stream with a header and one audio page."""
+    head = b"OpusHead" + bytes([1, 1]) + struct.pack("<H", pre_skip) + b"\x00" * 7
+    return ogg_page(serial, 0, head) + ogg_page(serial, final_granule, b"\x00" * 10)
+
+
+class TestWaveform(unittest.TestCase):
+    """Test duration and peak computation."""
+
+    def test_compute_peaks(self):
+        """Peaks are the absolute maximum of each window, scaled to 0-1."""
+        pcm = struct.pack("<8h", 0, 100, -32768, 5, 16384, 0, 0, -1)
+
+        self.assertEqual(waveform.compute_peaks(pcm, 4), [0.003, 1.0, 0.5, 0.0])
+        self.assertEqual(waveform.compute_peaks(b"", 4), [])
+
+    def test_mp3_duration_from_frame_headers(self):
+        """MP3 duration is the sum of the frame durations."""
+        id3 = b"ID3\x04\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+        duration = waveform._mp3_duration(id3 + MP3_FRAME * 3)
+
+        self.assertAlmostEqual(duration, 3 * 576 / 24000)
+
+    def test_chained_ogg_opus_duration(self):
+        """Each chained Opus stream contributes its samples after pre-skip."""
+        data = opus_stream(1, 312, 48000 + 312) + opus_stream(2, 312, 24000 + 312)
+
+        self.assertAlmostEqual(waveform._ogg_opus_duration(data), 1.5)
+
+    @patch("services.voice_service.waveform.ffmpeg_available", return_value=False)
+    def test_analysis_is_stored_next_to_the_file(self, _):
+        """Results are written to a JSON file next to the audio and reused."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            audio_path = os.path.join(temp_dir, "story.mp3")
+            with open(audio_path, "wb") as f:
+                f.write(MP3_FRAME * 10)
+
+            info = waveform.analyze_audio(audio_path)
+            self.assertEqual(info, {"duration": 0.24, "peaks": []})
+
+            with open(f"{audio_path}.json") as f:
+                self.assertEqual(json.load(f), info)
+
+            with patch("services.voice_service.waveform.read_container_duration") as read_duration:
+                self.assertEqual(waveform.analyze_audio(audio_path), info)
+                read_duration.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Admission control decorator for StorySpark
+
+This module applies the admission controller to API endpoints, classifying
+each request by its client and priority before the endpoint does any work.
+"""
+import math
+import inspect
+import logging
+import sqlite3
+from functools import wraps
+from flask import Response, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from ..services.admission import (
+    admission_controller, AdmissionRejected, ADMISSION_ENABLED,
+    PRIORITY_SAVE, PRIORITY_MEMBER, PRIORITY_PREVIEW
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def client_ip():
+    """
+    IP address of the client
+
+    Forwarded headers are only applied by ProxyFix for the number of proxies
+    configured in PROXY_FIX_HOPS, so a client reaching the app directly
+    cannot choose its address.
+
+    Returns:
+        The peer address of the request
+    """
+    return request.remote_addr
+
+
+def request_identity():
+    """
+    Identity of the signed-in user, read from the JWT without a database query
+
+    Returns:
+        User id as a string, or None for anonymous requests
+    """
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception:
+        return None
+    return str(user_id) if user_id else None
+
+
+def request_priority(user_key):
+    """
+    Priority class of the current request
+
+    Args:
+        user_key: Identity of the signed-in user, if any
+
+    Returns:
+        PRIORITY_SAVE for signed-in users saving a story, PRIORITY_MEMBER for
+        other signed-in requests and PRIORITY_PREVIEW for anonymous ones
+    """
+    if user_key is None:
+        return PRIORITY_PREVIEW
+    data = request.get_json(silent=True) if request.is_json else None
+    if isinstance(data, dict) and data.get('save'):
+        return PRIORITY_SAVE
+    return PRIORITY_MEMBER
+
+
+def admission_controlled():
+    """
+    Decorator for expensive endpoints that have to be admitted before running
+
+    Refused requests get a 429 (client at its limit) or 503 (host busy)
+    response with a Retry-After header. Coroutine endpoints are supported,
+    and streamed responses hold their lease until the stream is closed.
+
+    Usage:
+    @app.route('/generate-story', methods=['POST'])
+    @admission_controlled()
+    def generate_story():
+        ...
+    """
+    def wrapper(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_decorator(*args, **kwargs):
+                lease_id, refusal = _admit()
+                if refusal is not None:
+                    return refusal
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _release(lease_id)
+            return async_decorator
+
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            lease_id, refusal = _admit()
+            if refusal is not None:
+                return refusal
+            try:
+                response = fn(*args, **kwargs)
+            except BaseException:
+                _release(lease_id)
+                raise
+            if isinstance(response, Response) and response.is_streamed:
+                # The work happens while the body is sent
+                response.call_on_close(lambda: _release(lease_id))
+            else:
+                _release(lease_id)
+            return response
+        return decorator
+    return wrapper
+
+
+def _admit():
+    """
+    Take an admission lease for the current request
+
+    Returns:
+        Tuple of (lease id or None, refusal response or None)
+    """
+    if not ADMISSION_ENABLED:
+        return None, None
+
+    user_key = request_identity()
+    try:
+        return admission_controller.admit(request_priority(user_key), user_key=user_key, ip=client_ip()), None
+    except AdmissionRejected as e:
+        logger.info(f"Request to {request.path} refused: {str(e)}")
+        response = jsonify({
+            'status': 'error',
+            'message': str(e)
+        })
+        response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+        return None, (response, e.status_code)
+    except sqlite3.Error as e:
+        # Admission control is a safeguard; an unavailable store must not take the endpoint down
+        logger.error(f"Admission control unavailable, admitting request: {str(e)}")
+        return None, None
+
+
+def _release(lease_id):
+    """Give back an admission lease, if one was taken"""
+    if lease_id is None:
+        return
+    try:
+        admission_controller.release(lease_id)
+    except sqlite3.Error as e:
+        logger.error(f"Could not release admission lease, it will expire: {str(e)}")
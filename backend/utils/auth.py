@@ -1,18 +1,96 @@
 """
 Authentication middleware and utilities for StorySpark
 
-This module provides utility functions and middleware for authentication 
+This module provides utility functions and middleware for authentication
 and authorization in the API.
+
+Access tokens carry the user's admin flag, preferred language and the
+version of their preferences as additional claims, so most requests can
+identify the user without a database query. Fields that do not belong in a
+token, such as the child's name, come from the in-process user cache.
 """
 from functools import wraps
-from flask import jsonify
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask import jsonify, g
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity, get_jwt
 from ..models.user import User
+from ..services.user_cache import user_cache
+
+def token_claims(record):
+    """
+    Additional claims for an access token
+
+    Args:
+        record: User record from the user cache, or None
+
+    Returns:
+        Dictionary of claims (empty for unknown users)
+    """
+    if not record:
+        return {}
+    return {
+        'is_admin': record['is_admin'],
+        'preferred_language': record['preferred_language'],
+        'prefs_version': record['prefs_version']
+    }
+
+class UserContext:
+    """
+    Signed-in user of the current request
+
+    Fields carried in the token are read from its claims; the rest are
+    loaded from the user cache the first time they are used.
+    """
+
+    def __init__(self, user_id, claims):
+        """
+        Initialize the context
+
+        Args:
+            user_id: Identity of the token (the user id as a string)
+            claims: Claims of the token
+        """
+        self.id = int(user_id)
+        self.claims = claims
+        self._record = None
+
+    @property
+    def record(self):
+        """User record from the user cache, or None if the user no longer exists"""
+        if self._record is None:
+            self._record = user_cache.get(self.id, min_version=self.claims.get('prefs_version', 0)) or {}
+        return self._record or None
+
+    def _field(self, name):
+        """Read a field from the token claims, falling back to the user record"""
+        if name in self.claims:
+            return self.claims[name]
+        record = self.record
+        return record.get(name) if record else None
+
+    @property
+    def is_admin(self):
+        """Whether the user is an admin, as of when the token was issued"""
+        return bool(self._field('is_admin'))
+
+    @property
+    def preferred_language(self):
+        """Preferred story language of the user"""
+        return self._field('preferred_language')
+
+    @property
+    def child_name(self):
+        """Name of the user's child, used in generated stories"""
+        record = self.record
+        return record.get('child_name') if record else None
 
 def admin_required():
     """
     Decorator for endpoints that require admin access
-    
+
+    Tokens without the admin claim are refused without a database query;
+    the claim is confirmed against the user cache, so revoked admins lose
+    access within the cache TTL.
+
     Usage:
     @app.route('/admin-only')
     @admin_required()
@@ -24,35 +102,46 @@ def admin_required():
         def decorator(*args, **kwargs):
             # Verify JWT is present and valid
             verify_jwt_in_request()
-            
-            # Get user
-            user_id = get_jwt_identity()
-            user = User.query.get(user_id)
-            
+
             # Check if user is admin
-            if not user or not user.is_admin:
+            context = get_user_context()
+            record = context.record if context and context.is_admin else None
+            if not record or not record['is_admin']:
                 return jsonify({
                     'status': 'error',
                     'message': 'Admin access required'
                 }), 403
-                
+
             return fn(*args, **kwargs)
         return decorator
     return wrapper
 
+def get_user_context():
+    """
+    Get the signed-in user of the current request, memoized for the request
+
+    Returns:
+        UserContext or None if not authenticated
+    """
+    if '_user_context' not in g:
+        g._user_context = None
+        try:
+            verify_jwt_in_request(optional=True)
+            user_id = get_jwt_identity()
+            if user_id:
+                g._user_context = UserContext(user_id, get_jwt())
+        except Exception:
+            pass
+    return g._user_context
+
 def get_current_user():
     """
-    Get the current authenticated user from the JWT token
-    
+    Get the current authenticated user from the JWT token, memoized for the request
+
     Returns:
         User object or None if not authenticated
     """
-    try:
-        verify_jwt_in_request(optional=True)
-        user_id = get_jwt_identity()
-        
-        if user_id:
-            return User.query.get(user_id)
-        return None
-    except:
-        return None
+    if '_current_user' not in g:
+        context = get_user_context()
+        g._current_user = User.query.get(context.id) if context else None
+    return g._current_user
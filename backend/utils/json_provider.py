@@ -0,0 +1,109 @@
+"""
+JSON provider for StorySpark
+
+This module serializes API responses with orjson when it is installed and
+with the standard library otherwise. Output matches Flask's default
+provider (sorted keys, HTTP dates for datetimes, compact unless in debug
+mode); values orjson cannot represent, such as integers wider than 64 bits,
+fall back to the standard library.
+"""
+import logging
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider using orjson, with the standard library as fallback
+    """
+
+    def dumps_bytes(self, obj, indent: bool = False) -> bytes:
+        """
+        Serialize data as UTF-8 encoded JSON
+
+        Args:
+            obj: Data to serialize
+            indent: Whether to indent the output by two spaces
+
+        Returns:
+            JSON bytes
+        """
+        if orjson is not None:
+            option = ORJSON_OPTIONS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if indent:
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                # Not representable by orjson; the standard library either
+                # handles it or raises the usual error
+                pass
+
+        separators = None if indent else (",", ":")
+        return super().dumps(obj, indent=2 if indent else None, separators=separators).encode("utf-8")
+
+    def dumps(self, obj, **kwargs) -> str:
+        """
+        Serialize data as JSON to a string
+
+        Args:
+            obj: Data to serialize
+            **kwargs: Options for json.dumps; any given uses the standard library
+
+        Returns:
+            JSON string
+        """
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        """
+        Deserialize data from a JSON string or bytes
+
+        Args:
+            s: Text or UTF-8 bytes
+            **kwargs: Options for json.loads; any given uses the standard library
+
+        Returns:
+            Deserialized data
+        """
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """
+        Build a JSON response, as jsonify does
+
+        Returns:
+            Response with the serialized arguments
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        return self.raw_response(self.dumps_bytes(obj, indent=indent))
+
+    def raw_response(self, body: bytes, status: int = 200):
+        """
+        Build a JSON response from already serialized data
+
+        Args:
+            body: JSON bytes
+            status: HTTP status code
+
+        Returns:
+            Response with the body and a trailing newline, as jsonify adds
+        """
+        return self._app.response_class(body + b"\n", status=status, mimetype=self.mimetype)
@@ -20,14 +20,18 @@ fi
 
 echo "Frontend build complete."
 
-# Create a dist directory in the backend folder for the built frontend
-echo "Copying frontend build to backend/dist..."
-mkdir -p ../backend/dist
-cp -r dist/* ../backend/dist/
+# Copy the built frontend to the folder the backend serves it from
+echo "Copying frontend build to backend/static..."
+mkdir -p ../backend/static
+cp -r dist/* ../backend/static/
 
 # Go back to project root
 cd ..
 
+# Precompress text assets so they are served as .br/.gz without compressing per request
+echo "Precompressing frontend assets..."
+DATABASE_URI=sqlite:// flask --app backend.app precompress-static
+
 # Create production ready Python environment
 echo "Setting up backend for production..."
 cd backend
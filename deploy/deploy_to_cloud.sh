@@ -77,7 +77,9 @@ case $choice in
     npm ci
     npm run build
     cp -r dist/* ../backend/static/
-    cd ../deploy
+    cd ..
+    DATABASE_URI=sqlite:// flask --app backend.app precompress-static
+    cd deploy
     
     echo ""
     echo "Submitting build to Cloud Build..."
@@ -106,7 +108,9 @@ case $choice in
     npm ci
     npm run build
     cp -r dist/* ../backend/static/
-    cd ../deploy
+    cd ..
+    DATABASE_URI=sqlite:// flask --app backend.app precompress-static
+    cd deploy
     
     echo ""
     echo "Deploying to App Engine..."
@@ -118,7 +118,9 @@ function App() {
         voice: selectedVoice,
         language: "en", // Default language
         // Save the story if the user is logged in
-        save: isLoggedIn()
+        save: isLoggedIn(),
+        // Start playback while the narration is still being rendered
+        stream: true
       };
       
       // If we have a selected category, add it
@@ -130,10 +132,10 @@ function App() {
       const storyData = await voiceService.generateStory(storyParams);
       
       // Log the audio path for debugging
-      console.log("Received audio path:", storyData.audio_path);
+      console.log("Received audio path:", storyData.audio_path, "stream URL:", storyData.stream_url);
       
       // Make sure we have a valid audio path
-      if (!storyData.audio_path || storyData.audio_path === '#') {
+      if (!storyData.stream_url && (!storyData.audio_path || storyData.audio_path === '#')) {
         console.warn("No valid audio path received, using placeholder");
         storyData.audio_path = process.env.NODE_ENV === 'production' 
           ? '/static/placeholders/story_audio.mp3'
@@ -142,6 +144,23 @@ function App() {
       
       // Update the story data in state
       setGeneratedStory(storyData);
+      
+      // A streamed narration is rendered in the background; its audio file,
+      // duration, waveform and HLS playlist are only known once that job has
+      // finished. The player keeps the stream, so playback is not interrupted
+      if (storyData.narration_status === 'pending' && storyData.status_url) {
+        voiceService.waitForJob(storyData.status_url).then(result => {
+          if (!result) return;
+          setGeneratedStory(current => (current && current.status_url === storyData.status_url ? {
+            ...current,
+            narration_status: 'ready',
+            audio_path: result.audio_path,
+            audio_duration: result.audio_duration,
+            waveform: result.waveform,
+            hls_path: result.hls_path
+          } : current));
+        });
+      }
     } catch (error) {
       console.error('Error generating story:', error);
       
@@ -371,6 +390,9 @@ function App() {
           <div className="story-viewer">
             <div className="story-header">
               <h2>{generatedStory.title}</h2>
+              {generatedStory.dedication && (
+                <p className="story-dedication">{generatedStory.dedication}</p>
+              )}
               <div className="story-meta">
                 <span>Theme: {generatedStory.theme}</span>
                 <span>Age: {generatedStory.age_group}</span>
@@ -387,8 +409,10 @@ function App() {
             </div>
             
             <AudioPlayer 
-              audioUrl={generatedStory.audio_path || ''} 
+              audioUrl={generatedStory.stream_url || generatedStory.audio_path || ''} 
               title={generatedStory.title}
+              waveform={generatedStory.waveform}
+              durationSeconds={generatedStory.audio_duration}
               onEnded={handleAudioEnded}
             />
             
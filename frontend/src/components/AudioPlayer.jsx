@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import './AudioPlayer.css';
 
-const AudioPlayer = ({ audioUrl, title, onEnded }) => {
+const AudioPlayer = ({ audioUrl, title, onEnded, waveform, durationSeconds }) => {
   const [isPlaying, setIsPlaying] = useState(false);
   const [currentTime, setCurrentTime] = useState(0);
   const [duration, setDuration] = useState(0);
@@ -19,14 +19,21 @@ const AudioPlayer = ({ audioUrl, title, onEnded }) => {
     
     if (!audio) return;
     
+    // Forget the previous story's measurements; the effect below fills them in
+    setDuration(0);
+    setWaveformData([]);
+    
     // Event listeners
     const setAudioData = () => {
-      setDuration(audio.duration);
+      // Streamed audio reports an infinite duration until it has finished
+      if (Number.isFinite(audio.duration)) {
+        setDuration(audio.duration);
+      }
       setLoading(false);
       setError(null);
       console.log("Audio loaded successfully:", audioUrl);
       
-      // Generate a simulated waveform
+      // Generate a simulated waveform if the backend has not provided one (yet)
       generateSimulatedWaveform();
     };
     
@@ -82,6 +89,19 @@ const AudioPlayer = ({ audioUrl, title, onEnded }) => {
     };
   }, [audioUrl, onEnded]);
   
+  // Use the precomputed duration and waveform from the backend when available,
+  // so the player can render before the audio has loaded. A streamed story is
+  // only measured once its audio has been rendered, so they may arrive while it
+  // plays; they are applied without reloading the audio
+  useEffect(() => {
+    if (durationSeconds) {
+      setDuration(durationSeconds);
+    }
+    if (waveform && waveform.length > 0) {
+      setWaveformData(waveform);
+    }
+  }, [audioUrl, waveform, durationSeconds]);
+  
   // Generate a simulated waveform since we can't analyze the actual audio
   const generateSimulatedWaveform = () => {
     const waveformLength = 100;
@@ -101,7 +121,7 @@ const AudioPlayer = ({ audioUrl, title, onEnded }) => {
       prevValue = newValue;
     }
     
-    setWaveformData(waveformArray);
+    setWaveformData(current => (current.length > 0 ? current : waveformArray));
   };
   
   // Draw waveform
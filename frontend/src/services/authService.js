@@ -217,6 +217,11 @@ export const updatePreferences = async (preferences) => {
     if (!response.ok) {
       throw new Error(data.message || 'Failed to update preferences');
     }
+
+    // The new token carries the updated preferences
+    if (data.access_token) {
+      localStorage.setItem(TOKEN_KEY, data.access_token);
+    }
     
     return data;
   } catch (error) {
@@ -72,6 +72,36 @@ class VoiceService {
     }
   }
 
+  /**
+   * Wait for a background job, such as the rendering of a streamed narration
+   * @param {string} statusUrl - status_url returned with the story ("/api/voice/jobs/<id>")
+   * @param {Object} options - Polling interval and timeout in milliseconds
+   * @returns {Promise<Object|null>} - The job result, or null if the job failed or timed out
+   */
+  async waitForJob(statusUrl, { interval = 3000, timeout = 180000 } = {}) {
+    const url = `${API_BASE_URL}${statusUrl.replace(/^\/api/, '')}`;
+    const deadline = Date.now() + timeout;
+    
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, interval));
+      try {
+        const response = await axios.get(url, { headers: this.getHeaders() });
+        const job = response.data.job;
+        if (job.status === 'succeeded') {
+          return job.result;
+        }
+        if (job.status === 'failed') {
+          console.warn('Background job failed:', job.error);
+          return null;
+        }
+      } catch (error) {
+        console.error('Error polling background job:', error);
+        return null;
+      }
+    }
+    return null;
+  }
+
   /**
    * Get available voice profiles
    * @returns {Promise<Array>} - List of available voice profiles
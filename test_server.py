@@ -5,6 +5,7 @@ import os
 import logging
 import google.generativeai as genai
 from dotenv import load_dotenv
+from backend.services.prompts import prompt_registry, STORY_PROMPT
 
 # Load environment variables
 load_dotenv()
@@ -48,38 +49,15 @@ def build_story_prompt(
     child_name=None
 ) -> str:
     """Build a prompt for the Gemini model to generate a story"""
-    # Base prompt
-    prompt = f"""Write a children's story for age group {age_group} years that would take about {duration_minutes} minutes to read aloud.
-    """
-    
-    # Add theme if provided
-    if theme:
-        prompt += f"The story should be about {theme} and teach the value of {theme}. "
-    
-    # Add setting if provided
-    if setting:
-        prompt += f"The story should take place in a {setting}. "
-    
-    # Add characters if provided
-    if characters and len(characters) > 0:
-        chars_str = ', '.join(characters)
-        prompt += f"Include these characters: {chars_str}. "
-    
-    # Add child name for personalization if provided
-    if child_name:
-        prompt += f"Make {child_name} the main character or mention {child_name} in the story. "
-    
-    # Add formatting instructions
-    prompt += """
-    Make the story engaging, age-appropriate, and with a clear beginning, middle, and end.
-    Use simple language that children can understand.
-    Divide the story into paragraphs for better readability.
-    Start with a title on the first line prefixed with "Title: ".
-    
-    The story should convey positive values and end with a meaningful lesson.
-    """
-    
-    return prompt
+    return prompt_registry.get(STORY_PROMPT).render(
+        theme=theme,
+        characters=characters,
+        setting=setting,
+        duration_minutes=duration_minutes,
+        age_group=age_group,
+        language=language,
+        child_name=child_name
+    )
 
 def parse_story_content(content, theme=None, setting=None):
     """Parse the generated content into title and story text"""